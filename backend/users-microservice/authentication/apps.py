@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        # Conecta os signals que mantêm o cache de usuários da autenticação JWT
+        from . import signals  # noqa: F401
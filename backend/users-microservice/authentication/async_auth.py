@@ -0,0 +1,58 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+
+from .jwt_rapido import JWTRapidoAuthentication
+
+
+def jwt_required_async(view):
+    """
+    Decorator de autenticação JWT para views assíncronas do Django.
+
+    As views do DRF são síncronas; as views async do projeto são views
+    Django puras e usam este decorator para ter o mesmo comportamento da
+    permissão `IsAuthenticated` com `JWTRapidoAuthentication`: preenche
+    `request.user` / `request.auth` ou responde 401.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authenticator = JWTRapidoAuthentication()
+        try:
+            resultado = await _autenticar(authenticator, request)
+        except AuthenticationFailed as e:
+            return _nao_autorizado(authenticator, request, e.detail)
+
+        if resultado is None:
+            return _nao_autorizado(authenticator, request, "As credenciais de autenticação não foram fornecidas.")
+
+        request.user, request.auth = resultado
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def _autenticar(authenticator, request):
+    """
+    Valida o token no event loop (só CPU) e, quando o usuário vem do cache
+    ou das claims, não passa por thread; a busca no banco usa o ORM síncrono.
+    """
+    header = authenticator.get_header(request)
+    if header is None:
+        return None
+    raw_token = authenticator.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authenticator.get_validated_token(raw_token)
+
+    usuario = authenticator.get_user_sem_banco(validated_token)
+    if usuario is None:
+        usuario = await sync_to_async(authenticator.get_user)(validated_token)
+    return usuario, validated_token
+
+
+def _nao_autorizado(authenticator, request, detail):
+    response = JsonResponse({"detail": detail}, status=401)
+    response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+    return response
@@ -0,0 +1,188 @@
+"""
+Autenticação JWT sem consulta ao banco a cada requisição.
+
+O JWTAuthentication do simplejwt busca o usuário no banco em toda
+requisição autenticada. Aqui o usuário vem, nesta ordem:
+
+1. do cache de usuários do processo (LRU com TTL), preenchido pelas
+   buscas no banco e pelos signals de User. Com JWT_USUARIO_DAS_CLAIMS,
+   as alterações e exclusões feitas neste processo ficam no cache por
+   ACCESS_TOKEN_LIFETIME, por cima das claims dos tokens já emitidos;
+   sem as claims, ficam só pelo TTL normal;
+2. das claims do token (JWT_USUARIO_DAS_CLAIMS=True), gravadas no login
+   e no cadastro por `gerar_tokens`;
+3. do banco, como no simplejwt (tokens antigos, sem as claims).
+
+O usuário montado das claims tem só id, username, email, specialty,
+is_active, is_staff e is_superuser (sem grupos nem permissões
+individuais). Tokens emitidos antes de is_staff/is_superuser entrarem
+nas claims vão ao banco, como os tokens sem claims. Alterações feitas em
+outro processo, ou com QuerySet.update(), não passam pelos signals deste
+processo: valem depois de JWT_CACHE_USUARIOS['TTL'] para os usuários
+vindos do banco e só quando o token expira para os vindos das claims.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Claims do usuário gravadas nos tokens (além do user_id)
+CLAIMS_USUARIO = ('username', 'email', 'specialty', 'is_active', 'is_staff', 'is_superuser')
+
+# Marca de usuário excluído no cache
+_EXCLUIDO = object()
+
+
+def gerar_tokens(user) -> RefreshToken:
+    """
+    RefreshToken do usuário com as claims de CLAIMS_USUARIO (o access
+    token gerado a partir dele herda as mesmas claims).
+    """
+    refresh = RefreshToken.for_user(user)
+    for claim in CLAIMS_USUARIO:
+        refresh[claim] = getattr(user, claim)
+    return refresh
+
+
+def usuario_das_claims(validated_token):
+    """Usuário montado das claims do token, sem ir ao banco (None se faltar alguma)."""
+    try:
+        dados = {claim: validated_token[claim] for claim in CLAIMS_USUARIO}
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        return None
+    modelo = get_user_model()
+    # O simplejwt grava o id como string: volta ao tipo do campo
+    user_id = modelo._meta.get_field(api_settings.USER_ID_FIELD).to_python(user_id)
+    usuario = modelo(**{api_settings.USER_ID_FIELD: user_id}, **dados)
+    # Instância "já salva": pode ser usada em filtros e como valor de FKs
+    usuario._state.adding = False
+    usuario._state.db = DEFAULT_DB_ALIAS
+    return usuario
+
+
+class CacheUsuarios:
+    """
+    Usuários por id, por processo, com limite de itens e expiração
+    individual de cada entrada.
+    """
+
+    def __init__(self):
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _configuracao():
+        config = getattr(settings, 'JWT_CACHE_USUARIOS', {})
+        return config.get('TTL', 60), config.get('MAX_ITENS', 1000)
+
+    def obter(self, user_id):
+        """
+        Retorna (encontrado, usuario). `usuario` é None quando o cache sabe
+        que o usuário foi excluído.
+        """
+        chave = str(user_id)
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return False, None
+            expira_em, usuario = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return False, None
+            self._itens.move_to_end(chave)
+        if usuario is _EXCLUIDO:
+            return True, None
+        # Cópia rasa: cada requisição recebe a sua instância
+        return True, copy.copy(usuario)
+
+    def guardar(self, usuario, ttl: Optional[float] = None):
+        self._guardar(usuario.pk, copy.copy(usuario), ttl)
+
+    def marcar_excluido(self, user_id, ttl: Optional[float] = None):
+        self._guardar(user_id, _EXCLUIDO, ttl)
+
+    def _guardar(self, user_id, valor, ttl):
+        ttl_padrao, max_itens = self._configuracao()
+        ttl = ttl_padrao if ttl is None else ttl
+        if ttl <= 0 or max_itens <= 0:
+            return
+        chave = str(user_id)
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+# Instância única por processo
+cache_usuarios = CacheUsuarios()
+
+
+def ttl_alteracoes() -> float:
+    """
+    Por quanto tempo uma alteração vista pelos signals fica no cache.
+
+    Com JWT_USUARIO_DAS_CLAIMS, pelo menos a validade do access token, para
+    prevalecer sobre as claims dos tokens emitidos antes dela. Sem as
+    claims, o TTL normal: a entrada é só um cache do banco, e alterações
+    feitas em outros processos precisam aparecer depois dele.
+    """
+    ttl_padrao = CacheUsuarios._configuracao()[0]
+    if not getattr(settings, 'JWT_USUARIO_DAS_CLAIMS', False):
+        return ttl_padrao
+    return max(ttl_padrao, api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+class JWTRapidoAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication que evita o banco: usa o cache de usuários e, com
+    JWT_USUARIO_DAS_CLAIMS, as claims do token (ver o início do módulo).
+    """
+
+    def get_user(self, validated_token):
+        usuario = self.get_user_sem_banco(validated_token)
+        if usuario is not None:
+            return usuario
+        usuario = super().get_user(validated_token)
+        cache_usuarios.guardar(usuario)
+        return usuario
+
+    def get_user_sem_banco(self, validated_token):
+        """
+        Usuário do cache ou das claims; None quando é preciso ir ao banco.
+        Lança AuthenticationFailed para usuário excluído ou inativo.
+        """
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        # Sem o id (o simplejwt responde com o erro certo) ou com a checagem
+        # de troca de senha, que precisa do hash gravado no banco
+        if user_id is None or getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            return None
+
+        encontrado, usuario = cache_usuarios.obter(user_id)
+        if encontrado and usuario is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not encontrado:
+            if not getattr(settings, 'JWT_USUARIO_DAS_CLAIMS', False):
+                return None
+            usuario = usuario_das_claims(validated_token)
+            if usuario is None:
+                return None
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not usuario.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return usuario
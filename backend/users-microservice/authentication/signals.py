@@ -0,0 +1,23 @@
+"""
+Mantém o cache de usuários da autenticação JWT (jwt_rapido) em dia com
+as alterações e exclusões de usuários feitas neste processo.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .jwt_rapido import cache_usuarios, ttl_alteracoes
+
+
+@receiver(post_save, sender=get_user_model())
+def atualizar_usuario_em_cache(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Guarda a versão nova (e não só remove a antiga) para que ela prevaleça
+    # sobre as claims dos tokens emitidos antes da alteração
+    cache_usuarios.guardar(instance, ttl=ttl_alteracoes())
+
+
+@receiver(post_delete, sender=get_user_model())
+def remover_usuario_do_cache(sender, instance, **kwargs):
+    cache_usuarios.marcar_excluido(instance.pk, ttl=ttl_alteracoes())
@@ -1,3 +1,207 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .async_auth import jwt_required_async
+from .jwt_rapido import JWTRapidoAuthentication, cache_usuarios, gerar_tokens
+from .models import User
+
+
+class _Relogio:
+    """time.monotonic controlável, para expirar entradas do cache."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@override_settings(JWT_USUARIO_DAS_CLAIMS=False, JWT_CACHE_USUARIOS={'TTL': 60, 'MAX_ITENS': 100})
+class JWTRapidoAuthenticationTests(TestCase):
+    """
+    Origem do usuário autenticado (cache, claims ou banco) e o que acontece
+    quando ele é alterado, desativado ou excluído.
+    """
+
+    def setUp(self):
+        cache_usuarios.limpar()
+        self.usuario = User.objects.create_user(
+            username='medico', email='medico@exemplo.com', password='senha-forte-123', specialty='Oncologia',
+        )
+        # O signal do create_user já guardou o usuário; os testes começam sem cache
+        cache_usuarios.limpar()
+        self.relogio = _Relogio()
+        patcher = mock.patch('authentication.jwt_rapido.time.monotonic', self.relogio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cache_usuarios.limpar)
+
+    def _autenticar(self, token=None):
+        token = token or gerar_tokens(self.usuario).access_token
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return JWTRapidoAuthentication().authenticate(request)[0]
+
+    def test_primeira_requisicao_vai_ao_banco_e_as_seguintes_usam_o_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self._autenticar().pk, self.usuario.pk)
+        with self.assertNumQueries(0):
+            usuario = self._autenticar()
+        self.assertEqual(usuario.email, 'medico@exemplo.com')
+
+    def test_entrada_do_cache_expira_no_ttl(self):
+        self._autenticar()
+        self.relogio.agora += 61
+        with self.assertNumQueries(1):
+            self._autenticar()
+
+    def test_cache_desativado_com_ttl_zero(self):
+        with override_settings(JWT_CACHE_USUARIOS={'TTL': 0, 'MAX_ITENS': 100}):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    self._autenticar()
+
+    def test_limite_de_itens(self):
+        outro = User.objects.create_user(username='outro', email='outro@exemplo.com', password='x')
+        with override_settings(JWT_CACHE_USUARIOS={'TTL': 60, 'MAX_ITENS': 1}):
+            cache_usuarios.limpar()
+            self._autenticar()
+            self._autenticar(gerar_tokens(outro).access_token)
+            # O primeiro foi descartado para caber o segundo
+            with self.assertNumQueries(1):
+                self._autenticar()
+
+    def test_alteracao_em_outro_processo_aparece_depois_do_ttl(self):
+        # Salvo neste processo: fica no cache só pelo TTL normal
+        self.usuario.specialty = 'Ginecologia'
+        self.usuario.save()
+        self._autenticar()
+        # Desativado por outro processo (sem signal aqui)
+        User.objects.filter(pk=self.usuario.pk).update(is_active=False)
+        self.relogio.agora += 61
+        with self.assertRaises(AuthenticationFailed) as erro:
+            self._autenticar()
+        self.assertEqual(erro.exception.detail['code'], 'user_inactive')
+
+    def test_usuario_desativado_neste_processo(self):
+        token = gerar_tokens(self.usuario).access_token
+        self._autenticar(token)
+        self.usuario.is_active = False
+        self.usuario.save()
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self._autenticar(token)
+
+    def test_usuario_excluido(self):
+        token = gerar_tokens(self.usuario).access_token
+        self._autenticar(token)
+        self.usuario.delete()
+        with self.assertRaises(AuthenticationFailed) as erro:
+            self._autenticar(token)
+        self.assertEqual(erro.exception.detail['code'], 'user_not_found')
+
+    @override_settings(JWT_USUARIO_DAS_CLAIMS=True)
+    def test_usuario_montado_das_claims_sem_consulta(self):
+        with self.assertNumQueries(0):
+            usuario = self._autenticar()
+        self.assertEqual(usuario.pk, self.usuario.pk)
+        self.assertIsInstance(usuario.pk, int)
+        self.assertEqual((usuario.username, usuario.email, usuario.specialty), ('medico', 'medico@exemplo.com', 'Oncologia'))
+        self.assertEqual((usuario.is_staff, usuario.is_superuser), (False, False))
+
+    @override_settings(JWT_USUARIO_DAS_CLAIMS=True)
+    def test_administrador_das_claims_acessa_endpoints_de_admin(self):
+        admin = User.objects.create_user(username='admin', email='admin@exemplo.com', password='x', is_staff=True)
+        cache_usuarios.limpar()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {gerar_tokens(admin).access_token}')
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/metricas/integracoes/').status_code, 200)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {gerar_tokens(self.usuario).access_token}')
+        self.assertEqual(client.get('/api/metricas/integracoes/').status_code, 403)
+
+    @override_settings(JWT_USUARIO_DAS_CLAIMS=True)
+    def test_token_sem_as_claims_de_admin_vai_ao_banco(self):
+        self.usuario.is_staff = True
+        self.usuario.save()
+        cache_usuarios.limpar()
+        # Token emitido antes de is_staff/is_superuser entrarem nas claims
+        token = RefreshToken.for_user(self.usuario).access_token
+        for claim in ('username', 'email', 'specialty', 'is_active'):
+            token[claim] = getattr(self.usuario, claim)
+        with self.assertNumQueries(1):
+            self.assertTrue(self._autenticar(token).is_staff)
+
+    @override_settings(JWT_USUARIO_DAS_CLAIMS=True)
+    def test_token_sem_claims_vai_ao_banco(self):
+        with self.assertNumQueries(1):
+            self._autenticar(RefreshToken.for_user(self.usuario).access_token)
+
+    @override_settings(JWT_USUARIO_DAS_CLAIMS=True)
+    def test_desativacao_prevalece_sobre_as_claims_durante_a_validade_do_token(self):
+        token = gerar_tokens(self.usuario).access_token
+        self.usuario.is_active = False
+        self.usuario.save()
+        # Passado o TTL normal, a alteração continua valendo sobre as claims antigas
+        self.relogio.agora += 61
+        with self.assertRaises(AuthenticationFailed) as erro:
+            self._autenticar(token)
+        self.assertEqual(erro.exception.detail['code'], 'user_inactive')
+
+    @override_settings(JWT_USUARIO_DAS_CLAIMS=True)
+    def test_exclusao_prevalece_sobre_as_claims(self):
+        token = gerar_tokens(self.usuario).access_token
+        self.usuario.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self._autenticar(token)
+
+
+@override_settings(JWT_USUARIO_DAS_CLAIMS=False, JWT_CACHE_USUARIOS={'TTL': 60, 'MAX_ITENS': 100})
+class JWTRequiredAsyncTests(TestCase):
+    """Decorator de autenticação das views assíncronas."""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        cache_usuarios.limpar()
+        self.addCleanup(cache_usuarios.limpar)
+
+        @jwt_required_async
+        async def view(request):
+            return JsonResponse({'email': request.user.email})
+
+        # async_to_sync: o ORM roda na mesma thread (e transação) do teste
+        self.view = async_to_sync(view)
+
+    def _get(self, **headers):
+        return self.view(RequestFactory().get('/', **headers))
+
+    def test_token_valido(self):
+        token = gerar_tokens(self.usuario).access_token
+        response = self._get(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'email': 'medico@exemplo.com'})
+
+    @override_settings(JWT_USUARIO_DAS_CLAIMS=True)
+    def test_token_com_claims_nao_consulta_o_banco(self):
+        token = gerar_tokens(self.usuario).access_token
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get(HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+
+    def test_sem_credenciais(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    def test_token_invalido(self):
+        self.assertEqual(self._get(HTTP_AUTHORIZATION='Bearer invalido').status_code, 401)
+
+    def test_usuario_inativo(self):
+        token = gerar_tokens(self.usuario).access_token
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self._get(HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 401)
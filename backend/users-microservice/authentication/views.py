@@ -1,8 +1,8 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate, get_user_model
+from .jwt_rapido import gerar_tokens
 from .serializers import UserRegisterSerializer, UserLoginSerializer
 
 User = get_user_model()
@@ -17,7 +17,7 @@ class RegisterView(generics.CreateAPIView):
         user = serializer.save()
 
         # Gera tokens para o usuário recém-cadastrado
-        refresh = RefreshToken.for_user(user)
+        refresh = gerar_tokens(user)
         return Response({
             "user": {
                 "id": user.id,
@@ -41,7 +41,7 @@ class LoginView(APIView):
         user = authenticate(request, username=email, password=password) # Usa o email como username para autenticação
 
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            refresh = gerar_tokens(user)
             return Response({
                 "message": "Login bem-sucedido",
                 "refresh": str(refresh),
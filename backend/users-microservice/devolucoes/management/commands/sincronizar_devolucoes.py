@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from devolucoes.services import sincronizar_devolucoes
+
+
+class Command(BaseCommand):
+    """
+    Mantém o espelho local das devoluções atualizado a partir da API externa.
+    """
+    help = 'Sincroniza o espelho local de devoluções com a API externa, uma vez ou periodicamente.'
+
+    def add_arguments(self, parser):
+        """Adiciona os argumentos que o comando aceitará na linha de comando."""
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Repete a sincronização a cada N segundos (0 executa uma única vez).'
+        )
+        parser.add_argument(
+            '--completa',
+            action='store_true',
+            help='Ignora a marca d\'água: relê todas as devoluções e remove as que não existem mais na origem.'
+        )
+        parser.add_argument(
+            '--completa-a-cada',
+            type=int,
+            default=0,
+            help='Com --intervalo, faz uma sincronização completa a cada N ciclos (0 desliga). As incrementais '
+                 'não enxergam registros apagados na origem; a completa os remove do espelho.'
+        )
+
+    def handle(self, *args, **kwargs):
+        """A lógica principal do comando."""
+        intervalo = kwargs['intervalo']
+        completa = kwargs['completa']
+        completa_a_cada = kwargs['completa_a_cada']
+        # Ciclos incrementais desde a última sincronização completa
+        incrementais = 0
+
+        while True:
+            if completa_a_cada and incrementais >= completa_a_cada - 1:
+                completa = True
+            try:
+                resumo = sincronizar_devolucoes(completa=completa)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Devoluções sincronizadas ({'completa' if resumo['completa'] else 'incremental'}): "
+                    f"{resumo['recebidos']} recebida(s) em {resumo['paginas']} página(s), "
+                    f"{resumo['removidos']} removida(s)."
+                ))
+                # Depois de uma sincronização completa, as seguintes são incrementais
+                # (a primeira execução, sem marca d'água, também é completa)
+                incrementais = 0 if resumo['completa'] else incrementais + 1
+                completa = False
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Ocorreu um erro inesperado: {e}"))
+            finally:
+                close_old_connections()
+
+            if not intervalo:
+                break
+            time.sleep(intervalo)
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:44
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# Filtros usuario / profissional_solicitante (icontains, que o Django traduz
+# em UPPER(coluna) LIKE UPPER('%valor%')): índices de trigramas sobre UPPER
+INDICES_TRIGRAMAS = """
+CREATE INDEX IF NOT EXISTS devolucoes_usuario_trgm_idx
+    ON devolucoes_devolucao USING GIN (UPPER(usuario) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS devolucoes_profissional_trgm_idx
+    ON devolucoes_devolucao USING GIN (UPPER(profissional_solicitante) gin_trgm_ops);
+"""
+
+REMOVER_INDICES_TRIGRAMAS = """
+DROP INDEX IF EXISTS devolucoes_usuario_trgm_idx;
+DROP INDEX IF EXISTS devolucoes_profissional_trgm_idx;
+"""
+
+
+def criar_indices_trigramas(apps, schema_editor):
+    # pg_trgm só existe no PostgreSQL; em outros bancos os filtros fazem scan
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(INDICES_TRIGRAMAS)
+
+
+def remover_indices_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(REMOVER_INDICES_TRIGRAMAS)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='EstadoSincronizacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('marca_dagua', models.DateTimeField(blank=True, help_text='Maior alterado_em já recebido da origem.', null=True)),
+                ('sincronizado_em', models.DateTimeField(blank=True, help_text='Início da última sincronização concluída: os dados locais estão atualizados até este instante.', null=True)),
+                ('ultimo_erro', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'verbose_name': 'Estado da Sincronização de Devoluções',
+                'verbose_name_plural': 'Estado da Sincronização de Devoluções',
+            },
+        ),
+        migrations.CreateModel(
+            name='Devolucao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo_solicitacao', models.CharField(help_text='Codigo_Solicitacao da API externa.', max_length=100, unique=True)),
+                ('usuario', models.CharField(blank=True, default='', max_length=255)),
+                ('profissional_solicitante', models.CharField(blank=True, default='', max_length=255)),
+                ('data_solicitacao', models.DateField(blank=True, null=True)),
+                ('data_devolucao', models.DateField(blank=True, null=True)),
+                ('alterado_em', models.DateTimeField(blank=True, help_text="Data da última alteração na origem (marca d'água da sincronização).", null=True)),
+                ('dados', models.JSONField(default=dict, help_text='Registro como veio da API externa.')),
+                ('sincronizado_em', models.DateTimeField(help_text='Sincronização que gravou esta versão do registro.')),
+            ],
+            options={
+                'verbose_name': 'Devolução',
+                'verbose_name_plural': 'Devoluções',
+                'ordering': ['-data_devolucao', '-id'],
+                'indexes': [models.Index(fields=['-data_devolucao', '-id'], name='devolucoes_data_dev_idx'), models.Index(fields=['data_solicitacao'], name='devolucoes_data_sol_idx'), models.Index(fields=['sincronizado_em'], name='devolucoes_sincronizado_idx')],
+            },
+        ),
+        migrations.RunPython(criar_indices_trigramas, remover_indices_trigramas),
+    ]
@@ -1,3 +1,55 @@
 from django.db import models
 
-# Create your models here.
+
+class Devolucao(models.Model):
+    """
+    Cópia local de uma devolução da API externa (DEVOLUCOES_API_URL),
+    mantida pelo comando `sincronizar_devolucoes`.
+
+    O registro original vai em `dados` e é devolvido sem alteração na
+    listagem; as demais colunas existem só para filtrar e ordenar.
+    """
+    codigo_solicitacao = models.CharField(max_length=100, unique=True, help_text="Codigo_Solicitacao da API externa.")
+    usuario = models.CharField(max_length=255, blank=True, default='')
+    profissional_solicitante = models.CharField(max_length=255, blank=True, default='')
+    data_solicitacao = models.DateField(blank=True, null=True)
+    data_devolucao = models.DateField(blank=True, null=True)
+    alterado_em = models.DateTimeField(blank=True, null=True, help_text="Data da última alteração na origem (marca d'água da sincronização).")
+    dados = models.JSONField(default=dict, help_text="Registro como veio da API externa.")
+    sincronizado_em = models.DateTimeField(help_text="Sincronização que gravou esta versão do registro.")
+
+    def __str__(self):
+        return self.codigo_solicitacao
+
+    class Meta:
+        verbose_name = "Devolução"
+        verbose_name_plural = "Devoluções"
+        ordering = ['-data_devolucao', '-id']
+        indexes = [
+            # Listagem paginada na ordem padrão e filtro por data de devolução
+            models.Index(fields=['-data_devolucao', '-id'], name='devolucoes_data_dev_idx'),
+            models.Index(fields=['data_solicitacao'], name='devolucoes_data_sol_idx'),
+            # Remoção dos registros que sumiram da origem na sincronização completa
+            models.Index(fields=['sincronizado_em'], name='devolucoes_sincronizado_idx'),
+        ]
+
+
+class EstadoSincronizacao(models.Model):
+    """
+    Estado da sincronização das devoluções (uma única linha).
+    """
+    marca_dagua = models.DateTimeField(blank=True, null=True, help_text="Maior alterado_em já recebido da origem.")
+    sincronizado_em = models.DateTimeField(blank=True, null=True, help_text="Início da última sincronização concluída: os dados locais estão atualizados até este instante.")
+    ultimo_erro = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Sincronização de devoluções ({self.sincronizado_em})"
+
+    @classmethod
+    def atual(cls):
+        estado, _ = cls.objects.get_or_create(pk=1)
+        return estado
+
+    class Meta:
+        verbose_name = "Estado da Sincronização de Devoluções"
+        verbose_name_plural = "Estado da Sincronização de Devoluções"
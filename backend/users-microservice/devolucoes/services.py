@@ -1,13 +1,57 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import httpx
 import requests
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.exceptions import APIException
 
+from users_api import clientes_http
+from .models import Devolucao, EstadoSincronizacao
+
 class ServiceUnavailable(APIException):
     status_code = 503
     default_detail = 'Serviço temporariamente indisponível.'
     default_code = 'service_unavailable'
 
-def buscar_devolucoes_externas(params):
+def _get_base_url():
+    """Lê a URL da API Externa definida no settings.py."""
+    base_url = getattr(settings, 'DEVOLUCOES_API_URL', None)
+    if not base_url:
+        raise ValueError("A configuração DEVOLUCOES_API_URL não foi definida no settings.")
+    return base_url
+
+def _erro_da_api_externa(response):
+    """
+    Converte uma resposta de erro da API externa (requests ou httpx)
+    em uma APIException com a mensagem e o status code originais.
+    """
+    # Tenta pegar a mensagem de erro da API externa, se houver
+    error_msg = "Erro na comunicação com o serviço externo."
+    if response is not None:
+        try:
+            error_data = response.json()
+            if isinstance(error_data, dict) and 'message' in error_data:
+                error_msg = error_data['message']
+        except ValueError:
+            pass # Não é JSON
+
+    # Repassa o status code original se possível, senão 502 (Bad Gateway)
+    status_code = response.status_code if response is not None else 502
+
+    # Cria uma exceção genérica com o status code correto
+    exc = APIException(detail=error_msg)
+    exc.status_code = status_code
+    return exc
+
+def _buscar_na_api(params):
     """
     Busca as devoluções na API externa repassando os parâmetros recebidos.
     
@@ -17,14 +61,11 @@ def buscar_devolucoes_externas(params):
     Returns:
         list/dict: O JSON retornado pela API externa.
     """
-    # URL da API Externa definida no settings.py
-    base_url = getattr(settings, 'DEVOLUCOES_API_URL', None)
-    if not base_url:
-        raise ValueError("A configuração DEVOLUCOES_API_URL não foi definida no settings.")
+    base_url = _get_base_url()
 
     try:
         # Repassa os parâmetros (page, limit, usuario, etc) diretamente para a API externa
-        response = requests.get(base_url, params=params, timeout=10)
+        response = clientes_http.cliente("devolucoes").get(base_url, params=params)
         response.raise_for_status()
         
         return response.json()
@@ -34,20 +75,604 @@ def buscar_devolucoes_externas(params):
     except requests.exceptions.ConnectionError:
         raise ServiceUnavailable(detail="Não foi possível conectar à API de devoluções.")
     except requests.exceptions.RequestException as e:
-        # Tenta pegar a mensagem de erro da API externa, se houver
-        error_msg = "Erro na comunicação com o serviço externo."
-        if e.response is not None:
+        raise _erro_da_api_externa(e.response)
+
+async def _buscar_na_api_async(params):
+    """
+    Versão assíncrona de `_buscar_na_api`, usando httpx.
+    Mantém o mesmo mapeamento de erros.
+    """
+    base_url = _get_base_url()
+
+    try:
+        response = await clientes_http.cliente("devolucoes").get_async(base_url, params=params)
+        response.raise_for_status()
+
+        return response.json()
+
+    except httpx.TimeoutException:
+        raise ServiceUnavailable(detail="A API de devoluções demorou muito para responder.")
+    except httpx.ConnectError:
+        raise ServiceUnavailable(detail="Não foi possível conectar à API de devoluções.")
+    except httpx.HTTPStatusError as e:
+        raise _erro_da_api_externa(e.response)
+    except httpx.HTTPError:
+        raise _erro_da_api_externa(None)
+
+
+
+# --- Repasse Direto (pass-through) ---
+
+# Tamanho máximo de cada pedaço repassado ao cliente: é tudo o que fica em
+# memória por requisição, qualquer que seja o tamanho da página
+TAMANHO_PEDACO = 64 * 1024
+
+
+class RespostaBruta:
+    """Corpo da API externa a ser repassado sem decodificar o JSON."""
+
+    def __init__(self, pedacos, content_type, tamanho=None):
+        self.pedacos = pedacos            # iterador (ou iterador assíncrono) de bytes
+        self.content_type = content_type
+        self.tamanho = tamanho            # Content-Length, quando conhecido
+
+
+def repasse_ativo():
+    """settings.DEVOLUCOES_REPASSE_DIRETO: a listagem repassa os bytes da API externa."""
+    return getattr(settings, 'DEVOLUCOES_REPASSE_DIRETO', False)
+
+
+def _content_type(response):
+    return response.headers.get('Content-Type') or 'application/json'
+
+
+def _tamanho(response):
+    # Sem Content-Encoding os bytes repassados são exatamente os recebidos
+    if response.headers.get('Content-Encoding'):
+        return None
+    return response.headers.get('Content-Length')
+
+
+def abrir_devolucoes_brutas(params):
+    """
+    Abre a listagem na API externa em streaming e devolve o corpo para ser
+    repassado pedaço a pedaço (até TAMANHO_PEDACO bytes por vez), sem
+    passar pelo json() nem pelo cache de respostas.
+
+    Os erros antes do corpo (timeout, conexão, respostas não-2xx) têm o
+    mesmo mapeamento de `_buscar_na_api`. Uma falha no meio do corpo só
+    pode interromper a resposta, que já começou a ser enviada.
+    """
+    base_url = _get_base_url()
+
+    try:
+        response = clientes_http.cliente("devolucoes").get(base_url, params=params, stream=True)
+    except requests.exceptions.Timeout:
+        raise ServiceUnavailable(detail="A API de devoluções demorou muito para responder.")
+    except requests.exceptions.ConnectionError:
+        raise ServiceUnavailable(detail="Não foi possível conectar à API de devoluções.")
+    except requests.exceptions.RequestException as e:
+        raise _erro_da_api_externa(e.response)
+
+    if not response.ok:
+        try:
+            raise _erro_da_api_externa(response)
+        finally:
+            response.close()
+
+    def _pedacos():
+        try:
+            yield from response.iter_content(chunk_size=TAMANHO_PEDACO)
+        except requests.exceptions.RequestException as e:
+            print(f"AVISO: Repasse da API de devoluções interrompido: {e}")
+        finally:
+            response.close()
+
+    return RespostaBruta(_pedacos(), _content_type(response), _tamanho(response))
+
+
+async def abrir_devolucoes_brutas_async(params):
+    """Versão assíncrona de `abrir_devolucoes_brutas`, usando httpx."""
+    partes = _repasse_async(_get_base_url(), params)
+    # A primeira parte é a resposta (status já conferido); as demais, o corpo
+    response = await partes.__anext__()
+    return RespostaBruta(partes, _content_type(response), _tamanho(response))
+
+
+async def _repasse_async(base_url, params):
+    """
+    Gerador do repasse assíncrono: entrega a resposta e depois os pedaços
+    do corpo. A conexão fica aberta no `async with` até o corpo terminar
+    (ou o gerador ser fechado).
+    """
+    try:
+        async with clientes_http.cliente("devolucoes").stream_async("GET", base_url, params=params) as response:
+            if not response.is_success:
+                await response.aread()
+                raise _erro_da_api_externa(response)
+            yield response
+
             try:
-                error_data = e.response.json()
-                if 'message' in error_data:
-                    error_msg = error_data['message']
-            except ValueError:
-                pass # Não é JSON
-        
-        # Repassa o status code original se possível, senão 502 (Bad Gateway)
-        status_code = e.response.status_code if e.response else 502
-        
-        # Cria uma exceção genérica com o status code correto
-        exc = APIException(detail=error_msg)
-        exc.status_code = status_code
-        raise exc
\ No newline at end of file
+                async for pedaco in response.aiter_bytes(chunk_size=TAMANHO_PEDACO):
+                    yield pedaco
+            except httpx.HTTPError as e:
+                print(f"AVISO: Repasse da API de devoluções interrompido: {e}")
+    except httpx.TimeoutException:
+        raise ServiceUnavailable(detail="A API de devoluções demorou muito para responder.")
+    except httpx.ConnectError:
+        raise ServiceUnavailable(detail="Não foi possível conectar à API de devoluções.")
+    except httpx.HTTPError:
+        raise _erro_da_api_externa(None)
+
+
+# --- Cache de Respostas ---
+
+class _Chamada:
+    """Chamada à API externa em andamento, compartilhada entre requisições idênticas."""
+
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class CacheDevolucoes:
+    """
+    Cache em memória (por processo) das respostas da API de devoluções.
+
+    - Chave: usuário + query params normalizados.
+    - TTL curto: dentro dele a resposta é servida direto do cache.
+    - Stale-while-revalidate: por STALE_WHILE_REVALIDATE segundos após o
+      TTL, a resposta antiga é servida na hora e atualizada em segundo plano.
+    - Stale-if-error: até STALE_IF_ERROR segundos após o TTL, a resposta
+      antiga é servida se a API externa falhar (timeout, conexão ou 5xx).
+    - Single-flight: requisições idênticas simultâneas compartilham uma
+      única chamada à API externa.
+    """
+
+    def __init__(self, buscar, buscar_async):
+        self._buscar = buscar
+        self._buscar_async = buscar_async
+        self._itens = OrderedDict()
+        self._em_andamento = {}
+        self._em_andamento_async = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _config():
+        config = getattr(settings, 'DEVOLUCOES_CACHE', {})
+        return (
+            config.get('TTL', 15),
+            config.get('STALE_WHILE_REVALIDATE', 60),
+            config.get('STALE_IF_ERROR', 300),
+            config.get('MAX_ITENS', 500),
+        )
+
+    @staticmethod
+    def normalizar_params(params):
+        """Remove parâmetros vazios e ordena, para que a mesma consulta gere a mesma chave."""
+        normalizados = {}
+        for nome, valor in params.items():
+            valor = str(valor).strip()
+            if valor:
+                normalizados[nome] = valor
+        return dict(sorted(normalizados.items()))
+
+    @staticmethod
+    def chave(params, usuario_id):
+        return f"{usuario_id}:{json.dumps(params, ensure_ascii=False, separators=(',', ':'))}"
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    # --- Armazenamento ---
+
+    def _ler(self, chave):
+        """Retorna (dados, idade em segundos) ou None."""
+        ttl, swr, sie, _ = self._config()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            dados, armazenado_em = item
+            idade = time.monotonic() - armazenado_em
+            if idade > ttl + max(swr, sie):
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return dados, idade
+
+    def _guardar(self, chave, dados):
+        ttl, _, _, max_itens = self._config()
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._itens[chave] = (dados, time.monotonic())
+            self._itens.move_to_end(chave)
+            while len(self._itens) > max_itens:
+                self._itens.popitem(last=False)
+
+    @staticmethod
+    def _falha_do_servidor(erro):
+        """Timeout, falha de conexão (503) e erros 5xx da API externa."""
+        return getattr(erro, 'status_code', 500) >= 500
+
+    # --- Versão síncrona ---
+
+    def obter(self, params, usuario_id=None):
+        params = self.normalizar_params(params)
+        chave = self.chave(params, usuario_id)
+        ttl, swr, _, _ = self._config()
+
+        item = self._ler(chave)
+        if item is not None:
+            dados, idade = item
+            if idade <= ttl:
+                return dados
+            if idade <= ttl + swr:
+                self._revalidar_em_segundo_plano(chave, params)
+                return dados
+
+        try:
+            return self._chamar(chave, params)
+        except Exception as e:
+            if item is not None and self._falha_do_servidor(e):
+                print(f"AVISO: API de devoluções falhou ({e}); servindo resposta em cache.")
+                return item[0]
+            raise
+
+    def _chamar(self, chave, params):
+        """Chama a API externa; requisições idênticas simultâneas esperam a mesma chamada."""
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = _Chamada()
+
+        if not lider:
+            chamada.concluida.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = self._buscar(params)
+            self._guardar(chave, chamada.resultado)
+            return chamada.resultado
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            chamada.concluida.set()
+
+    def _revalidar_em_segundo_plano(self, chave, params):
+        with self._lock:
+            if chave in self._em_andamento:
+                return
+
+        def _revalidar():
+            try:
+                self._chamar(chave, params)
+            except Exception as e:
+                print(f"AVISO: Falha ao revalidar o cache de devoluções: {e}")
+
+        threading.Thread(target=_revalidar, daemon=True, name='devolucoes-revalidacao').start()
+
+    # --- Versão assíncrona ---
+
+    async def obter_async(self, params, usuario_id=None):
+        params = self.normalizar_params(params)
+        chave = self.chave(params, usuario_id)
+        ttl, swr, _, _ = self._config()
+
+        item = self._ler(chave)
+        if item is not None:
+            dados, idade = item
+            if idade <= ttl:
+                return dados
+            if idade <= ttl + swr:
+                self._revalidar_em_segundo_plano_async(chave, params)
+                return dados
+
+        try:
+            return await self._chamar_async(chave, params)
+        except Exception as e:
+            if item is not None and self._falha_do_servidor(e):
+                print(f"AVISO: API de devoluções falhou ({e}); servindo resposta em cache.")
+                return item[0]
+            raise
+
+    def _iniciar_chamada_async(self, chave, params):
+        """
+        Retorna a tarefa que busca `chave` na API externa, criando-a se
+        ainda não houver uma em andamento. A chamada roda em uma tarefa
+        própria: se a requisição que a iniciou for cancelada (cliente
+        desconectou), as demais continuam esperando o mesmo resultado.
+        """
+        tarefa = self._em_andamento_async.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.get_running_loop().create_task(self._buscar_e_guardar_async(chave, params))
+            self._em_andamento_async[chave] = tarefa
+            tarefa.add_done_callback(lambda _: self._em_andamento_async.pop(chave, None))
+        return tarefa
+
+    async def _buscar_e_guardar_async(self, chave, params):
+        resultado = await self._buscar_async(params)
+        self._guardar(chave, resultado)
+        return resultado
+
+    async def _chamar_async(self, chave, params):
+        return await asyncio.shield(self._iniciar_chamada_async(chave, params))
+
+    def _revalidar_em_segundo_plano_async(self, chave, params):
+        if chave in self._em_andamento_async:
+            return
+
+        def _registrar_falha(tarefa):
+            if not tarefa.cancelled() and tarefa.exception() is not None:
+                print(f"AVISO: Falha ao revalidar o cache de devoluções: {tarefa.exception()}")
+
+        self._iniciar_chamada_async(chave, params).add_done_callback(_registrar_falha)
+
+
+cache_devolucoes = CacheDevolucoes(_buscar_na_api, _buscar_na_api_async)
+
+
+def buscar_devolucoes_externas(params, usuario_id=None):
+    """
+    Busca as devoluções na API externa, passando pelo cache de respostas
+    (ver CacheDevolucoes). O cache é separado por usuário.
+    """
+    return cache_devolucoes.obter(params, usuario_id)
+
+
+async def buscar_devolucoes_externas_async(params, usuario_id=None):
+    """Versão assíncrona de `buscar_devolucoes_externas`."""
+    return await cache_devolucoes.obter_async(params, usuario_id)
+
+
+# --- Espelho Local ---
+
+# Filtros da listagem (mesmos query params aceitos pela API externa)
+_FILTROS_TEXTO = {
+    'usuario': 'usuario__icontains',
+    'profissional_solicitante': 'profissional_solicitante__icontains',
+}
+_FILTROS_DATA = {
+    'data_solicitacao_inicio': 'data_solicitacao__gte',
+    'data_solicitacao_fim': 'data_solicitacao__lte',
+    'data_devolucao_inicio': 'data_devolucao__gte',
+    'data_devolucao_fim': 'data_devolucao__lte',
+}
+LIMITE_PADRAO = 50
+LIMITE_MAX = 500
+
+
+def _converter_data(valor):
+    """Data/hora em ISO 8601 (com ou sem hora) ou DD/MM/AAAA; None se inválida."""
+    if not valor or not isinstance(valor, str):
+        return None
+    valor = valor.strip()
+    try:
+        convertida = parse_datetime(valor) or parse_date(valor)
+    except ValueError:
+        convertida = None
+    if convertida is None:
+        try:
+            convertida = datetime.strptime(valor[:10], '%d/%m/%Y').date()
+        except ValueError:
+            return None
+    return convertida
+
+
+def _data(valor):
+    convertida = _converter_data(valor)
+    return convertida.date() if isinstance(convertida, datetime) else convertida
+
+
+def _data_hora(valor):
+    convertida = _converter_data(valor)
+    if convertida is None:
+        return None
+    if not isinstance(convertida, datetime):
+        convertida = datetime.combine(convertida, datetime.min.time())
+    if timezone.is_naive(convertida):
+        convertida = timezone.make_aware(convertida)
+    return convertida
+
+
+def espelho_ativo():
+    """settings.DEVOLUCOES_ESPELHO: a listagem é servida do banco local."""
+    return getattr(settings, 'DEVOLUCOES_ESPELHO', False)
+
+
+def _ler_inteiro(params, nome, padrao, minimo, maximo=None):
+    valor = params.get(nome) or padrao
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        valor = None
+    if valor is None or valor < minimo or (maximo is not None and valor > maximo):
+        faixa = f"entre {minimo} e {maximo}" if maximo is not None else f"maior ou igual a {minimo}"
+        exc = APIException(detail=f"Parâmetro '{nome}' inválido: use um inteiro {faixa}.")
+        exc.status_code = 400
+        raise exc
+    return valor
+
+
+def _ler_data_do_filtro(params, nome):
+    valor = params.get(nome)
+    if not valor:
+        return None
+    data = _data(valor)
+    if data is None:
+        exc = APIException(detail=f"Parâmetro '{nome}' inválido: use o formato AAAA-MM-DD.")
+        exc.status_code = 400
+        raise exc
+    return data
+
+
+def listar_devolucoes_locais(params):
+    """
+    Listagem a partir do espelho local, com o mesmo contrato da API
+    externa: query params page, limit, usuario, profissional_solicitante e
+    data_(solicitacao|devolucao)_(inicio|fim); resposta
+    {"devolucoes": [...], "pagination": {...}}.
+
+    Returns:
+        (dados, sincronizado_em): sincronizado_em é None se o espelho ainda
+        não foi sincronizado (a view recorre à API externa).
+    """
+    estado = EstadoSincronizacao.objects.filter(pk=1).first()
+    if estado is None or estado.sincronizado_em is None:
+        return None, None
+
+    pagina = _ler_inteiro(params, 'page', 1, 1)
+    limite = _ler_inteiro(params, 'limit', LIMITE_PADRAO, 1, LIMITE_MAX)
+
+    queryset = Devolucao.objects.all()
+    for nome, lookup in _FILTROS_TEXTO.items():
+        valor = (params.get(nome) or '').strip()
+        if valor:
+            queryset = queryset.filter(**{lookup: valor})
+    for nome, lookup in _FILTROS_DATA.items():
+        data = _ler_data_do_filtro(params, nome)
+        if data:
+            queryset = queryset.filter(**{lookup: data})
+
+    total = queryset.count()
+    inicio = (pagina - 1) * limite
+    devolucoes = list(queryset.values_list('dados', flat=True)[inicio:inicio + limite])
+    return {
+        "devolucoes": devolucoes,
+        "pagination": {
+            "page": pagina,
+            "limit": limite,
+            "total_registros": total,
+            "total_paginas": math.ceil(total / limite),
+        },
+    }, estado.sincronizado_em
+
+
+def _configuracao_sync():
+    config = getattr(settings, 'DEVOLUCOES_SYNC', {})
+    return (
+        config.get('CAMPO_ALTERACAO', 'Data_Atualizacao'),
+        config.get('PARAM_ALTERADOS_DESDE', 'atualizado_desde'),
+        config.get('SOBREPOSICAO', 300),
+        config.get('LIMIT', 500),
+    )
+
+
+_CAMPOS_SINCRONIZADOS = [
+    'usuario', 'profissional_solicitante', 'data_solicitacao', 'data_devolucao',
+    'alterado_em', 'dados', 'sincronizado_em',
+]
+
+
+def _devolucao_do_registro(registro, campo_alteracao, sincronizado_em):
+    """Devolucao (não salva) a partir de um registro da API; None se não tiver código."""
+    codigo = registro.get('Codigo_Solicitacao') if isinstance(registro, dict) else None
+    if codigo in (None, ''):
+        print(f"AVISO: Devolução sem Codigo_Solicitacao ignorada: {registro}")
+        return None
+    return Devolucao(
+        codigo_solicitacao=str(codigo),
+        usuario=str(registro.get('Usuario') or '')[:255],
+        profissional_solicitante=str(registro.get('Profissional_Solicitante') or '')[:255],
+        data_solicitacao=_data(registro.get('Data_Solicitacao')),
+        data_devolucao=_data(registro.get('Data_Devolucao')),
+        alterado_em=_data_hora(registro.get(campo_alteracao)),
+        dados=registro,
+        sincronizado_em=sincronizado_em,
+    )
+
+
+def sincronizar_devolucoes(completa=False):
+    """
+    Traz para o espelho local as devoluções alteradas desde a última
+    sincronização (marca d'água), página a página, com upsert por
+    Codigo_Solicitacao.
+
+    - Incremental: envia à API o parâmetro PARAM_ALTERADOS_DESDE com a
+      marca d'água menos SOBREPOSICAO segundos (registros alterados durante
+      a sincronização anterior são relidos; o upsert é idempotente). A
+      marca d'água é o maior CAMPO_ALTERACAO recebido; se a API não envia
+      esse campo, toda sincronização é completa.
+    - Completa (`completa=True` ou primeira execução): lê tudo e apaga os
+      registros locais que não vieram mais da origem. A remoção é pulada
+      quando nada foi recebido ou quando o total_registros da API mudou
+      durante a paginação (a paginação por offset pode ter pulado
+      registros, que seriam apagados sem ter sumido da origem).
+
+    Erros da API externa são propagados (APIException); a marca d'água só
+    avança quando a sincronização termina, então a próxima recomeça dela.
+
+    Returns:
+        Resumo: {"recebidos": n, "paginas": n, "removidos": n, "completa": bool}
+    """
+    campo_alteracao, param_desde, sobreposicao, limite = _configuracao_sync()
+    estado = EstadoSincronizacao.atual()
+    completa = completa or estado.marca_dagua is None
+    inicio = timezone.now()
+
+    params = {'limit': limite}
+    if not completa:
+        params[param_desde] = (estado.marca_dagua - timedelta(seconds=sobreposicao)).isoformat()
+
+    marca_dagua = None if completa else estado.marca_dagua
+    recebidos = 0
+    pagina = 1
+    totais = set()
+    try:
+        while True:
+            params['page'] = pagina
+            resposta = _buscar_na_api(params) or {}
+            registros = resposta.get('devolucoes') or []
+
+            por_codigo = {}
+            for registro in registros:
+                devolucao = _devolucao_do_registro(registro, campo_alteracao, inicio)
+                if devolucao is None:
+                    continue
+                por_codigo[devolucao.codigo_solicitacao] = devolucao
+                if devolucao.alterado_em is not None and (marca_dagua is None or devolucao.alterado_em > marca_dagua):
+                    marca_dagua = devolucao.alterado_em
+
+            if por_codigo:
+                Devolucao.objects.bulk_create(
+                    list(por_codigo.values()),
+                    update_conflicts=True,
+                    unique_fields=['codigo_solicitacao'],
+                    update_fields=_CAMPOS_SINCRONIZADOS,
+                )
+            recebidos += len(por_codigo)
+
+            paginacao = resposta.get('pagination') or {}
+            totais.add(paginacao.get('total_registros'))
+            total_paginas = paginacao.get('total_paginas') or 0
+            if not registros or pagina >= total_paginas:
+                break
+            pagina += 1
+    except Exception as e:
+        EstadoSincronizacao.objects.filter(pk=estado.pk).update(ultimo_erro=str(e))
+        raise
+
+    removidos = 0
+    if completa:
+        if not recebidos:
+            print("AVISO: Sincronização completa sem nenhuma devolução recebida; remoção dos registros locais ignorada.")
+        elif len(totais) > 1:
+            print(f"AVISO: O total de devoluções da origem mudou durante a sincronização ({sorted(totais, key=str)}); "
+                  f"remoção dos registros locais ignorada até a próxima sincronização completa.")
+        else:
+            removidos, _ = Devolucao.objects.filter(sincronizado_em__lt=inicio).delete()
+
+    estado.marca_dagua = marca_dagua
+    estado.sincronizado_em = inicio
+    estado.ultimo_erro = ''
+    estado.save()
+    return {"recebidos": recebidos, "paginas": pagina, "removidos": removidos, "completa": completa}
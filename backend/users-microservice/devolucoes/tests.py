@@ -1,3 +1,595 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import io
+import json
+import socket
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import clear_url_caches, resolve
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+
+from authentication.jwt_rapido import gerar_tokens
+from authentication.models import User
+from users_api import clientes_http
+from . import services, urls as devolucoes_urls
+from .models import Devolucao, EstadoSincronizacao
+from .services import (
+    TAMANHO_PEDACO, CacheDevolucoes, RespostaBruta, ServiceUnavailable, abrir_devolucoes_brutas,
+    abrir_devolucoes_brutas_async, listar_devolucoes_locais, sincronizar_devolucoes,
+)
+from .views import CABECALHO_SINCRONIZACAO, DevolucaoViewSet, _repassar, listar_devolucoes_async
+
+
+def _registro(codigo, atualizacao='2025-01-10T10:00:00+00:00', **campos):
+    registro = {
+        'Codigo_Solicitacao': codigo,
+        'Usuario': f'usuario {codigo}',
+        'Profissional_Solicitante': 'Dra. Ana',
+        'Data_Solicitacao': '2025-01-02',
+        'Data_Devolucao': '10/01/2025',
+        'Data_Atualizacao': atualizacao,
+    }
+    registro.update(campos)
+    return registro
+
+
+class _ApiFalsa:
+    """Substitui `_buscar_na_api`: devolve as páginas informadas e guarda os params de cada chamada."""
+
+    def __init__(self, paginas, totais=None):
+        self.paginas = paginas
+        self.totais = totais
+        self.chamadas = []
+
+    def __call__(self, params):
+        self.chamadas.append(dict(params))
+        indice = params['page'] - 1
+        registros = self.paginas[indice] if indice < len(self.paginas) else []
+        total = self.totais[indice] if self.totais else sum(len(p) for p in self.paginas)
+        return {
+            'devolucoes': registros,
+            'pagination': {'page': params['page'], 'total_registros': total, 'total_paginas': len(self.paginas)},
+        }
+
+
+@override_settings(DEVOLUCOES_SYNC={'CAMPO_ALTERACAO': 'Data_Atualizacao', 'PARAM_ALTERADOS_DESDE': 'atualizado_desde',
+                                    'SOBREPOSICAO': 300, 'LIMIT': 2})
+class SincronizacaoDevolucoesTests(TestCase):
+    """Sincronização do espelho local: marca d'água, upsert e remoção na sincronização completa."""
+
+    def _sincronizar(self, api, completa=False):
+        with mock.patch('devolucoes.services._buscar_na_api', api):
+            return sincronizar_devolucoes(completa=completa)
+
+    def test_primeira_sincronizacao_e_completa_e_grava_a_marca_dagua(self):
+        api = _ApiFalsa([
+            [_registro(1, '2025-01-10T10:00:00+00:00'), _registro(2, '2025-01-12T08:00:00+00:00')],
+            [_registro(3, '2025-01-11T09:00:00+00:00'), {'Usuario': 'sem código'}],
+        ])
+        resumo = self._sincronizar(api)
+
+        self.assertEqual(resumo, {"recebidos": 3, "paginas": 2, "removidos": 0, "completa": True})
+        self.assertEqual(api.chamadas, [{'limit': 2, 'page': 1}, {'limit': 2, 'page': 2}])
+        devolucao = Devolucao.objects.get(codigo_solicitacao='1')
+        self.assertEqual((devolucao.data_solicitacao, devolucao.data_devolucao), (date(2025, 1, 2), date(2025, 1, 10)))
+        self.assertEqual(devolucao.dados['Usuario'], 'usuario 1')
+        estado = EstadoSincronizacao.atual()
+        self.assertEqual(estado.marca_dagua, datetime(2025, 1, 12, 8, tzinfo=dt_timezone.utc))
+        self.assertIsNotNone(estado.sincronizado_em)
+
+    def test_incremental_envia_a_marca_dagua_com_sobreposicao_e_faz_upsert(self):
+        self._sincronizar(_ApiFalsa([[_registro(1), _registro(2)]]))
+        api = _ApiFalsa([[_registro(1, '2025-01-15T10:00:00+00:00', Usuario='alterado')]])
+        resumo = self._sincronizar(api)
+
+        self.assertFalse(resumo['completa'])
+        desde = datetime(2025, 1, 10, 10, tzinfo=dt_timezone.utc) - timedelta(seconds=300)
+        self.assertEqual(api.chamadas, [{'limit': 2, 'atualizado_desde': desde.isoformat(), 'page': 1}])
+        self.assertEqual(Devolucao.objects.count(), 2)
+        self.assertEqual(Devolucao.objects.get(codigo_solicitacao='1').usuario, 'alterado')
+        self.assertEqual(EstadoSincronizacao.atual().marca_dagua, datetime(2025, 1, 15, 10, tzinfo=dt_timezone.utc))
+
+    def test_completa_remove_os_registros_que_sumiram_da_origem(self):
+        self._sincronizar(_ApiFalsa([[_registro(1), _registro(2)]]))
+        resumo = self._sincronizar(_ApiFalsa([[_registro(2)]]), completa=True)
+        self.assertEqual(resumo['removidos'], 1)
+        self.assertEqual(list(Devolucao.objects.values_list('codigo_solicitacao', flat=True)), ['2'])
+
+    def test_completa_sem_registros_recebidos_nao_remove(self):
+        self._sincronizar(_ApiFalsa([[_registro(1), _registro(2)]]))
+        resumo = self._sincronizar(_ApiFalsa([[]]), completa=True)
+        self.assertEqual(resumo['removidos'], 0)
+        self.assertEqual(Devolucao.objects.count(), 2)
+
+    def test_completa_com_total_alterado_durante_a_paginacao_nao_remove(self):
+        self._sincronizar(_ApiFalsa([[_registro(1), _registro(2)], [_registro(3)]]))
+        # Um registro novo na primeira página empurrou o 3 para uma página já lida
+        api = _ApiFalsa([[_registro(4), _registro(1)], [_registro(2)]], totais=[3, 4])
+        resumo = self._sincronizar(api, completa=True)
+        self.assertEqual(resumo['removidos'], 0)
+        self.assertEqual(Devolucao.objects.count(), 4)
+
+    def test_erro_da_api_nao_avanca_a_marca_dagua(self):
+        self._sincronizar(_ApiFalsa([[_registro(1)]]))
+        marca = EstadoSincronizacao.atual().marca_dagua
+        with mock.patch('devolucoes.services._buscar_na_api', side_effect=APIException('fora do ar')):
+            with self.assertRaises(APIException):
+                sincronizar_devolucoes()
+        estado = EstadoSincronizacao.atual()
+        self.assertEqual((estado.marca_dagua, estado.ultimo_erro), (marca, 'fora do ar'))
+
+    def test_comando_faz_uma_completa_a_cada_n_ciclos(self):
+        class _Parar(Exception):
+            pass
+
+        ciclos = []
+
+        def sincronizar(completa=False):
+            ciclos.append(completa)
+            if len(ciclos) == 4:
+                raise APIException('fora do ar')
+            return self._sincronizar(_ApiFalsa([[_registro(1)]]), completa=completa)
+
+        comando = 'devolucoes.management.commands.sincronizar_devolucoes'
+        saida = io.StringIO()
+        # close_old_connections fecharia a conexão da transação do TestCase
+        with mock.patch(f'{comando}.sincronizar_devolucoes', sincronizar), \
+                mock.patch(f'{comando}.close_old_connections'), \
+                mock.patch(f'{comando}.time.sleep', side_effect=[None] * 7 + [_Parar()]):
+            with self.assertRaises(_Parar):
+                call_command('sincronizar_devolucoes', '--intervalo', '60', '--completa-a-cada', '3', stdout=saida)
+
+        # A primeira é completa por falta de marca d'água; a completa que falhou é refeita no ciclo seguinte
+        self.assertEqual(ciclos, [False, False, False, True, True, False, False, True])
+        self.assertEqual(saida.getvalue().count('(completa)'), 3)
+        self.assertIn('fora do ar', saida.getvalue())
+
+
+class ListagemDevolucoesLocaisTests(TestCase):
+    """Listagem do espelho local com o contrato de filtros e paginação da API externa."""
+
+    def setUp(self):
+        with mock.patch('devolucoes.services._buscar_na_api', _ApiFalsa([[
+            _registro(1, Usuario='João Silva', Data_Devolucao='2025-01-10'),
+            _registro(2, Usuario='Maria', Profissional_Solicitante='Dr. Beto', Data_Devolucao='2025-02-10'),
+            _registro(3, Usuario='joão souza', Data_Solicitacao='2025-03-01', Data_Devolucao='2025-03-10'),
+        ]])):
+            sincronizar_devolucoes()
+
+    def _codigos(self, params):
+        dados, _ = listar_devolucoes_locais(params)
+        return [registro['Codigo_Solicitacao'] for registro in dados['devolucoes']]
+
+    def test_sem_sincronizacao_retorna_none(self):
+        EstadoSincronizacao.objects.all().delete()
+        self.assertEqual(listar_devolucoes_locais({}), (None, None))
+
+    def test_lista_na_ordem_padrao_com_paginacao(self):
+        dados, sincronizado_em = listar_devolucoes_locais({'page': '2', 'limit': '2'})
+        self.assertEqual([r['Codigo_Solicitacao'] for r in dados['devolucoes']], [1])
+        self.assertEqual(dados['pagination'], {"page": 2, "limit": 2, "total_registros": 3, "total_paginas": 2})
+        self.assertEqual(sincronizado_em, EstadoSincronizacao.atual().sincronizado_em)
+        self.assertEqual(self._codigos({}), [3, 2, 1])
+
+    def test_filtros_de_texto(self):
+        self.assertEqual(self._codigos({'usuario': 'joão'}), [3, 1])
+        self.assertEqual(self._codigos({'profissional_solicitante': 'beto'}), [2])
+        self.assertEqual(self._codigos({'usuario': '  '}), [3, 2, 1])
+
+    def test_filtros_de_data(self):
+        self.assertEqual(self._codigos({'data_devolucao_inicio': '2025-02-01'}), [3, 2])
+        self.assertEqual(self._codigos({'data_devolucao_inicio': '2025-02-01', 'data_devolucao_fim': '2025-02-28'}), [2])
+        self.assertEqual(self._codigos({'data_solicitacao_fim': '15/01/2025'}), [2, 1])
+
+    def test_parametros_invalidos(self):
+        for params in ({'page': '0'}, {'limit': '501'}, {'limit': 'x'}, {'data_devolucao_inicio': '2025-13-01'}):
+            with self.subTest(params=params):
+                with self.assertRaises(APIException) as contexto:
+                    listar_devolucoes_locais(params)
+                self.assertEqual(contexto.exception.status_code, 400)
+
+
+class _Relogio:
+    """time.monotonic controlável."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+class _EventoContado(threading.Event):
+    """Event que conta quantas threads estão esperando por ele."""
+
+    def __init__(self):
+        super().__init__()
+        self.esperando = 0
+
+    def wait(self, timeout=None):
+        self.esperando += 1
+        return super().wait(timeout)
+
+
+class _ChamadaContada(services._Chamada):
+
+    def __init__(self):
+        super().__init__()
+        self.concluida = _EventoContado()
+
+
+@override_settings(DEVOLUCOES_CACHE={'TTL': 10, 'STALE_WHILE_REVALIDATE': 0, 'STALE_IF_ERROR': 0, 'MAX_ITENS': 2})
+class CacheDevolucoesTests(SimpleTestCase):
+    """Cache de respostas da API de devoluções: validade, limite de itens, chave por usuário e single-flight."""
+
+    def setUp(self):
+        self.chamadas = []
+        self.cache = CacheDevolucoes(self._buscar, self._buscar_async)
+        self.relogio = _Relogio()
+        patcher = mock.patch('devolucoes.services.time.monotonic', self.relogio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _buscar(self, params):
+        self.chamadas.append(params)
+        return {'devolucoes': [], 'chamada': len(self.chamadas)}
+
+    async def _buscar_async(self, params):
+        self.chamadas.append(params)
+        # Cede o loop algumas vezes (o relógio do loop está parado pelo _Relogio)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        return {'devolucoes': [], 'chamada': len(self.chamadas)}
+
+    def test_resposta_servida_do_cache_ate_expirar(self):
+        self.assertEqual(self.cache.obter({'page': '1'})['chamada'], 1)
+        self.relogio.agora += 10
+        self.assertEqual(self.cache.obter({'page': 1, 'usuario': ' '})['chamada'], 1)
+        self.relogio.agora += 0.5
+        self.assertEqual(self.cache.obter({'page': '1'})['chamada'], 2)
+        self.assertEqual(self.chamadas, [{'page': '1'}, {'page': '1'}])
+
+    @override_settings(DEVOLUCOES_CACHE={'TTL': 10, 'STALE_WHILE_REVALIDATE': 0, 'STALE_IF_ERROR': 30, 'MAX_ITENS': 2})
+    def test_resposta_expirada_so_e_servida_se_a_api_falhar_dentro_do_stale_if_error(self):
+        self.cache.obter({'page': '1'})
+        self.relogio.agora += 20
+        with mock.patch.object(self.cache, '_buscar', side_effect=ServiceUnavailable()):
+            self.assertEqual(self.cache.obter({'page': '1'})['chamada'], 1)
+            with mock.patch.object(self.cache, '_buscar', side_effect=APIException('inválido', code=400)) as buscar:
+                buscar.side_effect.status_code = 400
+                with self.assertRaises(APIException):
+                    self.cache.obter({'page': '1'})
+            self.relogio.agora += 21
+            with self.assertRaises(ServiceUnavailable):
+                self.cache.obter({'page': '1'})
+
+    def test_limite_de_itens_descarta_o_menos_usado(self):
+        self.cache.obter({'page': '1'})
+        self.cache.obter({'page': '2'})
+        self.cache.obter({'page': '1'})
+        self.cache.obter({'page': '3'})
+        self.assertEqual(len(self.chamadas), 3)
+        self.cache.obter({'page': '1'})
+        self.assertEqual(len(self.chamadas), 3)
+        self.cache.obter({'page': '2'})
+        self.assertEqual(self.chamadas[-1], {'page': '2'})
+        self.assertEqual(len(self.chamadas), 4)
+
+    def test_cache_separado_por_usuario(self):
+        self.assertEqual(self.cache.obter({'page': '1'}, usuario_id=1)['chamada'], 1)
+        self.assertEqual(self.cache.obter({'page': '1'}, usuario_id=2)['chamada'], 2)
+        self.assertEqual(self.cache.obter({'page': '1'}, usuario_id=1)['chamada'], 1)
+        self.assertEqual(self.cache.obter({'page': '1'}, usuario_id=2)['chamada'], 2)
+
+    @override_settings(DEVOLUCOES_CACHE={'TTL': 0})
+    def test_requisicoes_simultaneas_compartilham_a_chamada(self):
+        iniciou, liberar = threading.Event(), threading.Event()
+
+        def _buscar_lento(params):
+            iniciou.set()
+            liberar.wait(5)
+            return self._buscar(params)
+
+        self.cache._buscar = _buscar_lento
+        resultados = []
+        with mock.patch.object(services, '_Chamada', _ChamadaContada):
+            threads = [threading.Thread(target=lambda: resultados.append(self.cache.obter({'page': '1'})))
+                       for _ in range(4)]
+            threads[0].start()
+            self.assertTrue(iniciou.wait(5))
+            for thread in threads[1:]:
+                thread.start()
+            chamada = self.cache._em_andamento[self.cache.chave({'page': '1'}, None)]
+            for _ in range(500):
+                if chamada.concluida.esperando == 3:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(chamada.concluida.esperando, 3)
+            liberar.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(self.chamadas), 1)
+        self.assertEqual([r['chamada'] for r in resultados], [1, 1, 1, 1])
+        self.assertEqual(self.cache._em_andamento, {})
+
+    @override_settings(DEVOLUCOES_CACHE={'TTL': 0})
+    def test_erro_da_chamada_compartilhada_chega_a_todas_as_requisicoes(self):
+        def _buscar_com_erro(params):
+            self.chamadas.append(params)
+            raise ServiceUnavailable()
+
+        self.cache._buscar = _buscar_com_erro
+        chave = self.cache.chave({'page': '1'}, None)
+        chamada = self.cache._em_andamento[chave] = services._Chamada()
+        erros = []
+
+        def _seguidor():
+            try:
+                self.cache.obter({'page': '1'})
+            except ServiceUnavailable as e:
+                erros.append(e)
+
+        seguidor = threading.Thread(target=_seguidor)
+        seguidor.start()
+        # O seguidor espera a chamada em andamento, sem ir à API
+        seguidor.join(0.05)
+        self.assertTrue(seguidor.is_alive())
+        chamada.erro = ServiceUnavailable()
+        del self.cache._em_andamento[chave]
+        chamada.concluida.set()
+        seguidor.join(5)
+        self.assertEqual((len(erros), self.chamadas), (1, []))
+
+    @override_settings(DEVOLUCOES_CACHE={'TTL': 0})
+    def test_requisicoes_simultaneas_async_compartilham_a_chamada(self):
+        async def _obter_varias():
+            return await asyncio.gather(*(self.cache.obter_async({'page': '1'}) for _ in range(4)))
+
+        resultados = async_to_sync(_obter_varias)()
+        self.assertEqual(len(self.chamadas), 1)
+        self.assertEqual([r['chamada'] for r in resultados], [1, 1, 1, 1])
+        self.assertEqual(self.cache._em_andamento_async, {})
+        # Sem chamada em andamento (e TTL 0), a próxima requisição vai à API
+        async_to_sync(self.cache.obter_async)({'page': '1'})
+        self.assertEqual(len(self.chamadas), 2)
+
+
+class _ApiDevolucoesFalsa:
+    """
+    API de devoluções falsa em uma porta local: responde qualquer GET com
+    `corpo` (comprimido com gzip se `comprimir=True`) e `status` após `atraso`
+    segundos, e guarda os caminhos recebidos.
+    """
+
+    def __init__(self, corpo=b'{}', status=200, atraso=0.0, comprimir=False):
+        self.corpo = corpo
+        self.status = status
+        self.atraso = atraso
+        self.comprimir = comprimir
+        self.caminhos = []
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                api.caminhos.append(self.path)
+                time.sleep(api.atraso)
+                corpo = gzip.compress(api.corpo) if api.comprimir else api.corpo
+                self.send_response(api.status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(corpo)))
+                if api.comprimir:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.end_headers()
+                try:
+                    self.wfile.write(corpo)
+                except (BrokenPipeError, ConnectionResetError):
+                    # O cliente desistiu (teste de timeout)
+                    pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.servidor.server_port}/devolucoes"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class DevolucoesBrutasTests(TestCase):
+    """
+    Repasse direto da listagem (DEVOLUCOES_REPASSE_DIRETO), nas versões
+    síncrona e assíncrona, contra uma API de devoluções falsa.
+    """
+    CORPO = json.dumps({'devolucoes': [{'Usuario': 'ação ' * 20, 'Codigo': i} for i in range(1500)]}).encode()
+
+    def setUp(self):
+        self.apis = []
+        cliente = clientes_http.cliente('devolucoes')
+        timeout_original = cliente.timeout_leitura
+        cliente.timeout_leitura = 0.2
+        self.addCleanup(setattr, cliente, 'timeout_leitura', timeout_original)
+
+    def tearDown(self):
+        for api in self.apis:
+            api.fechar()
+
+    def _api(self, **kwargs):
+        api = _ApiDevolucoesFalsa(**kwargs)
+        self.apis.append(api)
+        return api
+
+    @staticmethod
+    def _abrir_async(params):
+        async def _abrir_e_ler():
+            bruta = await abrir_devolucoes_brutas_async(params)
+            return bruta, [pedaco async for pedaco in bruta.pedacos]
+        return async_to_sync(_abrir_e_ler)()
+
+    def _abrir(self, api, versao, params=None):
+        """(RespostaBruta, pedaços lidos) pela versão síncrona ou assíncrona."""
+        with override_settings(DEVOLUCOES_API_URL=api.url):
+            if versao == 'async':
+                return self._abrir_async(params or {})
+            bruta = abrir_devolucoes_brutas(params or {})
+            return bruta, list(bruta.pedacos)
+
+    def _erro(self, api, versao):
+        with self.assertRaises(APIException) as contexto:
+            self._abrir(api, versao)
+        return contexto.exception
+
+    def test_repassa_o_corpo_em_pedacos_com_o_content_length(self):
+        for versao in ('sync', 'async'):
+            with self.subTest(versao=versao):
+                api = self._api(corpo=self.CORPO)
+                bruta, pedacos = self._abrir(api, versao, {'page': '2', 'usuario': 'joão'})
+                self.assertGreater(len(self.CORPO), 2 * TAMANHO_PEDACO)
+                self.assertEqual(b''.join(pedacos), self.CORPO)
+                self.assertTrue(all(len(pedaco) <= TAMANHO_PEDACO for pedaco in pedacos))
+                self.assertEqual(bruta.content_type, 'application/json; charset=utf-8')
+                self.assertEqual(bruta.tamanho, str(len(self.CORPO)))
+                self.assertEqual(api.caminhos, ['/devolucoes?page=2&usuario=jo%C3%A3o'])
+
+    def test_corpo_com_content_encoding_nao_repassa_o_content_length(self):
+        for versao in ('sync', 'async'):
+            with self.subTest(versao=versao):
+                bruta, pedacos = self._abrir(self._api(corpo=self.CORPO, comprimir=True), versao)
+                self.assertEqual(b''.join(pedacos), self.CORPO)
+                self.assertIsNone(bruta.tamanho)
+
+    def test_resposta_de_erro_vira_api_exception_antes_do_corpo(self):
+        for versao in ('sync', 'async'):
+            for status, corpo, mensagem in (
+                (404, b'{"message": "Nada aqui"}', 'Nada aqui'),
+                (500, b'<html>erro</html>', 'Erro na comunicação com o serviço externo.'),
+            ):
+                with self.subTest(versao=versao, status=status):
+                    erro = self._erro(self._api(corpo=corpo, status=status), versao)
+                    self.assertEqual((erro.status_code, str(erro.detail)), (status, mensagem))
+
+    def test_timeout_vira_503(self):
+        for versao in ('sync', 'async'):
+            with self.subTest(versao=versao):
+                erro = self._erro(self._api(atraso=0.5), versao)
+                self.assertIsInstance(erro, ServiceUnavailable)
+                self.assertIn('demorou muito', str(erro.detail))
+
+    def test_falha_de_conexao_vira_503(self):
+        # Porta sem ninguém escutando
+        with socket.socket() as livre:
+            livre.bind(('127.0.0.1', 0))
+            porta = livre.getsockname()[1]
+        api = mock.Mock(url=f"http://127.0.0.1:{porta}/devolucoes")
+        for versao in ('sync', 'async'):
+            with self.subTest(versao=versao):
+                erro = self._erro(api, versao)
+                self.assertIsInstance(erro, ServiceUnavailable)
+                self.assertIn('conectar', str(erro.detail))
+
+    def test_repassar_monta_a_resposta_em_streaming(self):
+        response = _repassar(RespostaBruta(iter([b'{"a":', b' 1}']), 'application/json', '9'))
+        self.assertEqual((response.status_code, response['Content-Type'], response['Content-Length']),
+                         (200, 'application/json', '9'))
+        self.assertEqual(b''.join(response.streaming_content), b'{"a": 1}')
+
+        async def _pedacos():
+            yield b'{}'
+
+        response = _repassar(RespostaBruta(_pedacos(), 'application/json'))
+        self.assertTrue(response.is_async)
+        self.assertFalse(response.has_header('Content-Length'))
+
+    def test_listagem_repassa_os_bytes_da_api_externa(self):
+        api = self._api(corpo=self.CORPO)
+        usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        client = APIClient()
+        client.force_authenticate(usuario)
+        with override_settings(DEVOLUCOES_API_URL=api.url, DEVOLUCOES_REPASSE_DIRETO=True):
+            response = client.get('/api/devolucoes/', {'page': '1'})
+            self.assertEqual(response['Content-Length'], str(len(self.CORPO)))
+            self.assertEqual(b''.join(response.streaming_content), self.CORPO)
+            api.status = 404
+            response = client.get('/api/devolucoes/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ListagemDevolucoesAsyncTests(TestCase):
+    """View assíncrona da listagem (USE_ASYNC_VIEWS=True): autenticação, API externa e espelho local."""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+
+    def _get(self, params=None, autorizacao=None):
+        headers = {}
+        if autorizacao is None:
+            autorizacao = f'Bearer {gerar_tokens(self.usuario).access_token}'
+        if autorizacao:
+            headers['HTTP_AUTHORIZATION'] = autorizacao
+        return async_to_sync(listar_devolucoes_async)(RequestFactory().get('/', params or {}, **headers))
+
+    def test_sem_token_ou_com_token_invalido_responde_401(self):
+        buscar = mock.AsyncMock()
+        with mock.patch('devolucoes.views.buscar_devolucoes_externas_async', buscar):
+            for autorizacao in ('', 'Bearer invalido'):
+                with self.subTest(autorizacao=autorizacao):
+                    response = self._get(autorizacao=autorizacao)
+                    self.assertEqual(response.status_code, 401)
+                    self.assertIn('Bearer', response['WWW-Authenticate'])
+        buscar.assert_not_called()
+
+    def test_lista_da_api_externa_com_o_cache_do_usuario(self):
+        dados = {'devolucoes': [_registro(1)], 'pagination': {'page': 2}}
+        buscar = mock.AsyncMock(return_value=dados)
+        with mock.patch('devolucoes.views.buscar_devolucoes_externas_async', buscar):
+            response = self._get({'page': '2'})
+        self.assertEqual((response.status_code, json.loads(response.content)), (200, dados))
+        buscar.assert_awaited_once_with({'page': '2'}, usuario_id=self.usuario.pk)
+
+    def test_erro_da_api_externa_mantem_o_status(self):
+        with mock.patch('devolucoes.views.buscar_devolucoes_externas_async',
+                        mock.AsyncMock(side_effect=ServiceUnavailable('fora do ar'))):
+            response = self._get()
+        self.assertEqual((response.status_code, json.loads(response.content)), (503, {'detail': 'fora do ar'}))
+
+    @override_settings(DEVOLUCOES_ESPELHO=True, DEVOLUCOES_SYNC={'CAMPO_ALTERACAO': 'Data_Atualizacao',
+                                                                 'PARAM_ALTERADOS_DESDE': 'atualizado_desde',
+                                                                 'SOBREPOSICAO': 300, 'LIMIT': 2})
+    def test_lista_do_espelho_local(self):
+        with mock.patch('devolucoes.services._buscar_na_api', _ApiFalsa([[_registro(1), _registro(2)]])):
+            sincronizar_devolucoes()
+        response = self._get({'limit': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['devolucoes']), 1)
+        self.assertEqual(response[CABECALHO_SINCRONIZACAO], EstadoSincronizacao.atual().sincronizado_em.isoformat())
+
+
+class RotasAsyncTests(SimpleTestCase):
+    """Com USE_ASYNC_VIEWS=True, a listagem vem antes do router e usa a view assíncrona."""
+
+    def _recarregar_urls(self, usar_async):
+        with override_settings(USE_ASYNC_VIEWS=usar_async):
+            importlib.reload(devolucoes_urls)
+        clear_url_caches()
+        self.addCleanup(clear_url_caches)
+        self.addCleanup(importlib.reload, devolucoes_urls)
+
+    def test_com_use_async_views_a_listagem_vai_para_a_view_async(self):
+        self._recarregar_urls(True)
+        self.assertIs(resolve('/devolucoes/', urlconf=devolucoes_urls).func, listar_devolucoes_async)
+
+    def test_sem_use_async_views_o_viewset_atende(self):
+        self._recarregar_urls(False)
+        self.assertIs(resolve('/devolucoes/', urlconf=devolucoes_urls).func.cls, DevolucaoViewSet)
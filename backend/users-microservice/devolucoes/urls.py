@@ -1,10 +1,19 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DevolucaoViewSet
+from .views import DevolucaoViewSet, listar_devolucoes_async
 
 router = DefaultRouter()
 router.register(r'devolucoes', DevolucaoViewSet, basename='devolucoes')
 
-urlpatterns = [
+urlpatterns = []
+
+# Com USE_ASYNC_VIEWS=True (servidor ASGI), a listagem usa a view assíncrona.
+if getattr(settings, 'USE_ASYNC_VIEWS', False):
+    urlpatterns += [
+        path('devolucoes/', listar_devolucoes_async),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
 ]
\ No newline at end of file
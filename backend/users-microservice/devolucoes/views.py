@@ -1,11 +1,50 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
-from .services import buscar_devolucoes_externas
+from authentication.async_auth import jwt_required_async
+from .services import (
+    abrir_devolucoes_brutas,
+    abrir_devolucoes_brutas_async,
+    buscar_devolucoes_externas,
+    buscar_devolucoes_externas_async,
+    espelho_ativo,
+    listar_devolucoes_locais,
+    repasse_ativo,
+)
+
+# Instante até o qual os dados do espelho local estão atualizados (ISO 8601)
+CABECALHO_SINCRONIZACAO = 'X-Dados-Sincronizados-Em'
+
+
+def _com_sincronizacao(response, sincronizado_em):
+    if sincronizado_em is not None:
+        response[CABECALHO_SINCRONIZACAO] = sincronizado_em.isoformat()
+    return response
+
+
+def _repassar(bruta):
+    # Os bytes da API externa vão direto para o cliente, com o Content-Type original
+    response = StreamingHttpResponse(bruta.pedacos, content_type=bruta.content_type, status=status.HTTP_200_OK)
+    if bruta.tamanho is not None:
+        response['Content-Length'] = bruta.tamanho
+    return response
 
 class DevolucaoViewSet(viewsets.ViewSet):
     """
     Proxy reverso para a API de Devoluções.
     O Frontend chama este endpoint, que busca os dados externamente.
+
+    Com settings.DEVOLUCOES_ESPELHO, a listagem é servida do espelho local
+    (ver `sincronizar_devolucoes`), com o mesmo contrato de query params e
+    de resposta, e o cabeçalho X-Dados-Sincronizados-Em informa até quando
+    os dados estão atualizados. Enquanto o espelho não foi sincronizado
+    nenhuma vez, a API externa continua sendo usada.
+
+    Com settings.DEVOLUCOES_REPASSE_DIRETO, a resposta da API externa é
+    repassada byte a byte, sem decodificar e recodificar o JSON (e sem o
+    cache de respostas).
     """
     permission_classes = [permissions.IsAuthenticated]
 
@@ -18,8 +57,17 @@ class DevolucaoViewSet(viewsets.ViewSet):
             # Pega todos os parâmetros da query string (ex: ?page=1&limit=50&usuario=joao)
             # request.query_params retorna um QueryDict, transformamos em dict padrão
             params = request.query_params.dict()
+
+            if espelho_ativo():
+                data, sincronizado_em = listar_devolucoes_locais(params)
+                if sincronizado_em is not None:
+                    return _com_sincronizacao(Response(data, status=status.HTTP_200_OK), sincronizado_em)
+
+            if repasse_ativo():
+                return _repassar(abrir_devolucoes_brutas(params))
             
-            data = buscar_devolucoes_externas(params)
+            # O cache de respostas é separado por usuário
+            data = buscar_devolucoes_externas(params, usuario_id=request.user.pk)
             return Response(data, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -31,4 +79,35 @@ class DevolucaoViewSet(viewsets.ViewSet):
             return Response(
                 {"detail": f"Erro interno ao processar devoluções: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+@require_GET
+@jwt_required_async
+async def listar_devolucoes_async(request):
+    """
+    GET /api/devolucoes/ (versão async de DevolucaoViewSet.list)
+    Usada quando USE_ASYNC_VIEWS=True (ver devolucoes/urls.py).
+    """
+    try:
+        params = request.GET.dict()
+
+        if espelho_ativo():
+            data, sincronizado_em = await sync_to_async(listar_devolucoes_locais)(params)
+            if sincronizado_em is not None:
+                return _com_sincronizacao(JsonResponse(data, status=status.HTTP_200_OK), sincronizado_em)
+
+        if repasse_ativo():
+            return _repassar(await abrir_devolucoes_brutas_async(params))
+
+        data = await buscar_devolucoes_externas_async(params, usuario_id=request.user.pk)
+        return JsonResponse(data, status=status.HTTP_200_OK, safe=False)
+
+    except Exception as e:
+        if hasattr(e, 'status_code'):
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+
+        return JsonResponse(
+            {"detail": f"Erro interno ao processar devoluções: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from fillsense.services.gerar_justificativa_service import aquecer_prefixo, carregar_modelo
+from fillsense.services.procedimentos_service import catalogo
+
+
+class Command(BaseCommand):
+    """
+    Aquece o Ollama antes do tráfego real: carrega o modelo (mantido em
+    memória por OLLAMA_KEEP_ALIVE) e processa o prefixo do prompt de cada
+    nota técnica do catálogo, reduzindo o tempo até o primeiro token das
+    primeiras gerações após um deploy ou reinício do Ollama.
+    """
+    help = 'Carrega o modelo no Ollama e pré-processa o prompt de cada nota técnica.'
+
+    def add_arguments(self, parser):
+        """Adiciona os argumentos que o comando aceitará na linha de comando."""
+        parser.add_argument(
+            '--sem-prefixos',
+            action='store_true',
+            help='Apenas carrega o modelo, sem pré-processar as notas técnicas.'
+        )
+
+    def handle(self, *args, **kwargs):
+        """A lógica principal do comando."""
+        inicio = time.monotonic()
+        try:
+            servidores = carregar_modelo()
+        except ConnectionError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Modelo {settings.OLLAMA_MODEL} carregado em {servidores} servidor(es) em {time.monotonic() - inicio:.1f}s."
+        ))
+
+        if kwargs['sem_prefixos']:
+            return
+
+        # Um aquecimento por nota técnica: procedimentos da mesma NT compartilham os critérios
+        notas = {}
+        for compilado in catalogo.obter().compilados.values():
+            notas.setdefault(compilado.nota.requisitos, compilado)
+
+        aquecidas = 0
+        for requisitos, compilado in notas.items():
+            inicio = time.monotonic()
+            try:
+                aquecer_prefixo(compilado.proc_label, requisitos)
+            except ConnectionError as e:
+                self.stdout.write(self.style.WARNING(f"NT {compilado.nt_id or '-'}: {e}"))
+                continue
+            aquecidas += 1
+            self.stdout.write(f"NT {compilado.nt_id or '-'} aquecida em {time.monotonic() - inicio:.1f}s.")
+
+        self.stdout.write(self.style.SUCCESS(f"{aquecidas} de {len(notas)} nota(s) técnica(s) aquecida(s)."))
@@ -0,0 +1,51 @@
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from fillsense.services.jobs_justificativa_service import processar_fila
+
+
+class Command(BaseCommand):
+    """
+    Worker que consome a fila de jobs de geração de justificativa.
+    Vários processos podem rodar ao mesmo tempo: a reserva usa SKIP LOCKED.
+    """
+    help = 'Processa a fila de jobs de geração de justificativa por IA.'
+
+    def add_arguments(self, parser):
+        """Adiciona os argumentos que o comando aceitará na linha de comando."""
+        parser.add_argument(
+            '--concorrencia',
+            type=int,
+            default=getattr(settings, 'JOBS_JUSTIFICATIVA_CONCORRENCIA', 2),
+            help='Número máximo de gerações simultâneas neste worker.'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Intervalo, em segundos, entre consultas à fila quando ela está vazia.'
+        )
+
+    def handle(self, *args, **kwargs):
+        """A lógica principal do comando."""
+        concorrencia = kwargs['concorrencia']
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        parar = threading.Event()
+
+        # Encerra de forma limpa: termina as gerações em andamento e sai
+        def _encerrar(signum, frame):
+            self.stdout.write(self.style.WARNING("Encerrando o worker após os jobs em andamento..."))
+            parar.set()
+
+        signal.signal(signal.SIGTERM, _encerrar)
+        signal.signal(signal.SIGINT, _encerrar)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker '{worker_id}' processando jobs de justificativa (concorrência {concorrencia})."
+        ))
+        processar_fila(worker_id, concorrencia, kwargs['intervalo'], parar)
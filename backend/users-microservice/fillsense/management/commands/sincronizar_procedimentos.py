@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from fillsense.services.procedimentos_service import (
+    carregar_procedimentos_da_fonte,
+    sincronizar_procedimentos,
+)
+
+
+class Command(BaseCommand):
+    """
+    Sincroniza a tabela de Procedimentos com a fonte (arquivos mock ou API real).
+    """
+    help = 'Sincroniza a tabela de Procedimentos com a fonte, uma vez ou periodicamente.'
+
+    def add_arguments(self, parser):
+        """Adiciona os argumentos que o comando aceitará na linha de comando."""
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Repete a sincronização a cada N segundos (0 executa uma única vez).'
+        )
+        parser.add_argument(
+            '--tamanho-lote',
+            type=int,
+            default=None,
+            help='Quantidade de procedimentos por lote/transação.'
+        )
+
+    def handle(self, *args, **kwargs):
+        """A lógica principal do comando."""
+        intervalo = kwargs['intervalo']
+
+        while True:
+            try:
+                procs_list = carregar_procedimentos_da_fonte()
+                if procs_list:
+                    resumo = sincronizar_procedimentos(procs_list, kwargs['tamanho_lote'])
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Procedimentos sincronizados: {resumo['criados']} criado(s), "
+                        f"{resumo['atualizados']} atualizado(s), {resumo['inalterados']} inalterado(s), "
+                        f"{resumo['invalidos']} inválido(s)."
+                    ))
+                else:
+                    self.stdout.write(self.style.WARNING("Nenhum procedimento obtido da fonte; nada a sincronizar."))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Ocorreu um erro inesperado: {e}"))
+
+            if not intervalo:
+                break
+            time.sleep(intervalo)
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fillsense', '0011_backfill_procedimento_fk'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobJustificativa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('procedimento', models.CharField(help_text='Nome do procedimento enviado à IA.', max_length=255)),
+                ('clinico_text', models.TextField(help_text='Informações clínicas do paciente enviadas à IA.')),
+                ('nota_tecnica', models.JSONField(default=dict, help_text="Nota técnica no formato de 'Categorias' esperado pelo serviço de IA.")),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EM_EXECUCAO', 'Em Execução'), ('CONCLUIDO', 'Concluído'), ('FALHOU', 'Falhou'), ('CANCELADO', 'Cancelado')], default='PENDENTE', max_length=20)),
+                ('resultado', models.JSONField(blank=True, help_text='JSON retornado pela IA quando o job é concluído.', null=True)),
+                ('erro', models.TextField(blank=True, default='', help_text='Mensagem da última falha.')),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=3)),
+                ('cancelamento_solicitado', models.BooleanField(default=False, help_text='Marcado quando o usuário cancela um job já em execução.')),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now, help_text='O job só pode ser reservado a partir deste instante (usado no backoff das novas tentativas).')),
+                ('worker', models.CharField(blank=True, default='', help_text='Identificador do worker que reservou o job.', max_length=100)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_fim', models.DateTimeField(blank=True, null=True)),
+                ('solicitacao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs_justificativa', to='fillsense.solicitacao')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs_justificativa', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Job de Justificativa',
+                'verbose_name_plural': 'Jobs de Justificativa',
+                'ordering': ['-data_criacao'],
+                'indexes': [models.Index(fields=['status', 'disponivel_em'], name='fillsense_job_fila_idx'), models.Index(fields=['usuario', 'status'], name='fillsense_job_usuario_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fillsense', '0012_jobjustificativa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheJustificativa',
+            fields=[
+                ('chave', models.CharField(help_text='SHA-256 das mensagens e opções enviadas ao modelo.', max_length=64, primary_key=True, serialize=False)),
+                ('resultado', models.JSONField(help_text='JSON já validado e normalizado retornado pela IA.')),
+                ('data_criacao', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cache de Justificativa',
+                'verbose_name_plural': 'Cache de Justificativas',
+            },
+        ),
+        migrations.AddField(
+            model_name='jobjustificativa',
+            name='usar_cache',
+            field=models.BooleanField(default=True, help_text='Se falso, ignora o cache de justificativas e força uma nova geração.'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:14
+
+import re
+
+from django.db import migrations, models
+
+_PROTOCOLO_RE = re.compile(r"^FS-(\d{4})-(\d+)$")
+
+
+def renumerar_duplicados_e_iniciar_contadores(apps, schema_editor):
+    """
+    Prepara os dados para a restrição de unicidade do protocolo:
+    mantém o primeiro protocolo de cada número (por data de criação),
+    renumera os duplicados/inválidos a partir do maior número do ano
+    e inicia o ContadorProtocolo de cada ano com o último número emitido.
+    """
+    Solicitacao = apps.get_model('fillsense', 'Solicitacao')
+    ContadorProtocolo = apps.get_model('fillsense', 'ContadorProtocolo')
+    db_alias = schema_editor.connection.alias
+
+    solicitacoes = list(
+        Solicitacao.objects.using(db_alias)
+        .order_by('data_criacao', 'id')
+        .values_list('id', 'protocolo', 'data_criacao')
+    )
+
+    # Maior número já emitido em cada ano
+    ultimo_por_ano = {}
+    for _, protocolo, data_criacao in solicitacoes:
+        m = _PROTOCOLO_RE.match(protocolo or '')
+        if m:
+            ano = int(m.group(1))
+            ultimo_por_ano[ano] = max(ultimo_por_ano.get(ano, 0), int(m.group(2)))
+
+    vistos = set()
+    for sol_id, protocolo, data_criacao in solicitacoes:
+        if _PROTOCOLO_RE.match(protocolo or '') and protocolo not in vistos:
+            vistos.add(protocolo)
+            continue
+
+        ano = data_criacao.year
+        ultimo_por_ano[ano] = ultimo_por_ano.get(ano, 0) + 1
+        novo = f"FS-{ano}-{ultimo_por_ano[ano]:05d}"
+        Solicitacao.objects.using(db_alias).filter(pk=sol_id).update(protocolo=novo)
+        vistos.add(novo)
+
+    ContadorProtocolo.objects.using(db_alias).bulk_create([
+        ContadorProtocolo(ano=ano, ultimo_numero=ultimo)
+        for ano, ultimo in ultimo_por_ano.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fillsense', '0013_cache_justificativa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorProtocolo',
+            fields=[
+                ('ano', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('ultimo_numero', models.PositiveIntegerField(default=0, help_text='Último número de protocolo emitido no ano.')),
+            ],
+            options={
+                'verbose_name': 'Contador de Protocolo',
+                'verbose_name_plural': 'Contadores de Protocolo',
+            },
+        ),
+        migrations.RunPython(renumerar_duplicados_e_iniciar_contadores, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='solicitacao',
+            name='protocolo',
+            field=models.CharField(default='FS-XXXX-YYYYY', editable=False, help_text='Protocolo único da solicitação (FS-ANO-ID).', max_length=20, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fillsense', '0014_protocolo_unico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='solicitacao',
+            index=models.Index(fields=['usuario', '-data_criacao', '-id'], name='fillsense_sol_usuario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitacao',
+            index=models.Index(fields=['usuario', 'status', '-data_criacao'], name='fillsense_sol_usuario_st_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import UnaccentExtension
+from django.db import migrations
+
+# Configuração de busca textual: a "portuguese" com os acentos removidos
+# antes do stemming ("cirurgia" e "cirúrgia" viram o mesmo lexema)
+CRIAR_CONFIGURACAO = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'portuguese_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION portuguese_unaccent (COPY = pg_catalog.portuguese);
+        ALTER TEXT SEARCH CONFIGURATION portuguese_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+    END IF;
+END
+$$;
+"""
+
+# O vetor é recalculado quando uma das colunas de texto aparece no UPDATE
+# (o WHEN que ignora as escritas sem mudança de valor vem na 0017)
+CRIAR_TRIGGER = """
+CREATE OR REPLACE FUNCTION fillsense_solicitacao_busca_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.busca :=
+        setweight(to_tsvector('portuguese_unaccent', coalesce(NEW.procedimento, '')), 'A') ||
+        setweight(to_tsvector('portuguese_unaccent', coalesce(NEW.protocolo, '')), 'A') ||
+        setweight(to_tsvector('portuguese_unaccent', coalesce(NEW.descricao_medica, '')), 'B') ||
+        setweight(to_tsvector('portuguese_unaccent', coalesce(NEW.justificativa, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS fillsense_solicitacao_busca ON fillsense_solicitacao;
+CREATE TRIGGER fillsense_solicitacao_busca
+    BEFORE INSERT OR UPDATE OF procedimento, protocolo, descricao_medica, justificativa
+    ON fillsense_solicitacao
+    FOR EACH ROW EXECUTE FUNCTION fillsense_solicitacao_busca_trigger();
+"""
+
+# Preenche as solicitações existentes (o trigger dispara no UPDATE)
+PREENCHER = "UPDATE fillsense_solicitacao SET procedimento = procedimento;"
+
+CRIAR_INDICE = "CREATE INDEX IF NOT EXISTS fillsense_sol_busca_idx ON fillsense_solicitacao USING GIN (busca);"
+
+REMOVER = """
+DROP INDEX IF EXISTS fillsense_sol_busca_idx;
+DROP TRIGGER IF EXISTS fillsense_solicitacao_busca ON fillsense_solicitacao;
+DROP FUNCTION IF EXISTS fillsense_solicitacao_busca_trigger();
+DROP TEXT SEARCH CONFIGURATION IF EXISTS portuguese_unaccent;
+"""
+
+
+def criar_busca_textual(apps, schema_editor):
+    """
+    Configuração, trigger e índice GIN da busca textual. Só existem no
+    PostgreSQL; em outros bancos a busca usa icontains (ver
+    SolicitacaoViewSet._aplicar_busca).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in (CRIAR_CONFIGURACAO, CRIAR_TRIGGER, PREENCHER, CRIAR_INDICE):
+        schema_editor.execute(sql)
+
+
+def remover_busca_textual(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(REMOVER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fillsense', '0015_solicitacao_indices_listagem'),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        migrations.AddField(
+            model_name='solicitacao',
+            name='busca',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Documento da busca textual (procedimento, protocolo, descrição médica e justificativa).', null=True),
+        ),
+        migrations.RunPython(criar_busca_textual, remover_busca_textual),
+    ]
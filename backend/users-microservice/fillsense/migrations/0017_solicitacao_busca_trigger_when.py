@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# O "UPDATE OF <colunas>" da 0016 dispara sempre que uma das colunas está no
+# SET, e o save() do PATCH escreve todas elas: mudar só o status recalculava
+# o to_tsvector. O WHEN compara os valores; como ele não pode citar OLD num
+# INSERT, a inserção ganha um trigger próprio.
+SEPARAR_TRIGGERS = """
+DROP TRIGGER IF EXISTS fillsense_solicitacao_busca ON fillsense_solicitacao;
+CREATE TRIGGER fillsense_solicitacao_busca_insert
+    BEFORE INSERT ON fillsense_solicitacao
+    FOR EACH ROW EXECUTE FUNCTION fillsense_solicitacao_busca_trigger();
+CREATE TRIGGER fillsense_solicitacao_busca
+    BEFORE UPDATE OF procedimento, protocolo, descricao_medica, justificativa
+    ON fillsense_solicitacao
+    FOR EACH ROW
+    WHEN (OLD.procedimento IS DISTINCT FROM NEW.procedimento
+          OR OLD.protocolo IS DISTINCT FROM NEW.protocolo
+          OR OLD.descricao_medica IS DISTINCT FROM NEW.descricao_medica
+          OR OLD.justificativa IS DISTINCT FROM NEW.justificativa)
+    EXECUTE FUNCTION fillsense_solicitacao_busca_trigger();
+"""
+
+JUNTAR_TRIGGERS = """
+DROP TRIGGER IF EXISTS fillsense_solicitacao_busca_insert ON fillsense_solicitacao;
+DROP TRIGGER IF EXISTS fillsense_solicitacao_busca ON fillsense_solicitacao;
+CREATE TRIGGER fillsense_solicitacao_busca
+    BEFORE INSERT OR UPDATE OF procedimento, protocolo, descricao_medica, justificativa
+    ON fillsense_solicitacao
+    FOR EACH ROW EXECUTE FUNCTION fillsense_solicitacao_busca_trigger();
+"""
+
+
+def separar_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(SEPARAR_TRIGGERS)
+
+
+def juntar_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(JUNTAR_TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fillsense', '0016_solicitacao_busca'),
+    ]
+
+    operations = [
+        migrations.RunPython(separar_triggers, juntar_triggers),
+    ]
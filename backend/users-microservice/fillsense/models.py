@@ -1,4 +1,5 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, models, transaction
 from django.utils import timezone
 from authentication.models import User
 
@@ -12,6 +13,41 @@ class Procedimento(models.Model):
     def __str__(self):
         return self.label
 
+class ContadorProtocolo(models.Model):
+    """
+    Contador sequencial de protocolos por ano (FS-ANO-NNNNN).
+    """
+    ano = models.PositiveIntegerField(primary_key=True)
+    ultimo_numero = models.PositiveIntegerField(default=0, help_text="Último número de protocolo emitido no ano.")
+
+    def __str__(self):
+        return f"{self.ano}: {self.ultimo_numero}"
+
+    @classmethod
+    def proximo_numero(cls, ano: int) -> int:
+        """
+        Reserva o próximo número do ano em um único comando:
+        INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+
+        O UPDATE trava a linha do ano até o fim da transação de quem chamou,
+        então criações concorrentes recebem números distintos e em sequência.
+        Funciona no PostgreSQL (e no SQLite >= 3.35).
+        """
+        tabela = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {tabela} (ano, ultimo_numero) VALUES (%s, 1) "
+                f"ON CONFLICT (ano) DO UPDATE SET ultimo_numero = {tabela}.ultimo_numero + 1 "
+                f"RETURNING ultimo_numero",
+                [ano],
+            )
+            return cursor.fetchone()[0]
+
+    class Meta:
+        verbose_name = "Contador de Protocolo"
+        verbose_name_plural = "Contadores de Protocolo"
+
+
 class Solicitacao(models.Model):
     """
     Modelo para representar uma solicitação de procedimento no FillSense.
@@ -38,7 +74,7 @@ class Solicitacao(models.Model):
     )
 
     # --- Campos da solicitação ---
-    protocolo = models.CharField(max_length=20, unique=False, editable=False, default="FS-XXXX-YYYYY", help_text="Protocolo único da solicitação (FS-ANO-ID).")
+    protocolo = models.CharField(max_length=20, unique=True, editable=False, default="FS-XXXX-YYYYY", help_text="Protocolo único da solicitação (FS-ANO-ID).")
 
     # Campos com as informações do procedimento
     descricao_medica = models.TextField(blank=True, null=True, help_text="Descrição médica inicial preenchida manualmente pelo o usuário.")
@@ -52,23 +88,114 @@ class Solicitacao(models.Model):
     # Campo para armazenar dados da interação com a IA
     metadados_ia = models.JSONField(blank=False, null=False, default=dict, help_text="Metadados da interação com a IA, como notas técnicas usadas.")
 
+    # Busca textual (português, sem acentos): mantido por um trigger no
+    # PostgreSQL (migração 0016) e indexado com GIN; a aplicação nunca o
+    # escreve. O GeneratedField não serve aqui porque unaccent não é IMMUTABLE.
+    busca = SearchVectorField(null=True, editable=False, help_text="Documento da busca textual (procedimento, protocolo, descrição médica e justificativa).")
+
     def __str__(self):
         return f"Solicitação {self.id} - {self.procedimento} ({self.status})"
 
     def save(self, *args, **kwargs):
-        # Gera o protocolo apenas na primeira vez que o objeto é salvo
+        # Gera o protocolo apenas na primeira vez que o objeto é salvo.
+        # O número vem do contador do ano e é gravado já no INSERT; contador e
+        # INSERT ficam na mesma transação, então uma falha não deixa buracos.
         if not self.pk:
-            super().save(*args, **kwargs) # Salva primeiro para obter um ID
             ano_atual = timezone.now().year
-            # Conta quantas solicitações já existem neste ano para determinar o próximo ID sequencial
-            id_no_ano = Solicitacao.objects.filter(data_criacao__year=ano_atual).count()
-            # Formata o protocolo com 5 dígitos, preenchendo com zeros à esquerda
-            self.protocolo = f"FS-{ano_atual}-{id_no_ano:05d}"
-            # O `update_fields` evita um loop de save e é mais performático
-            kwargs['force_insert'] = False # Permite que o próximo save seja um update
-        
+            with transaction.atomic():
+                numero = ContadorProtocolo.proximo_numero(ano_atual)
+                # Formata o protocolo com 5 dígitos, preenchendo com zeros à esquerda
+                self.protocolo = f"FS-{ano_atual}-{numero:05d}"
+                super().save(*args, **kwargs)
+            return
+
         super().save(*args, **kwargs)
     class Meta:
         verbose_name = "Solicitação"
         verbose_name_plural = "Solicitações"
-        ordering = ['-data_criacao'] # Ordena as solicitações da mais nova para a mais antiga
\ No newline at end of file
+        ordering = ['-data_criacao'] # Ordena as solicitações da mais nova para a mais antiga
+        indexes = [
+            # Listagem paginada por cursor: WHERE usuario = ? ORDER BY -data_criacao, -id
+            models.Index(fields=['usuario', '-data_criacao', '-id'], name='fillsense_sol_usuario_data_idx'),
+            # Filtro por status dentro do histórico do usuário, já na ordem da listagem
+            models.Index(fields=['usuario', 'status', '-data_criacao'], name='fillsense_sol_usuario_st_idx'),
+        ]
+
+class JobJustificativa(models.Model):
+    """
+    Job de geração de justificativa por IA processado em segundo plano.
+
+    A própria tabela funciona como fila: os workers (comando
+    `processar_jobs_justificativa`) reservam o próximo job com
+    SELECT ... FOR UPDATE SKIP LOCKED, sem infraestrutura adicional.
+    """
+    class StatusChoices(models.TextChoices):
+        PENDENTE = 'PENDENTE', 'Pendente'
+        EM_EXECUCAO = 'EM_EXECUCAO', 'Em Execução'
+        CONCLUIDO = 'CONCLUIDO', 'Concluído'
+        FALHOU = 'FALHOU', 'Falhou'
+        CANCELADO = 'CANCELADO', 'Cancelado'
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs_justificativa')
+    solicitacao = models.ForeignKey(Solicitacao, on_delete=models.CASCADE, related_name='jobs_justificativa')
+
+    # --- Entrada da geração ---
+    procedimento = models.CharField(max_length=255, help_text="Nome do procedimento enviado à IA.")
+    clinico_text = models.TextField(help_text="Informações clínicas do paciente enviadas à IA.")
+    nota_tecnica = models.JSONField(default=dict, help_text="Nota técnica no formato de 'Categorias' esperado pelo serviço de IA.")
+    usar_cache = models.BooleanField(default=True, help_text="Se falso, ignora o cache de justificativas e força uma nova geração.")
+
+    # --- Estado do job ---
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.PENDENTE)
+    resultado = models.JSONField(blank=True, null=True, help_text="JSON retornado pela IA quando o job é concluído.")
+    erro = models.TextField(blank=True, default='', help_text="Mensagem da última falha.")
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=3)
+    cancelamento_solicitado = models.BooleanField(default=False, help_text="Marcado quando o usuário cancela um job já em execução.")
+    disponivel_em = models.DateTimeField(default=timezone.now, help_text="O job só pode ser reservado a partir deste instante (usado no backoff das novas tentativas).")
+    worker = models.CharField(max_length=100, blank=True, default='', help_text="Identificador do worker que reservou o job.")
+
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(blank=True, null=True)
+    data_fim = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Job {self.id} - Solicitação {self.solicitacao_id} ({self.status})"
+
+    @property
+    def finalizado(self):
+        return self.status in (
+            self.StatusChoices.CONCLUIDO,
+            self.StatusChoices.FALHOU,
+            self.StatusChoices.CANCELADO,
+        )
+
+    class Meta:
+        verbose_name = "Job de Justificativa"
+        verbose_name_plural = "Jobs de Justificativa"
+        ordering = ['-data_criacao']
+        indexes = [
+            # Reserva do próximo job pendente pelos workers
+            models.Index(fields=['status', 'disponivel_em'], name='fillsense_job_fila_idx'),
+            # Contagem de jobs em execução por usuário (justiça entre usuários)
+            models.Index(fields=['usuario', 'status'], name='fillsense_job_usuario_idx'),
+        ]
+
+
+
+class CacheJustificativa(models.Model):
+    """
+    Backend "banco" do cache de justificativas geradas
+    (ver fillsense/services/cache_justificativa_service.py).
+    """
+    chave = models.CharField(max_length=64, primary_key=True, help_text="SHA-256 das mensagens e opções enviadas ao modelo.")
+    resultado = models.JSONField(help_text="JSON já validado e normalizado retornado pela IA.")
+    data_criacao = models.DateTimeField(default=timezone.now)
+    expira_em = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.chave
+
+    class Meta:
+        verbose_name = "Cache de Justificativa"
+        verbose_name_plural = "Cache de Justificativas"
@@ -0,0 +1,31 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class SolicitacaoCursorPagination(CursorPagination):
+    """
+    Paginação por cursor do histórico de solicitações.
+
+    O CursorPagination do DRF posiciona o cursor só pelo primeiro campo da
+    ordenação: cada página é uma busca pelo índice (usuario, -data_criacao,
+    -id) a partir do data_criacao do último item da página anterior, então
+    o custo não cresce com o tamanho do histórico, ao contrário da
+    paginação por OFFSET. Solicitações criadas no mesmo instante são
+    puladas com um offset guardado no cursor (pequeno: data_criacao tem
+    precisão de microssegundos); o `id` só deixa a ordem entre elas estável.
+    """
+    ordering = ('-data_criacao', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class SolicitacaoBuscaPagination(PageNumberPagination):
+    """
+    Paginação por número de página da busca textual. O cursor não serve
+    aqui: os resultados são ordenados pela relevância, que não é uma
+    coluna estável. A busca já restringe o conjunto às solicitações do
+    usuário que casam com o texto, então o OFFSET é pequeno.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
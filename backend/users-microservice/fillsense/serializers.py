@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Solicitacao, Procedimento
+from .models import Solicitacao, Procedimento, JobJustificativa
 
 class SolicitacaoSerializer(serializers.ModelSerializer):
     """
@@ -20,9 +20,87 @@ class SolicitacaoSerializer(serializers.ModelSerializer):
     data_criacao_display = serializers.DateTimeField(source='data_criacao', format='%d/%m/%Y %H:%M', read_only=True)
     data_atualizacao_display = serializers.DateTimeField(source='data_atualizacao', format='%d/%m/%Y %H:%M', read_only=True)
 
+    # Resumo da compactação da nota técnica da justificativa salva (ou null,
+    # se ela não foi compactada). Vai para metadados_ia["compactacao"] sem
+    # apagar os demais metadados gravados pelo backend.
+    compactacao = serializers.JSONField(write_only=True, required=False, allow_null=True)
+
     class Meta:
         model = Solicitacao
-        # Inclui todos os campos do modelo na API
-        fields = '__all__'
+        # Inclui todos os campos do modelo na API, menos o vetor da busca textual
+        exclude = ('busca',)
         # O campo 'usuario' e 'protocolo' serão definidos pelo sistema, não pelo cliente
-        read_only_fields = ('usuario', 'protocolo', 'data_criacao', 'data_atualizacao')
\ No newline at end of file
+        read_only_fields = ('usuario', 'protocolo', 'data_criacao', 'data_atualizacao')
+
+    @staticmethod
+    def _aplicar_compactacao(validated_data, metadados_atuais):
+        if 'compactacao' not in validated_data:
+            return
+        compactacao = validated_data.pop('compactacao')
+        metadados = {**(metadados_atuais or {}), **validated_data.get('metadados_ia', {})}
+        if compactacao:
+            metadados['compactacao'] = compactacao
+        else:
+            metadados.pop('compactacao', None)
+        validated_data['metadados_ia'] = metadados
+
+    def create(self, validated_data):
+        self._aplicar_compactacao(validated_data, {})
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self._aplicar_compactacao(validated_data, instance.metadados_ia)
+        return super().update(instance, validated_data)
+
+
+class SolicitacaoListSerializer(serializers.ModelSerializer):
+    """
+    Representação compacta usada na listagem (histórico), sem os campos de
+    texto longo e JSON (descricao_medica, justificativa, metadados_ia),
+    que só são enviados no detalhe.
+    """
+    procedimento = serializers.PrimaryKeyRelatedField(source='procedimento_fk', read_only=True)
+    procedimento_label = serializers.CharField(source='procedimento_fk.label', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    data_criacao_display = serializers.DateTimeField(source='data_criacao', format='%d/%m/%Y %H:%M', read_only=True)
+    data_atualizacao_display = serializers.DateTimeField(source='data_atualizacao', format='%d/%m/%Y %H:%M', read_only=True)
+
+    class Meta:
+        model = Solicitacao
+        fields = (
+            'id', 'protocolo', 'procedimento', 'procedimento_label',
+            'status', 'status_display',
+            'data_criacao', 'data_criacao_display',
+            'data_atualizacao', 'data_atualizacao_display',
+        )
+        read_only_fields = fields
+
+
+class SolicitacaoBuscaSerializer(SolicitacaoListSerializer):
+    """
+    Item do resultado da busca textual: a representação da listagem mais a
+    relevância (ts_rank; nula fora do PostgreSQL).
+    """
+    relevancia = serializers.FloatField(read_only=True)
+
+    class Meta(SolicitacaoListSerializer.Meta):
+        fields = SolicitacaoListSerializer.Meta.fields + ('relevancia',)
+        read_only_fields = fields
+
+
+class JobJustificativaSerializer(serializers.ModelSerializer):
+    """
+    Serializer (somente leitura) dos jobs de geração de justificativa,
+    usado pelo cliente para acompanhar o andamento do job.
+    """
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    finalizado = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = JobJustificativa
+        fields = (
+            'id', 'solicitacao', 'status', 'status_display', 'finalizado',
+            'resultado', 'erro', 'tentativas', 'max_tentativas',
+            'cancelamento_solicitado', 'data_criacao', 'data_inicio', 'data_fim',
+        )
+        read_only_fields = fields
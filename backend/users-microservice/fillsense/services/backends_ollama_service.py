@@ -0,0 +1,300 @@
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+import requests
+from django.conf import settings
+
+from users_api import clientes_http
+
+T = TypeVar("T")
+
+
+def _nome_modelo(nome: str) -> str:
+    # O Ollama trata "mistral" e "mistral:latest" como o mesmo modelo
+    return nome if ":" in nome else f"{nome}:latest"
+
+
+class BackendOllama:
+    """
+    Um servidor Ollama do pool.
+
+    `peso` é a capacidade relativa (ex.: 2 para uma GPU com o dobro de
+    vazão) e `modelos` restringe os modelos roteados para ele (vazio:
+    qualquer modelo). `modelos_disponiveis` vem do /api/tags da última
+    verificação de saúde.
+    """
+
+    def __init__(self, url: str, peso: float = 1, modelos: Optional[List[str]] = None):
+        self.url = url.rstrip("/")
+        self.peso = max(float(peso), 0.01)
+        self.modelos = {_nome_modelo(m) for m in modelos or []}
+
+        self.saudavel = True
+        self.modelos_disponiveis = None
+        self.suspenso_ate = 0.0
+        self.em_andamento = 0
+        self.chamadas = 0
+        self.falhas = 0
+        self.ultimo_erro = None
+
+    def atende(self, modelo: str) -> bool:
+        modelo = _nome_modelo(modelo)
+        if self.modelos and modelo not in self.modelos:
+            return False
+        return self.modelos_disponiveis is None or modelo in self.modelos_disponiveis
+
+    def disponivel(self, agora: float) -> bool:
+        return self.saudavel and agora >= self.suspenso_ate
+
+    def carga(self):
+        # Menos requisições em andamento por unidade de peso; no empate, menos chamadas
+        return (self.em_andamento / self.peso, self.chamadas / self.peso)
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "peso": self.peso,
+            "modelos": sorted(self.modelos) or None,
+            "modelos_disponiveis": sorted(self.modelos_disponiveis) if self.modelos_disponiveis is not None else None,
+            "saudavel": self.saudavel,
+            "suspenso": time.monotonic() < self.suspenso_ate,
+            "em_andamento": self.em_andamento,
+            "chamadas": self.chamadas,
+            "falhas": self.falhas,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+
+class PoolOllama:
+    """
+    Distribui as gerações entre vários servidores Ollama.
+
+    - Roteamento: o backend saudável que atende o modelo e tem menos
+      requisições em andamento em relação ao seu peso.
+    - Failover: se a chamada falhar (erro de rede, timeout ou resposta de
+      erro), é refeita no próximo backend, até todos terem sido tentados.
+      No streaming isso só vale até o primeiro pedaço de texto.
+    - Saúde: um backend que falha fica suspenso por `suspensao` segundos; a
+      cada `intervalo_verificacao` segundos o /api/tags de todos é
+      consultado em segundo plano (sem atrasar a requisição), o que também
+      atualiza a lista de modelos instalados em cada um.
+
+    Sem backends disponíveis para o modelo, tenta os suspensos/não
+    saudáveis mesmo assim (a verificação pode estar desatualizada).
+    """
+
+    def __init__(self, backends: List[BackendOllama], intervalo_verificacao: float = 15, suspensao: float = 15):
+        self.backends = backends
+        self.intervalo_verificacao = intervalo_verificacao
+        self.suspensao = suspensao
+        self._lock = threading.Lock()
+        self._verificado_em = 0.0
+        self._verificando = False
+
+    # --- Escolha do Backend ---
+
+    def backends_do_modelo(self, modelo: str) -> List[BackendOllama]:
+        return [b for b in self.backends if b.atende(modelo)]
+
+    def _escolher(self, modelo: str, excluir) -> Optional[BackendOllama]:
+        self._verificar_em_segundo_plano()
+        agora = time.monotonic()
+        with self._lock:
+            candidatos = [b for b in self.backends if b not in excluir and b.atende(modelo)]
+            if not candidatos:
+                # Nenhum backend declara o modelo: os modelos instalados podem
+                # ter mudado desde a última verificação
+                candidatos = [b for b in self.backends if b not in excluir and not b.modelos]
+            disponiveis = [b for b in candidatos if b.disponivel(agora)] or candidatos
+            if not disponiveis:
+                return None
+            backend = min(disponiveis, key=BackendOllama.carga)
+            backend.em_andamento += 1
+            backend.chamadas += 1
+            return backend
+
+    def _finalizar(self, backend: BackendOllama, erro: Optional[Exception]):
+        with self._lock:
+            backend.em_andamento -= 1
+            if erro is not None:
+                backend.falhas += 1
+                backend.ultimo_erro = str(erro)
+                backend.suspenso_ate = time.monotonic() + self.suspensao
+        if erro is not None:
+            print(f"AVISO: Backend Ollama {backend.url} falhou ({erro}); suspenso por {self.suspensao}s.")
+
+    def _sem_backend(self, modelo: str, ultimo_erro: Optional[Exception]) -> ConnectionError:
+        if ultimo_erro is not None:
+            return ultimo_erro
+        return ConnectionError(f"Nenhum servidor Ollama disponível para o modelo {modelo}.")
+
+    # --- Execução com Failover ---
+
+    def executar(self, modelo: str, chamada: Callable[[BackendOllama], T]) -> T:
+        """
+        Executa `chamada(backend)` no melhor backend, repetindo nos demais
+        enquanto ela lançar ConnectionError.
+        """
+        tentados = set()
+        ultimo_erro = None
+        while True:
+            backend = self._escolher(modelo, tentados)
+            if backend is None:
+                raise self._sem_backend(modelo, ultimo_erro)
+            tentados.add(backend)
+            erro = None
+            try:
+                return chamada(backend)
+            except ConnectionError as e:
+                erro = ultimo_erro = e
+            finally:
+                self._finalizar(backend, erro)
+
+    async def executar_async(self, modelo: str, chamada: Callable[[BackendOllama], Awaitable[T]]) -> T:
+        """Versão assíncrona de `executar`."""
+        tentados = set()
+        ultimo_erro = None
+        while True:
+            backend = self._escolher(modelo, tentados)
+            if backend is None:
+                raise self._sem_backend(modelo, ultimo_erro)
+            tentados.add(backend)
+            erro = None
+            try:
+                return await chamada(backend)
+            except ConnectionError as e:
+                erro = ultimo_erro = e
+            finally:
+                self._finalizar(backend, erro)
+
+    def stream(self, modelo: str, abrir: Callable[[BackendOllama], Iterator[T]]) -> Iterator[T]:
+        """
+        Repassa os itens de `abrir(backend)`. Falhas antes do primeiro item
+        passam para o próximo backend; depois dele são propagadas.
+        """
+        tentados = set()
+        ultimo_erro = None
+        while True:
+            backend = self._escolher(modelo, tentados)
+            if backend is None:
+                raise self._sem_backend(modelo, ultimo_erro)
+            tentados.add(backend)
+            erro = None
+            partes = abrir(backend)
+            try:
+                try:
+                    primeira = next(partes)
+                except StopIteration:
+                    return
+                except ConnectionError as e:
+                    erro = ultimo_erro = e
+                    continue
+                yield primeira
+                yield from partes
+                return
+            except ConnectionError as e:
+                erro = e
+                raise
+            finally:
+                partes.close()
+                self._finalizar(backend, erro)
+
+    async def stream_async(self, modelo: str, abrir: Callable[[BackendOllama], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Versão assíncrona de `stream`."""
+        tentados = set()
+        ultimo_erro = None
+        while True:
+            backend = self._escolher(modelo, tentados)
+            if backend is None:
+                raise self._sem_backend(modelo, ultimo_erro)
+            tentados.add(backend)
+            erro = None
+            partes = abrir(backend)
+            try:
+                try:
+                    primeira = await partes.__anext__()
+                except StopAsyncIteration:
+                    return
+                except ConnectionError as e:
+                    erro = ultimo_erro = e
+                    continue
+                yield primeira
+                async for parte in partes:
+                    yield parte
+                return
+            except ConnectionError as e:
+                erro = e
+                raise
+            finally:
+                await partes.aclose()
+                self._finalizar(backend, erro)
+
+    # --- Verificação de Saúde ---
+
+    def _verificar_em_segundo_plano(self):
+        if time.monotonic() - self._verificado_em < self.intervalo_verificacao:
+            return
+        with self._lock:
+            if self._verificando or time.monotonic() - self._verificado_em < self.intervalo_verificacao:
+                return
+            self._verificando = True
+        threading.Thread(target=self.verificar_saude, name='verificar-ollama', daemon=True).start()
+
+    def verificar_saude(self):
+        """Consulta o /api/tags de cada backend e atualiza saúde e modelos instalados."""
+        try:
+            for backend in self.backends:
+                try:
+                    r = clientes_http.cliente("ollama").get(f"{backend.url}/api/tags", tentativas=0, timeout_leitura=5)
+                    r.raise_for_status()
+                    modelos = {_nome_modelo(m.get("name", "")) for m in r.json().get("models", [])}
+                except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+                    if backend.saudavel:
+                        print(f"AVISO: Backend Ollama {backend.url} não respondeu à verificação de saúde: {e}")
+                    with self._lock:
+                        backend.saudavel = False
+                        backend.ultimo_erro = str(e)
+                    continue
+                with self._lock:
+                    if not backend.saudavel:
+                        print(f"INFO: Backend Ollama {backend.url} voltou a responder.")
+                    backend.saudavel = True
+                    backend.modelos_disponiveis = modelos
+        finally:
+            with self._lock:
+                self._verificado_em = time.monotonic()
+                self._verificando = False
+
+    def estado(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [b.resumo() for b in self.backends]
+
+
+# --- Ponto de Entrada ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool() -> PoolOllama:
+    """
+    Pool do processo, a partir de settings.OLLAMA_BACKENDS (lista de
+    {"URL", "PESO", "MODELOS"}). Sem essa configuração, usa um único
+    backend em OLLAMA_BASE_URL.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = getattr(settings, "OLLAMA_BACKENDS", None) or [{"URL": settings.OLLAMA_BASE_URL}]
+                _pool = PoolOllama(
+                    [BackendOllama(b["URL"], b.get("PESO", 1), b.get("MODELOS")) for b in config],
+                    intervalo_verificacao=getattr(settings, "OLLAMA_BACKENDS_VERIFICACAO", 15),
+                    suspensao=getattr(settings, "OLLAMA_BACKENDS_SUSPENSAO", 15),
+                )
+    return _pool
+
+
+def estado() -> List[Dict[str, Any]]:
+    return pool().estado()
@@ -0,0 +1,107 @@
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List
+
+_PALAVRA_RE = re.compile(r"\w+")
+
+# Limites do índice de prefixos e da busca aproximada
+_TAMANHO_MAX_PREFIXO = 20
+_SIMILARIDADE_MIN = 0.5
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos e com espaços simples."""
+    sem_acento = unicodedata.normalize("NFKD", (texto or "").lower()).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_PALAVRA_RE.findall(sem_acento))
+
+
+def _trigramas(texto: str) -> set:
+    # Como no pg_trgm: cada palavra com dois espaços antes e um depois
+    trigramas = set()
+    for palavra in texto.split():
+        palavra = f"  {palavra} "
+        trigramas.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return trigramas
+
+
+def resumo(proc: dict) -> Dict[str, Any]:
+    """Representação leve de um procedimento, usada nos resultados da busca."""
+    return {
+        "proc_id": proc.get("proc_id"),
+        "proc_label": proc.get("proc_label"),
+        "NT_label": proc.get("NT_label"),
+    }
+
+
+class IndiceBusca:
+    """
+    Índice em memória para a busca de procedimentos por nome (typeahead),
+    sem diferenciar acentos e maiúsculas. É construído uma vez por versão
+    do catálogo.
+
+    - Prefixos: cada palavra do nome/código do procedimento é indexada por
+      todos os seus prefixos, então "gine uro" encontra
+      "CONSULTA EM GINECOLOGIA - UROGINECOLOGIA". Todas as palavras da
+      busca precisam casar com o início de alguma palavra.
+    - Trigramas: sem resultado por prefixo, a busca é aproximada pela
+      similaridade de trigramas (tolera erros de digitação).
+    """
+
+    def __init__(self, procs: List[dict]):
+        self.procs = procs
+        self._textos = []
+        self._palavras = []
+        self._prefixos = defaultdict(set)
+        self._trigramas = defaultdict(set)
+
+        for i, proc in enumerate(procs):
+            texto = normalizar(f"{proc.get('proc_label') or ''} {proc.get('proc_sisreg') or ''}")
+            self._textos.append(normalizar(proc.get("proc_label") or ""))
+            self._palavras.append(texto.split())
+            for palavra in set(texto.split()):
+                for n in range(1, min(len(palavra), _TAMANHO_MAX_PREFIXO) + 1):
+                    self._prefixos[palavra[:n]].add(i)
+            for trigrama in _trigramas(texto):
+                self._trigramas[trigrama].add(i)
+
+    def buscar(self, consulta: str, limite: int = 10) -> List[dict]:
+        """Os `limite` procedimentos mais relevantes para a consulta."""
+        consulta = normalizar(consulta)
+        if not consulta:
+            return []
+
+        encontrados = self._por_prefixo(consulta)
+        if encontrados:
+            # Nome começando pela consulta primeiro; depois os nomes mais curtos
+            ordem = sorted(encontrados, key=lambda i: (not self._textos[i].startswith(consulta), len(self._textos[i]), i))
+        else:
+            similaridades = self._por_trigramas(consulta)
+            ordem = sorted(similaridades, key=lambda i: (-similaridades[i], len(self._textos[i]), i))
+        return [resumo(self.procs[i]) for i in ordem[:limite]]
+
+    def _por_prefixo(self, consulta: str) -> set:
+        encontrados = None
+        for palavra in consulta.split():
+            documentos = self._prefixos.get(palavra[:_TAMANHO_MAX_PREFIXO], set())
+            if len(palavra) > _TAMANHO_MAX_PREFIXO:
+                # O índice só guarda prefixos até o limite: confere o resto da palavra
+                documentos = {i for i in documentos if any(p.startswith(palavra) for p in self._palavras[i])}
+            encontrados = documentos if encontrados is None else encontrados & documentos
+            if not encontrados:
+                return set()
+        return encontrados
+
+    def _por_trigramas(self, consulta: str) -> Dict[int, float]:
+        trigramas = _trigramas(consulta)
+        em_comum = defaultdict(int)
+        for trigrama in trigramas:
+            for i in self._trigramas.get(trigrama, ()):
+                em_comum[i] += 1
+        # Fração dos trigramas da consulta presentes no procedimento (como o
+        # word_similarity do pg_trgm: o nome inteiro é bem maior que a consulta)
+        return {
+            i: comum / len(trigramas)
+            for i, comum in em_comum.items()
+            if comum / len(trigramas) >= _SIMILARIDADE_MIN
+        }
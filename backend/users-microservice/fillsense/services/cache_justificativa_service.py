@@ -0,0 +1,304 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional, Dict, Any
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from fillsense.models import CacheJustificativa
+
+# Campos do payload do Ollama que determinam a saída do modelo.
+# "stream" fica de fora: a resposta em streaming e a completa são a mesma.
+_CAMPOS_DA_CHAVE = ("model", "messages", "options", "format", "think")
+
+
+def chave_cache(payload: Dict[str, Any]) -> str:
+    """
+    Chave de conteúdo: SHA-256 das mensagens já montadas (_build_messages)
+    junto com o modelo e as opções de geração. Como o seed e a temperatura
+    são fixos, entradas idênticas produzem a mesma saída.
+    """
+    base = {campo: payload.get(campo) for campo in _CAMPOS_DA_CHAVE}
+    serializado = json.dumps(base, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+# --- Backends ---
+
+class CacheBackend(ABC):
+    """
+    Interface dos backends de cache de justificativas.
+    Os valores guardados são os dicionários já validados e normalizados.
+    """
+
+    def __init__(self, ttl: int, max_itens: int, **opcoes):
+        self.ttl = ttl
+        self.max_itens = max_itens
+
+    @abstractmethod
+    def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def guardar(self, chave: str, valor: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def limpar(self) -> None:
+        ...
+
+    async def obter_async(self, chave: str) -> Optional[Dict[str, Any]]:
+        return await sync_to_async(self.obter)(chave)
+
+    async def guardar_async(self, chave: str, valor: Dict[str, Any]) -> None:
+        await sync_to_async(self.guardar)(chave, valor)
+
+
+class MemoriaLRUCache(CacheBackend):
+    """
+    LRU em memória, por processo, com expiração por TTL e limite de itens.
+    """
+
+    def __init__(self, ttl: int, max_itens: int, **opcoes):
+        super().__init__(ttl, max_itens)
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return copy.deepcopy(valor)
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, copy.deepcopy(valor))
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    async def obter_async(self, chave):
+        return self.obter(chave)
+
+    async def guardar_async(self, chave, valor):
+        self.guardar(chave, valor)
+
+
+class DjangoCache(CacheBackend):
+    """
+    Usa um cache configurado em settings.CACHES (ex.: Redis, Memcached),
+    compartilhado entre os processos. O limite de itens fica a cargo do
+    próprio backend do Django.
+
+    As chaves levam uma versão guardada no próprio cache; `limpar` só
+    troca a versão (as entradas antigas expiram sozinhas), sem apagar as
+    demais chaves do alias, que pode ser usado por outras partes do sistema.
+    """
+    _CHAVE_VERSAO = "justificativa:versao"
+
+    def __init__(self, ttl: int, max_itens: int, alias: str = "default", **opcoes):
+        super().__init__(ttl, max_itens)
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _versao_inicial():
+        # Se a chave da versão for despejada, a nova versão não repete as anteriores
+        return int(time.time() * 1000)
+
+    def _versao(self):
+        versao = self._cache.get(self._CHAVE_VERSAO)
+        if versao is None:
+            self._cache.add(self._CHAVE_VERSAO, self._versao_inicial(), timeout=None)
+            versao = self._cache.get(self._CHAVE_VERSAO)
+        return versao
+
+    async def _versao_async(self):
+        versao = await self._cache.aget(self._CHAVE_VERSAO)
+        if versao is None:
+            await self._cache.aadd(self._CHAVE_VERSAO, self._versao_inicial(), timeout=None)
+            versao = await self._cache.aget(self._CHAVE_VERSAO)
+        return versao
+
+    def _chave(self, chave, versao):
+        return f"justificativa:{versao}:{chave}"
+
+    def obter(self, chave):
+        return self._cache.get(self._chave(chave, self._versao()))
+
+    def guardar(self, chave, valor):
+        self._cache.set(self._chave(chave, self._versao()), valor, timeout=self.ttl)
+
+    def limpar(self):
+        try:
+            self._cache.incr(self._CHAVE_VERSAO)
+        except ValueError:
+            # Ainda sem versão: a primeira leitura cria uma nova
+            pass
+
+    async def obter_async(self, chave):
+        return await self._cache.aget(self._chave(chave, await self._versao_async()))
+
+    async def guardar_async(self, chave, valor):
+        await self._cache.aset(self._chave(chave, await self._versao_async()), valor, timeout=self.ttl)
+
+
+class BancoCache(CacheBackend):
+    """
+    Guarda as justificativas na tabela CacheJustificativa (Postgres),
+    compartilhada entre processos e persistente entre deploys.
+
+    O despejo (expirados e excedentes de max_itens) não roda a cada
+    escrita, e sim no máximo uma vez a cada `intervalo_despejo` segundos
+    por processo: entre dois despejos a tabela pode passar do limite, e as
+    entradas expiradas já são ignoradas pela leitura.
+    """
+
+    def __init__(self, ttl: int, max_itens: int, intervalo_despejo: int = 60, **opcoes):
+        super().__init__(ttl, max_itens)
+        self.intervalo_despejo = intervalo_despejo
+        # O primeiro guardar do processo já despeja
+        self._proximo_despejo = 0.0
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        item = CacheJustificativa.objects.filter(chave=chave, expira_em__gt=timezone.now()).first()
+        return item.resultado if item else None
+
+    def guardar(self, chave, valor):
+        agora = timezone.now()
+        CacheJustificativa.objects.update_or_create(
+            chave=chave,
+            defaults={'resultado': valor, 'data_criacao': agora, 'expira_em': agora + timedelta(seconds=self.ttl)},
+        )
+        if self._despejo_pendente():
+            self.despejar()
+
+    def _despejo_pendente(self) -> bool:
+        with self._lock:
+            if time.monotonic() < self._proximo_despejo:
+                return False
+            self._proximo_despejo = time.monotonic() + self.intervalo_despejo
+            return True
+
+    def despejar(self) -> None:
+        """Remove os expirados e, acima do limite, os mais antigos."""
+        CacheJustificativa.objects.filter(expira_em__lte=timezone.now()).delete()
+        excedentes = CacheJustificativa.objects.order_by('-data_criacao').values_list('chave', flat=True)[self.max_itens:]
+        if excedentes:
+            CacheJustificativa.objects.filter(chave__in=list(excedentes)).delete()
+
+    def limpar(self):
+        CacheJustificativa.objects.all().delete()
+
+
+_BACKENDS = {
+    "memoria": MemoriaLRUCache,
+    "django": DjangoCache,
+    "banco": BancoCache,
+}
+
+
+# --- Ponto de Entrada ---
+
+_backend = None
+_backend_lock = threading.Lock()
+
+_contadores = {"hits": 0, "misses": 0}
+_contadores_lock = threading.Lock()
+
+
+def get_backend() -> Optional[CacheBackend]:
+    """
+    Instancia (uma vez por processo) o backend definido em
+    settings.JUSTIFICATIVA_CACHE["BACKEND"]: "memoria", "django", "banco",
+    um caminho Python para uma subclasse de CacheBackend, ou vazio para
+    desativar o cache.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = dict(getattr(settings, "JUSTIFICATIVA_CACHE", {}))
+                nome = config.pop("BACKEND", "memoria")
+                if not nome:
+                    _backend = False
+                else:
+                    classe = _BACKENDS.get(nome) or import_string(nome)
+                    _backend = classe(
+                        ttl=config.pop("TTL", 24 * 60 * 60),
+                        max_itens=config.pop("MAX_ITENS", 1000),
+                        **{k.lower(): v for k, v in config.items()},
+                    )
+    return _backend or None
+
+
+def _contar(hit: bool):
+    with _contadores_lock:
+        _contadores["hits" if hit else "misses"] += 1
+
+
+def obter(chave: str) -> Optional[Dict[str, Any]]:
+    backend = get_backend()
+    if backend is None:
+        return None
+    valor = backend.obter(chave)
+    _contar(valor is not None)
+    return valor
+
+
+def guardar(chave: str, valor: Dict[str, Any]) -> None:
+    backend = get_backend()
+    if backend is not None:
+        backend.guardar(chave, valor)
+
+
+async def obter_async(chave: str) -> Optional[Dict[str, Any]]:
+    backend = get_backend()
+    if backend is None:
+        return None
+    valor = await backend.obter_async(chave)
+    _contar(valor is not None)
+    return valor
+
+
+async def guardar_async(chave: str, valor: Dict[str, Any]) -> None:
+    backend = get_backend()
+    if backend is not None:
+        await backend.guardar_async(chave, valor)
+
+
+def estatisticas() -> Dict[str, Any]:
+    """Contadores de acertos/erros do cache neste processo."""
+    with _contadores_lock:
+        hits, misses = _contadores["hits"], _contadores["misses"]
+    total = hits + misses
+    backend = get_backend()
+    return {
+        "backend": type(backend).__name__ if backend else None,
+        "hits": hits,
+        "misses": misses,
+        "taxa_acerto": round(hits / total, 4) if total else 0.0,
+    }
@@ -0,0 +1,173 @@
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+# Estimativa sem o tokenizador do modelo: em média ~4 caracteres por token
+_CARACTERES_POR_TOKEN = 4
+
+_PALAVRA_RE = re.compile(r"\w+")
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas e sem acentos."""
+    return unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("ascii")
+
+
+_STOPWORDS = frozenset(_normalizar(p) for p in """
+    a o e as os de da do das dos em no na nos nas um uma uns umas para por pelo pela pelos pelas
+    com sem ao aos à às ou que se sua seu suas seus como mais menos ser ter há já não sim
+    entre sobre após até quando este esta estes estas isso esse essa esses essas cada outro outra
+""".split())
+
+
+def termos(texto: str) -> List[str]:
+    """
+    Termos usados no índice: palavras normalizadas, sem stopwords, reduzidas
+    aos 6 primeiros caracteres (um radical aproximado: "incontinência" e
+    "incontinente" viram o mesmo termo).
+    """
+    return [p[:6] for p in _PALAVRA_RE.findall(_normalizar(texto)) if len(p) > 2 and p not in _STOPWORDS]
+
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / _CARACTERES_POR_TOKEN)
+
+
+class IndiceBM25:
+    """Índice BM25 em memória sobre uma lista pequena de documentos já tokenizados."""
+
+    def __init__(self, documentos: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.frequencias = [Counter(doc) for doc in documentos]
+        self.tamanhos = [len(doc) for doc in documentos]
+        self.tamanho_medio = (sum(self.tamanhos) / len(documentos)) if documentos else 0.0
+
+        total = len(documentos)
+        documentos_por_termo = Counter(termo for doc in documentos for termo in set(doc))
+        self.idf = {
+            termo: math.log((total - df + 0.5) / (df + 0.5) + 1)
+            for termo, df in documentos_por_termo.items()
+        }
+
+    def pontuar(self, consulta: List[str]) -> List[float]:
+        consulta = [t for t in set(consulta) if t in self.idf]
+        pontuacoes = []
+        for frequencias, tamanho in zip(self.frequencias, self.tamanhos):
+            normalizacao = self.k1 * (1 - self.b + self.b * tamanho / (self.tamanho_medio or 1))
+            pontuacao = 0.0
+            for termo in consulta:
+                tf = frequencias.get(termo)
+                if tf:
+                    pontuacao += self.idf[termo] * tf * (self.k1 + 1) / (tf + normalizacao)
+            pontuacoes.append(pontuacao)
+        return pontuacoes
+
+
+class IndiceNota:
+    """
+    Índice das ERs de uma nota técnica (estrutura de Categorias). Cada ER
+    é indexada pelo nome e descrição dela e da sua categoria.
+    """
+
+    def __init__(self, nota: dict):
+        self.posicoes: List[Tuple[int, int]] = []
+        documentos = []
+        for ci, categoria in enumerate(nota.get("Categorias", [])):
+            texto_categoria = f"{categoria.get('Nome', '')} {categoria.get('Descrição', '')}"
+            for ei, er in enumerate(categoria.get("ERs", [])):
+                self.posicoes.append((ci, ei))
+                documentos.append(termos(f"{er.get('Nome', '')} {er.get('Descrição', '')} {texto_categoria}"))
+        self.bm25 = IndiceBM25(documentos)
+
+    def ranquear(self, clinico_text: str) -> List[Tuple[int, int]]:
+        """Posições (categoria, ER) da mais para a menos relevante ao texto clínico."""
+        pontuacoes = self.bm25.pontuar(termos(clinico_text))
+        ordem = sorted(range(len(self.posicoes)), key=lambda i: (-pontuacoes[i], i))
+        return [self.posicoes[i] for i in ordem]
+
+
+@lru_cache(maxsize=256)
+def indice_da_nota(nota_json_str: str) -> IndiceNota:
+    """
+    Índice da nota técnica, construído uma vez por nota (o catálogo de
+    procedimentos já os constrói ao carregar cada versão).
+    """
+    return IndiceNota(json.loads(nota_json_str))
+
+
+# --- Compactação ---
+
+def configuracao() -> Optional[Dict[str, Any]]:
+    """settings.JUSTIFICATIVA_COMPACTACAO, ou None se a compactação estiver desligada."""
+    config = getattr(settings, "JUSTIFICATIVA_COMPACTACAO", {})
+    if not config.get("ATIVA", False):
+        return None
+    return config
+
+
+class NotaCompactada(NamedTuple):
+    nota: dict
+    metadados: Dict[str, Any]   # o que foi mantido/descartado (vai para metadados_ia)
+
+
+def compactar(nota: dict, nota_json_str: str, clinico_text: str,
+              montar_requisitos: Callable[[dict], str], config: Dict[str, Any]) -> Optional[NotaCompactada]:
+    """
+    Reduz a nota técnica às ERs mais relevantes para o texto clínico quando
+    o texto de requisitos passa de ORCAMENTO_TOKENS.
+
+    Mantém sempre as ERs das CATEGORIAS_OBRIGATORIAS e acrescenta, na ordem
+    do ranking BM25, até TOP_K ERs das demais categorias que ainda caibam no
+    orçamento. A ordem original de categorias e ERs é preservada no prompt.
+    Retorna None se a nota já cabe no orçamento (nada a compactar).
+
+    O trecho da nota passa a depender do texto clínico, então o prefixo do
+    prompt deixa de ser compartilhado entre requisições do mesmo
+    procedimento: a compactação compensa para notas técnicas grandes.
+    """
+    orcamento = config.get("ORCAMENTO_TOKENS", 400)
+    tokens_original = estimar_tokens(montar_requisitos(nota))
+    if tokens_original <= orcamento:
+        return None
+
+    categorias = nota.get("Categorias", [])
+    obrigatorias = {_normalizar(nome) for nome in config.get("CATEGORIAS_OBRIGATORIAS", [])}
+    manter = {
+        (ci, ei)
+        for ci, categoria in enumerate(categorias) if _normalizar(categoria.get("Nome", "")) in obrigatorias
+        for ei in range(len(categoria.get("ERs", [])))
+    }
+
+    def _filtrar(posicoes):
+        filtradas = []
+        for ci, categoria in enumerate(categorias):
+            ers = [er for ei, er in enumerate(categoria.get("ERs", [])) if (ci, ei) in posicoes]
+            if ers:
+                filtradas.append({**categoria, "ERs": ers})
+        return {**nota, "Categorias": filtradas}
+
+    ranking = [pos for pos in indice_da_nota(nota_json_str).ranquear(clinico_text) if pos not in manter]
+    for pos in ranking[:config.get("TOP_K", 8)]:
+        candidata = manter | {pos}
+        if estimar_tokens(montar_requisitos(_filtrar(candidata))) <= orcamento:
+            manter = candidata
+
+    compactada = _filtrar(manter)
+    descartadas = [
+        {"categoria": categoria.get("Nome", ""), "er": er.get("Nome", "")}
+        for ci, categoria in enumerate(categorias)
+        for ei, er in enumerate(categoria.get("ERs", []))
+        if (ci, ei) not in manter
+    ]
+    return NotaCompactada(compactada, {
+        "ers_mantidas": len(manter),
+        "ers_descartadas": descartadas,
+        "tokens_estimados": {"original": tokens_original, "compactado": estimar_tokens(montar_requisitos(compactada))},
+    })
@@ -0,0 +1,332 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+
+# --- Exceções ---
+
+class IAIndisponivel(ConnectionError):
+    """
+    A geração foi recusada antes de chegar ao Ollama. Herda de
+    ConnectionError para manter o tratamento existente (views e fila de
+    jobs); as views usam `status_code` e `retry_after` na resposta.
+    """
+    status_code = 503
+
+    def __init__(self, mensagem: str, retry_after: int):
+        super().__init__(mensagem)
+        self.retry_after = max(1, int(retry_after))
+
+
+class SobrecargaIA(IAIndisponivel):
+    """Limite de gerações simultâneas atingido e fila de espera cheia (ou prazo de espera esgotado)."""
+    status_code = 429
+
+
+class CircuitoAberto(IAIndisponivel):
+    """O Ollama falhou seguidamente e as chamadas estão suspensas."""
+    status_code = 503
+
+
+# --- Limitador de Concorrência (AIMD) ---
+
+class LimitadorAdaptativo:
+    """
+    Controle de admissão das gerações no Ollama.
+
+    Mantém no máximo `limite` gerações em andamento; as demais esperam em
+    uma fila limitada (até `fila_max` requisições, por no máximo
+    `espera_max` segundos) e, com a fila cheia, são recusadas na hora.
+
+    Com `adaptativo`, o limite segue AIMD: cresce ~1 a cada `limite`
+    gerações concluídas dentro de `latencia_alvo` e cai pela metade quando
+    uma geração falha ou passa do alvo (no máximo uma redução por janela
+    de `latencia_alvo` segundos, para uma rajada lenta não zerar o limite).
+
+    A mesma fila atende threads (views WSGI e worker de jobs) e corrotinas
+    (views ASGI): cada requisição na fila é um threading.Event ou um
+    asyncio.Future, liberado por `sair`.
+    """
+
+    def __init__(self, limite: int, limite_min: int, limite_max: int, fila_max: int,
+                 espera_max: float, adaptativo: bool, latencia_alvo: float):
+        self.limite = float(limite)
+        self.limite_min = limite_min
+        self.limite_max = limite_max
+        self.fila_max = fila_max
+        self.espera_max = espera_max
+        self.adaptativo = adaptativo
+        self.latencia_alvo = latencia_alvo
+
+        self.em_andamento = 0
+        self.recusadas = 0
+        self._fila = deque()
+        self._ultima_reducao = 0.0
+        self._lock = threading.Lock()
+
+    def _livre(self) -> bool:
+        return self.em_andamento < int(self.limite)
+
+    def _retry_after(self) -> int:
+        # Estimativa grosseira: tempo para a fila andar uma vez
+        return int(self.latencia_alvo)
+
+    def _recusar(self, motivo: str):
+        self.recusadas += 1
+        return SobrecargaIA(f"O serviço de IA está sobrecarregado ({motivo}). Tente novamente em instantes.", self._retry_after())
+
+    def entrar(self):
+        with self._lock:
+            if self._livre() and not self._fila:
+                self.em_andamento += 1
+                return
+            if len(self._fila) >= self.fila_max:
+                raise self._recusar("fila cheia")
+            evento = threading.Event()
+            self._fila.append(evento)
+
+        if evento.wait(self.espera_max):
+            return
+        with self._lock:
+            if evento in self._fila:
+                self._fila.remove(evento)
+                raise self._recusar("tempo de espera esgotado")
+        # Liberado no limite do prazo: a vaga já é desta requisição
+
+    async def entrar_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._livre() and not self._fila:
+                self.em_andamento += 1
+                return
+            if len(self._fila) >= self.fila_max:
+                raise self._recusar("fila cheia")
+            futuro = loop.create_future()
+            self._fila.append(futuro)
+
+        try:
+            await asyncio.wait_for(futuro, self.espera_max)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                na_fila = futuro in self._fila
+                if na_fila:
+                    self._fila.remove(futuro)
+            if not na_fila and futuro.done() and not futuro.cancelled():
+                # A vaga foi concedida, mas a requisição desistiu antes de usá-la.
+                # (Se o futuro foi cancelado, `_conceder_async` devolve a vaga.)
+                self.sair(None, 0.0)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._recusar("tempo de espera esgotado")
+            raise
+
+    def sair(self, sucesso: Optional[bool], latencia: float):
+        """
+        Libera a vaga. `sucesso` None (geração interrompida pelo cliente,
+        por exemplo) não altera o limite.
+        """
+        with self._lock:
+            self.em_andamento -= 1
+            if self.adaptativo and sucesso is not None:
+                self._ajustar_limite(sucesso and latencia <= self.latencia_alvo)
+            self._liberar_fila()
+
+    def _ajustar_limite(self, dentro_do_alvo: bool):
+        if dentro_do_alvo:
+            self.limite = min(self.limite_max, self.limite + 1 / self.limite)
+        elif time.monotonic() - self._ultima_reducao >= self.latencia_alvo:
+            self.limite = max(self.limite_min, self.limite / 2)
+            self._ultima_reducao = time.monotonic()
+
+    def _liberar_fila(self):
+        while self._fila and self._livre():
+            aguardando = self._fila.popleft()
+            self.em_andamento += 1
+            if isinstance(aguardando, threading.Event):
+                aguardando.set()
+            else:
+                aguardando.get_loop().call_soon_threadsafe(self._conceder_async, aguardando)
+
+    def _conceder_async(self, futuro):
+        if futuro.done():
+            # A requisição desistiu (prazo ou cancelamento) depois de liberada
+            self.sair(None, 0.0)
+        else:
+            futuro.set_result(None)
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limite": int(self.limite),
+                "em_andamento": self.em_andamento,
+                "na_fila": len(self._fila),
+                "fila_max": self.fila_max,
+                "recusadas": self.recusadas,
+                "adaptativo": self.adaptativo,
+            }
+
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Suspende as chamadas ao Ollama depois de `limite_falhas` falhas
+    seguidas. Aberto, recusa na hora (sem ocupar workers esperando
+    timeouts); após `tempo_abertura` segundos fica meio-aberto e deixa
+    passar uma chamada de teste: sucesso fecha o circuito, falha o reabre.
+    """
+    FECHADO = "fechado"
+    ABERTO = "aberto"
+    MEIO_ABERTO = "meio_aberto"
+
+    def __init__(self, limite_falhas: int, tempo_abertura: float):
+        self.limite_falhas = limite_falhas
+        self.tempo_abertura = tempo_abertura
+        self.estado = self.FECHADO
+        self.falhas_consecutivas = 0
+        self._aberto_em = 0.0
+        self._sonda_em_andamento = False
+        self._lock = threading.Lock()
+
+    def _restante(self) -> float:
+        return self.tempo_abertura - (time.monotonic() - self._aberto_em)
+
+    def permitir(self) -> bool:
+        """
+        Autoriza uma chamada ou lança CircuitoAberto.
+        Retorna True se a chamada é a sonda do estado meio-aberto.
+        """
+        with self._lock:
+            if self.estado == self.ABERTO:
+                if self._restante() > 0:
+                    raise self._recusar(self._restante())
+                self.estado = self.MEIO_ABERTO
+                self._sonda_em_andamento = False
+            if self.estado == self.MEIO_ABERTO:
+                if self._sonda_em_andamento:
+                    raise self._recusar(self.tempo_abertura)
+                self._sonda_em_andamento = True
+                return True
+            return False
+
+    def registrar(self, sucesso: Optional[bool], sonda: bool):
+        """`sucesso` None: chamada interrompida sem resultado (só libera a sonda)."""
+        with self._lock:
+            if sonda:
+                self._sonda_em_andamento = False
+            if sucesso is None:
+                return
+            if sucesso:
+                if self.estado != self.FECHADO:
+                    print("INFO: Ollama respondeu; circuito fechado.")
+                self.estado = self.FECHADO
+                self.falhas_consecutivas = 0
+                return
+            self.falhas_consecutivas += 1
+            if self.estado == self.MEIO_ABERTO or self.falhas_consecutivas >= self.limite_falhas:
+                if self.estado != self.ABERTO:
+                    print(f"AVISO: {self.falhas_consecutivas} falha(s) seguida(s) do Ollama; circuito aberto por {self.tempo_abertura}s.")
+                self.estado = self.ABERTO
+                self._aberto_em = time.monotonic()
+
+    def _recusar(self, restante: float):
+        return CircuitoAberto("O serviço de IA está temporariamente indisponível.", restante)
+
+    def resumo(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "estado": self.estado,
+                "falhas_consecutivas": self.falhas_consecutivas,
+                "reabre_em": max(0, round(self._restante(), 1)) if self.estado == self.ABERTO else None,
+            }
+
+
+# --- Ponto de Entrada ---
+
+_limitador = None
+_circuito = None
+_instancias_lock = threading.Lock()
+
+
+def _instancias():
+    global _limitador, _circuito
+    if _limitador is None:
+        with _instancias_lock:
+            if _limitador is None:
+                config = getattr(settings, "OLLAMA_ADMISSAO", {})
+                limite = config.get("LIMITE", 4)
+                _circuito = CircuitBreaker(
+                    limite_falhas=config.get("CIRCUITO_FALHAS", 5),
+                    tempo_abertura=config.get("CIRCUITO_TEMPO_ABERTO", 30),
+                )
+                _limitador = LimitadorAdaptativo(
+                    limite=limite,
+                    limite_min=config.get("LIMITE_MIN", 1),
+                    limite_max=config.get("LIMITE_MAX", limite),
+                    fila_max=config.get("FILA_MAX", 16),
+                    espera_max=config.get("ESPERA_MAX", 30),
+                    adaptativo=config.get("ADAPTATIVO", False),
+                    latencia_alvo=config.get("LATENCIA_ALVO", 30),
+                )
+    return _limitador, _circuito
+
+
+@contextmanager
+def geracao():
+    """
+    Envolve uma chamada ao Ollama: passa pelo circuit breaker e pelo
+    limitador, e ao final registra o resultado nos dois.
+    Falhas de comunicação (ConnectionError) contam como falha.
+    """
+    limitador, circuito = _instancias()
+    sonda = circuito.permitir()
+    try:
+        limitador.entrar()
+    except BaseException:
+        circuito.registrar(None, sonda)
+        raise
+
+    inicio = time.monotonic()
+    sucesso = None
+    try:
+        yield
+        sucesso = True
+    except ConnectionError:
+        sucesso = False
+        raise
+    finally:
+        limitador.sair(sucesso, time.monotonic() - inicio)
+        circuito.registrar(sucesso, sonda)
+
+
+@asynccontextmanager
+async def geracao_async():
+    """Versão assíncrona de `geracao`."""
+    limitador, circuito = _instancias()
+    sonda = circuito.permitir()
+    try:
+        await limitador.entrar_async()
+    except BaseException:
+        circuito.registrar(None, sonda)
+        raise
+
+    inicio = time.monotonic()
+    sucesso = None
+    try:
+        yield
+        sucesso = True
+    except ConnectionError:
+        sucesso = False
+        raise
+    finally:
+        limitador.sair(sucesso, time.monotonic() - inicio)
+        circuito.registrar(sucesso, sonda)
+
+
+def estado() -> Dict[str, Any]:
+    limitador, circuito = _instancias()
+    return {"admissao": limitador.estado(), "circuito": circuito.resumo()}
@@ -0,0 +1,147 @@
+import json
+import re
+from typing import Iterable, Optional
+
+# Marcações do raciocínio que alguns modelos emitem antes da resposta
+_ABRE_THINK = "<think>"
+_FECHA_THINK_RE = re.compile(r"</think>", flags=re.IGNORECASE)
+
+# Próximo caractere relevante em cada estado do scan
+_FORA_RE = re.compile(r"[{<]")
+_OBJETO_RE = re.compile(r'[{}"]')
+_STRING_RE = re.compile(r'["\\]')
+
+
+class ExtratorJSON:
+    """
+    Extrai o primeiro objeto JSON válido de uma resposta do modelo, em uma
+    única passada e sem voltar atrás, a partir do texto inteiro ou de
+    pedaços chegando pelo streaming.
+
+    - Blocos <think>...</think> fora do objeto são ignorados (um bloco não
+      fechado descarta o resto do texto).
+    - Dentro do objeto, chaves em strings JSON (e aspas escapadas) não
+      contam para o balanceamento.
+    - Um trecho balanceado que não é JSON válido (ex.: "{texto}" na prosa
+      antes de um bloco ```json) é descartado e o scan continua depois
+      dele, então o custo total é linear no tamanho da resposta.
+
+    Uso: `alimentar(pedaco)` devolve o objeto (dict) assim que ele fecha;
+    depois disso os pedaços seguintes são ignorados.
+    """
+
+    def __init__(self):
+        self.objeto = None
+        self._candidato = []       # pedaços do objeto em andamento (desde a "{")
+        self._profundidade = 0
+        self._em_string = False
+        self._escape = False
+        self._em_think = False
+        self._pendente = ""        # fim do último pedaço que pode ser o início de uma tag
+
+    @property
+    def concluido(self) -> bool:
+        return self.objeto is not None
+
+    def alimentar(self, pedaco: str) -> Optional[dict]:
+        if self.objeto is not None or not pedaco:
+            return self.objeto
+
+        texto = self._pendente + pedaco
+        self._pendente = ""
+        i = 0
+        inicio = 0 if self._profundidade else None
+        n = len(texto)
+
+        while i < n:
+            if self._profundidade:
+                if self._em_string:
+                    if self._escape:
+                        self._escape = False
+                        i += 1
+                        continue
+                    m = _STRING_RE.search(texto, i)
+                    if m is None:
+                        break
+                    i = m.end()
+                    if m.group() == "\\":
+                        self._escape = True
+                    else:
+                        self._em_string = False
+                    continue
+
+                m = _OBJETO_RE.search(texto, i)
+                if m is None:
+                    break
+                i = m.end()
+                ch = m.group()
+                if ch == '"':
+                    self._em_string = True
+                elif ch == "{":
+                    self._profundidade += 1
+                else:
+                    self._profundidade -= 1
+                    if self._profundidade == 0:
+                        self._candidato.append(texto[inicio:i])
+                        inicio = None
+                        if self._decodificar():
+                            return self.objeto
+                continue
+
+            if self._em_think:
+                m = _FECHA_THINK_RE.search(texto, i)
+                if m is None:
+                    # Guarda só o que pode ser o começo de um "</think>"
+                    self._pendente = texto[max(i, n - len("</think>") + 1):]
+                    return None
+                self._em_think = False
+                i = m.end()
+                continue
+
+            m = _FORA_RE.search(texto, i)
+            if m is None:
+                return None
+            i = m.start()
+            if texto[i] == "{":
+                self._profundidade = 1
+                inicio = i
+                i += 1
+                continue
+            trecho = texto[i:i + len(_ABRE_THINK)].lower()
+            if trecho == _ABRE_THINK:
+                self._em_think = True
+                i += len(_ABRE_THINK)
+            elif i + len(trecho) == n and _ABRE_THINK.startswith(trecho):
+                # Tag possivelmente cortada entre dois pedaços
+                self._pendente = texto[i:]
+                return None
+            else:
+                i += 1
+
+        if inicio is not None:
+            self._candidato.append(texto[inicio:])
+        return None
+
+    def _decodificar(self) -> bool:
+        candidato = "".join(self._candidato)
+        self._candidato = []
+        try:
+            objeto = json.loads(candidato)
+        except json.JSONDecodeError:
+            return False
+        self.objeto = objeto
+        return True
+
+
+def extrair_primeiro_objeto(partes: Iterable[str]) -> Optional[dict]:
+    """
+    Primeiro objeto JSON válido de um texto (str) ou de uma sequência de
+    pedaços de texto; None se não houver nenhum.
+    """
+    if isinstance(partes, str):
+        partes = (partes,)
+    extrator = ExtratorJSON()
+    for parte in partes:
+        if extrator.alimentar(parte) is not None:
+            break
+    return extrator.objeto
@@ -1,73 +1,42 @@
 import json
-import re
 import textwrap
-import time
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterator, AsyncIterator, NamedTuple, Tuple
 
+import httpx
 import requests
 from django.conf import settings
 
-# --- Constantes e Expressões Regulares ---
-
-# Regex para remover blocos <think>...</think>
-_THINK_RE = re.compile(r"<think>.*?</think>", flags=re.DOTALL | re.IGNORECASE)
-# Regex para extrair de blocos de código ```json ... ```
-_CODE_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", flags=re.DOTALL | re.IGNORECASE)
-
-
-# --- Funções Auxiliares de Limpeza ---
-
-def _strip_think_blocks(text: str) -> str:
-    """Remove quaisquer blocos <think>...</think> que o modelo possa ter emitido."""
-    return _THINK_RE.sub("", text)
-
-
-def _extract_first_json_object(text: str) -> Optional[str]:
-    """
-    Extrai o primeiro objeto JSON bem balanceado encontrado na string.
-    Estratégia:
-      1) Se houver bloco ```json ... ```, tenta usar o conteúdo interno.
-      2) Scan por chaves { } balanceadas para isolar o primeiro objeto.
-    """
-    m = _CODE_FENCE_RE.search(text)
-    if m:
-        inner = m.group(1).strip()
-        maybe = _extract_by_brace_balance(inner)
-        if maybe:
-            return maybe
-    return _extract_by_brace_balance(text)
-
-def _extract_by_brace_balance(text: str) -> Optional[str]:
-    """Extrai o primeiro bloco {...} com chaves balanceadas."""
-    start = text.find("{")
-    while start != -1:
-        depth = 0
-        for i in range(start, len(text)):
-            ch = text[i]
-            if ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    return text[start:i+1]
-        start = text.find("{", start + 1)
-    return None
+from fillsense.services import (
+    backends_ollama_service,
+    cache_justificativa_service,
+    compactacao_nota_service,
+    controle_ollama_service,
+)
+from fillsense.services.extracao_json_service import ExtratorJSON
+from users_api import clientes_http
 
 # --- Funções de Geração de Prompt ---
 
+# O prompt é montado do conteúdo mais estável para o mais variável: instruções
+# fixas (mensagem de sistema), critérios da nota técnica, procedimento e, por
+# último, as informações clínicas. Assim, requisições do mesmo procedimento
+# compartilham o início do prompt e o Ollama reaproveita o cache KV desse
+# prefixo em vez de reprocessá-lo a cada geração.
+
 def _prompt_template() -> str:
     """
     Template modificado: saída deve ser JSON no ponto de vista do profissional de saúde solicitante.
+    Contém só as instruções fixas; os dados da requisição vêm em `_dados_template`.
     """
     return textwrap.dedent("""
     Sua tarefa é redigir a JUSTIFICATIVA CLÍNICA fundamentada nas informações clínicas e nos critérios da nota técnica.
 
     A saída deve ser EXCLUSIVAMENTE em JSON válido, no seguinte formato:
 
-    {{
+    {
       "procedimento": "<nome do procedimento>",
       "justificativa": "<texto clínico conciso estruturado em 2 a 3 parágrafos, escrito na perspectiva do profissional solicitante>"
-    }}
+    }
 
     REGRAS:
     - Escreva a justificativa como se fosse o médico/profissional solicitante.
@@ -80,50 +49,51 @@ def _prompt_template() -> str:
     - Apresente na justificativa TODOS os dados clínicos do paciente informados.
     - Quando um dado clínico do paciente atender ao critério apresentado, mencione isso na justificativa. CASO NÃO ATENDA, IGNORE.
     - NÃO inclua texto fora do JSON, comentários ou explicações adicionais.
+    """)
+
 
+def _dados_template() -> str:
+    """Dados da requisição, do mais estável (nota técnica) ao mais variável (texto clínico)."""
+    return textwrap.dedent("""
     DADOS:
+    - Critérios da nota técnica: <<{requisitos}>>
     - Procedimento: <<{procedimento}>>
     - Informações clínicas: <<{clinico}>>
-    - Critérios da nota técnica: <<{requisitos}>>
     """)
 
+
+_SYSTEM_TEXT = (
+    """Você é um profissional de saúde solicitando a realização de um procedimento 
+            para seu paciente. """
+    "Sempre retorne JSON válido, sem qualquer texto adicional fora do JSON.\n"
+    + _prompt_template()
+)
+
+
 def _build_messages(procedimento: str, clinico: str, requisitos: str) -> List[Dict[str, Any]]:
     """
     Constrói o array de mensagens para o endpoint /api/chat do Ollama.
+    A mensagem de sistema é idêntica em todas as requisições.
     """
-    system_text = (
-        """Você é um profissional de saúde solicitando a realização de um procedimento 
-            para seu paciente. """
-        "Sempre retorne JSON válido, sem qualquer texto adicional fora do JSON."
-    )
-    
-    user_prompt = _prompt_template().format(
+    user_prompt = _dados_template().format(
         procedimento=procedimento,
         clinico=clinico,
         requisitos=requisitos
     )
     return [
-        {"role": "system", "content": system_text},
+        {"role": "system", "content": _SYSTEM_TEXT},
         {"role": "user", "content": user_prompt},
     ]
 
 
 # --- Função de Chamada à API ---
 
-def _call_ollama(messages: List[Dict[str, Any]], retries: int = 2) -> str:
+def _build_payload(messages: List[Dict[str, Any]], stream: bool = False) -> Dict[str, Any]:
     """
-    Chama o Ollama /api/chat e retorna o texto final (string).
-    Adaptado para usar as configurações do settings.py do Django.
+    Monta o corpo da requisição para o /api/chat do Ollama a partir do settings.py.
     """
-    
-    # URL do endpoint
-    url = f"{settings.OLLAMA_BASE_URL.rstrip('/')}/api/chat"
-
-    # Lê as configurações do Django settings
-    timeout = getattr(settings, "OLLAMA_TIMEOUT", 600)
     num_predict = getattr(settings, "OLLAMA_MAX_TOKENS", 600)
-    
-    payload: Dict[str, Any] = {
+    return {
         "model": settings.OLLAMA_MODEL,
         "messages": messages,
         "options": {
@@ -132,38 +102,320 @@ def _call_ollama(messages: List[Dict[str, Any]], retries: int = 2) -> str:
             "seed": settings.OLLAMA_DEFAULT_SEED,
         },
         "format": "json",
-        "stream": False,
+        "stream": stream,
         "think": False,
+        # Mantém o modelo (e o cache KV do prefixo) carregado entre as requisições
+        "keep_alive": _keep_alive(),
     }
 
-    headers = {
-        "Content-Type": "application/json",
-    }
 
-    last_err = None
-    for attempt in range(retries + 1):
-        try:
-            r = requests.post(url, json=payload, headers=headers, timeout=timeout)
+def _keep_alive():
+    keep_alive = getattr(settings, "OLLAMA_KEEP_ALIVE", "30m")
+    # O Ollama aceita duração ("30m") ou segundos (-1 = sempre carregado)
+    try:
+        return int(keep_alive)
+    except (TypeError, ValueError):
+        return keep_alive
+
+
+def _url_chat(backend) -> str:
+    return f"{backend.url}/api/chat"
+
+
+def _chat_no_backend(backend, payload: Dict[str, Any], retries: Optional[int]) -> str:
+    try:
+        r = clientes_http.cliente("ollama").post(_url_chat(backend), json=payload, tentativas=retries)
+        r.raise_for_status()
+        data = r.json()
+        content = (data.get("message", {}) or {}).get("content", "")
+        return (content or "").strip()
+    except requests.exceptions.RequestException as e:
+        # Lança a exceção que a view espera
+        raise ConnectionError(f"Falha ao comunicar com o serviço Ollama ({backend.url}): {e}") from e
+
+
+def _call_ollama(messages: List[Dict[str, Any]], retries: Optional[int] = None) -> str:
+    """
+    Chama o Ollama /api/chat e retorna o texto final (string).
+
+    Usa o cliente HTTP compartilhado "ollama" (conexões keep-alive,
+    configurado em settings.CLIENTES_HTTP) e passa pelo controle de
+    admissão e circuit breaker (controle_ollama_service): com o Ollama
+    saturado ou fora do ar, a chamada é recusada na hora com SobrecargaIA
+    ou CircuitoAberto em vez de ocupar o worker com novas tentativas.
+    `retries` substitui o número de novas tentativas configurado.
+
+    Com vários servidores em settings.OLLAMA_BACKENDS, a chamada vai para o
+    menos ocupado e, se ele falhar, é refeita nos demais
+    (backends_ollama_service).
+    """
+    payload = _build_payload(messages, stream=False)
+
+    with controle_ollama_service.geracao():
+        return backends_ollama_service.pool().executar(
+            settings.OLLAMA_MODEL, lambda backend: _chat_no_backend(backend, payload, retries)
+        )
+
+
+def _stream_no_backend(backend, payload: Dict[str, Any]) -> Iterator[str]:
+    try:
+        with clientes_http.cliente("ollama").post(_url_chat(backend), json=payload, stream=True, tentativas=0) as r:
             r.raise_for_status()
-            data = r.json()
-            content = (data.get("message", {}) or {}).get("content", "")
-            return (content or "").strip()
-        except requests.exceptions.RequestException as e:
-            last_err = e
-            if attempt < retries:
-                time.sleep(2 ** attempt)
-            else:
-                # Lança a exceção que a view espera
-                raise ConnectionError(f"Falha ao comunicar com o serviço Ollama: {e}") from e
-    
-    if last_err:
-        raise ConnectionError(f"Falha ao comunicar com o serviço Ollama após {retries} tentativas: {last_err}") from last_err
-    return ""
+            for line in r.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise ConnectionError(f"O serviço Ollama retornou um erro: {data['error']}")
+                content = (data.get("message", {}) or {}).get("content", "")
+                if content:
+                    yield content
+                if data.get("done"):
+                    break
+    except requests.exceptions.RequestException as e:
+        raise ConnectionError(f"Falha ao comunicar com o serviço Ollama ({backend.url}): {e}") from e
+    except json.JSONDecodeError as e:
+        raise ConnectionError(f"Resposta inválida do serviço Ollama durante o streaming: {e}") from e
+
+
+def _stream_ollama(messages: List[Dict[str, Any]]) -> Iterator[str]:
+    """
+    Chama o Ollama /api/chat com "stream": True e devolve os pedaços de texto
+    à medida que o modelo os gera.
+
+    O Ollama responde em NDJSON: uma linha por pedaço, com o texto em
+    message.content, e uma última linha com "done": true.
+    Não há novas tentativas aqui: depois que o primeiro token foi repassado
+    ao cliente não é possível recomeçar a geração de forma transparente
+    (antes dele, uma falha passa para o próximo backend do pool).
+
+    O controle de admissão (controle_ollama_service.geracao) fica com quem
+    chama, para a admissão ser decidida antes de a conexão com o Ollama
+    ser aberta.
+    """
+    payload = _build_payload(messages, stream=True)
+
+    yield from backends_ollama_service.pool().stream(
+        settings.OLLAMA_MODEL, lambda backend: _stream_no_backend(backend, payload)
+    )
+
+
+async def _chat_no_backend_async(backend, payload: Dict[str, Any], retries: Optional[int]) -> str:
+    try:
+        r = await clientes_http.cliente("ollama").post_async(_url_chat(backend), json=payload, tentativas=retries)
+        r.raise_for_status()
+        data = r.json()
+        content = (data.get("message", {}) or {}).get("content", "")
+        return (content or "").strip()
+    except httpx.HTTPError as e:
+        raise ConnectionError(f"Falha ao comunicar com o serviço Ollama ({backend.url}): {e}") from e
+
+
+async def _call_ollama_async(messages: List[Dict[str, Any]], retries: Optional[int] = None) -> str:
+    """
+    Versão assíncrona de `_call_ollama`, usando httpx.
+
+    Não bloqueia o worker enquanto o modelo gera: sob um servidor ASGI,
+    um único processo mantém várias gerações em andamento ao mesmo tempo.
+    """
+    payload = _build_payload(messages, stream=False)
+
+    async with controle_ollama_service.geracao_async():
+        return await backends_ollama_service.pool().executar_async(
+            settings.OLLAMA_MODEL, lambda backend: _chat_no_backend_async(backend, payload, retries)
+        )
+
+
+async def _stream_no_backend_async(backend, payload: Dict[str, Any]) -> AsyncIterator[str]:
+    try:
+        async with clientes_http.cliente("ollama").stream_async("POST", _url_chat(backend), json=payload) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise ConnectionError(f"O serviço Ollama retornou um erro: {data['error']}")
+                content = (data.get("message", {}) or {}).get("content", "")
+                if content:
+                    yield content
+                if data.get("done"):
+                    break
+    except httpx.HTTPError as e:
+        raise ConnectionError(f"Falha ao comunicar com o serviço Ollama ({backend.url}): {e}") from e
+    except json.JSONDecodeError as e:
+        raise ConnectionError(f"Resposta inválida do serviço Ollama durante o streaming: {e}") from e
+
+
+async def _stream_ollama_async(messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Versão assíncrona de `_stream_ollama` (também sem o controle de admissão).
+    """
+    payload = _build_payload(messages, stream=True)
+
+    partes = backends_ollama_service.pool().stream_async(
+        settings.OLLAMA_MODEL, lambda backend: _stream_no_backend_async(backend, payload)
+    )
+    try:
+        async for parte in partes:
+            yield parte
+    finally:
+        # Ao contrário do "yield from", o "async for" não fecha o gerador
+        # interno quando este é fechado antes do fim do stream
+        await partes.aclose()
+
+
+# --- Funções de Montagem e Pós-processamento ---
+
+def montar_nota_tecnica(ers_list: list) -> dict:
+    """
+    Transforma a lista plana de 'ers' (que vem do procedimento)
+    na estrutura de 'Categorias' aninhadas usada no prompt.
+    """
+    categorias_map = {}
+    for er in ers_list:
+        categoria = er.get('categoria', {})
+        cat_nome = categoria.get('Nome', 'Sem Categoria')
+        cat_desc = categoria.get('Descricao', '')
+
+        if cat_nome not in categorias_map:
+            categorias_map[cat_nome] = {
+                "Nome": cat_nome,
+                "Descrição": cat_desc,
+                "ERs": []
+            }
+
+        # Adiciona apenas a info da ER que o prompt precisa
+        categorias_map[cat_nome]["ERs"].append({
+            "Nome": er.get('Nome', 'N/A'),
+            "Descrição": er.get('Descricao', 'N/A')
+        })
+
+    return {"Categorias": list(categorias_map.values())}
+
+
+def _build_requisitos_da_nota(nota_json: dict) -> str:
+    """Monta o texto de requisitos usado no prompt a partir da nota técnica (dict)."""
+    linhas = ["REQUISITOS DA NOTA TÉCNICA:"]
+    for categoria in nota_json.get("Categorias", []):
+        linhas.append(f"CATEGORIA: {categoria.get('Nome', 'N/A')}({categoria.get('Descrição', 'N/A')})")
+        for er in categoria.get("ERs", []):
+            linhas.append(f" - {er.get('Nome', 'N/A')}: {er.get('Descrição', 'N/A')}")
+    return "\n".join(linhas)
+
+
+def _ler_nota(nota_json_str: str) -> dict:
+    try:
+        return json.loads(nota_json_str)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"O texto da nota técnica não é um JSON válido. Erro: {e}") from e
+
+
+def _build_requisitos(nota_json_str: str) -> str:
+    """
+    Converte a STRING JSON da nota técnica no texto de requisitos usado no prompt.
+
+    Raises:
+        ValueError: Se a nota_json_str não for um JSON válido.
+    """
+    return _build_requisitos_da_nota(_ler_nota(nota_json_str))
+
+
+class NotaTecnicaCompilada(NamedTuple):
+    """Nota técnica de um procedimento já pronta para o prompt."""
+    nota: dict           # estrutura de Categorias (montar_nota_tecnica)
+    nota_json_str: str   # a mesma estrutura serializada
+    requisitos: str      # texto de requisitos do prompt
+
+
+def compilar_nota_tecnica(ers_list: list) -> NotaTecnicaCompilada:
+    """
+    Pré-compila a nota técnica a partir das 'ers' do procedimento. Usado
+    pelo catálogo de procedimentos ao carregar cada versão, para que as
+    gerações por proc_id não precisem agrupar, serializar e remontar os
+    requisitos a cada requisição.
+    """
+    nota = montar_nota_tecnica(ers_list)
+    nota_json_str = json.dumps(nota, ensure_ascii=False)
+    if compactacao_nota_service.configuracao() is not None:
+        # Índice de relevância das ERs, usado na compactação do prompt
+        compactacao_nota_service.indice_da_nota(nota_json_str)
+    return NotaTecnicaCompilada(nota, nota_json_str, _build_requisitos_da_nota(nota))
+
+
+def _parse_resposta_ia(raw_response: str, extrator: Optional[ExtratorJSON] = None) -> Dict[str, Any]:
+    """
+    Pós-processamento robusto da resposta do modelo: extrai o primeiro
+    objeto JSON (ignorando blocos <think> e texto ao redor) e normaliza os
+    parágrafos da justificativa. No streaming, `extrator` é o que já
+    recebeu os pedaços da resposta.
+
+    Raises:
+        ValueError: Se a IA não retornar um JSON válido.
+    """
+    if extrator is None:
+        extrator = ExtratorJSON()
+        extrator.alimentar(raw_response)
+    parsed = extrator.objeto
+
+    if parsed is None:
+        raise ValueError(f"A resposta da IA não foi um JSON válido. Resposta recebida: {raw_response}")
+
+    # Normaliza parágrafos na justificativa (lógica do generate-entities.py)
+    if isinstance(parsed, dict) and "justificativa" in parsed:
+        just = parsed.get("justificativa")
+        if isinstance(just, str):
+            lines = [p.strip() for p in just.strip().splitlines() if p.strip()]
+            parsed["justificativa"] = "\n\n".join(lines)
+
+    return parsed
+
+
+def _preparar_geracao(procedimento: str, clinico_text: str, nota_json_str: str, requisitos: Optional[str] = None,
+                      nota: Optional[dict] = None) -> Tuple[List[Dict[str, Any]], str, Optional[Dict[str, Any]]]:
+    """
+    Monta as mensagens para a IA e a chave do cache de justificativas
+    correspondente a elas (mensagens + modelo + opções de geração).
+    `requisitos`, se informado, é o texto já montado a partir da nota técnica;
+    `nota`, a nota técnica já decodificada (ex.: a compilada no catálogo),
+    que a compactação usa em vez de ler nota_json_str de novo.
+
+    Com settings.JUSTIFICATIVA_COMPACTACAO ativa, uma nota técnica acima do
+    orçamento de tokens é reduzida às ERs mais relevantes para o texto
+    clínico (compactacao_nota_service); o terceiro valor retornado descreve
+    o que foi descartado (None se a nota foi usada inteira).
+    """
+    compactacao = None
+    config = compactacao_nota_service.configuracao()
+    if config is not None:
+        compactada = compactacao_nota_service.compactar(
+            nota if nota is not None else _ler_nota(nota_json_str),
+            nota_json_str, clinico_text, _build_requisitos_da_nota, config,
+        )
+        if compactada is not None:
+            requisitos = _build_requisitos_da_nota(compactada.nota)
+            compactacao = compactada.metadados
+    if requisitos is None:
+        requisitos = _build_requisitos(nota_json_str)
+    messages = _build_messages(
+        procedimento=procedimento,
+        clinico=clinico_text,
+        requisitos=requisitos
+    )
+    return messages, cache_justificativa_service.chave_cache(_build_payload(messages)), compactacao
+
+
+def _com_compactacao(parsed: Dict[str, Any], compactacao: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # Registra no resultado (e no cache) as ERs que ficaram fora do prompt
+    if compactacao is not None and isinstance(parsed, dict):
+        parsed["compactacao"] = compactacao
+    return parsed
 
 
 # --- Função Principal do Serviço (Ponto de Entrada para a View) ---
 
-def gerar_justificativa_ia(procedimento: str, clinico_text: str, nota_json_str: str) -> Dict[str, Any]:
+def gerar_justificativa_ia(procedimento: str, clinico_text: str, nota_json_str: str, usar_cache: bool = True, requisitos: Optional[str] = None,
+                           nota: Optional[dict] = None) -> Dict[str, Any]:
     """
     Orquestra a geração de justificativa, chamando a IA e processando a resposta.
     
@@ -173,6 +425,11 @@ def gerar_justificativa_ia(procedimento: str, clinico_text: str, nota_json_str:
         procedimento: O nome do procedimento a ser solicitado.
         clinico_text: O texto com as informações clínicas do paciente.
         nota_json_str: Uma STRING contendo o JSON da nota técnica.
+        usar_cache: Se falso, ignora o cache e força uma nova geração
+                    (o resultado novo substitui o que estava no cache).
+        requisitos: Texto de requisitos já montado a partir de nota_json_str
+                    (reaproveitado quando várias gerações usam a mesma nota).
+        nota: A nota técnica de nota_json_str já decodificada (opcional).
                           
     Returns:
         Um dicionário Python com o resultado, ex: {"procedimento": "...", "justificativa": "..."}.
@@ -182,53 +439,169 @@ def gerar_justificativa_ia(procedimento: str, clinico_text: str, nota_json_str:
         ValueError: Se a IA não retornar um JSON válido ou se a nota_json_str for inválida.
     """
     
-    # 1. Parsear o JSON da nota técnica
-    try:
-        nota_json = json.loads(nota_json_str)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"O texto da nota técnica não é um JSON válido. Erro: {e}") from e
-    
-    # 2. Construir a string de requisitos
-    requisitos = """REQUISITOS DA NOTA TÉCNICA:"""
-    for categoria in nota_json.get("Categorias", []):
-        requisitos += f"\nCATEGORIA: {categoria.get('Nome', 'N/A')}({categoria.get('Descrição', 'N/A')})"
-        for er in categoria.get("ERs", []):
-            requisitos += f"\n - {er.get('Nome', 'N/A')}: {er.get('Descrição', 'N/A')}"
+    # 1. Construir as mensagens para a IA (e a chave do cache)
+    messages, chave, compactacao = _preparar_geracao(procedimento, clinico_text, nota_json_str, requisitos, nota)
 
-    # 3. Construir as mensagens para a IA
-    messages = _build_messages(
-        procedimento=procedimento,
-        clinico=clinico_text,
-        requisitos=requisitos
-    )
+    # 2. Entradas idênticas geram a mesma saída (seed fixo): tenta o cache
+    if usar_cache:
+        cached = cache_justificativa_service.obter(chave)
+        if cached is not None:
+            return cached
 
-    # 4. Chamar a IA
+    # 3. Chamar a IA
     raw_response = _call_ollama(messages)
 
-    # 5. Pós-processamento robusto
-    cleaned = _strip_think_blocks(raw_response).strip()
-    
-    parsed = None
-    try:
-        # Tenta parse direto
-        parsed = json.loads(cleaned)
-    except json.JSONDecodeError:
-        # Se falhar, tenta extrair o primeiro objeto JSON
-        candidate = _extract_first_json_object(cleaned)
-        if candidate:
-            try:
-                parsed = json.loads(candidate)
-            except json.JSONDecodeError:
-                pass # A falha será capturada abaixo
-            
-    if parsed is None:
-        raise ValueError(f"A resposta da IA não foi um JSON válido. Resposta recebida: {raw_response}")
+    # 4. Pós-processamento robusto
+    parsed = _com_compactacao(_parse_resposta_ia(raw_response), compactacao)
+    cache_justificativa_service.guardar(chave, parsed)
+    return parsed
 
-    # 6. Normaliza parágrafos na justificativa (lógica do generate-entities.py)
-    if isinstance(parsed, dict) and "justificativa" in parsed:
-        just = parsed.get("justificativa")
-        if isinstance(just, str):
-            lines = [p.strip() for p in just.strip().splitlines() if p.strip()]
-            parsed["justificativa"] = "\n\n".join(lines)
 
-    return parsed
\ No newline at end of file
+def gerar_justificativa_ia_stream(procedimento: str, clinico_text: str, nota_json_str: str, usar_cache: bool = True, requisitos: Optional[str] = None,
+                                  nota: Optional[dict] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Variante em streaming de `gerar_justificativa_ia`.
+
+    Gera tuplas (evento, dado) na ordem em que acontecem:
+        ("admitido", None)               -> a geração passou pelo controle de
+                                            admissão; emitido antes de chamar
+                                            o Ollama (as views decidem o status
+                                            HTTP aqui, sem esperar o modelo);
+        ("token", "<pedaço de texto>")  -> repetido enquanto o modelo gera;
+        ("resultado", {...})             -> JSON final, validado e normalizado
+                                            exatamente como em `gerar_justificativa_ia`.
+
+    Em um acerto do cache, só o evento "resultado" é emitido.
+
+    Raises:
+        ConnectionError: Se houver falha na comunicação com a IA.
+        ValueError: Se a IA não retornar um JSON válido ou se a nota_json_str for inválida.
+    """
+    messages, chave, compactacao = _preparar_geracao(procedimento, clinico_text, nota_json_str, requisitos, nota)
+
+    if usar_cache:
+        cached = cache_justificativa_service.obter(chave)
+        if cached is not None:
+            yield "resultado", cached
+            return
+
+    # Para de ler o stream assim que o objeto JSON fecha: o que o modelo
+    # gerasse depois seria descartado, e fechar a conexão interrompe a geração
+    partes = []
+    extrator = ExtratorJSON()
+    with controle_ollama_service.geracao():
+        yield "admitido", None
+        stream = _stream_ollama(messages)
+        try:
+            for parte in stream:
+                partes.append(parte)
+                yield "token", parte
+                if extrator.alimentar(parte) is not None:
+                    break
+        finally:
+            stream.close()
+
+    parsed = _com_compactacao(_parse_resposta_ia("".join(partes).strip(), extrator), compactacao)
+    cache_justificativa_service.guardar(chave, parsed)
+    yield "resultado", parsed
+
+
+async def gerar_justificativa_ia_async(procedimento: str, clinico_text: str, nota_json_str: str, usar_cache: bool = True, requisitos: Optional[str] = None,
+                                       nota: Optional[dict] = None) -> Dict[str, Any]:
+    """
+    Versão assíncrona de `gerar_justificativa_ia`, para as views ASGI.
+    Recebe os mesmos argumentos e lança as mesmas exceções.
+    """
+    messages, chave, compactacao = _preparar_geracao(procedimento, clinico_text, nota_json_str, requisitos, nota)
+
+    if usar_cache:
+        cached = await cache_justificativa_service.obter_async(chave)
+        if cached is not None:
+            return cached
+
+    raw_response = await _call_ollama_async(messages)
+    parsed = _com_compactacao(_parse_resposta_ia(raw_response), compactacao)
+    await cache_justificativa_service.guardar_async(chave, parsed)
+    return parsed
+
+
+async def gerar_justificativa_ia_stream_async(procedimento: str, clinico_text: str, nota_json_str: str, usar_cache: bool = True, requisitos: Optional[str] = None,
+                                              nota: Optional[dict] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Versão assíncrona de `gerar_justificativa_ia_stream`, com os mesmos eventos.
+    """
+    messages, chave, compactacao = _preparar_geracao(procedimento, clinico_text, nota_json_str, requisitos, nota)
+
+    if usar_cache:
+        cached = await cache_justificativa_service.obter_async(chave)
+        if cached is not None:
+            yield "resultado", cached
+            return
+
+    partes = []
+    extrator = ExtratorJSON()
+    async with controle_ollama_service.geracao_async():
+        yield "admitido", None
+        stream = _stream_ollama_async(messages)
+        try:
+            async for parte in stream:
+                partes.append(parte)
+                yield "token", parte
+                if extrator.alimentar(parte) is not None:
+                    break
+        finally:
+            await stream.aclose()
+
+    parsed = _com_compactacao(_parse_resposta_ia("".join(partes).strip(), extrator), compactacao)
+    await cache_justificativa_service.guardar_async(chave, parsed)
+    yield "resultado", parsed
+
+
+# --- Aquecimento do Modelo ---
+
+def carregar_modelo() -> int:
+    """
+    Carrega o modelo na memória de cada servidor Ollama que o atende (um
+    /api/chat sem mensagens só carrega o modelo) e o mantém residente por
+    OLLAMA_KEEP_ALIVE. Retorna em quantos servidores o modelo foi carregado.
+
+    Raises:
+        ConnectionError: Se nenhum servidor respondeu.
+    """
+    payload = {"model": settings.OLLAMA_MODEL, "messages": [], "keep_alive": _keep_alive()}
+    backends = backends_ollama_service.pool().backends_do_modelo(settings.OLLAMA_MODEL)
+    carregados = 0
+    erro = None
+    for backend in backends:
+        try:
+            r = clientes_http.cliente("ollama").post(_url_chat(backend), json=payload, tentativas=0)
+            r.raise_for_status()
+            carregados += 1
+        except requests.exceptions.RequestException as e:
+            erro = e
+            print(f"AVISO: Falha ao carregar o modelo em {backend.url}: {e}")
+    if not carregados:
+        raise ConnectionError(f"Falha ao carregar o modelo no serviço Ollama: {erro}")
+    return carregados
+
+
+def aquecer_prefixo(procedimento: str, requisitos: str) -> None:
+    """
+    Processa no Ollama o prefixo do prompt de uma nota técnica (instruções,
+    critérios e procedimento, sem texto clínico) gerando um único token,
+    para que a primeira requisição real desse prefixo reaproveite o cache KV.
+    O aquecimento é feito em cada servidor do pool que atende o modelo.
+
+    O Ollama guarda o cache do último prompt de cada slot
+    (OLLAMA_NUM_PARALLEL), então o ganho é maior para as notas técnicas
+    mais recentes/frequentes.
+
+    Raises:
+        ConnectionError: Se houver falha na comunicação com o Ollama.
+    """
+    payload = _build_payload(_build_messages(procedimento, "", requisitos), stream=False)
+    payload["options"]["num_predict"] = 1
+
+    for backend in backends_ollama_service.pool().backends_do_modelo(settings.OLLAMA_MODEL):
+        with controle_ollama_service.geracao():
+            _chat_no_backend(backend, payload, 0)
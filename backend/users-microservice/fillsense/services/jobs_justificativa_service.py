@@ -0,0 +1,268 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from fillsense.models import JobJustificativa, Solicitacao
+from fillsense.services.controle_ollama_service import IAIndisponivel
+from fillsense.services.gerar_justificativa_service import gerar_justificativa_ia
+
+Status = JobJustificativa.StatusChoices
+
+
+# --- Enfileiramento e Cancelamento (chamados pelas views) ---
+
+def enfileirar_job(usuario, solicitacao: Solicitacao, procedimento: str, clinico_text: str, nota_tecnica: dict, usar_cache: bool = True) -> JobJustificativa:
+    """
+    Cria um job pendente de geração de justificativa e retorna imediatamente.
+    """
+    return JobJustificativa.objects.create(
+        usuario=usuario,
+        solicitacao=solicitacao,
+        procedimento=procedimento,
+        clinico_text=clinico_text,
+        nota_tecnica=nota_tecnica,
+        usar_cache=usar_cache,
+        max_tentativas=getattr(settings, "JOBS_JUSTIFICATIVA_MAX_TENTATIVAS", 3),
+    )
+
+
+def cancelar_job(job: JobJustificativa) -> bool:
+    """
+    Cancela um job.
+
+    - Pendente: é cancelado na hora (o UPDATE condicional evita corrida com
+      um worker que esteja reservando o mesmo job).
+    - Em execução: a geração não pode ser interrompida no Ollama, então o job
+      é marcado e o worker descarta o resultado ao terminar.
+
+    Retorna False se o job já estava finalizado.
+    """
+    cancelados = JobJustificativa.objects.filter(pk=job.pk, status=Status.PENDENTE).update(
+        status=Status.CANCELADO,
+        cancelamento_solicitado=True,
+        data_fim=timezone.now(),
+    )
+    if not cancelados:
+        cancelados = JobJustificativa.objects.filter(pk=job.pk, status=Status.EM_EXECUCAO).update(
+            cancelamento_solicitado=True,
+        )
+    job.refresh_from_db()
+    return bool(cancelados)
+
+
+# --- Fila (chamada pelos workers) ---
+
+def reservar_proximo_job(worker_id: str) -> Optional[JobJustificativa]:
+    """
+    Reserva o próximo job pendente com FOR UPDATE SKIP LOCKED.
+
+    Justiça entre usuários: os jobs são ordenados primeiro pela quantidade
+    de jobs que o mesmo usuário já tem em execução e só depois pela data
+    de criação, e usuários no limite JOBS_JUSTIFICATIVA_MAX_POR_USUARIO
+    são ignorados. Assim, quem enfileira 50 jobs não impede que o job
+    de outro usuário seja o próximo a rodar.
+    """
+    max_por_usuario = getattr(settings, "JOBS_JUSTIFICATIVA_MAX_POR_USUARIO", 1)
+    agora = timezone.now()
+
+    em_execucao_do_usuario = (
+        JobJustificativa.objects
+        .filter(usuario=OuterRef('usuario'), status=Status.EM_EXECUCAO)
+        .order_by()
+        .values('usuario')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+
+    with transaction.atomic():
+        job = (
+            JobJustificativa.objects
+            .filter(status=Status.PENDENTE, disponivel_em__lte=agora)
+            .annotate(em_execucao=Coalesce(Subquery(em_execucao_do_usuario), 0))
+            .filter(em_execucao__lt=max_por_usuario)
+            .order_by('em_execucao', 'data_criacao', 'id')
+            .select_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = Status.EM_EXECUCAO
+        job.worker = worker_id
+        job.tentativas += 1
+        job.data_inicio = agora
+        job.save(update_fields=['status', 'worker', 'tentativas', 'data_inicio'])
+    return job
+
+
+def executar_job(job: JobJustificativa) -> JobJustificativa:
+    """
+    Executa a geração de um job já reservado e grava o resultado no job
+    e na Solicitacao (justificativa e metadados_ia).
+
+    Falhas de comunicação com o Ollama voltam para a fila com backoff
+    exponencial até max_tentativas; respostas inválidas da IA falham direto.
+    """
+    try:
+        resultado = gerar_justificativa_ia(
+            procedimento=job.procedimento,
+            clinico_text=job.clinico_text,
+            nota_json_str=json.dumps(job.nota_tecnica, ensure_ascii=False),
+            usar_cache=job.usar_cache,
+            nota=job.nota_tecnica,
+        )
+    except IAIndisponivel as e:
+        # Ollama saturado ou circuito aberto: a geração nem começou
+        return _adiar_job(job, str(e), e.retry_after)
+    except ConnectionError as e:
+        return _registrar_falha(job, str(e), pode_repetir=True)
+    except Exception as e:
+        return _registrar_falha(job, str(e), pode_repetir=False)
+
+    with transaction.atomic():
+        job = JobJustificativa.objects.select_for_update().get(pk=job.pk)
+        job.data_fim = timezone.now()
+
+        if job.cancelamento_solicitado:
+            job.status = Status.CANCELADO
+            job.save(update_fields=['status', 'data_fim'])
+            return job
+
+        job.status = Status.CONCLUIDO
+        job.resultado = resultado
+        job.erro = ''
+        job.save(update_fields=['status', 'resultado', 'erro', 'data_fim'])
+
+        solicitacao = Solicitacao.objects.select_for_update().get(pk=job.solicitacao_id)
+        solicitacao.justificativa = resultado.get("justificativa", "") if isinstance(resultado, dict) else ""
+        solicitacao.metadados_ia = {
+            **(solicitacao.metadados_ia or {}),
+            "job_justificativa": job.id,
+            "modelo": settings.OLLAMA_MODEL,
+            "tentativas": job.tentativas,
+        }
+        if isinstance(resultado, dict) and resultado.get("compactacao"):
+            solicitacao.metadados_ia["compactacao"] = resultado["compactacao"]
+        else:
+            solicitacao.metadados_ia.pop("compactacao", None)
+        solicitacao.save(update_fields=['justificativa', 'metadados_ia', 'data_atualizacao'])
+    return job
+
+
+def _registrar_falha(job: JobJustificativa, erro: str, pode_repetir: bool) -> JobJustificativa:
+    with transaction.atomic():
+        job = JobJustificativa.objects.select_for_update().get(pk=job.pk)
+        job.erro = erro
+
+        if job.cancelamento_solicitado:
+            job.status = Status.CANCELADO
+            job.data_fim = timezone.now()
+        elif pode_repetir and job.tentativas < job.max_tentativas:
+            # Backoff exponencial com jitter para não sincronizar as novas tentativas
+            base = getattr(settings, "JOBS_JUSTIFICATIVA_BACKOFF_BASE", 5)
+            atraso = base * (2 ** (job.tentativas - 1)) * random.uniform(0.5, 1.5)
+            job.status = Status.PENDENTE
+            job.disponivel_em = timezone.now() + timedelta(seconds=atraso)
+            job.worker = ''
+        else:
+            job.status = Status.FALHOU
+            job.data_fim = timezone.now()
+
+        job.save(update_fields=['status', 'erro', 'disponivel_em', 'worker', 'data_fim'])
+    return job
+
+
+def _adiar_job(job: JobJustificativa, erro: str, atraso: int) -> JobJustificativa:
+    """
+    Devolve o job à fila sem consumir uma tentativa, para quando a geração
+    foi recusada pelo controle de admissão do Ollama.
+    """
+    with transaction.atomic():
+        job = JobJustificativa.objects.select_for_update().get(pk=job.pk)
+        job.erro = erro
+        if job.cancelamento_solicitado:
+            job.status = Status.CANCELADO
+            job.data_fim = timezone.now()
+        else:
+            job.status = Status.PENDENTE
+            job.tentativas -= 1
+            job.disponivel_em = timezone.now() + timedelta(seconds=atraso * random.uniform(1, 1.5))
+            job.worker = ''
+        job.save(update_fields=['status', 'erro', 'tentativas', 'disponivel_em', 'worker', 'data_fim'])
+    return job
+
+
+def recuperar_jobs_travados() -> int:
+    """
+    Trata os jobs que estão em execução há mais tempo que
+    JOBS_JUSTIFICATIVA_TIMEOUT (worker encerrado no meio da geração):
+
+    - com cancelamento pedido, são cancelados;
+    - sem tentativas restantes, falham: um job que derruba o worker (falta
+      de memória, crash no cliente) não volta para a fila para sempre;
+    - os demais voltam para a fila.
+
+    Retorna quantos jobs voltaram para a fila.
+    """
+    timeout = getattr(settings, "JOBS_JUSTIFICATIVA_TIMEOUT", getattr(settings, "OLLAMA_TIMEOUT", 600) * 2)
+    agora = timezone.now()
+    travados = JobJustificativa.objects.filter(status=Status.EM_EXECUCAO, data_inicio__lt=agora - timedelta(seconds=timeout))
+
+    travados.filter(cancelamento_solicitado=True).update(status=Status.CANCELADO, worker='', data_fim=agora)
+    esgotados = travados.filter(tentativas__gte=F('max_tentativas')).update(
+        status=Status.FALHOU,
+        erro="Execução interrompida (worker encerrado) sem tentativas restantes.",
+        worker='',
+        data_fim=agora,
+    )
+    if esgotados:
+        print(f"AVISO: {esgotados} job(s) travado(s) sem tentativas restantes marcado(s) como falha.")
+    return travados.update(status=Status.PENDENTE, worker='', disponivel_em=agora)
+
+
+def processar_fila(worker_id: str, concorrencia: int, intervalo: float, parar: threading.Event):
+    """
+    Loop do worker: mantém até `concorrencia` gerações em andamento,
+    reservando novos jobs conforme as anteriores terminam.
+    """
+    slots = threading.Semaphore(concorrencia)
+    ultima_recuperacao = 0.0
+
+    def _rodar(job):
+        try:
+            executar_job(job)
+        except Exception as e:
+            print(f"ERRO: Falha inesperada ao executar o job {job.pk}: {e}")
+        finally:
+            close_old_connections()
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix='job-justificativa') as executor:
+        while not parar.is_set():
+            if time.monotonic() - ultima_recuperacao > intervalo * 60:
+                recuperados = recuperar_jobs_travados()
+                if recuperados:
+                    print(f"INFO: {recuperados} job(s) travado(s) devolvido(s) à fila.")
+                ultima_recuperacao = time.monotonic()
+
+            if not slots.acquire(timeout=intervalo):
+                continue
+
+            job = reservar_proximo_job(worker_id)
+            if job is None:
+                slots.release()
+                parar.wait(intervalo)
+                continue
+
+            print(f"INFO: Job {job.pk} reservado (tentativa {job.tentativas}).")
+            executor.submit(_rodar, job)
@@ -0,0 +1,187 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from fillsense.models import Solicitacao
+from fillsense.services.controle_ollama_service import IAIndisponivel
+from fillsense.services.gerar_justificativa_service import (
+    _build_requisitos,
+    gerar_justificativa_ia,
+    gerar_justificativa_ia_async,
+)
+
+
+class ItemLote(NamedTuple):
+    """Um item do lote, já com a nota técnica resolvida pela view."""
+    indice: int
+    procedimento: str
+    clinico_text: str
+    nota_json_str: str
+    solicitacao_id: Optional[int] = None
+    requisitos: Optional[str] = None   # pré-compilado no catálogo, quando houver
+    nota: Optional[dict] = None        # nota_json_str já decodificada, quando houver
+
+
+def concorrencia_padrao() -> int:
+    return getattr(settings, "JUSTIFICATIVA_LOTE_CONCORRENCIA", 4)
+
+
+def _requisitos_por_nota(itens: List[ItemLote]) -> Dict[str, Any]:
+    """
+    Monta o texto de requisitos uma única vez por nota técnica do lote
+    (itens do mesmo procedimento compartilham a mesma nota). Uma nota
+    inválida guarda o ValueError, que vira o erro dos itens que a usam.
+    """
+    requisitos = {}
+    for item in itens:
+        if item.nota_json_str in requisitos:
+            continue
+        if item.requisitos is not None:
+            requisitos[item.nota_json_str] = item.requisitos
+            continue
+        try:
+            requisitos[item.nota_json_str] = _build_requisitos(item.nota_json_str)
+        except ValueError as e:
+            requisitos[item.nota_json_str] = e
+    return requisitos
+
+
+def _status_do_erro(erro: Exception) -> int:
+    # Mesmo mapeamento do endpoint 'gerar-justificativa'
+    if isinstance(erro, IAIndisponivel):
+        return erro.status_code
+    if isinstance(erro, ConnectionError):
+        return 503
+    return 500
+
+
+def _resultado_item(item: ItemLote, resultado: Optional[dict] = None, erro: Optional[Exception] = None) -> Dict[str, Any]:
+    if erro is None:
+        return {"indice": item.indice, "solicitacao": item.solicitacao_id, "status": 200, "resultado": resultado}
+    return {"indice": item.indice, "solicitacao": item.solicitacao_id, "status": _status_do_erro(erro), "erro": str(erro)}
+
+
+def gerar_lote(itens: List[ItemLote], usar_cache: bool = True, concorrencia: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Gera as justificativas de todos os itens, até `concorrencia` ao mesmo
+    tempo, e devolve o resultado de cada item assim que ele termina (fora
+    de ordem; use o campo "indice"). A falha de um item não interrompe os
+    demais: o item sai com "status" e "erro" no lugar de "resultado".
+
+    O limite global de gerações no Ollama continua valendo
+    (controle_ollama_service); `concorrencia` só limita este lote.
+    """
+    requisitos = _requisitos_por_nota(itens)
+
+    def _gerar(item):
+        texto = requisitos[item.nota_json_str]
+        if isinstance(texto, Exception):
+            return _resultado_item(item, erro=texto)
+        try:
+            resultado = gerar_justificativa_ia(
+                procedimento=item.procedimento,
+                clinico_text=item.clinico_text,
+                nota_json_str=item.nota_json_str,
+                usar_cache=usar_cache,
+                requisitos=texto,
+                nota=item.nota,
+            )
+            return _resultado_item(item, resultado=resultado)
+        except Exception as e:
+            return _resultado_item(item, erro=e)
+        finally:
+            # O cache de justificativas pode usar o banco nestas threads
+            close_old_connections()
+
+    max_workers = max(1, min(concorrencia or concorrencia_padrao(), len(itens)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lote-justificativa')
+    try:
+        futuros = [executor.submit(_gerar, item) for item in itens]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+    finally:
+        # Cliente desconectou no meio do stream: descarta o que ainda não
+        # começou e não espera as gerações em andamento (o "with" do
+        # executor seguraria a resposta até todas terminarem)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def gerar_lote_async(itens: List[ItemLote], usar_cache: bool = True, concorrencia: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Versão assíncrona de `gerar_lote`, com os mesmos resultados."""
+    requisitos = _requisitos_por_nota(itens)
+    semaforo = asyncio.Semaphore(concorrencia or concorrencia_padrao())
+
+    async def _gerar(item):
+        texto = requisitos[item.nota_json_str]
+        if isinstance(texto, Exception):
+            return _resultado_item(item, erro=texto)
+        async with semaforo:
+            try:
+                resultado = await gerar_justificativa_ia_async(
+                    procedimento=item.procedimento,
+                    clinico_text=item.clinico_text,
+                    nota_json_str=item.nota_json_str,
+                    usar_cache=usar_cache,
+                    requisitos=texto,
+                    nota=item.nota,
+                )
+                return _resultado_item(item, resultado=resultado)
+            except Exception as e:
+                return _resultado_item(item, erro=e)
+
+    tarefas = [asyncio.ensure_future(_gerar(item)) for item in itens]
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            yield await proxima
+    finally:
+        # Cliente desconectou no meio do stream: não deixa gerações órfãs
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+def salvar_resultados(usuario, resultados: List[Dict[str, Any]]) -> int:
+    """
+    Grava as justificativas geradas nas solicitações do usuário com um
+    único bulk_update. Itens com erro ou sem solicitação são ignorados.
+    Retorna quantas solicitações foram atualizadas.
+    """
+    por_solicitacao = {
+        r["solicitacao"]: r["resultado"]
+        for r in resultados
+        if r.get("solicitacao") is not None and r["status"] == 200
+    }
+    if not por_solicitacao:
+        return 0
+
+    agora = timezone.now()
+    with transaction.atomic():
+        solicitacoes = list(
+            Solicitacao.objects
+            .select_for_update()
+            .filter(usuario=usuario, pk__in=por_solicitacao.keys())
+            .only('id', 'metadados_ia')
+        )
+        for solicitacao in solicitacoes:
+            resultado = por_solicitacao[solicitacao.pk]
+            solicitacao.justificativa = resultado.get("justificativa", "") if isinstance(resultado, dict) else ""
+            solicitacao.metadados_ia = {
+                **(solicitacao.metadados_ia or {}),
+                "modelo": settings.OLLAMA_MODEL,
+                "gerado_em_lote": True,
+            }
+            if isinstance(resultado, dict) and resultado.get("compactacao"):
+                solicitacao.metadados_ia["compactacao"] = resultado["compactacao"]
+            else:
+                solicitacao.metadados_ia.pop("compactacao", None)
+            # bulk_update não aplica o auto_now
+            solicitacao.data_atualizacao = agora
+        Solicitacao.objects.bulk_update(solicitacoes, ['justificativa', 'metadados_ia', 'data_atualizacao'])
+    return len(solicitacoes)
+
+
+salvar_resultados_async = sync_to_async(salvar_resultados)
@@ -1,9 +1,21 @@
+import asyncio
 import os
 import glob
+import hashlib
 import json
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import close_old_connections, transaction
 from fillsense.models import Procedimento
+from fillsense.services.busca_procedimentos_service import IndiceBusca
+from fillsense.services.gerar_justificativa_service import NotaTecnicaCompilada, compilar_nota_tecnica
+from users_api import clientes_http
 
 # --- Camada de Adaptação (Transformação de Dados) ---
 
@@ -60,71 +72,394 @@ def _fetch_mock_procedimentos() -> list:
             continue
     return all_procs
 
-def _fetch_api_procedimentos() -> list:
+class RespostaApiProcedimentos(NamedTuple):
+    """Resultado de uma consulta (condicional) à API de procedimentos."""
+    procs: Optional[list]          # None quando a API respondeu 304
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+def _headers_condicionais(etag: Optional[str], last_modified: Optional[str]) -> dict:
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def _ler_resposta_api(response) -> RespostaApiProcedimentos:
+    """Interpreta a resposta (requests ou httpx) da API de procedimentos."""
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if response.status_code == 304:
+        return RespostaApiProcedimentos(None, etag, last_modified)
+
+    api_data = response.json() # API retorna uma lista [...]
+
+    # Transforma os dados da API para o formato mock
+    return RespostaApiProcedimentos(_transform_api_data_to_mock_format(api_data), etag, last_modified)
+
+
+def _fetch_api_procedimentos(etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[RespostaApiProcedimentos]:
     """
     Busca procedimentos da API real e os transforma.
+
+    Envia If-None-Match / If-Modified-Since quando já há uma versão em
+    memória, para que a API responda 304 sem corpo se nada mudou.
+    Retorna None em caso de falha.
     """
     print("INFO: Usando dados da API REAL para procedimentos.")
     api_url = settings.PROCEDIMENTOS_API_URL
     try:
-        response = requests.get(api_url, timeout=10) # Timeout de 10s
+        response = clientes_http.cliente("procedimentos").get(api_url, headers=_headers_condicionais(etag, last_modified))
         response.raise_for_status() # Lança exceção para erros HTTP (4xx, 5xx)
+        return _ler_resposta_api(response)
         
-        api_data = response.json() # API retorna uma lista [...]
-        
-        # Transforma os dados da API para o formato mock
-        transformed_procs = _transform_api_data_to_mock_format(api_data)
-        return transformed_procs
-        
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         print(f"ERRO: Falha ao buscar dados da API de procedimentos: {e}")
-        return [] # Retorna lista vazia em caso de falha
+        return None
 
+async def _fetch_api_procedimentos_async(etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[RespostaApiProcedimentos]:
+    """
+    Versão assíncrona de `_fetch_api_procedimentos`, usando httpx.
+    """
+    print("INFO: Usando dados da API REAL para procedimentos.")
+    api_url = settings.PROCEDIMENTOS_API_URL
+    try:
+        response = await clientes_http.cliente("procedimentos").get_async(api_url, headers=_headers_condicionais(etag, last_modified))
+        # O httpx trata o 304 como erro (classe 3xx) em raise_for_status
+        if response.status_code != 304:
+            response.raise_for_status()
+        return _ler_resposta_api(response)
 
-def _update_procedimentos_no_banco(procs_list: list):
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"ERRO: Falha ao buscar dados da API de procedimentos: {e}")
+        return None
+
+
+def carregar_procedimentos_da_fonte() -> list:
     """
-    Recebe a lista de procedimentos (já no formato mock)
-    e atualiza o banco de dados.
+    Busca a lista completa de procedimentos direto da fonte (mock ou API),
+    sem passar pelo catálogo em memória. Usado pela sincronização agendada.
     """
+    if settings.USE_MOCK_DATA:
+        return _fetch_mock_procedimentos()
+    resposta = _fetch_api_procedimentos()
+    return resposta.procs if resposta and resposta.procs else []
+
+
+def sincronizar_procedimentos(procs_list: list, tamanho_lote: Optional[int] = None) -> dict:
+    """
+    Sincroniza a tabela Procedimento com a lista recebida (formato mock).
+
+    Carrega os códigos/labels existentes em uma única consulta, calcula a
+    diferença e aplica só o necessário, em lotes e transações:
+    bulk_create (com update_conflicts, caso outro processo tenha inserido o
+    mesmo código no meio tempo) para os novos e bulk_update para os labels
+    alterados. Procedimentos que sumiram da fonte não são apagados, pois
+    podem estar referenciados por solicitações.
+
+    Returns:
+        Resumo: {"criados": n, "atualizados": n, "inalterados": n, "invalidos": n}
+    """
+    tamanho_lote = tamanho_lote or getattr(settings, 'PROCEDIMENTOS_SYNC_TAMANHO_LOTE', 500)
+
+    # Pega o 'proc_id' e 'proc_label' que foram padronizados (o último vence)
+    desejados = {}
+    invalidos = 0
     for proc in procs_list:
-        # Pega o 'proc_id' e 'proc_label' que foram padronizados
         proc_id = proc.get('proc_id')
         proc_label = proc.get('proc_label')
-
         if not proc_id or not proc_label:
             print(f"Aviso: Procedimento inválido ou incompleto, pulando: {proc_id}")
+            invalidos += 1
             continue
-            
-        try:
-            obj, created = Procedimento.objects.update_or_create(
-                codigo=proc_id,
-                defaults={'label': proc_label}
+        desejados[str(proc_id)] = proc_label
+
+    existentes = dict(Procedimento.objects.values_list('codigo', 'label'))
+
+    novos = [Procedimento(codigo=codigo, label=label)
+             for codigo, label in desejados.items() if codigo not in existentes]
+    alterados = [Procedimento(codigo=codigo, label=label)
+                 for codigo, label in desejados.items()
+                 if codigo in existentes and existentes[codigo] != label]
+
+    for inicio in range(0, len(novos), tamanho_lote):
+        with transaction.atomic():
+            Procedimento.objects.bulk_create(
+                novos[inicio:inicio + tamanho_lote],
+                update_conflicts=True,
+                unique_fields=['codigo'],
+                update_fields=['label'],
             )
-            if created:
-                print(f"Procedimento criado: {proc_id}")
-        except Exception as e:
-            # Captura erros de banco (ex: violação de constraint)
-            print(f"Erro ao salvar procedimento {proc_id} no DB: {e}")
+
+    for inicio in range(0, len(alterados), tamanho_lote):
+        with transaction.atomic():
+            Procedimento.objects.bulk_update(alterados[inicio:inicio + tamanho_lote], ['label'])
+
+    return {
+        "criados": len(novos),
+        "atualizados": len(alterados),
+        "inalterados": len(desejados) - len(novos) - len(alterados),
+        "invalidos": invalidos,
+    }
+
+
+def _sincronizar_em_segundo_plano(procs_list: list):
+    """Sincroniza o banco fora do caminho da requisição (thread do catálogo)."""
+    try:
+        resumo = sincronizar_procedimentos(procs_list)
+        print(f"INFO: Procedimentos sincronizados: {resumo}")
+    except Exception as e:
+        # Captura erros de banco (ex: violação de constraint)
+        print(f"Erro ao sincronizar procedimentos no DB: {e}")
+    finally:
+        close_old_connections()
+
+
+# --- Catálogo em Memória ---
+
+class ProcedimentoCompilado(NamedTuple):
+    """Dados de um procedimento usados na geração, prontos para o prompt."""
+    proc_id: str
+    proc_label: str
+    nt_id: Optional[str]
+    nota: NotaTecnicaCompilada
+    nt_label: Optional[str] = None
+
+
+class SnapshotCatalogo(NamedTuple):
+    """Versão imutável do catálogo servida às views."""
+    procs: list         # Lista de procedimentos no formato padrão (mock)
+    conteudo: bytes     # A mesma lista já serializada em JSON (UTF-8)
+    etag: str           # ETag do conteúdo, para GETs condicionais do frontend
+    compilados: Dict[str, ProcedimentoCompilado] = {}  # Por proc_id (ver `_compilar_procedimentos`)
+    definicoes: Dict[str, bytes] = {}  # JSON de cada procedimento, por proc_id
+    indice_busca: Optional[IndiceBusca] = None
+
+    def procedimento(self, proc_id) -> Optional[ProcedimentoCompilado]:
+        return self.compilados.get(str(proc_id))
+
+    def buscar(self, consulta: str, limite: int) -> list:
+        if self.indice_busca is None:
+            return []
+        return self.indice_busca.buscar(consulta, limite)
+
+
+def _compilar_procedimentos(procs_list: list) -> Dict[str, ProcedimentoCompilado]:
+    """
+    Pré-compila, uma vez por versão do catálogo, a nota técnica (estrutura
+    de Categorias, JSON e texto de requisitos) de cada procedimento.
+    Procedimentos com a mesma nota técnica e as mesmas ERs compartilham
+    o mesmo objeto compilado.
+    """
+    notas = {}
+    compilados = {}
+    for proc in procs_list:
+        ers = proc.get('ers') or []
+        chave = (proc.get('NT_id'), json.dumps(ers, sort_keys=True, ensure_ascii=False))
+        if chave not in notas:
+            notas[chave] = compilar_nota_tecnica(ers)
+        proc_id = str(proc.get('proc_id'))
+        compilados[proc_id] = ProcedimentoCompilado(proc_id, proc.get('proc_label') or '', proc.get('NT_id'), notas[chave],
+                                                   proc.get('NT_label'))
+    return compilados
+
+
+class CatalogoProcedimentos:
+    """
+    Catálogo de procedimentos carregado uma vez por processo.
+
+    - Modo mock: recarrega apenas quando o conjunto de arquivos em
+      jsons_procedimentos/ ou o mtime de algum deles muda. A verificação
+      (um stat por arquivo) é feita no máximo a cada
+      PROCEDIMENTOS_CATALOGO_VERIFICACAO segundos.
+    - Modo API: depois de PROCEDIMENTOS_CATALOGO_TTL segundos, revalida com
+      um GET condicional (ETag/Last-Modified); um 304 só renova o prazo.
+
+    A tabela de Procedimentos é sincronizada pelo comando agendado
+    `sincronizar_procedimentos`. Com PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO
+    (desligado por padrão), cada processo também sincroniza o banco em uma
+    thread separada quando o conteúdo muda. Se a fonte falhar, a última
+    versão válida continua sendo servida.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Single-flight das recargas nas views async (ver `_lock_do_loop`)
+        self._lock_async = None
+        self._loop_do_lock_async = None
+        self._snapshot: Optional[SnapshotCatalogo] = None
+        self._verificado_em = 0.0
+        # Estado da fonte: assinatura dos arquivos (mock) ou validadores HTTP (API)
+        self._assinatura_mock = None
+        self._etag_api = None
+        self._last_modified_api = None
+
+    # --- Leitura ---
+
+    def obter(self) -> SnapshotCatalogo:
+        """Retorna o catálogo atual, recarregando-o antes se necessário."""
+        snapshot = self.obter_se_valido()
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            # Outra thread pode ter recarregado enquanto esperávamos o lock
+            snapshot = self.obter_se_valido()
+            if snapshot is not None:
+                return snapshot
+            if settings.USE_MOCK_DATA:
+                self._atualizar_mock()
+            else:
+                self._aplicar_resposta_api(_fetch_api_procedimentos(self._etag_api, self._last_modified_api))
+            return self._snapshot_ou_vazio()
+
+    async def obter_async(self) -> SnapshotCatalogo:
+        """
+        Versão assíncrona de `obter`: o caminho comum é só uma leitura de
+        memória; a busca na API real não bloqueia o event loop.
+
+        Com o catálogo vencido, só uma corrotina por event loop vai à fonte;
+        as demais esperam no asyncio.Lock e usam o catálogo que ela trouxe.
+        """
+        snapshot = self.obter_se_valido()
+        if snapshot is not None:
+            return snapshot
+
+        async with self._lock_do_loop():
+            # Outra corrotina pode ter recarregado enquanto esperávamos o lock
+            snapshot = self.obter_se_valido()
+            if snapshot is not None:
+                return snapshot
+
+            if settings.USE_MOCK_DATA:
+                return await sync_to_async(self.obter)()
+
+            resposta = await _fetch_api_procedimentos_async(self._etag_api, self._last_modified_api)
+            return await sync_to_async(self._aplicar_resposta_api_com_lock)(resposta)
+
+    def _lock_do_loop(self) -> asyncio.Lock:
+        """
+        asyncio.Lock do event loop atual. Um asyncio.Lock só pode ser usado
+        no loop em que foi criado; o catálogo é único por processo e pode
+        ser lido de loops diferentes (ex.: async_to_sync).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop_do_lock_async is not loop:
+            self._lock_async = asyncio.Lock()
+            self._loop_do_lock_async = loop
+        return self._lock_async
+
+    def obter_se_valido(self) -> Optional[SnapshotCatalogo]:
+        """Retorna o catálogo em memória se ele ainda estiver dentro do prazo."""
+        if self._snapshot is None:
+            return None
+        if time.monotonic() - self._verificado_em < self._intervalo_verificacao():
+            return self._snapshot
+        if settings.USE_MOCK_DATA and self._assinatura_arquivos_mock() == self._assinatura_mock:
+            self._verificado_em = time.monotonic()
+            return self._snapshot
+        return None
+
+    def invalidar(self):
+        """Força a recarga na próxima leitura."""
+        with self._lock:
+            self._verificado_em = 0.0
+            self._assinatura_mock = None
+            self._etag_api = None
+            self._last_modified_api = None
+
+    # --- Recarga ---
+
+    def _intervalo_verificacao(self) -> float:
+        if settings.USE_MOCK_DATA:
+            return getattr(settings, 'PROCEDIMENTOS_CATALOGO_VERIFICACAO', 5)
+        return getattr(settings, 'PROCEDIMENTOS_CATALOGO_TTL', 300)
+
+    def _assinatura_arquivos_mock(self):
+        data_path = os.path.join(settings.BASE_DIR, 'jsons_procedimentos')
+        assinatura = []
+        for file_path in sorted(glob.glob(os.path.join(data_path, '*.json'))):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            assinatura.append((file_path, stat.st_mtime_ns, stat.st_size))
+        return tuple(assinatura)
+
+    def _atualizar_mock(self):
+        assinatura = self._assinatura_arquivos_mock()
+        self._verificado_em = time.monotonic()
+        if assinatura == self._assinatura_mock and self._snapshot is not None:
+            return
+        self._assinatura_mock = assinatura
+        self._substituir(_fetch_mock_procedimentos())
+
+    def _aplicar_resposta_api_com_lock(self, resposta) -> SnapshotCatalogo:
+        with self._lock:
+            self._aplicar_resposta_api(resposta)
+            return self._snapshot_ou_vazio()
+
+    def _aplicar_resposta_api(self, resposta: Optional[RespostaApiProcedimentos]):
+        if resposta is None:
+            # Falha na API: mantém a versão anterior e só tenta de novo após
+            # o prazo. Sem versão anterior, a próxima leitura tenta de novo.
+            if self._snapshot is not None:
+                self._verificado_em = time.monotonic()
+            return
+
+        self._verificado_em = time.monotonic()
+        self._etag_api = resposta.etag
+        self._last_modified_api = resposta.last_modified
+        if resposta.procs is not None:
+            self._substituir(resposta.procs)
+
+    def _substituir(self, procs_list: list):
+        """Publica uma nova versão do catálogo e dispara a sincronização do banco."""
+        conteudo = json.dumps(procs_list, ensure_ascii=False).encode('utf-8')
+        etag = f'"{hashlib.sha1(conteudo).hexdigest()}"'
+
+        if self._snapshot is not None and self._snapshot.etag == etag:
+            return
+
+        if procs_list and getattr(settings, 'PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO', False):
+            threading.Thread(
+                target=_sincronizar_em_segundo_plano,
+                args=(procs_list,),
+                name='sincronizar-procedimentos',
+                daemon=True,
+            ).start()
+
+        definicoes = {
+            str(proc.get('proc_id')): json.dumps(proc, ensure_ascii=False).encode('utf-8')
+            for proc in procs_list
+        }
+        self._snapshot = SnapshotCatalogo(
+            procs_list, conteudo, etag,
+            compilados=_compilar_procedimentos(procs_list),
+            definicoes=definicoes,
+            indice_busca=IndiceBusca(procs_list),
+        )
+
+    def _snapshot_ou_vazio(self) -> SnapshotCatalogo:
+        if self._snapshot is not None:
+            return self._snapshot
+        return SnapshotCatalogo([], b'[]', '"vazio"')
+
+
+# Instância única por processo
+catalogo = CatalogoProcedimentos()
 
 
 # --- Função Pública do Serviço ---
 def get_procedimentos_data() -> list:
     """
     Função principal do serviço.
-    
-    1. Decide se usa mock ou API baseado em settings.USE_MOCK_DATA.
-    2. Busca os dados da fonte correta.
-    3. (Se for API) Transforma os dados para o formato padrão.
-    4. Atualiza o banco de dados com os dados obtidos.
-    5. Retorna a lista de procedimentos no formato padrão (mock).
+
+    Retorna a lista de procedimentos no formato padrão (mock), a partir do
+    catálogo em memória (ver `CatalogoProcedimentos`), que decide entre
+    mock e API com base em settings.USE_MOCK_DATA.
     """
-    if settings.USE_MOCK_DATA:
-        procs_list = _fetch_mock_procedimentos()
-    else:
-        procs_list = _fetch_api_procedimentos()
-    
-    # Atualiza o DB em segundo plano (ou de forma síncrona, como aqui)
-    if procs_list:
-        _update_procedimentos_no_banco(procs_list)
-        
-    return procs_list
\ No newline at end of file
+    return catalogo.obter().procs
@@ -1,3 +1,1635 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import IntegrityError, close_old_connections, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.jwt_rapido import gerar_tokens
+from authentication.models import User
+from users_api import clientes_http
+from .models import CacheJustificativa, ContadorProtocolo, JobJustificativa, Procedimento, Solicitacao
+from . import urls as fillsense_urls, views
+from .services import (
+    cache_justificativa_service, compactacao_nota_service, controle_ollama_service, gerar_justificativa_service,
+    jobs_justificativa_service, lote_justificativa_service, procedimentos_service,
+)
+from .services.backends_ollama_service import BackendOllama, PoolOllama
+from .services.busca_procedimentos_service import IndiceBusca
+from .services.extracao_json_service import ExtratorJSON, extrair_primeiro_objeto
+
+
+class ProtocoloSolicitacaoTests(TestCase):
+    """
+    Testes da geração do protocolo FS-ANO-NNNNN.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+
+    def test_protocolos_sequenciais_no_ano(self):
+        ano = timezone.now().year
+        protocolos = [
+            Solicitacao.objects.create(usuario=self.usuario, procedimento='P').protocolo
+            for _ in range(3)
+        ]
+        self.assertEqual(protocolos, [f"FS-{ano}-00001", f"FS-{ano}-00002", f"FS-{ano}-00003"])
+        self.assertEqual(ContadorProtocolo.objects.get(ano=ano).ultimo_numero, 3)
+
+    def test_protocolo_gravado_no_insert(self):
+        # Contador (1 comando) + INSERT + contagens dos relatórios (1 upsert),
+        # dentro de uma transação (savepoint)
+        with self.assertNumQueries(5):
+            Solicitacao.objects.create(usuario=self.usuario, procedimento='P')
+
+    def test_protocolo_nao_muda_ao_atualizar(self):
+        solicitacao = Solicitacao.objects.create(usuario=self.usuario, procedimento='P')
+        protocolo = solicitacao.protocolo
+        solicitacao.status = Solicitacao.StatusChoices.EM_ANALISE
+        solicitacao.save()
+        solicitacao.refresh_from_db()
+        self.assertEqual(solicitacao.protocolo, protocolo)
+
+    def test_protocolo_unico(self):
+        solicitacao = Solicitacao.objects.create(usuario=self.usuario, procedimento='P')
+        with self.assertRaises(IntegrityError):
+            Solicitacao.objects.bulk_create([
+                Solicitacao(usuario=self.usuario, procedimento='P', protocolo=solicitacao.protocolo)
+            ])
+
+
+@skipUnless(connection.vendor == 'postgresql', "Requer PostgreSQL (escritas concorrentes).")
+class ProtocoloConcorrenteTests(TransactionTestCase):
+    """
+    Cria milhares de solicitações em threads paralelas e verifica que os
+    protocolos não se repetem e não deixam buracos.
+    """
+    THREADS = 8
+    POR_THREAD = 250
+
+    def test_criacao_concorrente_sem_duplicados_nem_buracos(self):
+        usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        erros = []
+        barreira = threading.Barrier(self.THREADS)
+
+        def criar():
+            try:
+                barreira.wait()
+                for _ in range(self.POR_THREAD):
+                    Solicitacao.objects.create(usuario=usuario, procedimento='P')
+            except Exception as e:
+                erros.append(e)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=criar) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(erros, [])
+        total = self.THREADS * self.POR_THREAD
+        ano = timezone.now().year
+        protocolos = set(Solicitacao.objects.values_list('protocolo', flat=True))
+        self.assertEqual(protocolos, {f"FS-{ano}-{n:05d}" for n in range(1, total + 1)})
+
+
+class ConsultasSolicitacaoApiTests(TestCase):
+    """
+    Fixa o número de consultas da listagem e do detalhe: deve ser o mesmo
+    com poucas ou muitas solicitações (sem N+1 no procedimento_label nem
+    nos campos adiados da listagem).
+    """
+    URL = '/api/fillsense/solicitacoes/'
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.procedimentos = [
+            Procedimento.objects.create(codigo=f"0{i}", label=f"Procedimento {i}")
+            for i in range(3)
+        ]
+
+    def _criar(self, quantidade):
+        for i in range(quantidade):
+            Solicitacao.objects.create(
+                usuario=self.usuario,
+                procedimento='P',
+                procedimento_fk=self.procedimentos[i % len(self.procedimentos)],
+                descricao_medica='Descrição longa ' * 50,
+                justificativa='Justificativa longa ' * 50,
+                metadados_ia={'nota_tecnica': {'ERs': list(range(50))}},
+            )
+
+    def test_listagem_com_consultas_constantes(self):
+        self._criar(2)
+        with self.assertNumQueries(1):
+            self.client.get(self.URL)
+
+        self._criar(30)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.URL, {'page_size': 50})
+        self.assertEqual(len(response.data['results']), 32)
+
+    def test_listagem_usa_representacao_compacta(self):
+        self._criar(1)
+        item = self.client.get(self.URL).data['results'][0]
+        self.assertEqual(item['procedimento_label'], 'Procedimento 0')
+        for campo in ('descricao_medica', 'justificativa', 'metadados_ia'):
+            self.assertNotIn(campo, item)
+
+    def test_detalhe_com_consultas_constantes(self):
+        self._criar(1)
+        solicitacao = Solicitacao.objects.get()
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{self.URL}{solicitacao.pk}/")
+        self.assertEqual(response.data['procedimento_label'], 'Procedimento 0')
+        self.assertIn('justificativa', response.data)
+
+    def test_cursor_nao_repete_nem_pula_solicitacoes_do_mesmo_instante(self):
+        self._criar(5)
+        Solicitacao.objects.update(data_criacao=timezone.now())
+        vistos, url = [], f"{self.URL}?page_size=2"
+        while url:
+            dados = self.client.get(url).data
+            vistos += [item['id'] for item in dados['results']]
+            url = dados['next']
+        self.assertEqual(vistos, sorted(Solicitacao.objects.values_list('id', flat=True), reverse=True))
+
+
+class CompactacaoNosMetadadosApiTests(TestCase):
+    """O campo compactacao do PATCH é juntado aos metadados_ia gravados pelo backend."""
+    URL = '/api/fillsense/solicitacoes/'
+    COMPACTACAO = {"ers_mantidas": 2, "ers_descartadas": [{"categoria": "Exames", "er": "Ultrassom"}]}
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.solicitacao = Solicitacao.objects.create(
+            usuario=self.usuario, procedimento='P', metadados_ia={"modelo": "mistral", "job_justificativa": 7},
+        )
+
+    def _patch(self, dados):
+        response = self.client.patch(f"{self.URL}{self.solicitacao.pk}/", dados, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('compactacao', response.data)
+        self.solicitacao.refresh_from_db()
+        return self.solicitacao.metadados_ia
+
+    def test_compactacao_e_juntada_aos_metadados(self):
+        metadados = self._patch({'justificativa': 'texto', 'compactacao': self.COMPACTACAO})
+        self.assertEqual(metadados, {"modelo": "mistral", "job_justificativa": 7, "compactacao": self.COMPACTACAO})
+
+    def test_compactacao_nula_remove_a_anterior(self):
+        self._patch({'compactacao': self.COMPACTACAO})
+        self.assertEqual(self._patch({'justificativa': 'nova', 'compactacao': None}), {"modelo": "mistral", "job_justificativa": 7})
+
+    def test_sem_o_campo_os_metadados_ficam_como_estao(self):
+        self._patch({'compactacao': self.COMPACTACAO})
+        self.assertEqual(self._patch({'justificativa': 'editada'})['compactacao'], self.COMPACTACAO)
+
+
+class CorpoGeracaoApiTests(TestCase):
+    """
+    As actions do DRF leem o corpo pelo parser configurado (request.data):
+    JSON inválido vira 400 com a mesma mensagem de antes.
+    """
+    URL = '/api/fillsense/solicitacoes/'
+    DADOS = {"procedimento": "P", "clinico_text": "texto", "ers": [{"Nome": "ER", "categoria": {"Nome": "C"}}]}
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_geracao_le_o_json_pelo_parser(self):
+        with mock.patch('fillsense.views.gerar_justificativa_ia', return_value={"justificativa": "ok"}) as gerar:
+            response = self.client.post(f"{self.URL}gerar-justificativa/", self.DADOS, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(gerar.call_args.kwargs['clinico_text'], 'texto')
+
+    def test_json_invalido_responde_400(self):
+        for acao in ('gerar-justificativa', 'gerar-justificativa-stream', 'gerar-justificativas-lote'):
+            with self.subTest(acao=acao):
+                response = self.client.post(f"{self.URL}{acao}/", '{"clinico_text": ', content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"erro": "Dados Incompletos."})
+
+    def test_dados_incompletos_responde_400(self):
+        response = self.client.post(f"{self.URL}gerar-justificativa/", {"procedimento": "P"}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_job_le_o_json_pelo_parser(self):
+        solicitacao = Solicitacao.objects.create(usuario=self.usuario, procedimento='P')
+        response = self.client.post(f"{self.URL}{solicitacao.pk}/gerar-justificativa-job/", self.DADOS, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(JobJustificativa.objects.get().clinico_text, 'texto')
+
+
+
+class _StubOllama:
+    """
+    Servidor Ollama falso em uma porta local: responde /api/tags e
+    /api/chat (com ou sem stream) após `atraso` segundos, ou com `status`
+    de erro, e conta as chamadas recebidas.
+    """
+
+    def __init__(self, atraso=0.0, status=200, modelos=('mistral:latest',)):
+        self.atraso = atraso
+        self.status = status
+        self.modelos = list(modelos)
+        self.chamadas = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, corpo, tipo='application/json'):
+                self.send_response(stub.status)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                try:
+                    self.wfile.write(corpo)
+                except (BrokenPipeError, ConnectionResetError):
+                    # O cliente desistiu (teste de timeout)
+                    pass
+
+            def do_GET(self):
+                self._responder(json.dumps({'models': [{'name': m} for m in stub.modelos]}).encode())
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.chamadas += 1
+                time.sleep(stub.atraso)
+                if payload.get('stream'):
+                    linhas = [{'message': {'content': parte}, 'done': False} for parte in ('{"a": ', '1}')]
+                    corpo = ''.join(json.dumps(linha) + '\n' for linha in linhas + [{'done': True}])
+                    self._responder(corpo.encode(), 'application/x-ndjson')
+                else:
+                    self._responder(json.dumps({'message': {'content': '{"a": 1}'}, 'done': True}).encode())
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.servidor.server_port}"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class PoolOllamaTests(SimpleTestCase):
+    """
+    Roteamento, failover e verificação de saúde do pool de servidores
+    Ollama, contra servidores falsos com latências diferentes.
+    """
+    PAYLOAD = {'model': 'mistral:latest', 'messages': [], 'stream': False}
+
+    def setUp(self):
+        self.stubs = []
+
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.fechar()
+
+    def _stub(self, **kwargs):
+        stub = _StubOllama(**kwargs)
+        self.stubs.append(stub)
+        return stub
+
+    def _pool(self, *backends):
+        # Verificação de saúde só quando o teste pedir
+        return PoolOllama(list(backends), intervalo_verificacao=3600, suspensao=60)
+
+    def _chamar(self, pool):
+        return pool.executar('mistral', lambda b: gerar_justificativa_service._chat_no_backend(b, self.PAYLOAD, 0))
+
+    def test_distribui_pelo_peso(self):
+        leve, pesado = self._stub(), self._stub()
+        pool = self._pool(BackendOllama(leve.url, peso=1), BackendOllama(pesado.url, peso=2))
+        for _ in range(9):
+            self.assertEqual(self._chamar(pool), '{"a": 1}')
+        self.assertEqual((leve.chamadas, pesado.chamadas), (3, 6))
+
+    def test_prefere_o_backend_com_menos_requisicoes_em_andamento(self):
+        rapido, lento = self._stub(atraso=0.02), self._stub(atraso=0.4)
+        pool = self._pool(BackendOllama(lento.url), BackendOllama(rapido.url))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: self._chamar(pool), range(24)))
+        self.assertEqual(rapido.chamadas + lento.chamadas, 24)
+        self.assertGreater(rapido.chamadas, 3 * lento.chamadas)
+        self.assertEqual([b['em_andamento'] for b in pool.estado()], [0, 0])
+
+    def test_failover_quando_o_backend_falha(self):
+        quebrado, saudavel = self._stub(status=500), self._stub()
+        pool = self._pool(BackendOllama(quebrado.url), BackendOllama(saudavel.url))
+        self.assertEqual(self._chamar(pool), '{"a": 1}')
+        self.assertEqual((quebrado.chamadas, saudavel.chamadas), (1, 1))
+
+        # Suspenso: as próximas chamadas não passam pelo backend com falha
+        self._chamar(pool)
+        self.assertEqual((quebrado.chamadas, saudavel.chamadas), (1, 2))
+        self.assertEqual(pool.estado()[0]['falhas'], 1)
+
+    def test_failover_por_timeout(self):
+        travado, saudavel = self._stub(atraso=1), self._stub()
+        pool = self._pool(BackendOllama(travado.url), BackendOllama(saudavel.url))
+        chat = lambda b: gerar_justificativa_service._chat_no_backend(b, self.PAYLOAD, 0)
+        cliente = clientes_http.cliente('ollama')
+        timeout_original = cliente.timeout_leitura
+        cliente.timeout_leitura = 0.2
+        try:
+            self.assertEqual(pool.executar('mistral', chat), '{"a": 1}')
+        finally:
+            cliente.timeout_leitura = timeout_original
+
+    def test_sem_backend_disponivel_lanca_connection_error(self):
+        quebrado = self._stub(status=503)
+        pool = self._pool(BackendOllama(quebrado.url))
+        with self.assertRaises(ConnectionError):
+            self._chamar(pool)
+
+    def test_stream_faz_failover_antes_do_primeiro_token(self):
+        quebrado, saudavel = self._stub(status=500), self._stub(atraso=0.01)
+        pool = self._pool(BackendOllama(quebrado.url), BackendOllama(saudavel.url))
+        payload = {**self.PAYLOAD, 'stream': True}
+        partes = list(pool.stream('mistral', lambda b: gerar_justificativa_service._stream_no_backend(b, payload)))
+        self.assertEqual(''.join(partes), '{"a": 1}')
+        self.assertEqual((quebrado.chamadas, saudavel.chamadas), (1, 1))
+
+    def test_verificacao_de_saude_e_modelos(self):
+        sem_modelo, fora_do_ar, saudavel = self._stub(modelos=['llama3:8b']), self._stub(), self._stub()
+        fora_do_ar.fechar()
+        self.stubs.remove(fora_do_ar)
+        pool = self._pool(
+            BackendOllama(sem_modelo.url), BackendOllama(fora_do_ar.url), BackendOllama(saudavel.url),
+            BackendOllama(saudavel.url, modelos=['llama3:8b']),
+        )
+        pool.verificar_saude()
+
+        self.assertEqual([b.url for b in pool.backends_do_modelo('mistral')], [fora_do_ar.url, saudavel.url])
+        self.assertEqual([b['saudavel'] for b in pool.estado()], [True, False, True, True])
+        for _ in range(3):
+            self._chamar(pool)
+        self.assertEqual((sem_modelo.chamadas, saudavel.chamadas), (0, 3))
+
+
+class ExtratorJSONTests(SimpleTestCase):
+    """
+    Extração do JSON da resposta do modelo com saídas problemáticas,
+    entregues inteiras e em pedaços aleatórios (como no streaming).
+    """
+    OBJETO = {"procedimento": "P", "justificativa": "Texto com {chaves}, \"aspas\" e ```json\n{}\n``` no meio."}
+
+    def _casos(self):
+        objeto = json.dumps(self.OBJETO, ensure_ascii=False)
+        return [
+            (objeto, self.OBJETO),
+            (f"<think>{'raciocínio {com chaves} ' * 500}</think>\n{objeto}", self.OBJETO),
+            (f"<THINK>{{\"falso\": 1}}</Think>{objeto}", self.OBJETO),
+            (f"Aqui está {{o resultado}}:\n```json\n{objeto}\n```\nfim", self.OBJETO),
+            (f"```\n```json\n{objeto}\n```\n```", self.OBJETO),
+            (f'Texto "com aspas" fora do objeto {objeto} {{"depois": 2}}', self.OBJETO),
+            ('{"a": {"b": [1, {"c": "}"}]}}', {"a": {"b": [1, {"c": "}"}]}}),
+            ('{"a": "barra no fim \\\\"}', {"a": "barra no fim \\"}),
+            (objeto[:-10], None),                           # JSON truncado
+            (f"<think>sem fim {objeto}", None),             # <think> não fechado
+            ("sem json nenhum < > <thi", None),
+        ]
+
+    def test_texto_inteiro(self):
+        for texto, esperado in self._casos():
+            with self.subTest(texto=texto[:60]):
+                self.assertEqual(extrair_primeiro_objeto(texto), esperado)
+
+    def test_pedacos_aleatorios(self):
+        aleatorio = random.Random(20)
+        for texto, esperado in self._casos():
+            for _ in range(50):
+                cortes = sorted(aleatorio.sample(range(1, len(texto)), min(len(texto) - 1, aleatorio.randint(1, 30))))
+                pedacos = [texto[i:j] for i, j in zip([0] + cortes, cortes + [len(texto)])]
+                with self.subTest(texto=texto[:60], pedacos=len(pedacos)):
+                    self.assertEqual(extrair_primeiro_objeto(pedacos), esperado)
+
+    def test_pedacos_de_um_caractere(self):
+        for texto, esperado in self._casos():
+            with self.subTest(texto=texto[:60]):
+                self.assertEqual(extrair_primeiro_objeto(list(texto)), esperado)
+
+    def test_para_no_primeiro_objeto(self):
+        extrator = ExtratorJSON()
+        self.assertIsNone(extrator.alimentar('{"a": '))
+        self.assertEqual(extrator.alimentar('1} {"b": 2}'), {"a": 1})
+        self.assertEqual(extrator.alimentar('{"c": 3}'), {"a": 1})
+        self.assertTrue(extrator.concluido)
+
+    def test_tempo_linear_em_saidas_patologicas(self):
+        # A varredura antiga recomeçava em cada "{": O(n²) nestes casos
+        casos = [
+            "{" * 200_000,
+            "{x}" * 70_000 + json.dumps(self.OBJETO),
+            '{"a": "' + "}{" * 100_000,
+            "<think>" * 30_000,
+        ]
+        for texto in casos:
+            inicio = time.perf_counter()
+            extrair_primeiro_objeto(texto)
+            extrair_primeiro_objeto(texto[i:i + 97] for i in range(0, len(texto), 97))
+            self.assertLess(time.perf_counter() - inicio, 2.0)
+
+    def test_stream_para_de_ler_quando_o_objeto_fecha(self):
+        lidos = []
+
+        def stream_falso(messages):
+            for parte in ('<think>...</think>{"justificativa": ', '"linha 1\\nlinha 2"}', 'texto extra', 'mais texto'):
+                lidos.append(parte)
+                yield parte
+
+        with mock.patch.object(gerar_justificativa_service, '_stream_ollama', stream_falso):
+            eventos = list(gerar_justificativa_service.gerar_justificativa_ia_stream(
+                'P', 'clínico', '{}', usar_cache=False, requisitos='requisitos'
+            ))
+
+        self.assertEqual(len(lidos), 2)
+        self.assertEqual(eventos[-1], ("resultado", {"justificativa": "linha 1\n\nlinha 2"}))
+
+
+class _Relogio:
+    """time.monotonic controlável."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+class ControleOllamaTests(SimpleTestCase):
+    """
+    Limitador adaptativo (AIMD) e circuit breaker do controle de admissão
+    das gerações no Ollama.
+    """
+
+    def setUp(self):
+        self.relogio = _Relogio()
+        patcher = mock.patch('fillsense.services.controle_ollama_service.time.monotonic', self.relogio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _limitador(limite=4, **opcoes):
+        config = dict(limite=limite, limite_min=1, limite_max=8, fila_max=0, espera_max=0.1,
+                      adaptativo=True, latencia_alvo=10)
+        config.update(opcoes)
+        return controle_ollama_service.LimitadorAdaptativo(**config)
+
+    def test_limite_cresce_com_geracoes_dentro_do_alvo(self):
+        limitador = self._limitador(limite=2)
+        for _ in range(2):
+            limitador.entrar()
+            limitador.sair(True, 1.0)
+        # +1/limite a cada geração: ~1 a cada `limite` gerações
+        self.assertEqual(limitador.estado()['limite'], 2)
+        self.assertAlmostEqual(limitador.limite, 2 + 1 / 2 + 1 / 2.5)
+        for _ in range(60):
+            limitador.entrar()
+            limitador.sair(True, 1.0)
+        self.assertEqual(limitador.estado()['limite'], 8)  # limite_max
+
+    def test_limite_cai_pela_metade_uma_vez_por_janela(self):
+        limitador = self._limitador(limite=8)
+        limitador.entrar()
+        limitador.sair(False, 1.0)
+        self.assertEqual(limitador.limite, 4)
+        # Outra falha na mesma janela de latencia_alvo não reduz de novo
+        limitador.entrar()
+        limitador.sair(True, 30.0)
+        self.assertEqual(limitador.limite, 4)
+        self.relogio.agora += 10
+        for _ in range(5):
+            limitador.entrar()
+            limitador.sair(False, 1.0)
+            self.relogio.agora += 10
+        self.assertEqual(limitador.limite, 1)  # limite_min
+
+    def test_geracao_interrompida_ou_limite_fixo_nao_ajustam(self):
+        limitador = self._limitador(limite=4)
+        limitador.entrar()
+        limitador.sair(None, 99.0)
+        self.assertEqual(limitador.limite, 4)
+        fixo = self._limitador(limite=4, adaptativo=False)
+        fixo.entrar()
+        fixo.sair(False, 99.0)
+        self.assertEqual(fixo.limite, 4)
+
+    def test_recusa_com_fila_cheia_e_com_prazo_esgotado(self):
+        limitador = self._limitador(limite=1, adaptativo=False)
+        limitador.entrar()
+        with self.assertRaises(controle_ollama_service.SobrecargaIA):
+            limitador.entrar()
+        com_fila = self._limitador(limite=1, fila_max=1, espera_max=0.05, adaptativo=False)
+        com_fila.entrar()
+        with mock.patch('fillsense.services.controle_ollama_service.time.monotonic', time.monotonic):
+            with self.assertRaises(controle_ollama_service.SobrecargaIA) as contexto:
+                com_fila.entrar()
+        self.assertEqual(contexto.exception.status_code, 429)
+        self.assertEqual(com_fila.estado()['na_fila'], 0)
+        self.assertEqual(com_fila.estado()['recusadas'], 1)
+
+    def test_saida_libera_quem_espera_na_fila(self):
+        limitador = self._limitador(limite=1, fila_max=1, espera_max=5, adaptativo=False)
+        limitador.entrar()
+        with mock.patch('fillsense.services.controle_ollama_service.time.monotonic', time.monotonic):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                espera = executor.submit(limitador.entrar)
+                while limitador.estado()['na_fila'] == 0:
+                    time.sleep(0.01)
+                limitador.sair(True, 1.0)
+                espera.result(timeout=5)
+        self.assertEqual(limitador.estado()['em_andamento'], 1)
+
+    def test_circuito_abre_depois_das_falhas_seguidas(self):
+        circuito = controle_ollama_service.CircuitBreaker(limite_falhas=3, tempo_abertura=30)
+        for _ in range(2):
+            self.assertFalse(circuito.permitir())
+            circuito.registrar(False, False)
+        circuito.registrar(True, False)  # um sucesso zera a contagem
+        for _ in range(3):
+            circuito.permitir()
+            circuito.registrar(False, False)
+        self.assertEqual(circuito.estado, circuito.ABERTO)
+        with self.assertRaises(controle_ollama_service.CircuitoAberto) as contexto:
+            circuito.permitir()
+        self.assertEqual((contexto.exception.status_code, contexto.exception.retry_after), (503, 30))
+
+    def _aberto(self):
+        circuito = controle_ollama_service.CircuitBreaker(limite_falhas=1, tempo_abertura=30)
+        circuito.permitir()
+        circuito.registrar(False, False)
+        self.relogio.agora += 30
+        return circuito
+
+    def test_meio_aberto_deixa_passar_uma_sonda_e_fecha_com_sucesso(self):
+        circuito = self._aberto()
+        self.assertTrue(circuito.permitir())
+        self.assertEqual(circuito.estado, circuito.MEIO_ABERTO)
+        with self.assertRaises(controle_ollama_service.CircuitoAberto):
+            circuito.permitir()
+        circuito.registrar(True, True)
+        self.assertEqual(circuito.resumo(), {"estado": circuito.FECHADO, "falhas_consecutivas": 0, "reabre_em": None})
+        self.assertFalse(circuito.permitir())
+
+    def test_sonda_com_falha_reabre_o_circuito(self):
+        circuito = self._aberto()
+        self.assertTrue(circuito.permitir())
+        circuito.registrar(False, True)
+        self.assertEqual(circuito.estado, circuito.ABERTO)
+        self.assertEqual(circuito.resumo()['reabre_em'], 30)
+
+    def test_sonda_interrompida_libera_nova_sonda(self):
+        circuito = self._aberto()
+        self.assertTrue(circuito.permitir())
+        circuito.registrar(None, True)
+        self.assertEqual(circuito.estado, circuito.MEIO_ABERTO)
+        self.assertTrue(circuito.permitir())
+
+
+class AdmissaoStreamTests(SimpleTestCase):
+    """
+    O endpoint de streaming decide a admissão (429/503 ou 200) antes de
+    chamar o Ollama, sem esperar o primeiro token do modelo.
+    """
+
+    def _instancias(self, circuito=None):
+        limitador = controle_ollama_service.LimitadorAdaptativo(
+            limite=1, limite_min=1, limite_max=1, fila_max=0, espera_max=0, adaptativo=False, latencia_alvo=10,
+        )
+        circuito = circuito or controle_ollama_service.CircuitBreaker(limite_falhas=1, tempo_abertura=30)
+        return mock.patch.object(controle_ollama_service, '_instancias', return_value=(limitador, circuito))
+
+    def test_admissao_antes_de_chamar_o_ollama(self):
+        chamadas = []
+        with self._instancias() as instancias:
+            def stream_falso(messages):
+                chamadas.append('ollama')
+                yield '{"justificativa": "ok"}'
+            with mock.patch.object(gerar_justificativa_service, '_stream_ollama', stream_falso):
+                eventos = views._antecipar_primeiro_evento(gerar_justificativa_service.gerar_justificativa_ia_stream(
+                    'P', 'clínico', '{}', usar_cache=False, requisitos='r'
+                ))
+                limitador = instancias.return_value[0]
+                self.assertEqual((chamadas, limitador.estado()['em_andamento']), ([], 1))
+                self.assertEqual([evento for evento, _ in eventos], ["token", "resultado"])
+            self.assertEqual((chamadas, limitador.estado()['em_andamento']), (['ollama'], 0))
+
+    def test_recusa_sem_chamar_o_ollama(self):
+        circuito = controle_ollama_service.CircuitBreaker(limite_falhas=1, tempo_abertura=30)
+        circuito.permitir()
+        circuito.registrar(False, False)
+        with self._instancias(circuito), mock.patch.object(gerar_justificativa_service, '_stream_ollama') as stream:
+            with self.assertRaises(controle_ollama_service.CircuitoAberto):
+                views._antecipar_primeiro_evento(gerar_justificativa_service.gerar_justificativa_ia_stream(
+                    'P', 'clínico', '{}', usar_cache=False, requisitos='r'
+                ))
+        stream.assert_not_called()
+
+    def test_admissao_antes_de_chamar_o_ollama_async(self):
+        chamadas = []
+
+        async def stream_falso(messages):
+            chamadas.append('ollama')
+            yield '{"justificativa": "ok"}'
+
+        async def _gerar():
+            eventos = await views._antecipar_primeiro_evento_async(gerar_justificativa_service.gerar_justificativa_ia_stream_async(
+                'P', 'clínico', '{}', usar_cache=False, requisitos='r'
+            ))
+            antes = list(chamadas)
+            return antes, [evento async for evento, _ in eventos]
+
+        with self._instancias(), mock.patch.object(gerar_justificativa_service, '_stream_ollama_async', stream_falso):
+            antes, eventos = async_to_sync(_gerar)()
+        self.assertEqual((antes, eventos, chamadas), ([], ["token", "resultado"], ['ollama']))
+
+
+
+@override_settings(JOBS_JUSTIFICATIVA_MAX_POR_USUARIO=1, JOBS_JUSTIFICATIVA_MAX_TENTATIVAS=3,
+                   JOBS_JUSTIFICATIVA_TIMEOUT=60, JOBS_JUSTIFICATIVA_BACKOFF_BASE=5)
+class FilaJobsJustificativaTests(TestCase):
+    """
+    Fila de jobs de justificativa: enfileiramento, reserva, novas
+    tentativas, cancelamento e recuperação de jobs travados.
+    """
+
+    def setUp(self):
+        self.usuarios = [
+            User.objects.create_user(username=f'medico{i}', email=f'medico{i}@exemplo.com', password='senha-forte-123')
+            for i in range(2)
+        ]
+        self.solicitacoes = [Solicitacao.objects.create(usuario=u, procedimento='P') for u in self.usuarios]
+
+    def _enfileirar(self, indice=0):
+        return jobs_justificativa_service.enfileirar_job(
+            self.usuarios[indice], self.solicitacoes[indice], 'Procedimento', 'texto clínico', {'Categorias': []},
+        )
+
+    def _travar(self, job, tentativas):
+        JobJustificativa.objects.filter(pk=job.pk).update(
+            status=JobJustificativa.StatusChoices.EM_EXECUCAO,
+            tentativas=tentativas,
+            data_inicio=timezone.now() - timedelta(seconds=120),
+        )
+
+    def test_enfileirar_cria_job_pendente(self):
+        job = self._enfileirar()
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.PENDENTE)
+        self.assertEqual((job.tentativas, job.max_tentativas), (0, 3))
+
+    def test_reserva_marca_em_execucao_e_conta_tentativa(self):
+        job = self._enfileirar()
+        reservado = jobs_justificativa_service.reservar_proximo_job('w1')
+        self.assertEqual(reservado.pk, job.pk)
+        self.assertEqual((reservado.status, reservado.worker, reservado.tentativas),
+                         (JobJustificativa.StatusChoices.EM_EXECUCAO, 'w1', 1))
+        self.assertIsNone(jobs_justificativa_service.reservar_proximo_job('w2'))
+
+    def test_reserva_respeita_o_limite_por_usuario(self):
+        primeiro, segundo = self._enfileirar(0), self._enfileirar(0)
+        outro_usuario = self._enfileirar(1)
+        self.assertEqual(jobs_justificativa_service.reservar_proximo_job('w').pk, primeiro.pk)
+        # O usuário 0 já tem um job em execução: o próximo é o do usuário 1
+        self.assertEqual(jobs_justificativa_service.reservar_proximo_job('w').pk, outro_usuario.pk)
+        self.assertIsNone(jobs_justificativa_service.reservar_proximo_job('w'))
+        self.assertEqual(JobJustificativa.objects.get(pk=segundo.pk).status, JobJustificativa.StatusChoices.PENDENTE)
+
+    def test_reserva_ignora_job_ainda_indisponivel(self):
+        job = self._enfileirar()
+        JobJustificativa.objects.filter(pk=job.pk).update(disponivel_em=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(jobs_justificativa_service.reservar_proximo_job('w'))
+
+    def test_execucao_grava_resultado_na_solicitacao(self):
+        self._enfileirar()
+        job = jobs_justificativa_service.reservar_proximo_job('w')
+        with mock.patch.object(jobs_justificativa_service, 'gerar_justificativa_ia', return_value={'justificativa': 'ok'}):
+            job = jobs_justificativa_service.executar_job(job)
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.CONCLUIDO)
+        solicitacao = Solicitacao.objects.get(pk=self.solicitacoes[0].pk)
+        self.assertEqual(solicitacao.justificativa, 'ok')
+        self.assertEqual(solicitacao.metadados_ia['job_justificativa'], job.pk)
+
+    def test_falha_de_conexao_volta_para_a_fila_com_backoff(self):
+        self._enfileirar()
+        job = jobs_justificativa_service.reservar_proximo_job('w')
+        with mock.patch.object(jobs_justificativa_service, 'gerar_justificativa_ia', side_effect=ConnectionError('fora do ar')):
+            job = jobs_justificativa_service.executar_job(job)
+        self.assertEqual((job.status, job.worker, job.erro), (JobJustificativa.StatusChoices.PENDENTE, '', 'fora do ar'))
+        self.assertGreater(job.disponivel_em, timezone.now())
+
+    def test_falha_de_conexao_sem_tentativas_restantes_falha(self):
+        job = self._enfileirar()
+        self._travar(job, tentativas=3)
+        with mock.patch.object(jobs_justificativa_service, 'gerar_justificativa_ia', side_effect=ConnectionError('fora do ar')):
+            job = jobs_justificativa_service.executar_job(JobJustificativa.objects.get(pk=job.pk))
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.FALHOU)
+
+    def test_resposta_invalida_falha_sem_nova_tentativa(self):
+        self._enfileirar()
+        job = jobs_justificativa_service.reservar_proximo_job('w')
+        with mock.patch.object(jobs_justificativa_service, 'gerar_justificativa_ia', side_effect=ValueError('JSON inválido')):
+            job = jobs_justificativa_service.executar_job(job)
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.FALHOU)
+
+    def test_cancelar_job_pendente(self):
+        job = self._enfileirar()
+        self.assertTrue(jobs_justificativa_service.cancelar_job(job))
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.CANCELADO)
+        self.assertFalse(jobs_justificativa_service.cancelar_job(job))
+
+    def test_cancelar_job_em_execucao_descarta_o_resultado(self):
+        self._enfileirar()
+        job = jobs_justificativa_service.reservar_proximo_job('w')
+        self.assertTrue(jobs_justificativa_service.cancelar_job(job))
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.EM_EXECUCAO)
+        with mock.patch.object(jobs_justificativa_service, 'gerar_justificativa_ia', return_value={'justificativa': 'ok'}):
+            job = jobs_justificativa_service.executar_job(job)
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.CANCELADO)
+        self.assertIsNone(Solicitacao.objects.get(pk=self.solicitacoes[0].pk).justificativa)
+
+    def test_recuperacao_devolve_job_travado_a_fila(self):
+        job = self._enfileirar()
+        self._travar(job, tentativas=1)
+        self.assertEqual(jobs_justificativa_service.recuperar_jobs_travados(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (JobJustificativa.StatusChoices.PENDENTE, ''))
+
+    def test_recuperacao_ignora_job_dentro_do_timeout(self):
+        job = self._enfileirar()
+        jobs_justificativa_service.reservar_proximo_job('w')
+        self.assertEqual(jobs_justificativa_service.recuperar_jobs_travados(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.EM_EXECUCAO)
+
+    def test_recuperacao_marca_como_falha_job_sem_tentativas_restantes(self):
+        job = self._enfileirar()
+        self._travar(job, tentativas=3)
+        self.assertEqual(jobs_justificativa_service.recuperar_jobs_travados(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.FALHOU)
+        self.assertIsNotNone(job.data_fim)
+        self.assertIsNone(jobs_justificativa_service.reservar_proximo_job('w'))
+
+    def test_recuperacao_cancela_job_com_cancelamento_pedido(self):
+        job = self._enfileirar()
+        self._travar(job, tentativas=1)
+        JobJustificativa.objects.filter(pk=job.pk).update(cancelamento_solicitado=True)
+        jobs_justificativa_service.recuperar_jobs_travados()
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobJustificativa.StatusChoices.CANCELADO)
+
+
+@override_settings(USE_MOCK_DATA=False, PROCEDIMENTOS_CATALOGO_TTL=300, PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO=False)
+class CatalogoAsyncTests(SimpleTestCase):
+    """Recarga do catálogo nas views async: uma única busca na API por vez."""
+    PROCS = [{'proc_id': '01', 'proc_label': 'Procedimento 1', 'NT_id': 'nt-1', 'NT_label': 'NT 1', 'ers': []}]
+
+    def setUp(self):
+        self.catalogo = procedimentos_service.CatalogoProcedimentos()
+        self.buscas = 0
+
+    async def _buscar(self, etag=None, last_modified=None):
+        self.buscas += 1
+        await asyncio.sleep(0.05)
+        return procedimentos_service.RespostaApiProcedimentos(self.PROCS, '"v1"', None)
+
+    def _obter_concorrentes(self, quantidade):
+        async def _todas():
+            return await asyncio.gather(*(self.catalogo.obter_async() for _ in range(quantidade)))
+        with mock.patch.object(procedimentos_service, '_fetch_api_procedimentos_async', self._buscar):
+            return async_to_sync(_todas)()
+
+    def test_leituras_concorrentes_fazem_uma_busca(self):
+        snapshots = self._obter_concorrentes(10)
+        self.assertEqual(self.buscas, 1)
+        self.assertTrue(all(snapshot is snapshots[0] for snapshot in snapshots))
+        self.assertEqual(snapshots[0].procedimento('01').nt_label, 'NT 1')
+
+    def test_catalogo_vencido_e_buscado_de_novo(self):
+        self._obter_concorrentes(3)
+        self.catalogo.invalidar()
+        self._obter_concorrentes(3)
+        self.assertEqual(self.buscas, 2)
+
+
+class IndiceBuscaTests(SimpleTestCase):
+    """Busca de procedimentos por prefixo das palavras e, sem resultado, por trigramas."""
+    PROCS = [
+        {'proc_id': '1', 'proc_label': 'CONSULTA EM GINECOLOGIA - UROGINECOLOGIA', 'proc_sisreg': '0701', 'NT_label': 'NT 1'},
+        {'proc_id': '2', 'proc_label': 'CONSULTA EM UROLOGIA', 'proc_sisreg': '0702', 'NT_label': 'NT 2'},
+        {'proc_id': '3', 'proc_label': 'Ginecologia', 'proc_sisreg': '0703'},
+        {'proc_id': '4', 'proc_label': 'Eletroencefalografiaquantitativa', 'proc_sisreg': '0704'},
+        {'proc_id': '5', 'proc_label': 'Eletroencefalografiaconvencional', 'proc_sisreg': '0705'},
+        {'proc_id': '6', 'proc_label': 'Cirurgia de catarata', 'proc_sisreg': 'OFTALMO'},
+    ]
+
+    def setUp(self):
+        self.indice = IndiceBusca(self.PROCS)
+
+    def _ids(self, consulta, limite=10):
+        return [r['proc_id'] for r in self.indice.buscar(consulta, limite)]
+
+    def test_todas_as_palavras_casam_com_o_inicio_de_alguma_palavra(self):
+        self.assertEqual(self._ids('gine uro'), ['1'])
+        self.assertEqual(self._ids('URÓ'), ['2', '1'])
+        self.assertEqual(self._ids('oftal'), ['6'])
+        self.assertEqual(self._ids('  '), [])
+
+    def test_ordem_nome_comecando_pela_consulta_e_depois_mais_curto(self):
+        self.assertEqual(self._ids('ginecologia'), ['3', '1'])
+        self.assertEqual(self._ids('consulta'), ['2', '1'])
+        self.assertEqual(self._ids('consulta', limite=1), ['2'])
+        self.assertEqual(self.indice.buscar('ginecologia', 1),
+                         [{'proc_id': '3', 'proc_label': 'Ginecologia', 'NT_label': None}])
+
+    def test_palavra_maior_que_o_limite_do_indice_confere_o_resto(self):
+        self.assertEqual(self._ids('eletroencefalografia'), ['4', '5'])
+        self.assertEqual(self._ids('eletroencefalografiaquanti'), ['4'])
+        self.assertEqual(self._ids('eletroencefalografiaconvencional'), ['5'])
+
+    def test_sem_prefixo_busca_aproximada_por_trigramas(self):
+        # Erro de digitação: nenhuma palavra começa com "ginecolgia"
+        self.assertEqual(self._ids('ginecolgia'), ['3', '1'])
+        self.assertEqual(self._ids('catarta'), ['6'])
+        self.assertEqual(self._ids('xyzw'), [])
+
+
+@override_settings(USE_MOCK_DATA=False, PROCEDIMENTOS_CATALOGO_TTL=300, PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO=False,
+                   JWT_USUARIO_DAS_CLAIMS=False)
+class BuscaProcedimentosApiTests(TestCase):
+    """Endpoints de busca e de definição de um procedimento, nas views do ViewSet e nas async."""
+    URL = '/api/fillsense/solicitacoes/'
+    PROCS = [
+        {'proc_id': '01', 'proc_label': 'Consulta em Ginecologia', 'NT_label': 'NT 1', 'fields': [], 'ers': []},
+        {'proc_id': '02', 'proc_label': 'Consulta em Urologia', 'NT_label': 'NT 2', 'fields': [{'nome': 'idade'}], 'ers': []},
+    ]
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        catalogo = procedimentos_service.CatalogoProcedimentos()
+        catalogo._substituir(self.PROCS)
+        catalogo._verificado_em = time.monotonic()
+        self.etag = catalogo.obter().etag
+        patcher = mock.patch.object(views, 'catalogo', catalogo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_async(self, view, params=None, **kwargs):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {gerar_tokens(self.usuario).access_token}'}
+        headers.update(kwargs.pop('headers', {}))
+        request = RequestFactory().get('/', params or {}, **headers)
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_busca(self):
+        response = self.client.get(f"{self.URL}procedimentos/busca/", {'q': 'uro'})
+        self.assertEqual(response.json(), [{'proc_id': '02', 'proc_label': 'Consulta em Urologia', 'NT_label': 'NT 2'}])
+        self.assertEqual(len(self.client.get(f"{self.URL}procedimentos/busca/", {'q': 'consulta', 'limite': '1'}).json()), 1)
+        self.assertEqual(self.client.get(f"{self.URL}procedimentos/busca/", {'limite': 'x'}).status_code, 400)
+
+    def test_busca_async(self):
+        response = self._get_async(views.buscar_procedimentos_async, {'q': 'ginec'})
+        self.assertEqual([r['proc_id'] for r in json.loads(response.content)], ['01'])
+        self.assertEqual(self._get_async(views.buscar_procedimentos_async, {'limite': 'x'}).status_code, 400)
+        self.assertEqual(async_to_sync(views.buscar_procedimentos_async)(RequestFactory().get('/')).status_code, 401)
+
+    def test_definicao_do_procedimento_com_etag(self):
+        response = self.client.get(f"{self.URL}procedimento/02/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), self.PROCS[1])
+        self.assertEqual(response['ETag'], self.etag)
+        response = self.client.get(f"{self.URL}procedimento/02/", HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(self.client.get(f"{self.URL}procedimento/99/").status_code, 404)
+
+    def test_definicao_do_procedimento_async(self):
+        response = self._get_async(views.procedimento_async, proc_id='01')
+        self.assertEqual((json.loads(response.content), response['ETag']), (self.PROCS[0], self.etag))
+        response = self._get_async(views.procedimento_async, proc_id='01', headers={'HTTP_IF_NONE_MATCH': self.etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self._get_async(views.procedimento_async, proc_id='99').status_code, 404)
+
+
+
+class ViewsAsyncTests(TestCase):
+    """
+    Views assíncronas (USE_ASYNC_VIEWS=True): autenticação pelo
+    jwt_required_async e o caminho de sucesso de cada uma, com os serviços
+    de IA substituídos.
+    """
+    PROCS = [{'proc_id': '01', 'proc_label': 'Consulta em Ginecologia', 'NT_label': 'NT 1', 'fields': [],
+              'ers': [{'categoria': {'Nome': 'Exames'}, 'Nome': 'Ultrassom'}]}]
+    SEM_TOKEN = object()
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        catalogo = procedimentos_service.CatalogoProcedimentos()
+        catalogo._substituir(self.PROCS)
+        catalogo._verificado_em = time.monotonic()
+        self.snapshot = catalogo.obter()
+        patcher = mock.patch.object(views, 'catalogo', catalogo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request(self, dados=None, autorizacao=None, **headers):
+        if autorizacao is None:
+            autorizacao = f'Bearer {gerar_tokens(self.usuario).access_token}'
+        if autorizacao is not self.SEM_TOKEN:
+            headers['HTTP_AUTHORIZATION'] = autorizacao
+        if dados is None:
+            return RequestFactory().get('/', **headers)
+        return RequestFactory().post('/', json.dumps(dados), content_type='application/json', **headers)
+
+    def _chamar(self, view, dados=None, **kwargs):
+        return async_to_sync(view)(self._request(dados, **kwargs))
+
+    def _chamar_stream(self, view, dados=None, **kwargs):
+        request = self._request(dados, **kwargs)
+
+        # A resposta é lida no mesmo event loop da view: ao terminar, o loop
+        # fecha os geradores assíncronos que começaram nele
+        async def _ler():
+            response = await view(request)
+            return response, b''.join([pedaco async for pedaco in response.streaming_content]).decode()
+        return async_to_sync(_ler)()
+
+    def test_sem_token_ou_com_token_invalido_responde_401(self):
+        chamadas = [
+            (views.gerar_justificativa_async, {}),
+            (views.gerar_justificativa_stream_async, {}),
+            (views.gerar_justificativas_lote_async, {}),
+            (views.procedimentos_async, None),
+        ]
+        gerar = mock.AsyncMock()
+        with mock.patch.object(views, 'gerar_justificativa_ia_async', gerar):
+            for view, dados in chamadas:
+                for autorizacao in (self.SEM_TOKEN, 'Bearer invalido'):
+                    with self.subTest(view=view.__name__, autorizacao=autorizacao):
+                        response = self._chamar(view, dados, autorizacao=autorizacao)
+                        self.assertEqual(response.status_code, 401)
+                        self.assertIn('Bearer', response['WWW-Authenticate'])
+        gerar.assert_not_called()
+
+    def test_gerar_justificativa(self):
+        gerar = mock.AsyncMock(return_value={"justificativa": "Texto"})
+        with mock.patch.object(views, 'gerar_justificativa_ia_async', gerar):
+            response = self._chamar(views.gerar_justificativa_async,
+                                    {'proc_id': '01', 'clinico_text': 'Dor pélvica', 'nova_geracao': True})
+            self.assertEqual(self._chamar(views.gerar_justificativa_async, {'proc_id': '01'}).status_code, 400)
+
+        self.assertEqual((response.status_code, json.loads(response.content)), (200, {"justificativa": "Texto"}))
+        kwargs = gerar.call_args.kwargs
+        self.assertEqual((kwargs['procedimento'], kwargs['clinico_text'], kwargs['usar_cache']),
+                         ('Consulta em Ginecologia', 'Dor pélvica', False))
+        self.assertEqual(kwargs['requisitos'], self.snapshot.procedimento('01').nota.requisitos)
+
+    def test_gerar_justificativa_com_ia_indisponivel(self):
+        indisponivel = controle_ollama_service.SobrecargaIA('Fila cheia', retry_after=7)
+        with mock.patch.object(views, 'gerar_justificativa_ia_async', mock.AsyncMock(side_effect=indisponivel)):
+            response = self._chamar(views.gerar_justificativa_async, {'proc_id': '01', 'clinico_text': 'Dor'})
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '7'))
+
+    def test_gerar_justificativa_stream(self):
+        async def stream(**kwargs):
+            for evento in (("admitido", None), ("token", "Pac"), ("token", "iente"), ("fim", {"justificativa": "Paciente"})):
+                yield evento
+
+        with mock.patch.object(views, 'gerar_justificativa_ia_stream_async', stream):
+            response, corpo = self._chamar_stream(views.gerar_justificativa_stream_async, {'proc_id': '01', 'clinico_text': 'Dor'})
+
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+        self.assertEqual(corpo, views._formatar_sse("token", {"conteudo": "Pac"}) + views._formatar_sse("token", {"conteudo": "iente"})
+                         + views._formatar_sse("fim", {"justificativa": "Paciente"}))
+
+    def test_gerar_justificativa_stream_recusada_antes_do_primeiro_evento(self):
+        async def stream(**kwargs):
+            raise controle_ollama_service.IAIndisponivel('Ollama fora do ar', retry_after=30)
+            yield
+
+        with mock.patch.object(views, 'gerar_justificativa_ia_stream_async', stream):
+            response = self._chamar(views.gerar_justificativa_stream_async, {'proc_id': '01', 'clinico_text': 'Dor'})
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '30'))
+
+    def _lote_falso(self):
+        itens_recebidos = []
+
+        async def gerar_lote(itens, usar_cache=True):
+            itens_recebidos.extend(itens)
+            # Os resultados chegam na ordem em que as gerações terminam
+            yield {"indice": 1, "status": 200, "justificativa": "B"}
+            yield {"indice": 0, "status": 503, "error": "Ollama fora do ar"}
+
+        return mock.patch.object(lote_justificativa_service, 'gerar_lote_async', gerar_lote), itens_recebidos
+
+    def test_gerar_justificativas_lote(self):
+        lote = {'itens': [{'proc_id': '01', 'clinico_text': 'A'}, {'proc_id': '01', 'clinico_text': 'B'}]}
+        patcher, itens = self._lote_falso()
+        with patcher:
+            response = self._chamar(views.gerar_justificativas_lote_async, lote)
+
+        self.assertEqual(response.status_code, 200)
+        dados = json.loads(response.content)
+        self.assertEqual([r['indice'] for r in dados['resultados']], [0, 1])
+        self.assertEqual({k: dados[k] for k in ('total', 'sucesso', 'falhas', 'salvas')},
+                         {"total": 2, "sucesso": 1, "falhas": 1, "salvas": 0})
+        self.assertEqual([(i.procedimento, i.clinico_text) for i in itens],
+                         [('Consulta em Ginecologia', 'A'), ('Consulta em Ginecologia', 'B')])
+        self.assertEqual(self._chamar(views.gerar_justificativas_lote_async, {'itens': []}).status_code, 400)
+
+    def test_gerar_justificativas_lote_em_stream(self):
+        lote = {'itens': [{'proc_id': '01', 'clinico_text': 'A'}, {'proc_id': '01', 'clinico_text': 'B'}]}
+        patcher, _ = self._lote_falso()
+        with patcher:
+            response, corpo = self._chamar_stream(views.gerar_justificativas_lote_async, lote, HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+        self.assertEqual(corpo.count('event: item\n'), 2)
+        self.assertTrue(corpo.endswith(views._formatar_sse("fim", {"total": 2, "sucesso": 1, "falhas": 1, "salvas": 0})))
+
+    def test_procedimentos(self):
+        response = self._chamar(views.procedimentos_async)
+        self.assertEqual((response.status_code, response.content, response['ETag']),
+                         (200, self.snapshot.conteudo, self.snapshot.etag))
+        response = self._chamar(views.procedimentos_async, HTTP_IF_NONE_MATCH=self.snapshot.etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+
+class RotasAsyncTests(SimpleTestCase):
+    """Com USE_ASYNC_VIEWS=True, as rotas async vêm antes do router e têm precedência sobre as actions."""
+    ROTAS = {
+        '/solicitacoes/gerar-justificativa/': views.gerar_justificativa_async,
+        '/solicitacoes/gerar-justificativa-stream/': views.gerar_justificativa_stream_async,
+        '/solicitacoes/gerar-justificativas-lote/': views.gerar_justificativas_lote_async,
+        '/solicitacoes/procedimentos/': views.procedimentos_async,
+        '/solicitacoes/procedimentos/busca/': views.buscar_procedimentos_async,
+        '/solicitacoes/procedimento/01/': views.procedimento_async,
+    }
+
+    def _recarregar_urls(self, usar_async):
+        with override_settings(USE_ASYNC_VIEWS=usar_async):
+            importlib.reload(fillsense_urls)
+        clear_url_caches()
+        self.addCleanup(clear_url_caches)
+        self.addCleanup(importlib.reload, fillsense_urls)
+
+    def test_com_use_async_views_as_rotas_vao_para_as_views_async(self):
+        self._recarregar_urls(True)
+        for rota, view in self.ROTAS.items():
+            with self.subTest(rota=rota):
+                self.assertIs(resolve(rota, urlconf=fillsense_urls).func, view)
+        # As demais rotas continuam no router
+        self.assertIs(resolve('/solicitacoes/busca/', urlconf=fillsense_urls).func.cls, views.SolicitacaoViewSet)
+
+    def test_sem_use_async_views_o_viewset_atende(self):
+        self._recarregar_urls(False)
+        for rota in self.ROTAS:
+            with self.subTest(rota=rota):
+                self.assertIs(resolve(rota, urlconf=fillsense_urls).func.cls, views.SolicitacaoViewSet)
+
+
+class SincronizacaoProcedimentosTests(TestCase):
+    """Sincronização da tabela de Procedimentos pela diferença com a fonte, e o comando agendado."""
+
+    def _procs(self, *pares):
+        return [{'proc_id': codigo, 'proc_label': label} for codigo, label in pares]
+
+    def _tabela(self):
+        return dict(Procedimento.objects.values_list('codigo', 'label'))
+
+    def test_insere_os_novos_em_lotes(self):
+        procs = self._procs(*((f"0{i}", f"Procedimento {i}") for i in range(5))) + [{'proc_id': '99'}]
+        resumo = procedimentos_service.sincronizar_procedimentos(procs, tamanho_lote=2)
+        self.assertEqual(resumo, {"criados": 5, "atualizados": 0, "inalterados": 0, "invalidos": 1})
+        self.assertEqual(self._tabela(), {f"0{i}": f"Procedimento {i}" for i in range(5)})
+
+    def test_atualiza_so_os_labels_alterados_e_nao_apaga(self):
+        Procedimento.objects.create(codigo='01', label='Antigo')
+        Procedimento.objects.create(codigo='02', label='Igual')
+        Procedimento.objects.create(codigo='03', label='Fora da fonte')
+        resumo = procedimentos_service.sincronizar_procedimentos(self._procs(('01', 'Novo'), ('02', 'Igual'), ('04', 'Criado')))
+        self.assertEqual(resumo, {"criados": 1, "atualizados": 1, "inalterados": 1, "invalidos": 0})
+        self.assertEqual(self._tabela(), {'01': 'Novo', '02': 'Igual', '03': 'Fora da fonte', '04': 'Criado'})
+
+    def test_sem_alteracoes_so_le_a_tabela(self):
+        procs = self._procs(('01', 'Procedimento 1'), ('02', 'Procedimento 2'))
+        procedimentos_service.sincronizar_procedimentos(procs)
+        with self.assertNumQueries(1):
+            resumo = procedimentos_service.sincronizar_procedimentos(procs)
+        self.assertEqual(resumo, {"criados": 0, "atualizados": 0, "inalterados": 2, "invalidos": 0})
+
+    def test_comando_com_intervalo_repete_e_sobrevive_a_falhas_da_fonte(self):
+        class _Parar(Exception):
+            pass
+
+        comando = 'fillsense.management.commands.sincronizar_procedimentos'
+        fonte = mock.Mock(side_effect=[RuntimeError('fonte fora do ar'), self._procs(('01', 'Procedimento 1'))])
+        saida = io.StringIO()
+        with mock.patch(f'{comando}.carregar_procedimentos_da_fonte', fonte), \
+                mock.patch(f'{comando}.time.sleep', side_effect=[None, _Parar()]) as sleep:
+            with self.assertRaises(_Parar):
+                call_command('sincronizar_procedimentos', '--intervalo', '60', stdout=saida)
+        sleep.assert_called_with(60)
+        self.assertIn('fonte fora do ar', saida.getvalue())
+        self.assertIn('1 criado(s)', saida.getvalue())
+        self.assertEqual(self._tabela(), {'01': 'Procedimento 1'})
+
+    def test_comando_sem_intervalo_executa_uma_vez(self):
+        saida = io.StringIO()
+        with mock.patch('fillsense.management.commands.sincronizar_procedimentos.carregar_procedimentos_da_fonte',
+                        return_value=[]):
+            call_command('sincronizar_procedimentos', stdout=saida)
+        self.assertIn('nada a sincronizar', saida.getvalue())
+
+
+@override_settings(OLLAMA_MODEL='mistral:latest', OLLAMA_KEEP_ALIVE='30m')
+class PromptOllamaTests(SimpleTestCase):
+    """
+    Ordem do prompt para o cache de prefixo do Ollama (o que não muda entre
+    requisições vem primeiro), keep_alive e aquecimento do modelo.
+    """
+    REQUISITOS = "- Exames: Estudo urodinâmico\n- Tratamento: Fisioterapia pélvica"
+
+    def _payload(self, clinico, procedimento='Uroginecologia'):
+        mensagens = gerar_justificativa_service._build_messages(procedimento, clinico, self.REQUISITOS)
+        return gerar_justificativa_service._build_payload(mensagens)
+
+    def test_instrucoes_e_criterios_vem_antes_do_texto_clinico(self):
+        mensagens = self._payload('Paciente com incontinência')['messages']
+        self.assertEqual([m['role'] for m in mensagens], ['system', 'user'])
+        self.assertEqual(mensagens[0]['content'], gerar_justificativa_service._SYSTEM_TEXT)
+        usuario = mensagens[1]['content']
+        self.assertLess(usuario.index(self.REQUISITOS), usuario.index('Uroginecologia'))
+        self.assertLess(usuario.index('Uroginecologia'), usuario.index('Paciente com incontinência'))
+
+    def test_prefixo_identico_para_textos_clinicos_diferentes(self):
+        corpos = [json.dumps(self._payload(clinico), ensure_ascii=False).encode('utf-8')
+                  for clinico in ('Paciente com incontinência', 'Dor pélvica há 2 anos')]
+        prefixo = os.path.commonprefix(corpos).decode('utf-8')
+        self.assertTrue(prefixo.endswith('Informações clínicas: <<'))
+        self.assertIn(json.dumps(gerar_justificativa_service._SYSTEM_TEXT, ensure_ascii=False), prefixo)
+        self.assertIn('Procedimento: <<Uroginecologia>>', prefixo)
+        self.assertIn(json.dumps(self.REQUISITOS, ensure_ascii=False)[1:-1], prefixo)
+
+    def test_keep_alive_enviado_em_todas_as_chamadas(self):
+        self.assertEqual(self._payload('x')['keep_alive'], '30m')
+        with override_settings(OLLAMA_KEEP_ALIVE='-1'):
+            self.assertEqual(self._payload('x')['keep_alive'], -1)
+
+    def _cliente_falso(self, post):
+        cliente = mock.Mock()
+        cliente.post.side_effect = post
+        pool = PoolOllama([BackendOllama('http://ollama-1'), BackendOllama('http://ollama-2')],
+                          intervalo_verificacao=3600, suspensao=60)
+        return (mock.patch.object(gerar_justificativa_service.clientes_http, 'cliente', return_value=cliente),
+                mock.patch.object(gerar_justificativa_service.backends_ollama_service, 'pool', return_value=pool),
+                cliente)
+
+    @staticmethod
+    def _responder(url, json, **kwargs):
+        return mock.Mock(status_code=200, json=lambda: {'message': {'content': '{'}, 'done': True},
+                         raise_for_status=lambda: None)
+
+    def test_comando_aquecer_ollama(self):
+        catalogo = procedimentos_service.CatalogoProcedimentos()
+        with override_settings(PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO=False):
+            catalogo._substituir([
+                {'proc_id': '01', 'proc_label': 'Uroginecologia', 'NT_id': 'nt-1', 'ers': [{'categoria': {'Nome': 'Exames'}, 'Nome': 'Urodinâmica'}]},
+                {'proc_id': '02', 'proc_label': 'Urologia', 'NT_id': 'nt-1', 'ers': [{'categoria': {'Nome': 'Exames'}, 'Nome': 'Urodinâmica'}]},
+                {'proc_id': '03', 'proc_label': 'Cardiologia', 'NT_id': 'nt-2', 'ers': [{'categoria': {'Nome': 'Exames'}, 'Nome': 'ECG'}]},
+            ])
+        catalogo._verificado_em = time.monotonic()
+        patch_cliente, patch_pool, cliente = self._cliente_falso(self._responder)
+        saida = io.StringIO()
+        with patch_cliente, patch_pool, \
+                mock.patch('fillsense.management.commands.aquecer_ollama.catalogo', catalogo), \
+                override_settings(USE_MOCK_DATA=False, PROCEDIMENTOS_CATALOGO_TTL=300):
+            call_command('aquecer_ollama', stdout=saida)
+
+        payloads = [(c.args[0], c.kwargs['json']) for c in cliente.post.call_args_list]
+        # Carga do modelo em cada servidor, depois um aquecimento por nota técnica em cada servidor
+        self.assertEqual([url for url, _ in payloads], ['http://ollama-1/api/chat', 'http://ollama-2/api/chat'] * 3)
+        self.assertEqual(payloads[0][1], {'model': 'mistral:latest', 'messages': [], 'keep_alive': '30m'})
+        for _, payload in payloads[2:]:
+            self.assertEqual((payload['options']['num_predict'], payload['keep_alive']), (1, '30m'))
+            self.assertTrue(payload['messages'][1]['content'].rstrip().endswith('Informações clínicas: <<>>'))
+        self.assertIn('2 de 2 nota(s) técnica(s) aquecida(s)', saida.getvalue())
+
+    def test_comando_sem_servidor_disponivel(self):
+        def _falhar(url, json, **kwargs):
+            raise requests.exceptions.ConnectionError('recusada')
+
+        patch_cliente, patch_pool, cliente = self._cliente_falso(_falhar)
+        saida = io.StringIO()
+        with patch_cliente, patch_pool:
+            call_command('aquecer_ollama', '--sem-prefixos', stdout=saida)
+        self.assertEqual(cliente.post.call_count, 2)
+        self.assertIn('Falha ao carregar o modelo', saida.getvalue())
+
+
+class CacheJustificativaBackendsTests(TestCase):
+    """Backends do cache de justificativas: expiração, limite de itens e limpeza."""
+    VALOR = {"procedimento": "P", "justificativa": "texto"}
+
+    def setUp(self):
+        self.relogio = _Relogio()
+        patcher = mock.patch('fillsense.services.cache_justificativa_service.time.monotonic', self.relogio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_memoria_expira_pelo_ttl(self):
+        cache = cache_justificativa_service.MemoriaLRUCache(ttl=60, max_itens=10)
+        cache.guardar('a', self.VALOR)
+        self.relogio.agora += 59
+        self.assertEqual(cache.obter('a'), self.VALOR)
+        self.relogio.agora += 2
+        self.assertIsNone(cache.obter('a'))
+
+    def test_memoria_descarta_o_menos_usado(self):
+        cache = cache_justificativa_service.MemoriaLRUCache(ttl=60, max_itens=2)
+        cache.guardar('a', self.VALOR)
+        cache.guardar('b', self.VALOR)
+        cache.obter('a')
+        cache.guardar('c', self.VALOR)
+        self.assertEqual([chave for chave in 'abc' if cache.obter(chave) is not None], ['a', 'c'])
+        cache.limpar()
+        self.assertIsNone(cache.obter('a'))
+
+    def test_memoria_devolve_copias(self):
+        cache = cache_justificativa_service.MemoriaLRUCache(ttl=60, max_itens=2)
+        cache.guardar('a', self.VALOR)
+        cache.obter('a')['justificativa'] = 'alterada'
+        self.assertEqual(cache.obter('a'), self.VALOR)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'testes-cache-justificativa'}})
+    def test_django_limpar_preserva_as_outras_chaves_do_alias(self):
+        from django.core.cache import cache as cache_padrao
+        cache_padrao.clear()
+        cache = cache_justificativa_service.DjangoCache(ttl=60, max_itens=10)
+        cache.limpar()  # sem versão ainda: não falha
+        cache.guardar('a', self.VALOR)
+        cache_padrao.set('sessao:123', 'outro uso do alias')
+        self.assertEqual(cache.obter('a'), self.VALOR)
+
+        cache.limpar()
+        self.assertIsNone(cache.obter('a'))
+        self.assertEqual(cache_padrao.get('sessao:123'), 'outro uso do alias')
+        cache.guardar('a', {"justificativa": "nova"})
+        self.assertEqual(cache.obter('a'), {"justificativa": "nova"})
+
+        async def _async():
+            await cache.guardar_async('b', self.VALOR)
+            return await cache.obter_async('a'), await cache.obter_async('b')
+        self.assertEqual(async_to_sync(_async)(), ({"justificativa": "nova"}, self.VALOR))
+
+    def test_backend_sem_todos_os_metodos_nao_instancia(self):
+        class SemLimpar(cache_justificativa_service.CacheBackend):
+            def obter(self, chave):
+                return None
+
+            def guardar(self, chave, valor):
+                pass
+
+        with self.assertRaises(TypeError):
+            SemLimpar(ttl=60, max_itens=10)
+
+    def _guardar_no_banco(self, cache, chave, instante):
+        with mock.patch('django.utils.timezone.now', return_value=instante):
+            cache.guardar(chave, self.VALOR)
+
+    def _chaves_no_banco(self):
+        return sorted(CacheJustificativa.objects.values_list('chave', flat=True))
+
+    def test_banco_expira_e_respeita_o_limite_no_despejo(self):
+        cache = cache_justificativa_service.BancoCache(ttl=60, max_itens=2, intervalo_despejo=30)
+        agora = timezone.now()
+        for segundos, chave in enumerate('abc'):
+            self._guardar_no_banco(cache, chave, agora + timedelta(seconds=segundos))
+        # O despejo rodou no primeiro guardar: até o próximo, a tabela passa do limite
+        self.assertEqual(self._chaves_no_banco(), ['a', 'b', 'c'])
+
+        self.relogio.agora += 30
+        self._guardar_no_banco(cache, 'd', agora + timedelta(seconds=3))
+        self.assertEqual(self._chaves_no_banco(), ['c', 'd'])
+        with mock.patch('django.utils.timezone.now', return_value=agora + timedelta(seconds=62.5)):
+            self.assertIsNone(cache.obter('c'))
+            self.assertEqual(cache.obter('d'), self.VALOR)
+
+        self.relogio.agora += 30
+        self._guardar_no_banco(cache, 'e', agora + timedelta(seconds=70))
+        self.assertEqual(self._chaves_no_banco(), ['e'])
+        cache.limpar()
+        self.assertFalse(CacheJustificativa.objects.exists())
+
+    def test_banco_despeja_no_maximo_uma_vez_por_intervalo(self):
+        cache = cache_justificativa_service.BancoCache(ttl=60, max_itens=10, intervalo_despejo=30)
+        with mock.patch.object(cache, 'despejar', wraps=cache.despejar) as despejar:
+            for chave in 'abc':
+                cache.guardar(chave, self.VALOR)
+            self.assertEqual(despejar.call_count, 1)
+            self.relogio.agora += 29
+            cache.guardar('d', self.VALOR)
+            self.assertEqual(despejar.call_count, 1)
+            self.relogio.agora += 1
+            cache.guardar('e', self.VALOR)
+            self.assertEqual(despejar.call_count, 2)
+
+
+class LoteJustificativasTests(TestCase):
+    """Geração em lote: endpoint, desconexão do cliente e gravação dos resultados."""
+    URL = '/api/fillsense/solicitacoes/gerar-justificativas-lote/'
+    ERS = [{"Nome": "ER", "categoria": {"Nome": "C"}}]
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    @staticmethod
+    def _gerar_falso(procedimento, clinico_text, **kwargs):
+        if clinico_text == 'falha':
+            raise ConnectionError('Ollama fora do ar')
+        return {"procedimento": procedimento, "justificativa": f"justificativa de {clinico_text}"}
+
+    def _item(self, indice, texto, solicitacao=None):
+        return lote_justificativa_service.ItemLote(indice, 'P', texto, '{"Categorias": []}', solicitacao, 'requisitos')
+
+    def _post(self, itens, **dados):
+        with mock.patch.object(lote_justificativa_service, 'gerar_justificativa_ia', self._gerar_falso):
+            return self.client.post(self.URL, {"itens": itens, **dados}, format='json')
+
+    def test_endpoint_responde_cada_item_e_grava_nas_solicitacoes(self):
+        solicitacao = Solicitacao.objects.create(usuario=self.usuario, procedimento='P')
+        response = self._post([
+            {"procedimento": "P", "clinico_text": "a", "ers": self.ERS, "solicitacao": solicitacao.pk},
+            {"procedimento": "P", "clinico_text": "falha", "ers": self.ERS},
+        ], salvar=True)
+
+        self.assertEqual(response.status_code, 200)
+        dados = response.json()
+        self.assertEqual([(r['indice'], r['status']) for r in dados['resultados']], [(0, 200), (1, 503)])
+        self.assertEqual((dados['sucesso'], dados['falhas'], dados['salvas']), (1, 1, 1))
+        self.assertEqual(Solicitacao.objects.get(pk=solicitacao.pk).justificativa, 'justificativa de a')
+
+    def test_endpoint_em_streaming(self):
+        response = self.client.post(f"{self.URL}?stream=true", {"itens": [
+            {"procedimento": "P", "clinico_text": "a", "ers": self.ERS},
+        ]}, format='json')
+        with mock.patch.object(lote_justificativa_service, 'gerar_justificativa_ia', self._gerar_falso):
+            corpo = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual([linha for linha in corpo.splitlines() if linha.startswith('event:')],
+                         ['event: item', 'event: fim'])
+
+    def test_endpoint_valida_o_lote(self):
+        for dados in ({}, {"itens": []}, {"itens": [{"procedimento": "P"}]}, {"itens": [{"clinico_text": "a"}]}):
+            with self.subTest(dados=dados):
+                response = self.client.post(self.URL, dados, format='json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_desconexao_nao_espera_as_geracoes_em_andamento(self):
+        liberar = threading.Event()
+        iniciados = []
+
+        def gerar(procedimento, clinico_text, **kwargs):
+            iniciados.append(clinico_text)
+            if clinico_text == 'lento':
+                liberar.wait(5)
+            return {"justificativa": clinico_text}
+
+        itens = [self._item(0, 'rapido'), self._item(1, 'lento'), self._item(2, 'pendente')]
+        with mock.patch.object(lote_justificativa_service, 'gerar_justificativa_ia', gerar):
+            resultados = lote_justificativa_service.gerar_lote(itens, concorrencia=1)
+            self.assertEqual(next(resultados)['indice'], 0)
+            while 'lento' not in iniciados:
+                time.sleep(0.01)
+            inicio = time.monotonic()
+            resultados.close()
+            self.assertLess(time.monotonic() - inicio, 1)
+            liberar.set()
+            time.sleep(0.1)
+        self.assertEqual(iniciados, ['rapido', 'lento'])
+
+    def test_salvar_resultados_so_nas_solicitacoes_do_usuario(self):
+        outro = User.objects.create_user(username='outro', email='outro@exemplo.com', password='senha-forte-123')
+        minha = Solicitacao.objects.create(usuario=self.usuario, procedimento='P', metadados_ia={"origem": "manual"})
+        alheia = Solicitacao.objects.create(usuario=outro, procedimento='P')
+        com_erro = Solicitacao.objects.create(usuario=self.usuario, procedimento='P')
+        resultados = [
+            {"indice": 0, "solicitacao": minha.pk, "status": 200,
+             "resultado": {"justificativa": "ok", "compactacao": {"ers_usadas": 3}}},
+            {"indice": 1, "solicitacao": alheia.pk, "status": 200, "resultado": {"justificativa": "ok"}},
+            {"indice": 2, "solicitacao": com_erro.pk, "status": 503, "erro": "fora do ar"},
+            {"indice": 3, "solicitacao": None, "status": 200, "resultado": {"justificativa": "ok"}},
+        ]
+
+        self.assertEqual(lote_justificativa_service.salvar_resultados(self.usuario, resultados), 1)
+        minha.refresh_from_db()
+        self.assertEqual(minha.justificativa, 'ok')
+        self.assertEqual(minha.metadados_ia['origem'], 'manual')
+        self.assertTrue(minha.metadados_ia['gerado_em_lote'])
+        self.assertEqual(minha.metadados_ia['compactacao'], {"ers_usadas": 3})
+        self.assertIsNone(Solicitacao.objects.get(pk=alheia.pk).justificativa)
+        self.assertIsNone(Solicitacao.objects.get(pk=com_erro.pk).justificativa)
+        self.assertEqual(lote_justificativa_service.salvar_resultados(self.usuario, resultados[2:3]), 0)
+
+
+class BuscaSolicitacoesApiTests(TestCase):
+    """
+    Busca textual no histórico (/busca/). Fora do PostgreSQL a busca cai
+    no icontains, sem ranking; é o caminho exercitado aqui (SQLite).
+    """
+    URL = '/api/fillsense/solicitacoes/busca/'
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.outro = User.objects.create_user(username='outro', email='outro@exemplo.com', password='senha-forte-123')
+        self.ressonancia = Solicitacao.objects.create(usuario=self.usuario, procedimento='Ressonância de joelho',
+                                                      descricao_medica='Dor crônica')
+        self.consulta = Solicitacao.objects.create(usuario=self.usuario, procedimento='Consulta',
+                                                   justificativa='Paciente com DOR lombar', status=Solicitacao.StatusChoices.APROVADA)
+        Solicitacao.objects.create(usuario=self.outro, procedimento='Consulta', descricao_medica='dor')
+
+    def _ids(self, params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_icontains_em_todos_os_campos_sem_diferenciar_maiusculas(self):
+        self.assertEqual(self._ids({'q': 'dor'}), [self.consulta.pk, self.ressonancia.pk])
+        self.assertEqual(self._ids({'q': 'JOELHO'}), [self.ressonancia.pk])
+        self.assertEqual(self._ids({'q': self.consulta.protocolo.lower()}), [self.consulta.pk])
+        self.assertEqual(self._ids({'q': 'inexistente'}), [])
+
+    def test_so_busca_nas_solicitacoes_do_usuario(self):
+        self.client.force_authenticate(self.outro)
+        self.assertEqual(len(self._ids({'q': 'dor'})), 1)
+        self.assertEqual(self._ids({'q': 'joelho'}), [])
+
+    def test_resultado_sem_relevancia_fora_do_postgres(self):
+        item = self.client.get(self.URL, {'q': 'joelho'}).json()['results'][0]
+        self.assertIsNone(item['relevancia'])
+        self.assertNotIn('justificativa', item)
+
+    def test_texto_vazio_responde_400(self):
+        for params in ({}, {'q': ''}, {'q': '   '}):
+            with self.subTest(params=params):
+                response = self.client.get(self.URL, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('q', response.json())
+
+    def test_filtros_e_paginacao_da_listagem(self):
+        self.assertEqual(self._ids({'q': 'dor', 'status': 'aprovada'}), [self.consulta.pk])
+        response = self.client.get(self.URL, {'q': 'dor', 'page_size': 1, 'page': 2}).json()
+        self.assertEqual((response['count'], [item['id'] for item in response['results']]), (2, [self.ressonancia.pk]))
+
+    def test_aplicar_busca_no_queryset(self):
+        queryset = views.SolicitacaoViewSet._aplicar_busca(Solicitacao.objects.filter(usuario=self.usuario), 'crônica')
+        self.assertEqual(list(queryset), [self.ressonancia])
+        self.assertIsNone(queryset[0].relevancia)
+
+
+@skipUnless(connection.vendor == 'postgresql', "Requer PostgreSQL (trigger da busca textual).")
+class TriggerBuscaSolicitacaoTests(TestCase):
+    """
+    O trigger da busca só recalcula o vetor quando o texto muda: o save()
+    de uma mudança de status escreve as colunas de texto com o mesmo valor.
+    """
+
+    def setUp(self):
+        usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.solicitacao = Solicitacao.objects.create(usuario=usuario, procedimento='Ressonância de joelho')
+
+    def _busca(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT busca::text FROM fillsense_solicitacao WHERE id = %s', [self.solicitacao.pk])
+            return cursor.fetchone()[0]
+
+    def test_insert_preenche_o_vetor(self):
+        self.assertIn('joelh', self._busca())
+
+    def test_save_sem_mudanca_de_texto_nao_recalcula(self):
+        # Zera o vetor por fora do trigger (busca não está no UPDATE OF)
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE fillsense_solicitacao SET busca = NULL WHERE id = %s', [self.solicitacao.pk])
+        self.solicitacao.status = Solicitacao.StatusChoices.APROVADA
+        self.solicitacao.save()
+        self.assertIsNone(self._busca())
+
+        self.solicitacao.justificativa = 'Dor crônica'
+        self.solicitacao.save()
+        self.assertIn('cron', self._busca())
+
+
+class CompactacaoNotaTests(SimpleTestCase):
+    """Ranking BM25 das ERs e compactação da nota técnica no prompt."""
+    CONFIG = {"ATIVA": True, "TOP_K": 2, "ORCAMENTO_TOKENS": 60, "CATEGORIAS_OBRIGATORIAS": ["Conteúdo descritivo mínimo"]}
+
+    @staticmethod
+    def _nota():
+        return {"Categorias": [
+            {"Nome": "Conteúdo descritivo mínimo", "Descrição": "", "ERs": [
+                {"Nome": "Idade", "Descrição": "Idade do paciente"},
+            ]},
+            {"Nome": "Exames", "Descrição": "Resultados", "ERs": [
+                {"Nome": "Urodinâmica", "Descrição": "Estudo urodinâmico com incontinência de esforço"},
+                {"Nome": "Ultrassom", "Descrição": "Ultrassonografia pélvica transvaginal"},
+                {"Nome": "Cistoscopia", "Descrição": "Cistoscopia com biópsia de bexiga"},
+            ]},
+            {"Nome": "Tratamento", "Descrição": "Condutas prévias", "ERs": [
+                {"Nome": "Fisioterapia", "Descrição": "Fisioterapia pélvica por seis meses sem melhora da incontinência"},
+            ]},
+        ]}
+
+    def test_termos_normalizados_sem_stopwords_e_com_radical(self):
+        self.assertEqual(compactacao_nota_service.termos("Incontinência e INCONTINENTE da paciente"),
+                         ["incont", "incont", "pacien"])
+        self.assertEqual(compactacao_nota_service.estimar_tokens("x" * 9), 3)
+
+    def test_bm25_pontua_termos_raros_e_documentos_curtos_acima(self):
+        indice = compactacao_nota_service.IndiceBM25([
+            ["dor", "joelho"],
+            ["dor", "joelho", "lesao", "menisco", "cirurg", "previa"],
+            ["dor", "lombar"],
+            ["cefale"],
+        ])
+        curto, longo, lombar, sem_termos = indice.pontuar(["joelho", "inexistente"])
+        self.assertGreater(curto, longo)
+        self.assertGreater(longo, 0)
+        self.assertEqual((lombar, sem_termos), (0, 0))
+        self.assertGreater(indice.idf["joelho"], indice.idf["dor"])
+        self.assertEqual(compactacao_nota_service.IndiceBM25([]).pontuar(["dor"]), [])
+
+    def test_ranking_das_ers_pelo_texto_clinico(self):
+        indice = compactacao_nota_service.IndiceNota(self._nota())
+        ranking = indice.ranquear("Paciente com incontinência urinária de esforço, fez fisioterapia")
+        self.assertEqual(ranking[:2], [(2, 0), (1, 0)])
+        # Empates (sem termos em comum) mantêm a ordem original
+        self.assertEqual(indice.ranquear("nada relacionado"), indice.posicoes)
+
+    def _compactar(self, clinico_text, config=None):
+        nota = self._nota()
+        return compactacao_nota_service.compactar(
+            nota, json.dumps(nota, ensure_ascii=False), clinico_text,
+            gerar_justificativa_service._build_requisitos_da_nota, config or self.CONFIG,
+        )
+
+    def test_nota_dentro_do_orcamento_nao_e_compactada(self):
+        self.assertIsNone(self._compactar("incontinência", {**self.CONFIG, "ORCAMENTO_TOKENS": 10_000}))
+
+    def test_compacta_mantendo_obrigatorias_e_as_mais_relevantes(self):
+        compactada = self._compactar("Incontinência de esforço confirmada no estudo urodinâmico")
+        ers = [(c["Nome"], er["Nome"]) for c in compactada.nota["Categorias"] for er in c["ERs"]]
+        self.assertEqual(ers, [("Conteúdo descritivo mínimo", "Idade"), ("Exames", "Urodinâmica")])
+        metadados = compactada.metadados
+        self.assertEqual(metadados["ers_mantidas"], 2)
+        self.assertEqual([d["er"] for d in metadados["ers_descartadas"]], ["Ultrassom", "Cistoscopia", "Fisioterapia"])
+        self.assertLessEqual(metadados["tokens_estimados"]["compactado"], self.CONFIG["ORCAMENTO_TOKENS"])
+        self.assertGreater(metadados["tokens_estimados"]["original"], self.CONFIG["ORCAMENTO_TOKENS"])
+
+    def test_top_k_limita_as_ers_acrescentadas(self):
+        clinico_text = "incontinência fisioterapia urodinâmica"
+        config = {**self.CONFIG, "ORCAMENTO_TOKENS": 100, "TOP_K": 8}
+        self.assertEqual(self._compactar(clinico_text, config).metadados["ers_mantidas"], 4)
+        config["TOP_K"] = 1
+        self.assertEqual(self._compactar(clinico_text, config).metadados["ers_mantidas"], 2)
+
+    @override_settings(JUSTIFICATIVA_COMPACTACAO=CONFIG)
+    def test_geracao_compacta_a_partir_da_nota_ja_decodificada(self):
+        nota = self._nota()
+        nota_json_str = json.dumps(nota, ensure_ascii=False)
+        esperado = gerar_justificativa_service._preparar_geracao('P', 'incontinência urodinâmica', nota_json_str)
+        with mock.patch.object(gerar_justificativa_service, '_ler_nota') as ler_nota:
+            obtido = gerar_justificativa_service._preparar_geracao('P', 'incontinência urodinâmica', nota_json_str, nota=nota)
+        ler_nota.assert_not_called()
+        self.assertEqual(obtido, esperado)
+        self.assertIsNotNone(obtido[2])
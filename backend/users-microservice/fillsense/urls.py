@@ -1,14 +1,32 @@
 
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SolicitacaoViewSet
+from . import views
+from .views import SolicitacaoViewSet, JobJustificativaViewSet
 
 # O DefaultRouter do DRF registra automaticamente as URLs para um ViewSet.
 # Ele cria as rotas para list, create, retrieve, update e destroy.
 router = DefaultRouter()
 router.register(r'solicitacoes', SolicitacaoViewSet, basename='solicitacao')
+router.register(r'jobs-justificativa', JobJustificativaViewSet, basename='job-justificativa')
+
+urlpatterns = []
+
+# Com USE_ASYNC_VIEWS=True (servidor ASGI), as rotas que chamam serviços
+# externos são atendidas pelas views assíncronas. Elas precisam vir antes
+# do router para terem precedência sobre as actions do ViewSet.
+if getattr(settings, 'USE_ASYNC_VIEWS', False):
+    urlpatterns += [
+        path('solicitacoes/gerar-justificativa/', views.gerar_justificativa_async),
+        path('solicitacoes/gerar-justificativa-stream/', views.gerar_justificativa_stream_async),
+        path('solicitacoes/gerar-justificativas-lote/', views.gerar_justificativas_lote_async),
+        path('solicitacoes/procedimentos/', views.procedimentos_async),
+        path('solicitacoes/procedimentos/busca/', views.buscar_procedimentos_async),
+        path('solicitacoes/procedimento/<str:proc_id>/', views.procedimento_async),
+    ]
 
 # As URLs da nossa API são determinadas automaticamente pelo router.
-urlpatterns = [
+urlpatterns += [
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,15 +1,336 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
-from .models import Solicitacao, Procedimento
-from .serializers import SolicitacaoSerializer
-from .services.gerar_justificativa_service import gerar_justificativa_ia
-from .services.procedimentos_service import get_procedimentos_data
+from .models import Solicitacao, Procedimento, JobJustificativa
+from .serializers import SolicitacaoSerializer, SolicitacaoListSerializer, SolicitacaoBuscaSerializer, JobJustificativaSerializer
+from .pagination import SolicitacaoBuscaPagination, SolicitacaoCursorPagination
+from .services.gerar_justificativa_service import (
+    montar_nota_tecnica,
+    gerar_justificativa_ia,
+    gerar_justificativa_ia_stream,
+    gerar_justificativa_ia_async,
+    gerar_justificativa_ia_stream_async,
+)
+from .services.procedimentos_service import catalogo
+from .services.jobs_justificativa_service import enfileirar_job, cancelar_job
+from .services import backends_ollama_service, cache_justificativa_service, controle_ollama_service, lote_justificativa_service
+from .services.controle_ollama_service import IAIndisponivel
+from authentication.async_auth import jwt_required_async
+from users_api import json_rapido
+from rest_framework.settings import api_settings
 from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ParseError, ValidationError
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from datetime import datetime, time, timedelta
+from typing import NamedTuple, Optional
 import os
 import glob
+import itertools
 import json
 
+class EventStreamRenderer(BaseRenderer):
+    """
+    Permite a negociação de conteúdo com 'Accept: text/event-stream'.
+    O corpo dos eventos é produzido pela própria view (StreamingHttpResponse);
+    aqui só são renderizadas as respostas de erro, como JSON.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def _formatar_sse(evento: str, dado) -> str:
+    """Formata um evento no padrão Server-Sent Events."""
+    return f"event: {evento}\ndata: {json.dumps(dado, ensure_ascii=False)}\n\n"
+
+
+def _eventos_sse(eventos):
+    """
+    Converte os eventos do serviço de IA em Server-Sent Events.
+
+    Os erros são enviados como um evento 'erro', pois o status HTTP
+    (200) já foi enviado quando o primeiro token chegou.
+    """
+    try:
+        for evento, dado in eventos:
+            if evento == "token":
+                yield _formatar_sse("token", {"conteudo": dado})
+            else:
+                yield _formatar_sse(evento, dado)
+    except ConnectionError as e:
+        # Erro de rede ou indisponibilidade do Ollama
+        yield _formatar_sse("erro", {"error": str(e), "status": status.HTTP_503_SERVICE_UNAVAILABLE})
+    except ValueError as e:
+        # IA retornou algo que não é JSON
+        yield _formatar_sse("erro", {"error": str(e), "status": status.HTTP_500_INTERNAL_SERVER_ERROR})
+    except Exception as e:
+        # Outros erros inesperados
+        yield _formatar_sse("erro", {"error": f"Ocorreu um erro inesperado: {e}", "status": status.HTTP_500_INTERNAL_SERVER_ERROR})
+
+
+async def _eventos_sse_async(eventos):
+    """Versão assíncrona de `_eventos_sse`."""
+    try:
+        async for evento, dado in eventos:
+            if evento == "token":
+                yield _formatar_sse("token", {"conteudo": dado})
+            else:
+                yield _formatar_sse(evento, dado)
+    except ConnectionError as e:
+        yield _formatar_sse("erro", {"error": str(e), "status": status.HTTP_503_SERVICE_UNAVAILABLE})
+    except ValueError as e:
+        yield _formatar_sse("erro", {"error": str(e), "status": status.HTTP_500_INTERNAL_SERVER_ERROR})
+    except Exception as e:
+        yield _formatar_sse("erro", {"error": f"Ocorreu um erro inesperado: {e}", "status": status.HTTP_500_INTERNAL_SERVER_ERROR})
+
+
+def _relancar(erro):
+    raise erro
+    yield
+
+
+def _antecipar_primeiro_evento(eventos):
+    """
+    Avança o gerador de eventos até o primeiro evento antes de a resposta
+    de streaming ser enviada. Assim, uma geração recusada pelo controle de
+    admissão (IAIndisponivel) vira uma resposta 429/503 com Retry-After em
+    vez de um evento 'erro' dentro de um stream com status 200.
+    O primeiro evento é 'admitido' (descartado aqui), emitido logo depois
+    da admissão: a resposta não espera o primeiro token do modelo.
+    Os demais erros continuam sendo enviados como evento 'erro'.
+    """
+    try:
+        primeiro = next(eventos)
+    except StopIteration:
+        return iter(())
+    except IAIndisponivel:
+        raise
+    except Exception as e:
+        return _relancar(e)
+    if primeiro[0] == "admitido":
+        return eventos
+    return itertools.chain([primeiro], eventos)
+
+
+async def _antecipar_primeiro_evento_async(eventos):
+    """Versão assíncrona de `_antecipar_primeiro_evento`."""
+    try:
+        primeiro = await eventos.__anext__()
+    except StopAsyncIteration:
+        primeiro = None
+    except IAIndisponivel:
+        raise
+    except Exception as e:
+        async def _falha():
+            raise e
+            yield
+        return _falha()
+
+    async def _todos():
+        if primeiro is None:
+            return
+        if primeiro[0] != "admitido":
+            yield primeiro
+        async for evento in eventos:
+            yield evento
+    return _todos()
+
+
+class DadosGeracao(NamedTuple):
+    procedimento: str
+    clinico_text: str
+    nota_tecnica: dict
+    nota_json_str: str
+    requisitos: Optional[str]   # texto pré-compilado no catálogo (geração por proc_id)
+    usar_cache: bool
+
+
+class DadosInvalidos(Exception):
+    pass
+
+
+def _ler_json(request):
+    """
+    Corpo da requisição já decodificado: request.data nas views do DRF
+    (com o parser configurado) ou o JSON de request.body nas views async.
+    Lança DadosInvalidos se não for um JSON válido.
+    """
+    try:
+        if isinstance(request, Request):
+            return request.data
+        return json_rapido.loads(request.body)
+    except (ParseError, ValueError):
+        raise DadosInvalidos("Dados Incompletos.")
+
+
+def _ler_dados_geracao(data, snapshot) -> DadosGeracao:
+    """
+    Valida os dados (já decodificados) de geração de justificativa:
+    {
+        "proc_id": "...",              // nota técnica pré-compilada no catálogo
+        "procedimento": "...",         // opcional com proc_id (usa o nome do catálogo)
+        "clinico_text": "...",
+        "ers": [ ... ],                // alternativa ao proc_id (formato antigo)
+        "nova_geracao": false          // opcional: true ignora o cache
+    }
+    Lança DadosInvalidos se estiver incompleto ou o procedimento não existir.
+    """
+    try:
+        clinico_text = data['clinico_text']
+        usar_cache = not data.get('nova_geracao', False)
+
+        proc_id = data.get('proc_id')
+        if proc_id is not None:
+            compilado = snapshot.procedimento(proc_id)
+            if compilado is None:
+                raise DadosInvalidos(f"Procedimento '{proc_id}' não encontrado.")
+            nota = compilado.nota
+            return DadosGeracao(data.get('procedimento') or compilado.proc_label, clinico_text,
+                                nota.nota, nota.nota_json_str, nota.requisitos, usar_cache)
+
+        procedimento_nome = data['procedimento']
+        nota_tecnica = montar_nota_tecnica(data['ers'])
+    except (KeyError, TypeError, AttributeError):
+        raise DadosInvalidos("Dados Incompletos.")
+
+    return DadosGeracao(procedimento_nome, clinico_text, nota_tecnica,
+                        json.dumps(nota_tecnica, ensure_ascii=False), None, usar_cache)
+
+
+class LoteInvalido(Exception):
+    pass
+
+
+def _ler_lote(data, snapshot):
+    """
+    Valida o corpo do endpoint de geração em lote e resolve a nota técnica
+    de cada item. A nota vem das 'ers' do próprio item ou, se ausentes, da
+    nota pré-compilada do procedimento `proc_id` no catálogo; itens do
+    mesmo procedimento compartilham a mesma nota (e o texto de requisitos).
+
+    Retorna (itens, usar_cache, salvar) ou lança LoteInvalido.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('itens'), list) or not data['itens']:
+        raise LoteInvalido("Informe a lista 'itens'.")
+    maximo = getattr(settings, 'JUSTIFICATIVA_LOTE_MAX_ITENS', 20)
+    if len(data['itens']) > maximo:
+        raise LoteInvalido(f"O lote aceita no máximo {maximo} itens.")
+
+    notas = {}
+    itens = []
+    for indice, item in enumerate(data['itens']):
+        try:
+            clinico_text = item['clinico_text']
+        except (KeyError, TypeError):
+            raise LoteInvalido(f"Item {indice}: dados incompletos.")
+
+        ers_list = item.get('ers')
+        proc_id = item.get('proc_id')
+        requisitos = None
+        if ers_list is None:
+            if not proc_id:
+                raise LoteInvalido(f"Item {indice}: informe 'proc_id' ou 'ers'.")
+            compilado = snapshot.procedimento(proc_id)
+            if compilado is None:
+                raise LoteInvalido(f"Item {indice}: procedimento '{proc_id}' não encontrado.")
+            procedimento = item.get('procedimento') or compilado.proc_label
+            nota, nota_json_str, requisitos = compilado.nota.nota, compilado.nota.nota_json_str, compilado.nota.requisitos
+        else:
+            if 'procedimento' not in item:
+                raise LoteInvalido(f"Item {indice}: dados incompletos.")
+            procedimento = item['procedimento']
+            chave_nota = json.dumps(ers_list, sort_keys=True, ensure_ascii=False)
+            if chave_nota not in notas:
+                nota = montar_nota_tecnica(ers_list)
+                notas[chave_nota] = (nota, json.dumps(nota, ensure_ascii=False))
+            nota, nota_json_str = notas[chave_nota]
+
+        solicitacao_id = item.get('solicitacao')
+        try:
+            solicitacao_id = int(solicitacao_id) if solicitacao_id is not None else None
+        except (TypeError, ValueError):
+            raise LoteInvalido(f"Item {indice}: 'solicitacao' inválida.")
+
+        itens.append(lote_justificativa_service.ItemLote(indice, procedimento, clinico_text, nota_json_str, solicitacao_id, requisitos, nota))
+
+    return itens, not data.get('nova_geracao', False), bool(data.get('salvar', False))
+
+
+def _resumo_lote(resultados, salvas):
+    sucesso = sum(1 for r in resultados if r['status'] == 200)
+    return {"total": len(resultados), "sucesso": sucesso, "falhas": len(resultados) - sucesso, "salvas": salvas}
+
+
+def _dados_ia_indisponivel(e: IAIndisponivel):
+    return {"error": str(e), "retry_after": e.retry_after}
+
+
+def _resposta_catalogo(request, snapshot):
+    """
+    Resposta do catálogo de procedimentos com os bytes JSON pré-serializados.
+    Responde 304 quando o frontend já tem a mesma versão (If-None-Match).
+    """
+    if request.META.get('HTTP_IF_NONE_MATCH') == snapshot.etag:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(snapshot.conteudo, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    # O navegador pode guardar a resposta, mas deve revalidá-la a cada uso
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Busca de procedimentos (typeahead)
+LIMITE_BUSCA_PADRAO = 10
+LIMITE_BUSCA_MAX = 50
+
+
+def _buscar_procedimentos(params, snapshot) -> list:
+    """
+    Resultados da busca de procedimentos: ?q=<texto>&limite=<n>.
+    Lança ValidationError se o limite for inválido.
+    """
+    try:
+        limite = int(params.get('limite', LIMITE_BUSCA_PADRAO))
+    except ValueError:
+        raise ValidationError({"limite": "Informe um número inteiro."})
+    limite = max(1, min(limite, LIMITE_BUSCA_MAX))
+    return snapshot.buscar(params.get('q', ''), limite)
+
+
+def _resposta_definicao_procedimento(request, snapshot, proc_id):
+    """
+    Definição completa (fields e ers) de um procedimento, com os bytes JSON
+    pré-serializados. O ETag é o da versão do catálogo: responde 304 quando
+    o frontend já tem a definição dessa versão (If-None-Match).
+    """
+    conteudo = snapshot.definicoes.get(str(proc_id))
+    if conteudo is None:
+        return JsonResponse({"erro": "Procedimento não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    if request.META.get('HTTP_IF_NONE_MATCH') == snapshot.etag:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(conteudo, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _inicio_do_dia(data):
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
 class SolicitacaoViewSet(viewsets.ModelViewSet):
     """
     API endpoint que permite que as solicitações sejam visualizadas ou editadas.
@@ -17,13 +338,126 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
     serializer_class = SolicitacaoSerializer
     # Garante que apenas usuários autenticados possam acessar este endpoint.
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SolicitacaoCursorPagination
+    CAMPOS_SOMENTE_DETALHE = ('procedimento', 'descricao_medica', 'justificativa', 'metadados_ia')
 
     def get_queryset(self):
         """
         Esta view deve retornar uma lista de todas as solicitações
         para o usuário atualmente autenticado.
         """
-        return Solicitacao.objects.filter(usuario=self.request.user)
+        # select_related: o procedimento_label vem no mesmo SELECT (sem N+1)
+        # O vetor da busca textual nunca é lido nem escrito pela aplicação
+        queryset = Solicitacao.objects.filter(usuario=self.request.user).select_related('procedimento_fk').defer('busca')
+        if self.action in ('list', 'busca'):
+            # A listagem não usa os campos de texto longo / JSON
+            queryset = queryset.defer(*self.CAMPOS_SOMENTE_DETALHE)
+            queryset = self._aplicar_filtros(queryset, self.request.query_params)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SolicitacaoListSerializer
+        if self.action == 'busca':
+            return SolicitacaoBuscaSerializer
+        return SolicitacaoSerializer
+
+    @staticmethod
+    def _aplicar_filtros(queryset, params):
+        """
+        Filtros da listagem, todos opcionais:
+        - status: um ou mais status separados por vírgula (ex.: CRIADA,EM_ANALISE)
+        - procedimento: código do procedimento (procedimento_fk)
+        - data_inicio / data_fim: intervalo de data_criacao (AAAA-MM-DD, inclusivo)
+        - protocolo: prefixo do protocolo (ex.: FS-2025)
+        """
+        status_param = params.get('status')
+        if status_param:
+            valores = [s.strip().upper() for s in status_param.split(',') if s.strip()]
+            invalidos = [s for s in valores if s not in Solicitacao.StatusChoices.values]
+            if invalidos:
+                raise ValidationError({'status': f"Status inválido: {', '.join(invalidos)}."})
+            queryset = queryset.filter(status__in=valores)
+
+        procedimento = params.get('procedimento')
+        if procedimento:
+            queryset = queryset.filter(procedimento_fk_id=procedimento)
+
+        # Limites convertidos para datetime, para que o filtro use o índice
+        # de data_criacao (um lookup __date aplicaria uma função à coluna)
+        data_inicio = SolicitacaoViewSet._ler_data(params, 'data_inicio')
+        if data_inicio:
+            queryset = queryset.filter(data_criacao__gte=_inicio_do_dia(data_inicio))
+        data_fim = SolicitacaoViewSet._ler_data(params, 'data_fim')
+        if data_fim:
+            queryset = queryset.filter(data_criacao__lt=_inicio_do_dia(data_fim + timedelta(days=1)))
+
+        protocolo = params.get('protocolo')
+        if protocolo:
+            queryset = queryset.filter(protocolo__startswith=protocolo.strip().upper())
+
+        return queryset
+
+    @staticmethod
+    def _ler_data(params, nome):
+        valor = params.get(nome)
+        if not valor:
+            return None
+        try:
+            data = parse_date(valor)
+        except ValueError:
+            data = None
+        if data is None:
+            raise ValidationError({nome: "Data inválida. Use o formato AAAA-MM-DD."})
+        return data
+
+    # GET /api/fillsense/solicitacoes/busca/?q=texto
+    @action(detail=False, methods=['get'], url_path='busca', pagination_class=SolicitacaoBuscaPagination)
+    def busca(self, request):
+        """
+        Busca textual no histórico do usuário (procedimento, protocolo,
+        descrição médica e justificativa), ordenada pela relevância e
+        paginada por número de página (?page=, ?page_size=).
+
+        O parâmetro "q" aceita a sintaxe de busca web: palavras soltas
+        (todas precisam aparecer), "frase entre aspas", "or" e -exclusão.
+        Acentos e maiúsculas são ignorados. Os filtros da listagem (status,
+        procedimento, data_inicio, data_fim, protocolo) também valem aqui.
+        """
+        texto = (request.query_params.get('q') or '').strip()
+        if not texto:
+            raise ValidationError({'q': "Informe o texto da busca."})
+
+        queryset = self._aplicar_busca(self.get_queryset(), texto)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @staticmethod
+    def _aplicar_busca(queryset, texto):
+        """
+        No PostgreSQL, casa o texto com o tsvector mantido por trigger
+        (índice GIN) e ordena por ts_rank. Em outros bancos (ex.: SQLite
+        local) cai num icontains sem ranking, só para o endpoint funcionar.
+        """
+        if connections[queryset.db].vendor == 'postgresql':
+            consulta = SearchQuery(texto, config='portuguese_unaccent', search_type='websearch')
+            return (
+                queryset
+                .filter(busca=consulta)
+                .annotate(relevancia=SearchRank(F('busca'), consulta))
+                .order_by('-relevancia', '-data_criacao', '-id')
+            )
+
+        filtro = Q()
+        for campo in ('procedimento', 'protocolo', 'descricao_medica', 'justificativa'):
+            filtro |= Q(**{f'{campo}__icontains': texto})
+        return (
+            queryset
+            .filter(filtro)
+            .annotate(relevancia=Value(None, output_field=FloatField()))
+            .order_by('-data_criacao', '-id')
+        )
 
     def perform_create(self, serializer):
         """
@@ -31,36 +465,14 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
         """
         serializer.save(usuario=self.request.user)
 
-    def _transform_ers_to_categorias(self, ers_list: list) -> dict:
+    @staticmethod
+    def _transform_ers_to_categorias(ers_list: list) -> dict:
         """
         Transforma a lista plana de 'ers' (que vem do procedimento)
         na estrutura de 'Categorias' aninhadas que o 
         'gerar_justificativa_service' espera.
         """
-        categorias_map = {}
-        for er in ers_list:
-            categoria = er.get('categoria', {})
-            cat_nome = categoria.get('Nome', 'Sem Categoria')
-            cat_desc = categoria.get('Descricao', '')
-            
-            if cat_nome not in categorias_map:
-                categorias_map[cat_nome] = {
-                    "Nome": cat_nome,
-                    "Descrição": cat_desc,
-                    "ERs": []
-                }
-            
-            # Adiciona apenas a info da ER que o prompt precisa
-            categorias_map[cat_nome]["ERs"].append({
-                "Nome": er.get('Nome', 'N/A'),
-                "Descrição": er.get('Descricao', 'N/A')
-            })
-            
-        # Converte o mapa de volta para uma lista
-        categorias_list = list(categorias_map.values())
-        
-        # Retorna o dicionário final no formato esperado pelo serviço de IA
-        return {"Categorias": categorias_list}
+        return montar_nota_tecnica(ers_list)
 
     # Este é o endpoint customizado para gerar a justificativa
     # POST /api/fillsense/solicitacoes/gerar-justificativa/
@@ -71,38 +483,39 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
 
         Recebe um JSON do frontend com:
         {
-            "procedimento": "Nome do Procedimento...",
+            "proc_id": "Código do procedimento no catálogo",
             "clinico_text": "Texto clínico do paciente...",
-            "ers": [ ...lista de ers do procedimento selecionado... ]
+            "nova_geracao": false  // opcional: true ignora o cache
         }
+
+        A nota técnica do procedimento já vem pré-compilada do catálogo.
+        O formato antigo, com "procedimento" e a lista "ers" no lugar de
+        "proc_id", continua aceito.
         """
         
         try:
-            # Carrega os dados do corpo da requisição POST
-            data = json.loads(request.body)
-            procedimento_nome = data['procedimento']
-            clinico_text = data['clinico_text']
-            ers_list = data['ers']
-            
-        except (json.JSONDecodeError, KeyError) as e:
-            return Response({"erro": "Dados Incompletos."}, status=status.HTTP_400_BAD_REQUEST)
+            # Dados do corpo da requisição POST (parser do DRF)
+            dados = _ler_dados_geracao(_ler_json(request), catalogo.obter())
+        except DadosInvalidos as e:
+            return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            nota_tecnica_dict = self._transform_ers_to_categorias(ers_list)
-        
-            # Converte esse dicionário de volta para uma string JSON
-            nota_json_str = json.dumps(nota_tecnica_dict, ensure_ascii=False)
-
             # Chama o serviço de IA 
             result = gerar_justificativa_ia(
-                procedimento=procedimento_nome,
-                clinico_text=clinico_text,
-                nota_json_str=nota_json_str
+                procedimento=dados.procedimento,
+                clinico_text=dados.clinico_text,
+                nota_json_str=dados.nota_json_str,
+                usar_cache=dados.usar_cache,
+                requisitos=dados.requisitos,
+                nota=dados.nota_tecnica,
             )
 
             # Retorna a justificativa gerada
             return Response(result, status=status.HTTP_200_OK)
         
+        except IAIndisponivel as e:
+            # Ollama saturado (429) ou circuito aberto (503): recusado sem chamar a IA
+            return Response(_dados_ia_indisponivel(e), status=e.status_code, headers={'Retry-After': str(e.retry_after)})
         except ConnectionError as e:
             # Erro de rede ou indisponibilidade do Ollama
             return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -113,6 +526,144 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
             # Outros erros inesperados
             return Response({"error": f"Ocorreu um erro inesperado: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    # Endpoint de geração em streaming (Server-Sent Events)
+    # POST /api/fillsense/solicitacoes/gerar-justificativa-stream/
+    @action(detail=False, methods=['post'], url_path='gerar-justificativa-stream',
+            renderer_classes=[api_settings.DEFAULT_RENDERER_CLASSES[0], EventStreamRenderer])
+    def gerar_justificativa_stream(self, request, pk=None):
+        """
+        Variante em streaming do endpoint 'gerar-justificativa'.
+
+        Recebe o mesmo JSON e repassa os tokens ao cliente como
+        Server-Sent Events enquanto o modelo os gera:
+
+            event: token      data: {"conteudo": "..."}
+            event: resultado  data: {"procedimento": "...", "justificativa": "..."}
+            event: erro       data: {"error": "...", "status": 503}
+
+        O evento 'resultado' traz o JSON final validado e normalizado
+        da mesma forma que o endpoint síncrono.
+        """
+        try:
+            dados = _ler_dados_geracao(_ler_json(request), catalogo.obter())
+        except DadosInvalidos as e:
+            return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        eventos = gerar_justificativa_ia_stream(
+            procedimento=dados.procedimento,
+            clinico_text=dados.clinico_text,
+            nota_json_str=dados.nota_json_str,
+            usar_cache=dados.usar_cache,
+            requisitos=dados.requisitos,
+            nota=dados.nota_tecnica,
+        )
+
+        try:
+            eventos = _antecipar_primeiro_evento(eventos)
+        except IAIndisponivel as e:
+            return Response(_dados_ia_indisponivel(e), status=e.status_code, headers={'Retry-After': str(e.retry_after)})
+
+        response = StreamingHttpResponse(_eventos_sse(eventos), content_type='text/event-stream')
+        # Impede que proxies (nginx) ou o navegador acumulem a resposta
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    # Enfileira a geração da justificativa em segundo plano
+    # POST /api/fillsense/solicitacoes/{id}/gerar-justificativa-job/
+    @action(detail=True, methods=['post'], url_path='gerar-justificativa-job')
+    def gerar_justificativa_job(self, request, pk=None):
+        """
+        Versão assíncrona (fila de jobs) do endpoint 'gerar-justificativa'.
+
+        Recebe o mesmo JSON, cria um job e retorna 202 imediatamente com o
+        id do job. O andamento é consultado em
+        GET /api/fillsense/jobs-justificativa/{job_id}/ e, ao concluir, a
+        justificativa é gravada nesta solicitação.
+        """
+        solicitacao = self.get_object()
+
+        try:
+            dados = _ler_dados_geracao(_ler_json(request), catalogo.obter())
+        except DadosInvalidos as e:
+            return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = enfileirar_job(
+            usuario=request.user,
+            solicitacao=solicitacao,
+            procedimento=dados.procedimento,
+            clinico_text=dados.clinico_text,
+            nota_tecnica=dados.nota_tecnica,
+            usar_cache=dados.usar_cache,
+        )
+        return Response(JobJustificativaSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    # Geração de várias justificativas em uma chamada
+    # POST /api/fillsense/solicitacoes/gerar-justificativas-lote/
+    @action(detail=False, methods=['post'], url_path='gerar-justificativas-lote',
+            renderer_classes=[api_settings.DEFAULT_RENDERER_CLASSES[0], EventStreamRenderer])
+    def gerar_justificativas_lote(self, request, pk=None):
+        """
+        Gera as justificativas de vários itens em paralelo.
+
+        Recebe:
+        {
+            "itens": [
+                {"procedimento": "...", "clinico_text": "...", "proc_id": "...",
+                 "ers": [...],          // opcional: senão vem do catálogo (proc_id)
+                 "solicitacao": 12}     // opcional: solicitação que recebe o resultado
+            ],
+            "nova_geracao": false,      // opcional: true ignora o cache
+            "salvar": false             // opcional: grava os resultados nas solicitações
+        }
+
+        Responde com o resultado de cada item ('indice', 'status' e
+        'resultado' ou 'erro') e um resumo. Com 'Accept: text/event-stream'
+        (ou ?stream=true), envia um evento 'item' a cada item concluído e
+        um evento 'fim' com o resumo.
+        """
+        try:
+            itens, usar_cache, salvar = _ler_lote(_ler_json(request), catalogo.obter())
+        except (DadosInvalidos, LoteInvalido) as e:
+            return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = lote_justificativa_service.gerar_lote(itens, usar_cache=usar_cache)
+
+        if request.accepted_renderer.format == 'sse' or request.query_params.get('stream') == 'true':
+            def _eventos():
+                concluidos = []
+                for resultado in resultados:
+                    concluidos.append(resultado)
+                    yield _formatar_sse("item", resultado)
+                salvas = lote_justificativa_service.salvar_resultados(request.user, concluidos) if salvar else 0
+                yield _formatar_sse("fim", _resumo_lote(concluidos, salvas))
+
+            response = StreamingHttpResponse(_eventos(), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        resultados = sorted(resultados, key=lambda r: r['indice'])
+        salvas = lote_justificativa_service.salvar_resultados(request.user, resultados) if salvar else 0
+        return Response({"resultados": resultados, **_resumo_lote(resultados, salvas)}, status=status.HTTP_200_OK)
+
+    # Estatísticas do cache de justificativas (somente administradores)
+    # GET /api/fillsense/solicitacoes/cache-justificativas/
+    @action(detail=False, methods=['get'], url_path='cache-justificativas',
+            permission_classes=[permissions.IsAdminUser])
+    def cache_justificativas(self, request):
+        return Response(cache_justificativa_service.estatisticas(), status=status.HTTP_200_OK)
+
+    # Estado do controle de admissão e do circuit breaker do Ollama (somente administradores)
+    # GET /api/fillsense/solicitacoes/controle-ia/
+    @action(detail=False, methods=['get'], url_path='controle-ia',
+            permission_classes=[permissions.IsAdminUser])
+    def controle_ia(self, request):
+        return Response(
+            {**controle_ollama_service.estado(), "backends": backends_ollama_service.estado()},
+            status=status.HTTP_200_OK,
+        )
+
     # Este é o endpoint customizado para retornar os procedimentos
     # GET /api/fillsense/solicitacoes/procedimentos/
     @action(detail=False, methods=['get'], url_path='procedimentos')
@@ -120,17 +671,12 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
         """
         Esta view retorna os procedimentos do FillSense.
         
-        Busca da API real ou de arquivos mock locais, 
-        dependendo da configuração 'USE_MOCK_DATA'.
-        
-        Aproveita a chamada para popular/atualizar a tabela
-        de Procedimentos no banco de dados.
+        Os dados vêm do catálogo em memória (API real ou arquivos mock
+        locais, dependendo da configuração 'USE_MOCK_DATA'), que já guarda
+        o JSON serializado: a resposta é só uma leitura de memória.
         """
         try:
-            # 1. Chamar o serviço
-            all_procs = get_procedimentos_data()
-            # 2. Retornar a resposta no formato que o frontend espera
-            return Response(all_procs, status=status.HTTP_200_OK)
+            return _resposta_catalogo(request, catalogo.obter())
             
         except Exception as e:
             print(f"Erro inesperado na view de procedimentos: {e}")
@@ -138,4 +684,218 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
             return Response(
                 {"error": "Não foi possível processar a solicitação de procedimentos."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+    # Busca de procedimentos por nome, para o typeahead do formulário
+    # GET /api/fillsense/solicitacoes/procedimentos/busca/?q=gineco&limite=10
+    @action(detail=False, methods=['get'], url_path='procedimentos/busca')
+    def buscar_procedimentos(self, request):
+        """
+        Retorna até `limite` procedimentos (proc_id, proc_label e NT_label)
+        cujo nome casa com `q`, sem diferenciar acentos e maiúsculas.
+        A busca usa o índice montado junto com o catálogo em memória.
+        """
+        return Response(_buscar_procedimentos(request.query_params, catalogo.obter()), status=status.HTTP_200_OK)
+
+    # Definição completa de um procedimento (fields e ers)
+    # GET /api/fillsense/solicitacoes/procedimento/<proc_id>/
+    @action(detail=False, methods=['get'], url_path=r'procedimento/(?P<proc_id>[^/]+)')
+    def procedimento(self, request, proc_id=None):
+        return _resposta_definicao_procedimento(request, catalogo.obter(), proc_id)
+
+
+class JobJustificativaViewSet(mixins.ListModelMixin,
+                              mixins.RetrieveModelMixin,
+                              viewsets.GenericViewSet):
+    """
+    API endpoint para acompanhar e cancelar os jobs de geração de justificativa.
+    """
+    serializer_class = JobJustificativaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """
+        Retorna apenas os jobs do usuário autenticado.
+        Aceita o filtro opcional ?solicitacao=<id>.
+        """
+        queryset = JobJustificativa.objects.filter(usuario=self.request.user)
+        solicitacao_id = self.request.query_params.get('solicitacao')
+        if solicitacao_id:
+            queryset = queryset.filter(solicitacao_id=solicitacao_id)
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Consulta (polling) de um job. Enquanto não finaliza, sugere ao
+        cliente quando consultar de novo pelo cabeçalho Retry-After.
+        """
+        job = self.get_object()
+        response = Response(self.get_serializer(job).data)
+        if not job.finalizado:
+            response['Retry-After'] = str(getattr(settings, 'JOBS_JUSTIFICATIVA_RETRY_AFTER', 2))
+        return response
+
+    # POST /api/fillsense/jobs-justificativa/{id}/cancelar/
+    @action(detail=True, methods=['post'])
+    def cancelar(self, request, pk=None):
+        job = self.get_object()
+        if not cancelar_job(job):
+            return Response(
+                {"error": "O job já foi finalizado e não pode ser cancelado."},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(self.get_serializer(job).data, status=status.HTTP_200_OK)
+
+
+# --- Views assíncronas (ASGI) ---
+# Servem as mesmas rotas das actions acima quando USE_ASYNC_VIEWS=True
+# (ver fillsense/urls.py). As chamadas ao Ollama e à API de procedimentos
+# não bloqueiam o worker, então um único processo atende muitas gerações
+# simultâneas.
+
+def _json_ia_indisponivel(e: IAIndisponivel):
+    response = JsonResponse(_dados_ia_indisponivel(e), status=e.status_code)
+    response['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@csrf_exempt
+@require_POST
+@jwt_required_async
+async def gerar_justificativa_async(request):
+    """
+    POST /api/fillsense/solicitacoes/gerar-justificativa/ (versão async)
+    """
+    try:
+        dados = _ler_dados_geracao(_ler_json(request), await catalogo.obter_async())
+    except DadosInvalidos as e:
+        return JsonResponse({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = await gerar_justificativa_ia_async(
+            procedimento=dados.procedimento,
+            clinico_text=dados.clinico_text,
+            nota_json_str=dados.nota_json_str,
+            usar_cache=dados.usar_cache,
+            requisitos=dados.requisitos,
+            nota=dados.nota_tecnica,
+        )
+        return JsonResponse(result, status=status.HTTP_200_OK, safe=False)
+
+    except IAIndisponivel as e:
+        return _json_ia_indisponivel(e)
+    except ConnectionError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        return JsonResponse({"error": f"Ocorreu um erro inesperado: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required_async
+async def gerar_justificativa_stream_async(request):
+    """
+    POST /api/fillsense/solicitacoes/gerar-justificativa-stream/ (versão async)
+
+    Sob ASGI, o Django só consegue transmitir sem acumular a resposta
+    quando o iterador é assíncrono.
+    """
+    try:
+        dados = _ler_dados_geracao(_ler_json(request), await catalogo.obter_async())
+    except DadosInvalidos as e:
+        return JsonResponse({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    eventos = gerar_justificativa_ia_stream_async(
+        procedimento=dados.procedimento,
+        clinico_text=dados.clinico_text,
+        nota_json_str=dados.nota_json_str,
+        usar_cache=dados.usar_cache,
+        requisitos=dados.requisitos,
+        nota=dados.nota_tecnica,
+    )
+
+    try:
+        eventos = await _antecipar_primeiro_evento_async(eventos)
+    except IAIndisponivel as e:
+        return _json_ia_indisponivel(e)
+
+    response = StreamingHttpResponse(_eventos_sse_async(eventos), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_POST
+@jwt_required_async
+async def gerar_justificativas_lote_async(request):
+    """
+    POST /api/fillsense/solicitacoes/gerar-justificativas-lote/ (versão async)
+    """
+    try:
+        itens, usar_cache, salvar = _ler_lote(_ler_json(request), await catalogo.obter_async())
+    except (DadosInvalidos, LoteInvalido) as e:
+        return JsonResponse({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    resultados = lote_justificativa_service.gerar_lote_async(itens, usar_cache=usar_cache)
+
+    if 'text/event-stream' in request.headers.get('Accept', '') or request.GET.get('stream') == 'true':
+        async def _eventos():
+            concluidos = []
+            async for resultado in resultados:
+                concluidos.append(resultado)
+                yield _formatar_sse("item", resultado)
+            salvas = await lote_justificativa_service.salvar_resultados_async(request.user, concluidos) if salvar else 0
+            yield _formatar_sse("fim", _resumo_lote(concluidos, salvas))
+
+        response = StreamingHttpResponse(_eventos(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    concluidos = sorted([r async for r in resultados], key=lambda r: r['indice'])
+    salvas = await lote_justificativa_service.salvar_resultados_async(request.user, concluidos) if salvar else 0
+    return JsonResponse({"resultados": concluidos, **_resumo_lote(concluidos, salvas)}, status=status.HTTP_200_OK)
+
+
+@require_GET
+@jwt_required_async
+async def procedimentos_async(request):
+    """
+    GET /api/fillsense/solicitacoes/procedimentos/ (versão async)
+    """
+    try:
+        return _resposta_catalogo(request, await catalogo.obter_async())
+
+    except Exception as e:
+        print(f"Erro inesperado na view de procedimentos: {e}")
+
+        return JsonResponse(
+            {"error": "Não foi possível processar a solicitação de procedimentos."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@require_GET
+@jwt_required_async
+async def buscar_procedimentos_async(request):
+    """
+    GET /api/fillsense/solicitacoes/procedimentos/busca/ (versão async)
+    """
+    try:
+        resultados = _buscar_procedimentos(request.GET, await catalogo.obter_async())
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse(resultados, safe=False)
+
+
+@require_GET
+@jwt_required_async
+async def procedimento_async(request, proc_id):
+    """
+    GET /api/fillsense/solicitacoes/procedimento/<proc_id>/ (versão async)
+    """
+    return _resposta_definicao_procedimento(request, await catalogo.obter_async(), proc_id)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class RelatoriosConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'relatorios'
+
+    def ready(self):
+        # Conecta os signals que mantêm as contagens das solicitações
+        from . import signals  # noqa: F401
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from relatorios.services import recalcular_contagens
+
+
+class Command(BaseCommand):
+    """
+    Reconstrói as contagens dos relatórios a partir das solicitações.
+    """
+    help = 'Recalcula as contagens de solicitações usadas nos relatórios (carga inicial ou correção de desvios).'
+
+    def handle(self, *args, **kwargs):
+        """A lógica principal do comando."""
+        try:
+            linhas = recalcular_contagens()
+            self.stdout.write(self.style.SUCCESS(f"Contagens recalculadas: {linhas} linha(s)."))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Ocorreu um erro inesperado: {e}"))
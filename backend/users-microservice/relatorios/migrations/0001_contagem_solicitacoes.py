@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:52
+
+from collections import Counter
+from datetime import date
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# ContagemSolicitacoes.INICIO_GERAL na época desta migração
+INICIO_GERAL = date(1970, 1, 1)
+
+
+def preencher_contagens(apps, schema_editor):
+    """
+    Carga inicial das contagens a partir das solicitações existentes
+    (a mesma conta do comando `recalcular_relatorios`, escrita aqui para
+    não depender do código atual do app).
+    """
+    Solicitacao = apps.get_model('fillsense', 'Solicitacao')
+    ContagemSolicitacoes = apps.get_model('relatorios', 'ContagemSolicitacoes')
+    db_alias = schema_editor.connection.alias
+
+    contagens = Counter()
+    solicitacoes = (
+        Solicitacao.objects.using(db_alias)
+        .values_list('usuario_id', 'data_criacao', 'status', 'procedimento_fk_id')
+        .iterator(chunk_size=5000)
+    )
+    for usuario_id, data_criacao, status, procedimento_id in solicitacoes:
+        dia = timezone.localdate(data_criacao)
+        # Cada solicitação conta no dia, no mês e no período geral
+        for periodo, inicio in (('DIA', dia), ('MES', dia.replace(day=1)), ('GERAL', INICIO_GERAL)):
+            contagens[(usuario_id, periodo, inicio, status, procedimento_id or '')] += 1
+
+    ContagemSolicitacoes.objects.using(db_alias).bulk_create(
+        (
+            ContagemSolicitacoes(
+                usuario_id=usuario_id, periodo=periodo, inicio=inicio,
+                status=status, procedimento=procedimento, quantidade=quantidade,
+            )
+            for (usuario_id, periodo, inicio, status, procedimento), quantidade in contagens.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('fillsense', '0016_solicitacao_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContagemSolicitacoes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('DIA', 'Dia'), ('MES', 'Mês'), ('GERAL', 'Geral')], max_length=5)),
+                ('inicio', models.DateField(help_text='Dia, primeiro dia do mês ou INICIO_GERAL, conforme o período.')),
+                ('status', models.CharField(help_text='Status atual das solicitações contadas.', max_length=20)),
+                ('procedimento', models.CharField(blank=True, default='', help_text='Código do procedimento (procedimento_fk); vazio para solicitações sem procedimento.', max_length=255)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contagens_solicitacoes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Contagem de Solicitações',
+                'verbose_name_plural': 'Contagens de Solicitações',
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'periodo', 'inicio', 'status', 'procedimento'), name='relatorios_contagem_chave')],
+            },
+        ),
+        migrations.RunPython(preencher_contagens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.db import models
+from authentication.models import User
+
+
+class ContagemSolicitacoes(models.Model):
+    """
+    Quantidade de solicitações de um usuário por período de criação,
+    status e procedimento.
+
+    Cada solicitação conta em três linhas: a do dia e a do mês em que foi
+    criada e a do período GERAL (todo o histórico). Os relatórios leem só
+    essas linhas, então o custo não depende do tamanho do histórico.
+
+    Mantida pelos signals de Solicitacao (relatorios/signals.py) e
+    reconstruída pelo comando `recalcular_relatorios`.
+    """
+    class PeriodoChoices(models.TextChoices):
+        DIA = 'DIA', 'Dia'
+        MES = 'MES', 'Mês'
+        GERAL = 'GERAL', 'Geral'
+
+    # 'inicio' das linhas GERAL (a coluna faz parte da chave e não pode ser nula)
+    INICIO_GERAL = date(1970, 1, 1)
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='contagens_solicitacoes')
+    periodo = models.CharField(max_length=5, choices=PeriodoChoices.choices)
+    inicio = models.DateField(help_text="Dia, primeiro dia do mês ou INICIO_GERAL, conforme o período.")
+    status = models.CharField(max_length=20, help_text="Status atual das solicitações contadas.")
+    procedimento = models.CharField(max_length=255, blank=True, default='', help_text="Código do procedimento (procedimento_fk); vazio para solicitações sem procedimento.")
+    quantidade = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.usuario_id} {self.periodo} {self.inicio} {self.status} {self.procedimento}: {self.quantidade}"
+
+    class Meta:
+        verbose_name = "Contagem de Solicitações"
+        verbose_name_plural = "Contagens de Solicitações"
+        constraints = [
+            # Chave do upsert incremental; também atende o resumo
+            # (usuario, GERAL) e as séries (usuario, DIA/MES, faixa de inicio)
+            models.UniqueConstraint(
+                fields=['usuario', 'periodo', 'inicio', 'status', 'procedimento'],
+                name='relatorios_contagem_chave',
+            ),
+        ]
@@ -0,0 +1,234 @@
+"""
+Relatórios das solicitações do FillSense a partir das contagens
+pré-calculadas (ContagemSolicitacoes), sem percorrer o histórico.
+"""
+from collections import Counter
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from fillsense.models import Procedimento, Solicitacao
+from fillsense.services.procedimentos_service import catalogo
+from .models import ContagemSolicitacoes
+
+Periodo = ContagemSolicitacoes.PeriodoChoices
+
+# Máximo de pontos de uma série (dias ou meses)
+MAXIMO_PONTOS = {Periodo.DIA: 366, Periodo.MES: 120}
+
+
+# --- Manutenção das Contagens ---
+
+def chave_da_solicitacao(usuario_id, data_criacao, status, procedimento_id) -> tuple:
+    """Chave (usuario, dia, status, procedimento) em que a solicitação é contada."""
+    return (usuario_id, timezone.localdate(data_criacao), status, procedimento_id or '')
+
+
+def _linhas_da_chave(chave: tuple):
+    usuario_id, dia, status, procedimento = chave
+    for periodo, inicio in (
+        (Periodo.DIA, dia),
+        (Periodo.MES, dia.replace(day=1)),
+        (Periodo.GERAL, ContagemSolicitacoes.INICIO_GERAL),
+    ):
+        yield (usuario_id, periodo.value, inicio, status, procedimento)
+
+
+def variacoes(removidas: Iterable[tuple] = (), adicionadas: Iterable[tuple] = ()) -> Counter:
+    """
+    Variação de cada linha de contagem (usuario, periodo, inicio, status,
+    procedimento) quando as chaves `removidas` deixam de ser contadas e as
+    `adicionadas` passam a ser.
+    """
+    resultado = Counter()
+    for chave in removidas:
+        for linha in _linhas_da_chave(chave):
+            resultado[linha] -= 1
+    for chave in adicionadas:
+        for linha in _linhas_da_chave(chave):
+            resultado[linha] += 1
+    return resultado
+
+
+def aplicar_variacoes(variacao: Counter):
+    """
+    Soma as variações às contagens em um único comando:
+    INSERT ... ON CONFLICT DO UPDATE SET quantidade = quantidade + EXCLUDED.quantidade.
+
+    As linhas vão sempre ordenadas pela chave, então transações
+    concorrentes travam as mesmas linhas na mesma ordem (sem deadlock).
+    Funciona no PostgreSQL (e no SQLite >= 3.24).
+    """
+    linhas = sorted(linha + (delta,) for linha, delta in variacao.items() if delta)
+    if not linhas:
+        return
+
+    tabela = connection.ops.quote_name(ContagemSolicitacoes._meta.db_table)
+    valores = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(linhas))
+    parametros = []
+    for usuario_id, periodo, inicio, status, procedimento, delta in linhas:
+        parametros += [usuario_id, periodo, connection.ops.adapt_datefield_value(inicio), status, procedimento, delta]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {tabela} (usuario_id, periodo, inicio, status, procedimento, quantidade) "
+            f"VALUES {valores} "
+            f"ON CONFLICT (usuario_id, periodo, inicio, status, procedimento) "
+            f"DO UPDATE SET quantidade = {tabela}.quantidade + EXCLUDED.quantidade",
+            parametros,
+        )
+
+
+def descontar(chave: tuple):
+    """
+    Tira uma solicitação apagada das contagens. Só atualiza linhas
+    existentes (nunca insere): na exclusão em cascata de um usuário, as
+    contagens dele podem já ter sido apagadas.
+    """
+    usuario_id, _, status, procedimento = chave
+    periodos = Q()
+    for _, periodo, inicio, _, _ in _linhas_da_chave(chave):
+        periodos |= Q(periodo=periodo, inicio=inicio)
+    (
+        ContagemSolicitacoes.objects
+        .filter(periodos, usuario_id=usuario_id, status=status, procedimento=procedimento)
+        .update(quantidade=F('quantidade') - 1)
+    )
+
+
+def recalcular_contagens() -> int:
+    """
+    Reconstrói todas as contagens a partir das solicitações (carga
+    inicial e correção de desvios, ex.: alterações feitas com
+    QuerySet.update(), que não disparam os signals).
+    Retorna o número de linhas gravadas.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Segura as escritas nas solicitações até o fim da reconstrução,
+            # para nenhuma variação se perder entre a leitura e a gravação
+            with connection.cursor() as cursor:
+                tabela = connection.ops.quote_name(Solicitacao._meta.db_table)
+                cursor.execute(f"LOCK TABLE {tabela} IN SHARE MODE")
+
+        solicitacoes = (
+            Solicitacao.objects
+            .values_list('usuario_id', 'data_criacao', 'status', 'procedimento_fk_id')
+            .iterator(chunk_size=5000)
+        )
+        contagens = variacoes(adicionadas=(chave_da_solicitacao(*valores) for valores in solicitacoes))
+
+        ContagemSolicitacoes.objects.all().delete()
+        ContagemSolicitacoes.objects.bulk_create(
+            (
+                ContagemSolicitacoes(
+                    usuario_id=usuario_id, periodo=periodo, inicio=inicio,
+                    status=status, procedimento=procedimento, quantidade=quantidade,
+                )
+                for (usuario_id, periodo, inicio, status, procedimento), quantidade in contagens.items()
+            ),
+            batch_size=1000,
+        )
+    return len(contagens)
+
+
+# --- Consultas ---
+
+def resumo_do_usuario(usuario) -> dict:
+    """
+    Totais de todo o histórico do usuário: por status, por procedimento e
+    por nota técnica (procedimentos agrupados pelo catálogo atual).
+    Lê só as linhas do período GERAL.
+    """
+    linhas = (
+        ContagemSolicitacoes.objects
+        .filter(usuario=usuario, periodo=Periodo.GERAL, inicio=ContagemSolicitacoes.INICIO_GERAL, quantidade__gt=0)
+        .values_list('status', 'procedimento', 'quantidade')
+    )
+    por_status = Counter()
+    por_procedimento = Counter()
+    for status, procedimento, quantidade in linhas:
+        por_status[status] += quantidade
+        por_procedimento[procedimento] += quantidade
+
+    labels = dict(
+        Procedimento.objects
+        .filter(codigo__in=[codigo for codigo in por_procedimento if codigo])
+        .values_list('codigo', 'label')
+    )
+
+    # A nota técnica de cada procedimento vem do catálogo em memória
+    snapshot = catalogo.obter()
+    por_nota = Counter()
+    labels_notas = {}
+    for codigo, quantidade in por_procedimento.items():
+        compilado = snapshot.procedimento(codigo) if codigo else None
+        nt_id = compilado.nt_id if compilado is not None else None
+        por_nota[nt_id] += quantidade
+        if compilado is not None:
+            labels_notas[nt_id] = compilado.nt_label
+
+    return {
+        "total": sum(por_status.values()),
+        "por_status": [
+            {"status": valor, "status_label": label, "quantidade": por_status.get(valor, 0)}
+            for valor, label in Solicitacao.StatusChoices.choices
+        ],
+        "por_procedimento": [
+            {"procedimento": codigo or None, "procedimento_label": labels.get(codigo), "quantidade": quantidade}
+            for codigo, quantidade in por_procedimento.most_common()
+        ],
+        "por_nota_tecnica": [
+            {"nota_tecnica": nt_id, "nota_tecnica_label": labels_notas.get(nt_id), "quantidade": quantidade}
+            for nt_id, quantidade in por_nota.most_common()
+        ],
+    }
+
+
+def _inicio_do_periodo(dia: date, periodo: str) -> date:
+    return dia.replace(day=1) if periodo == Periodo.MES else dia
+
+
+def _proximo_periodo(inicio: date, periodo: str) -> date:
+    if periodo == Periodo.DIA:
+        return inicio + timedelta(days=1)
+    if inicio.month == 12:
+        return inicio.replace(year=inicio.year + 1, month=1)
+    return inicio.replace(month=inicio.month + 1)
+
+
+def serie_do_usuario(usuario, periodo: str, inicio: date, fim: date, procedimento: Optional[str] = None) -> list:
+    """
+    Quantidade de solicitações criadas em cada dia ou mês entre `inicio` e
+    `fim` (inclusive), com a divisão por status. Períodos sem solicitações
+    aparecem com zero. Lança ValueError se o intervalo for inválido ou
+    passar de MAXIMO_PONTOS.
+    """
+    inicio = _inicio_do_periodo(inicio, periodo)
+    fim = _inicio_do_periodo(fim, periodo)
+    if fim < inicio:
+        raise ValueError("A data final deve ser igual ou posterior à inicial.")
+
+    pontos = {}
+    atual = inicio
+    while atual <= fim:
+        if len(pontos) >= MAXIMO_PONTOS[periodo]:
+            raise ValueError(f"Intervalo longo demais: no máximo {MAXIMO_PONTOS[periodo]} pontos por série.")
+        pontos[atual] = Counter()
+        atual = _proximo_periodo(atual, periodo)
+
+    linhas = ContagemSolicitacoes.objects.filter(
+        usuario=usuario, periodo=periodo, inicio__gte=inicio, inicio__lte=fim, quantidade__gt=0,
+    )
+    if procedimento is not None:
+        linhas = linhas.filter(procedimento=procedimento)
+    for linha in linhas.values('inicio', 'status').annotate(soma=Sum('quantidade')).order_by():
+        pontos[linha['inicio']][linha['status']] += linha['soma']
+
+    return [
+        {"inicio": dia, "total": sum(por_status.values()), "por_status": dict(por_status)}
+        for dia, por_status in pontos.items()
+    ]
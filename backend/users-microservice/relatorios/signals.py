@@ -0,0 +1,69 @@
+"""
+Manutenção incremental das contagens de solicitações.
+
+Cada instância de Solicitacao guarda a chave (usuario, dia, status,
+procedimento) com que foi carregada; no post_save a contagem sai da
+chave antiga e vai para a nova, e no post_delete sai da chave atual.
+Alterações que não passam pelo save()/delete() do modelo (QuerySet.update,
+SQL direto) não são vistas: o comando `recalcular_relatorios` corrige.
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from fillsense.models import Solicitacao
+from .services import aplicar_variacoes, chave_da_solicitacao, descontar, variacoes
+
+# Campos (attname) que definem em quais contagens a solicitação entra
+CAMPOS_CHAVE = ('usuario_id', 'data_criacao', 'status', 'procedimento_fk_id')
+# Nomes aceitos em save(update_fields=...) para esses campos
+_NOMES_CAMPOS_CHAVE = frozenset(CAMPOS_CHAVE) | {'usuario', 'procedimento_fk'}
+
+
+def _chave_atual(instance) -> tuple:
+    return chave_da_solicitacao(*(getattr(instance, campo) for campo in CAMPOS_CHAVE))
+
+
+@receiver(post_init, sender=Solicitacao)
+def guardar_chave_carregada(sender, instance, **kwargs):
+    # Lê direto do __dict__: campos adiados (only/defer) não disparam consulta
+    valores = instance.__dict__
+    if instance.pk is None or not all(campo in valores for campo in CAMPOS_CHAVE):
+        instance._chave_relatorios = None
+        return
+    instance._chave_relatorios = chave_da_solicitacao(*(valores[campo] for campo in CAMPOS_CHAVE))
+
+
+@receiver(pre_save, sender=Solicitacao)
+def carregar_chave_antiga(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Instância carregada sem algum dos campos da chave: busca a chave
+    # gravada, mas só se o save pode alterá-la
+    if raw or instance._state.adding or getattr(instance, '_chave_relatorios', None) is not None:
+        return
+    if update_fields is not None and not _NOMES_CAMPOS_CHAVE.intersection(update_fields):
+        return
+    valores = Solicitacao.objects.filter(pk=instance.pk).values_list(*CAMPOS_CHAVE).first()
+    instance._chave_relatorios = chave_da_solicitacao(*valores) if valores is not None else None
+
+
+@receiver(post_save, sender=Solicitacao)
+def atualizar_contagens(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        nova = _chave_atual(instance)
+        aplicar_variacoes(variacoes(adicionadas=[nova]))
+        instance._chave_relatorios = nova
+        return
+
+    if update_fields is not None and not _NOMES_CAMPOS_CHAVE.intersection(update_fields):
+        return
+    antiga = getattr(instance, '_chave_relatorios', None)
+    nova = _chave_atual(instance)
+    if antiga != nova:
+        aplicar_variacoes(variacoes(removidas=[antiga] if antiga is not None else [], adicionadas=[nova]))
+    instance._chave_relatorios = nova
+
+
+@receiver(post_delete, sender=Solicitacao)
+def remover_das_contagens(sender, instance, **kwargs):
+    descontar(_chave_atual(instance))
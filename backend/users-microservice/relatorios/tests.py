@@ -0,0 +1,177 @@
+import importlib
+from datetime import date, datetime, time
+from unittest import mock
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from fillsense.models import Procedimento, Solicitacao
+from .models import ContagemSolicitacoes
+from .services import recalcular_contagens
+
+Periodo = ContagemSolicitacoes.PeriodoChoices
+Status = Solicitacao.StatusChoices
+
+
+class _Base(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.procedimento = Procedimento.objects.create(codigo='01', label='Procedimento 1')
+
+    def _criar(self, dia=date(2025, 3, 10), usuario=None, **campos):
+        """Cria uma solicitação com data_criacao no `dia` informado."""
+        momento = timezone.make_aware(datetime.combine(dia, time(12)))
+        campos.setdefault('procedimento_fk', self.procedimento)
+        with mock.patch('django.utils.timezone.now', return_value=momento):
+            return Solicitacao.objects.create(usuario=usuario or self.usuario, procedimento='P', **campos)
+
+    def _contagens(self, usuario=None):
+        """{(periodo, inicio, status, procedimento): quantidade} das linhas não zeradas."""
+        return {
+            (c.periodo, c.inicio, c.status, c.procedimento): c.quantidade
+            for c in ContagemSolicitacoes.objects.filter(usuario=usuario or self.usuario, quantidade__gt=0)
+        }
+
+    @staticmethod
+    def _linhas(dia, status, procedimento='01', quantidade=1):
+        return {
+            (Periodo.DIA, dia, status, procedimento): quantidade,
+            (Periodo.MES, dia.replace(day=1), status, procedimento): quantidade,
+            (Periodo.GERAL, ContagemSolicitacoes.INICIO_GERAL, status, procedimento): quantidade,
+        }
+
+
+class ManutencaoContagensTests(_Base):
+    """Os signals de Solicitacao mantêm as contagens do dia, do mês e gerais."""
+
+    def test_criacao_conta_no_dia_no_mes_e_no_geral(self):
+        self._criar()
+        self._criar(procedimento_fk=None)
+        esperado = self._linhas(date(2025, 3, 10), Status.CRIADA)
+        esperado.update(self._linhas(date(2025, 3, 10), Status.CRIADA, procedimento=''))
+        self.assertEqual(self._contagens(), esperado)
+
+    def test_mudanca_de_status_move_a_contagem(self):
+        solicitacao = self._criar()
+        self._criar()
+        solicitacao.status = Status.APROVADA
+        solicitacao.save()
+        esperado = self._linhas(date(2025, 3, 10), Status.CRIADA)
+        esperado.update(self._linhas(date(2025, 3, 10), Status.APROVADA))
+        self.assertEqual(self._contagens(), esperado)
+
+    def test_mudanca_de_status_em_instancia_com_campos_adiados(self):
+        self._criar()
+        solicitacao = Solicitacao.objects.only('pk', 'descricao_medica').get()
+        solicitacao.status = Status.REJEITADA
+        solicitacao.save(update_fields=['status'])
+        self.assertEqual(self._contagens(), self._linhas(date(2025, 3, 10), Status.REJEITADA))
+
+    def test_save_sem_campos_da_chave_nao_altera_contagens(self):
+        solicitacao = self._criar()
+        solicitacao.justificativa = 'texto'
+        with self.assertNumQueries(1):
+            solicitacao.save(update_fields=['justificativa'])
+        self.assertEqual(self._contagens(), self._linhas(date(2025, 3, 10), Status.CRIADA))
+
+    def test_exclusao_desconta(self):
+        solicitacao = self._criar()
+        self._criar()
+        solicitacao.delete()
+        self.assertEqual(self._contagens(), self._linhas(date(2025, 3, 10), Status.CRIADA))
+        Solicitacao.objects.all().delete()
+        self.assertEqual(self._contagens(), {})
+
+    def test_exclusao_do_usuario_apaga_as_contagens_em_cascata(self):
+        self._criar()
+        self._criar(status=Status.CONCLUIDA)
+        self.usuario.delete()
+        self.assertFalse(ContagemSolicitacoes.objects.exists())
+        self.assertFalse(Solicitacao.objects.exists())
+
+    def test_recalculo_reproduz_as_contagens_incrementais(self):
+        self._criar(date(2025, 1, 31))
+        self._criar(date(2025, 2, 1), status=Status.APROVADA)
+        self._criar(date(2025, 2, 1), procedimento_fk=None)
+        incrementais = self._contagens()
+        # Desvio que os signals não veem
+        Solicitacao.objects.filter(status=Status.APROVADA).update(status=Status.CONCLUIDA)
+        self.assertEqual(recalcular_contagens(), ContagemSolicitacoes.objects.count())
+        incrementais = {
+            (periodo, inicio, Status.CONCLUIDA if status == Status.APROVADA else status, procedimento): quantidade
+            for (periodo, inicio, status, procedimento), quantidade in incrementais.items()
+        }
+        self.assertEqual(self._contagens(), incrementais)
+
+    def test_migracao_preenche_as_contagens_existentes(self):
+        self._criar(date(2025, 1, 31))
+        self._criar(date(2025, 2, 1), status=Status.APROVADA)
+        esperado = self._contagens()
+        ContagemSolicitacoes.objects.all().delete()
+
+        migracao = importlib.import_module('relatorios.migrations.0001_contagem_solicitacoes')
+        migracao.preencher_contagens(apps, connection.schema_editor())
+        self.assertEqual(self._contagens(), esperado)
+
+
+class RelatoriosApiTests(_Base):
+    """Endpoints de resumo e série da tela Relatórios."""
+    URL = '/api/relatorios/solicitacoes/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.outro = User.objects.create_user(username='outro', email='outro@exemplo.com', password='senha-forte-123')
+        self._criar(date(2025, 3, 10))
+        self._criar(date(2025, 3, 10), status=Status.APROVADA)
+        self._criar(date(2025, 3, 12), procedimento_fk=None)
+        self._criar(date(2025, 1, 5))
+        self._criar(date(2025, 3, 10), usuario=self.outro)
+
+    def test_resumo(self):
+        dados = self.client.get(f"{self.URL}resumo/").json()
+        self.assertEqual(dados['total'], 4)
+        por_status = {item['status']: item['quantidade'] for item in dados['por_status']}
+        self.assertEqual(por_status, {valor: 0 for valor in Status.values} | {Status.CRIADA: 3, Status.APROVADA: 1})
+        self.assertEqual(dados['por_procedimento'], [
+            {"procedimento": "01", "procedimento_label": "Procedimento 1", "quantidade": 3},
+            {"procedimento": None, "procedimento_label": None, "quantidade": 1},
+        ])
+        self.assertEqual(sum(item['quantidade'] for item in dados['por_nota_tecnica']), 4)
+
+    def test_serie_por_dia_inclui_dias_sem_solicitacoes(self):
+        dados = self.client.get(f"{self.URL}serie/", {'data_inicio': '2025-03-09', 'data_fim': '2025-03-12'}).json()
+        self.assertEqual(dados['periodo'], 'dia')
+        self.assertEqual(dados['pontos'], [
+            {"inicio": "2025-03-09", "total": 0, "por_status": {}},
+            {"inicio": "2025-03-10", "total": 2, "por_status": {Status.CRIADA: 1, Status.APROVADA: 1}},
+            {"inicio": "2025-03-11", "total": 0, "por_status": {}},
+            {"inicio": "2025-03-12", "total": 1, "por_status": {Status.CRIADA: 1}},
+        ])
+
+    def test_serie_por_mes_com_filtro_de_procedimento(self):
+        dados = self.client.get(f"{self.URL}serie/", {
+            'periodo': 'mes', 'data_inicio': '2025-01-20', 'data_fim': '2025-03-01', 'procedimento': '01',
+        }).json()
+        self.assertEqual([(p['inicio'], p['total']) for p in dados['pontos']],
+                         [("2025-01-01", 1), ("2025-02-01", 0), ("2025-03-01", 2)])
+
+    def test_serie_parametros_invalidos(self):
+        for params in (
+            {'periodo': 'ano'},
+            {'data_inicio': '10/03/2025'},
+            {'data_inicio': '2025-03-12', 'data_fim': '2025-03-10'},
+            {'data_inicio': '2020-01-01', 'data_fim': '2025-03-10'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(f"{self.URL}serie/", params).status_code, 400)
+
+    def test_exige_autenticacao(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(f"{self.URL}resumo/").status_code, 401)
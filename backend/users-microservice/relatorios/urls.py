@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import RelatorioSolicitacoesViewSet
+
+router = DefaultRouter()
+router.register(r'solicitacoes', RelatorioSolicitacoesViewSet, basename='relatorio-solicitacoes')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import ContagemSolicitacoes
+from .services import resumo_do_usuario, serie_do_usuario
+
+Periodo = ContagemSolicitacoes.PeriodoChoices
+
+# Intervalo padrão da série quando data_inicio não é informada
+INTERVALO_PADRAO = {Periodo.DIA: timedelta(days=29), Periodo.MES: timedelta(days=334)}
+
+
+class RelatorioSolicitacoesViewSet(viewsets.ViewSet):
+    """
+    Relatórios das solicitações do usuário autenticado (tela Relatórios),
+    servidos das contagens pré-calculadas: o custo não cresce com o
+    histórico.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    # GET /api/relatorios/solicitacoes/resumo/
+    @action(detail=False, methods=['get'])
+    def resumo(self, request):
+        """
+        Totais do histórico inteiro: total, por_status (todos os status,
+        inclusive os zerados), por_procedimento e por_nota_tecnica (do
+        maior para o menor).
+        """
+        return Response(resumo_do_usuario(request.user))
+
+    # GET /api/relatorios/solicitacoes/serie/?periodo=dia&data_inicio=2025-01-01&data_fim=2025-01-31
+    @action(detail=False, methods=['get'])
+    def serie(self, request):
+        """
+        Solicitações criadas por dia ou por mês, com a divisão por status.
+        - periodo: "dia" (padrão) ou "mes"
+        - data_inicio / data_fim: AAAA-MM-DD, inclusivos (padrão: últimos
+          30 dias ou 12 meses até hoje)
+        - procedimento: código do procedimento (opcional)
+        """
+        periodo = (request.query_params.get('periodo') or 'dia').strip().upper()
+        if periodo not in (Periodo.DIA, Periodo.MES):
+            raise ValidationError({'periodo': "Período inválido. Use 'dia' ou 'mes'."})
+
+        data_fim = self._ler_data(request.query_params, 'data_fim') or timezone.localdate()
+        data_inicio = self._ler_data(request.query_params, 'data_inicio') or data_fim - INTERVALO_PADRAO[periodo]
+
+        try:
+            pontos = serie_do_usuario(
+                request.user, periodo, data_inicio, data_fim,
+                procedimento=request.query_params.get('procedimento') or None,
+            )
+        except ValueError as e:
+            return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"periodo": periodo.lower(), "pontos": pontos})
+
+    @staticmethod
+    def _ler_data(params, nome):
+        valor = params.get(nome)
+        if not valor:
+            return None
+        try:
+            data = parse_date(valor)
+        except ValueError:
+            data = None
+        if data is None:
+            raise ValidationError({nome: "Data inválida. Use o formato AAAA-MM-DD."})
+        return data
@@ -0,0 +1,266 @@
+"""
+Clientes HTTP compartilhados para as integrações externas (Ollama, API de
+procedimentos e API de devoluções).
+
+Cada integração ("upstream") tem um cliente próprio, criado uma vez por
+processo, com:
+- pool de conexões keep-alive (requests.Session e httpx.AsyncClient), para
+  não abrir uma conexão TCP/TLS nova a cada chamada;
+- timeouts separados de conexão e de leitura;
+- novas tentativas com backoff exponencial e jitter para falhas de rede e
+  respostas 5xx/429;
+- métricas de latência e erros por upstream (ver `metricas()`).
+
+A configuração fica em settings.CLIENTES_HTTP, por nome de upstream.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_PADRAO = {
+    "POOL": 10,
+    "HOSTS": 1,
+    "TIMEOUT_CONEXAO": 5,
+    "TIMEOUT_LEITURA": 30,
+    "TENTATIVAS": 0,
+    "BACKOFF_BASE": 0.5,
+}
+
+# Respostas que indicam falha temporária do upstream
+_STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+# Quantidade de latências recentes usadas nos percentis
+_AMOSTRAS_LATENCIA = 500
+
+
+class MetricasUpstream:
+    """Contadores de chamadas, erros e latência de um upstream."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chamadas = 0
+        self.erros = 0
+        self.novas_tentativas = 0
+        self.ultimo_erro = None
+        self._latencias = deque(maxlen=_AMOSTRAS_LATENCIA)
+
+    def registrar(self, latencia: float, erro: str = None):
+        with self._lock:
+            self.chamadas += 1
+            self._latencias.append(latencia)
+            if erro:
+                self.erros += 1
+                self.ultimo_erro = erro
+
+    def registrar_nova_tentativa(self):
+        with self._lock:
+            self.novas_tentativas += 1
+
+    def resumo(self) -> Dict[str, Any]:
+        with self._lock:
+            latencias = sorted(self._latencias)
+            chamadas, erros = self.chamadas, self.erros
+            novas_tentativas, ultimo_erro = self.novas_tentativas, self.ultimo_erro
+
+        def percentil(p):
+            if not latencias:
+                return None
+            return round(latencias[min(len(latencias) - 1, int(p * len(latencias)))] * 1000, 1)
+
+        return {
+            "chamadas": chamadas,
+            "erros": erros,
+            "taxa_erro": round(erros / chamadas, 4) if chamadas else 0.0,
+            "novas_tentativas": novas_tentativas,
+            "latencia_ms": {"p50": percentil(0.5), "p95": percentil(0.95), "max": percentil(1.0)},
+            "ultimo_erro": ultimo_erro,
+        }
+
+
+class ClienteHttp:
+    """
+    Cliente de um upstream. Os métodos devolvem as respostas do requests /
+    httpx e lançam as mesmas exceções dessas bibliotecas, para que cada
+    serviço mantenha o seu próprio mapeamento de erros.
+    """
+
+    def __init__(self, nome: str, config: Dict[str, Any]):
+        self.nome = nome
+        self.pool = config["POOL"]
+        self.hosts = config["HOSTS"]
+        self.timeout_conexao = config["TIMEOUT_CONEXAO"]
+        self.timeout_leitura = config["TIMEOUT_LEITURA"]
+        self.tentativas = config["TENTATIVAS"]
+        self.backoff_base = config["BACKOFF_BASE"]
+        self.metricas = MetricasUpstream()
+
+        self._sessao = None
+        self._sessao_lock = threading.Lock()
+        # Um AsyncClient por event loop (o cliente não pode trocar de loop)
+        self._clientes_async = weakref.WeakKeyDictionary()
+
+    # --- Conexões ---
+
+    @property
+    def sessao(self) -> requests.Session:
+        if self._sessao is None:
+            with self._sessao_lock:
+                if self._sessao is None:
+                    sessao = requests.Session()
+                    # As novas tentativas são feitas aqui, com jitter, e não pelo urllib3
+                    # Um pool por host (o Ollama pode ter vários servidores)
+                    adaptador = HTTPAdapter(pool_connections=self.hosts, pool_maxsize=self.pool, max_retries=0)
+                    sessao.mount("http://", adaptador)
+                    sessao.mount("https://", adaptador)
+                    self._sessao = sessao
+        return self._sessao
+
+    def cliente_async(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        cliente = self._clientes_async.get(loop)
+        if cliente is None:
+            cliente = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool, max_keepalive_connections=self.pool),
+                timeout=self._timeout_httpx(None),
+            )
+            self._clientes_async[loop] = cliente
+        return cliente
+
+    def _timeout_requests(self, timeout_leitura):
+        return (self.timeout_conexao, timeout_leitura or self.timeout_leitura)
+
+    def _timeout_httpx(self, timeout_leitura):
+        return httpx.Timeout(timeout_leitura or self.timeout_leitura, connect=self.timeout_conexao)
+
+    def _espera(self, tentativa: int) -> float:
+        # Backoff exponencial com jitter, para não sincronizar as novas tentativas
+        return self.backoff_base * (2 ** tentativa) * random.uniform(0.5, 1.5)
+
+    def _tentativas(self, tentativas):
+        return self.tentativas if tentativas is None else tentativas
+
+    # --- Versão síncrona ---
+
+    def request(self, metodo: str, url: str, *, tentativas: int = None, timeout_leitura: float = None, **kwargs) -> requests.Response:
+        """
+        Faz a requisição pelo pool do upstream, repetindo falhas de rede e
+        respostas 5xx/429. Se todas as tentativas falharem, lança a última
+        exceção ou devolve a última resposta (o chamador faz o raise_for_status).
+        """
+        tentativas = self._tentativas(tentativas)
+        kwargs["timeout"] = self._timeout_requests(timeout_leitura)
+
+        for tentativa in range(tentativas + 1):
+            inicio = time.perf_counter()
+            try:
+                response = self.sessao.request(metodo, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.metricas.registrar(time.perf_counter() - inicio, erro=f"{type(e).__name__}: {e}")
+                if tentativa >= tentativas:
+                    raise
+            else:
+                falhou = response.status_code in _STATUS_REPETIVEIS
+                self.metricas.registrar(time.perf_counter() - inicio, erro=f"HTTP {response.status_code}" if response.status_code >= 500 else None)
+                if not falhou or tentativa >= tentativas:
+                    return response
+                response.close()
+
+            self.metricas.registrar_nova_tentativa()
+            time.sleep(self._espera(tentativa))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    # --- Versão assíncrona ---
+
+    async def request_async(self, metodo: str, url: str, *, tentativas: int = None, timeout_leitura: float = None, **kwargs) -> httpx.Response:
+        """Versão assíncrona de `request`, com o mesmo comportamento."""
+        tentativas = self._tentativas(tentativas)
+        kwargs["timeout"] = self._timeout_httpx(timeout_leitura)
+        cliente = self.cliente_async()
+
+        for tentativa in range(tentativas + 1):
+            inicio = time.perf_counter()
+            try:
+                response = await cliente.request(metodo, url, **kwargs)
+            except httpx.TransportError as e:
+                self.metricas.registrar(time.perf_counter() - inicio, erro=f"{type(e).__name__}: {e}")
+                if tentativa >= tentativas:
+                    raise
+            else:
+                falhou = response.status_code in _STATUS_REPETIVEIS
+                self.metricas.registrar(time.perf_counter() - inicio, erro=f"HTTP {response.status_code}" if response.status_code >= 500 else None)
+                if not falhou or tentativa >= tentativas:
+                    return response
+
+            self.metricas.registrar_nova_tentativa()
+            await asyncio.sleep(self._espera(tentativa))
+
+    async def get_async(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request_async("GET", url, **kwargs)
+
+    async def post_async(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request_async("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream_async(self, metodo: str, url: str, *, timeout_leitura: float = None, **kwargs):
+        """
+        Requisição em streaming (sem novas tentativas: depois que o corpo
+        começou a ser repassado não é possível recomeçar). A latência
+        registrada é a do início da resposta.
+        """
+        inicio = time.perf_counter()
+        conectado = False
+        try:
+            async with self.cliente_async().stream(metodo, url, timeout=self._timeout_httpx(timeout_leitura), **kwargs) as response:
+                conectado = True
+                self.metricas.registrar(time.perf_counter() - inicio, erro=f"HTTP {response.status_code}" if response.status_code >= 500 else None)
+                yield response
+        except httpx.TransportError as e:
+            if not conectado:
+                self.metricas.registrar(time.perf_counter() - inicio, erro=f"{type(e).__name__}: {e}")
+            raise
+
+    def fechar(self):
+        if self._sessao is not None:
+            self._sessao.close()
+            self._sessao = None
+
+
+# --- Registro dos clientes ---
+
+_clientes: Dict[str, ClienteHttp] = {}
+_clientes_lock = threading.Lock()
+
+
+def cliente(nome: str) -> ClienteHttp:
+    """
+    Retorna (criando na primeira chamada) o cliente do upstream `nome`,
+    configurado por settings.CLIENTES_HTTP[nome].
+    """
+    instancia = _clientes.get(nome)
+    if instancia is None:
+        with _clientes_lock:
+            instancia = _clientes.get(nome)
+            if instancia is None:
+                config = {**_PADRAO, **getattr(settings, "CLIENTES_HTTP", {}).get(nome, {})}
+                instancia = _clientes[nome] = ClienteHttp(nome, config)
+    return instancia
+
+
+def metricas() -> Dict[str, Dict[str, Any]]:
+    """Métricas de todos os upstreams já usados neste processo."""
+    return {nome: instancia.metricas.resumo() for nome, instancia in list(_clientes.items())}
@@ -0,0 +1,74 @@
+"""
+Renderer e parser JSON do DRF baseados no orjson (opcional: sem o pacote,
+usam o json da biblioteca padrão, como os do DRF).
+
+O orjson serializa nativamente datetime/date/time, UUID, enums (inclusive
+TextChoices) e subclasses de str/dict/list (ErrorDetail, ReturnDict...);
+o restante (Decimal, textos lazy, QuerySets) passa pelo encoder do DRF.
+
+Ativados em settings.REST_FRAMEWORK com JSON_RAPIDO=True.
+"""
+import json
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - o fallback é o json da biblioteca padrão
+    orjson = None
+
+# Mesmo formato do encoder do DRF: datas UTC terminam em "Z"
+_OPCOES = orjson.OPT_UTC_Z if orjson is not None else 0
+_encoder_drf = JSONEncoder()
+
+
+def dumps(dados) -> bytes:
+    """JSON compacto em UTF-8 (sem escapar acentos)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(dados, default=_encoder_drf.default, option=_OPCOES)
+        except orjson.JSONEncodeError:
+            # Ex.: inteiros acima de 64 bits; o json da biblioteca padrão aceita
+            pass
+    return json.dumps(dados, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(conteudo):
+    """Lê JSON de bytes ou str. Lança ValueError se for inválido."""
+    if orjson is not None:
+        return orjson.loads(conteudo)
+    return json.loads(conteudo)
+
+
+class JSONRapidoRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer com o orjson. Respostas com indentação (pedida no header
+    Accept ou pela API navegável) continuam com o renderer do DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Como o renderer do DRF: U+2028/U+2029 escapados para o JSON
+        # continuar válido dentro de <script>
+        return dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class JSONRapidoParser(parsers.JSONParser):
+    """JSONParser com o orjson (que só lê UTF-8; outros charsets usam o do DRF)."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read() if stream is not None else b'')
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
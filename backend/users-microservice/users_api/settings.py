@@ -12,8 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+import json
 import os
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -40,10 +41,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Busca textual das solicitações
     'rest_framework',
     'authentication', # Aplicativo autenticador de usuários
     'fillsense', # Aplicativo gerenciador de solicitações
     'devolucoes', # Aplicativo gerenciador de devoluções
+    'relatorios', # Relatórios das solicitações (contagens pré-calculadas)
     'rest_framework_simplejwt', # Para JWT
     'corsheaders', # Para CORS
 ]
@@ -84,14 +87,29 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'users_api.wsgi.application'
+ASGI_APPLICATION = 'users_api.asgi.application'
 
 # Configurações do REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.jwt_rapido.JWTRapidoAuthentication',
     )
 }
 
+# Renderer/parser JSON com orjson (users_api/json_rapido.py); sem o pacote instalado,
+# usam o json da biblioteca padrão
+JSON_RAPIDO = config('JSON_RAPIDO', default=False, cast=bool)
+if JSON_RAPIDO:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+        'users_api.json_rapido.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    )
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = (
+        'users_api.json_rapido.JSONRapidoParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    )
+
 # Configurações do JWT
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
@@ -125,6 +143,15 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 }
 
+# Autenticação JWT sem consulta ao banco (authentication/jwt_rapido.py): os usuários
+# autenticados ficam em cache por processo e, com JWT_USUARIO_DAS_CLAIMS, são montados
+# das claims do token (tokens sem as claims, emitidos antes, continuam indo ao banco)
+JWT_USUARIO_DAS_CLAIMS = config('JWT_USUARIO_DAS_CLAIMS', default=False, cast=bool)
+JWT_CACHE_USUARIOS = {
+    'TTL': config('JWT_CACHE_USUARIOS_TTL', default=60, cast=int),
+    'MAX_ITENS': config('JWT_CACHE_USUARIOS_MAX_ITENS', default=1000, cast=int),
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -191,8 +218,125 @@ OLLAMA_MODEL = config('OLLAMA_MODEL')
 OLLAMA_TIMEOUT = config('OLLAMA_TIMEOUT', cast=int)
 OLLAMA_DEFAULT_SEED = config('OLLAMA_DEFAULT_SEED', cast=int)
 OLLAMA_DEFAULT_TEMPERATURE = config('OLLAMA_DEFAULT_TEMPERATURE', cast=float)
+# Vários servidores Ollama (fillsense/services/backends_ollama_service.py), em JSON:
+# [{"URL": "http://gpu1:11434", "PESO": 2, "MODELOS": ["mistral:latest"]}, ...]
+# PESO é a capacidade relativa e MODELOS (opcional) restringe os modelos do servidor.
+# Vazio usa apenas OLLAMA_BASE_URL. A saúde é verificada (/api/tags) a cada
+# OLLAMA_BACKENDS_VERIFICACAO segundos e um servidor que falha fica fora por
+# OLLAMA_BACKENDS_SUSPENSAO segundos.
+OLLAMA_BACKENDS = config('OLLAMA_BACKENDS', default='[]', cast=json.loads)
+OLLAMA_BACKENDS_VERIFICACAO = config('OLLAMA_BACKENDS_VERIFICACAO', default=15, cast=int)
+OLLAMA_BACKENDS_SUSPENSAO = config('OLLAMA_BACKENDS_SUSPENSAO', default=15, cast=int)
+# Tempo que o Ollama mantém o modelo carregado após a última requisição
+# (duração como "30m" ou segundos; -1 mantém sempre). Ver o comando aquecer_ollama.
+OLLAMA_KEEP_ALIVE = config('OLLAMA_KEEP_ALIVE', default='30m')
+
+# Controle de admissão das gerações no Ollama (fillsense/services/controle_ollama_service.py):
+# limite de gerações simultâneas (fixo ou AIMD entre LIMITE_MIN e LIMITE_MAX),
+# fila de espera limitada e circuit breaker após falhas seguidas
+OLLAMA_ADMISSAO = {
+    'LIMITE': config('OLLAMA_LIMITE_GERACOES', default=4, cast=int),
+    'LIMITE_MIN': 1,
+    'LIMITE_MAX': config('OLLAMA_LIMITE_GERACOES_MAX', default=8, cast=int),
+    'ADAPTATIVO': config('OLLAMA_LIMITE_ADAPTATIVO', default=False, cast=bool),
+    'LATENCIA_ALVO': config('OLLAMA_LATENCIA_ALVO', default=30, cast=int),
+    'FILA_MAX': config('OLLAMA_FILA_MAX', default=16, cast=int),
+    'ESPERA_MAX': config('OLLAMA_ESPERA_MAX', default=30, cast=int),
+    'CIRCUITO_FALHAS': config('OLLAMA_CIRCUITO_FALHAS', default=5, cast=int),
+    'CIRCUITO_TEMPO_ABERTO': config('OLLAMA_CIRCUITO_TEMPO_ABERTO', default=30, cast=int),
+}
+
+# Views assíncronas (ASGI) para as rotas que chamam serviços externos
+USE_ASYNC_VIEWS = config('USE_ASYNC_VIEWS', default=False, cast=bool)
+
+# Fila de jobs de geração de justificativa (comando processar_jobs_justificativa)
+JOBS_JUSTIFICATIVA_CONCORRENCIA = config('JOBS_JUSTIFICATIVA_CONCORRENCIA', default=2, cast=int)
+JOBS_JUSTIFICATIVA_MAX_POR_USUARIO = config('JOBS_JUSTIFICATIVA_MAX_POR_USUARIO', default=1, cast=int)
+JOBS_JUSTIFICATIVA_MAX_TENTATIVAS = config('JOBS_JUSTIFICATIVA_MAX_TENTATIVAS', default=3, cast=int)
+
+# Geração de justificativas em lote (endpoint gerar-justificativas-lote)
+JUSTIFICATIVA_LOTE_MAX_ITENS = config('JUSTIFICATIVA_LOTE_MAX_ITENS', default=20, cast=int)
+JUSTIFICATIVA_LOTE_CONCORRENCIA = config('JUSTIFICATIVA_LOTE_CONCORRENCIA', default=4, cast=int)
+
+# Cache de justificativas geradas (BACKEND: memoria, django, banco ou vazio para desativar)
+JUSTIFICATIVA_CACHE = {
+    'BACKEND': config('JUSTIFICATIVA_CACHE_BACKEND', default='memoria'),
+    'TTL': config('JUSTIFICATIVA_CACHE_TTL', default=24 * 60 * 60, cast=int),
+    'MAX_ITENS': config('JUSTIFICATIVA_CACHE_MAX_ITENS', default=1000, cast=int),
+    # Backend banco: segundos entre dois despejos (expirados e excedentes de MAX_ITENS)
+    'INTERVALO_DESPEJO': config('JUSTIFICATIVA_CACHE_INTERVALO_DESPEJO', default=60, cast=int),
+}
+
+# Compactação do prompt (fillsense/services/compactacao_nota_service.py): quando os
+# requisitos da nota técnica passam de ORCAMENTO_TOKENS, o prompt leva só as ERs das
+# CATEGORIAS_OBRIGATORIAS e as TOP_K ERs mais relevantes (BM25) para o texto clínico
+JUSTIFICATIVA_COMPACTACAO = {
+    'ATIVA': config('JUSTIFICATIVA_COMPACTACAO', default=False, cast=bool),
+    'TOP_K': config('JUSTIFICATIVA_COMPACTACAO_TOP_K', default=8, cast=int),
+    'ORCAMENTO_TOKENS': config('JUSTIFICATIVA_COMPACTACAO_ORCAMENTO_TOKENS', default=400, cast=int),
+    'CATEGORIAS_OBRIGATORIAS': config('JUSTIFICATIVA_COMPACTACAO_CATEGORIAS_OBRIGATORIAS', default='Conteúdo descritivo mínimo', cast=Csv()),
+}
 
 # Procedimentos variables
 USE_MOCK_DATA = config('USE_MOCK_DATA', cast=bool)
 PROCEDIMENTOS_API_URL = config('PROCEDIMENTOS_API_URL')
-DEVOLUCOES_API_URL = config('DEVOLUCOES_API_URL')
\ No newline at end of file
+# Catálogo de procedimentos em memória: intervalo entre verificações dos
+# arquivos mock e prazo de validade da cópia da API real (segundos)
+PROCEDIMENTOS_CATALOGO_VERIFICACAO = config('PROCEDIMENTOS_CATALOGO_VERIFICACAO', default=5, cast=int)
+PROCEDIMENTOS_CATALOGO_TTL = config('PROCEDIMENTOS_CATALOGO_TTL', default=300, cast=int)
+# Sincronização da tabela de Procedimentos (comando sincronizar_procedimentos). Com
+# PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO, cada processo também sincroniza o banco ao
+# recarregar o catálogo; desligado por padrão, pois o comando agendado já faz isso
+PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO = config('PROCEDIMENTOS_SINCRONIZAR_NO_CATALOGO', default=False, cast=bool)
+PROCEDIMENTOS_SYNC_TAMANHO_LOTE = config('PROCEDIMENTOS_SYNC_TAMANHO_LOTE', default=500, cast=int)
+DEVOLUCOES_API_URL = config('DEVOLUCOES_API_URL')
+# Cache das respostas da API de devoluções (segundos; TTL 0 desativa)
+DEVOLUCOES_CACHE = {
+    'TTL': config('DEVOLUCOES_CACHE_TTL', default=15, cast=int),
+    'STALE_WHILE_REVALIDATE': config('DEVOLUCOES_CACHE_STALE_WHILE_REVALIDATE', default=60, cast=int),
+    'STALE_IF_ERROR': config('DEVOLUCOES_CACHE_STALE_IF_ERROR', default=300, cast=int),
+    'MAX_ITENS': config('DEVOLUCOES_CACHE_MAX_ITENS', default=500, cast=int),
+}
+
+# Repasse direto: a listagem devolve o corpo da API externa pedaço a pedaço, sem
+# decodificar o JSON (memória constante em páginas grandes; não usa o cache acima)
+DEVOLUCOES_REPASSE_DIRETO = config('DEVOLUCOES_REPASSE_DIRETO', default=False, cast=bool)
+
+# Espelho local das devoluções (devolucoes/models.py): com DEVOLUCOES_ESPELHO=True a
+# listagem é servida do banco, mantido pelo comando `sincronizar_devolucoes`. A cada
+# execução ele pede à API só as devoluções alteradas desde a marca d'água (maior
+# CAMPO_ALTERACAO recebido), pelo query param PARAM_ALTERADOS_DESDE, em páginas de LIMIT
+DEVOLUCOES_ESPELHO = config('DEVOLUCOES_ESPELHO', default=False, cast=bool)
+DEVOLUCOES_SYNC = {
+    'CAMPO_ALTERACAO': config('DEVOLUCOES_SYNC_CAMPO_ALTERACAO', default='Data_Atualizacao'),
+    'PARAM_ALTERADOS_DESDE': config('DEVOLUCOES_SYNC_PARAM_ALTERADOS_DESDE', default='atualizado_desde'),
+    'SOBREPOSICAO': config('DEVOLUCOES_SYNC_SOBREPOSICAO', default=300, cast=int),
+    'LIMIT': config('DEVOLUCOES_SYNC_LIMIT', default=500, cast=int),
+}
+
+# Clientes HTTP das integrações externas (users_api/clientes_http.py):
+# tamanho do pool de conexões keep-alive, timeouts de conexão e de leitura
+# (segundos) e número de novas tentativas com backoff e jitter
+CLIENTES_HTTP = {
+    'ollama': {
+        'POOL': config('OLLAMA_POOL', default=10, cast=int),
+        'HOSTS': max(1, len(OLLAMA_BACKENDS)),
+        'TIMEOUT_CONEXAO': config('OLLAMA_TIMEOUT_CONEXAO', default=5, cast=int),
+        'TIMEOUT_LEITURA': OLLAMA_TIMEOUT,
+        # Sem novas tentativas: falhas vão para o circuit breaker (OLLAMA_ADMISSAO)
+        'TENTATIVAS': config('OLLAMA_TENTATIVAS', default=0, cast=int),
+        'BACKOFF_BASE': 1,
+    },
+    'procedimentos': {
+        'POOL': 4,
+        'TIMEOUT_CONEXAO': 3,
+        'TIMEOUT_LEITURA': 10,
+        'TENTATIVAS': 1,
+    },
+    'devolucoes': {
+        'POOL': config('DEVOLUCOES_POOL', default=20, cast=int),
+        'TIMEOUT_CONEXAO': 3,
+        'TIMEOUT_LEITURA': 10,
+        'TENTATIVAS': 1,
+    },
+}
\ No newline at end of file
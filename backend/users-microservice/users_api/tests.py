@@ -0,0 +1,284 @@
+import asyncio
+import io
+import json
+import socket
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from . import clientes_http, json_rapido
+
+
+class JSONRapidoRendererTests(SimpleTestCase):
+    """
+    O renderer com orjson deve produzir o mesmo JSON que o JSONRenderer
+    do DRF (o que muda é só a velocidade).
+    """
+    DADOS = {
+        "texto": "acentuação e separadores \u2028 \u2029 no meio",
+        "criado_em": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        "dia": date(2024, 5, 1),
+        "valor": Decimal("10.50"),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "lazy": gettext_lazy("texto"),
+        "lista": [1, 2.5, None, True, {"aninhado": "sim"}],
+    }
+
+    def _renderizar(self, renderer, dados, media_type='application/json', contexto=None):
+        return renderer.render(dados, media_type, contexto or {})
+
+    def test_mesma_saida_do_renderer_do_drf(self):
+        rapido = self._renderizar(json_rapido.JSONRapidoRenderer(), self.DADOS)
+        drf = self._renderizar(JSONRenderer(), self.DADOS)
+        self.assertEqual(rapido, drf)
+        self.assertIn(b'"2024-05-01T12:30:15.123456Z"', rapido)
+
+    def test_separadores_de_linha_escapados(self):
+        rapido = self._renderizar(json_rapido.JSONRapidoRenderer(), self.DADOS)
+        self.assertNotIn('\u2028'.encode('utf-8'), rapido)
+        self.assertNotIn('\u2029'.encode('utf-8'), rapido)
+        self.assertIn(b'\\u2028', rapido)
+        self.assertIn(b'\\u2029', rapido)
+
+    def test_indentacao_usa_o_renderer_do_drf(self):
+        media_type = 'application/json; indent=4'
+        rapido = self._renderizar(json_rapido.JSONRapidoRenderer(), self.DADOS, media_type)
+        drf = self._renderizar(JSONRenderer(), self.DADOS, media_type)
+        self.assertEqual(rapido, drf)
+        self.assertIn(b'\n    "texto"', rapido)
+
+    def test_inteiro_acima_de_64_bits_usa_a_biblioteca_padrao(self):
+        self.assertEqual(json.loads(json_rapido.dumps({"n": 2 ** 70})), {"n": 2 ** 70})
+
+    def test_sem_orjson_usa_o_renderer_do_drf(self):
+        with mock.patch.object(json_rapido, 'orjson', None):
+            rapido = self._renderizar(json_rapido.JSONRapidoRenderer(), self.DADOS)
+        self.assertEqual(rapido, self._renderizar(JSONRenderer(), self.DADOS))
+
+    def test_resposta_vazia(self):
+        self.assertEqual(json_rapido.JSONRapidoRenderer().render(None), b'')
+
+
+class JSONRapidoParserTests(SimpleTestCase):
+    """Leitura do corpo JSON e erros no mesmo formato do JSONParser do DRF."""
+
+    def _ler(self, conteudo, encoding='utf-8'):
+        return json_rapido.JSONRapidoParser().parse(
+            io.BytesIO(conteudo), 'application/json', {'encoding': encoding},
+        )
+
+    def test_le_json_em_utf8(self):
+        self.assertEqual(self._ler('{"texto": "ação"}'.encode('utf-8')), {"texto": "ação"})
+
+    def test_json_invalido_lanca_parse_error(self):
+        for conteudo in (b'{"texto": ', b'', b'\xff\xfe', b'{"a": NaN'):
+            with self.subTest(conteudo=conteudo):
+                with self.assertRaises(ParseError) as contexto:
+                    self._ler(conteudo)
+                self.assertTrue(str(contexto.exception.detail).startswith('JSON parse error - '))
+
+    def test_outro_charset_usa_o_parser_do_drf(self):
+        conteudo = '{"texto": "ação"}'.encode('latin-1')
+        self.assertEqual(self._ler(conteudo, encoding='latin-1'), {"texto": "ação"})
+        with self.assertRaises(ParseError):
+            self._ler(b'{"texto": ', encoding='latin-1')
+
+    def test_mesmos_dados_do_parser_do_drf(self):
+        conteudo = json.dumps({"lista": [1, 2.5, None, {"x": "\u2028"}]}).encode('utf-8')
+        drf = JSONParser().parse(io.BytesIO(conteudo), 'application/json', {'encoding': 'utf-8'})
+        self.assertEqual(self._ler(conteudo), drf)
+
+
+class _Upstream:
+    """
+    Servidor HTTP falso em uma porta local: responde cada requisição com o
+    próximo status de `status` (o último se repete) após `atraso` segundos.
+    """
+
+    def __init__(self, *status, atraso=0.0):
+        self.status = list(status) or [200]
+        self.atraso = atraso
+        self.chamadas = 0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status = upstream.status[min(upstream.chamadas, len(upstream.status) - 1)]
+                upstream.chamadas += 1
+                time.sleep(upstream.atraso)
+                corpo = json.dumps({'status': status}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                try:
+                    self.wfile.write(corpo)
+                except (BrokenPipeError, ConnectionResetError):
+                    # O cliente desistiu (teste de timeout)
+                    pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.servidor.server_port}/"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def _porta_livre():
+    with socket.socket() as livre:
+        livre.bind(('127.0.0.1', 0))
+        return livre.getsockname()[1]
+
+
+class ClienteHttpTests(SimpleTestCase):
+    """Novas tentativas, timeouts, clientes async e métricas do cliente de um upstream."""
+
+    def setUp(self):
+        self.upstreams = []
+        self.cliente = clientes_http.ClienteHttp('teste', {**clientes_http._PADRAO, 'TENTATIVAS': 2, 'BACKOFF_BASE': 0.01})
+        self.addCleanup(self.cliente.fechar)
+        # Sem jitter; as esperas entre as tentativas ficam registradas
+        for patcher in (mock.patch('users_api.clientes_http.random.uniform', return_value=1.0),
+                        mock.patch.object(self.cliente, '_espera', wraps=self.cliente._espera)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for upstream in self.upstreams:
+            upstream.fechar()
+
+    def _upstream(self, *status, **kwargs):
+        upstream = _Upstream(*status, **kwargs)
+        self.upstreams.append(upstream)
+        return upstream
+
+    def _esperas(self):
+        """Segundos esperados antes de cada nova tentativa."""
+        return [clientes_http.ClienteHttp._espera(self.cliente, c.args[0]) for c in self.cliente._espera.call_args_list]
+
+    def test_repete_5xx_com_backoff_exponencial(self):
+        upstream = self._upstream(503, 502, 200)
+        self.assertEqual(self.cliente.get(upstream.url).status_code, 200)
+        self.assertEqual(upstream.chamadas, 3)
+        self.assertEqual(self._esperas(), [0.01, 0.02])
+        metricas = self.cliente.metricas.resumo()
+        self.assertEqual((metricas['chamadas'], metricas['erros'], metricas['novas_tentativas']), (3, 2, 2))
+        self.assertEqual(metricas['ultimo_erro'], 'HTTP 502')
+
+    def test_devolve_a_ultima_resposta_quando_as_tentativas_acabam(self):
+        upstream = self._upstream(500)
+        self.assertEqual(self.cliente.get(upstream.url, tentativas=1).status_code, 500)
+        self.assertEqual(upstream.chamadas, 2)
+
+    def test_nao_repete_4xx(self):
+        upstream = self._upstream(404, 200)
+        self.assertEqual(self.cliente.get(upstream.url).status_code, 404)
+        self.assertEqual((upstream.chamadas, self._esperas()), (1, []))
+        self.assertEqual(self.cliente.metricas.resumo()['erros'], 0)
+
+    def test_repete_falha_de_conexao_e_lanca_a_ultima(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.cliente.get(f"http://127.0.0.1:{_porta_livre()}/")
+        metricas = self.cliente.metricas.resumo()
+        self.assertEqual((metricas['chamadas'], metricas['erros'], metricas['novas_tentativas']), (3, 3, 2))
+        self.assertTrue(metricas['ultimo_erro'].startswith('ConnectionError'))
+
+    def test_timeout_de_leitura_por_requisicao(self):
+        upstream = self._upstream(200, atraso=0.5)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.cliente.get(upstream.url, tentativas=0, timeout_leitura=0.1)
+        self.assertEqual(self.cliente.get(upstream.url, tentativas=0).status_code, 200)
+
+        async def _get_async():
+            return await self.cliente.get_async(upstream.url, tentativas=0, timeout_leitura=0.1)
+
+        with self.assertRaises(httpx.ReadTimeout):
+            async_to_sync(_get_async)()
+
+    def test_versao_async_repete_5xx_e_nao_repete_4xx(self):
+        upstream = self._upstream(503, 502, 200)
+        self.assertEqual(async_to_sync(self.cliente.get_async)(upstream.url).status_code, 200)
+        self.assertEqual((upstream.chamadas, self._esperas()), (3, [0.01, 0.02]))
+        upstream.status, upstream.chamadas = [404, 200], 0
+        self.assertEqual(async_to_sync(self.cliente.get_async)(upstream.url).status_code, 404)
+        self.assertEqual(upstream.chamadas, 1)
+        self.assertEqual(self.cliente.metricas.resumo()['novas_tentativas'], 2)
+
+    def test_um_cliente_async_por_event_loop(self):
+        upstream = self._upstream(200)
+
+        async def _dois_gets():
+            await self.cliente.get_async(upstream.url)
+            primeiro = self.cliente.cliente_async()
+            await self.cliente.get_async(upstream.url)
+            self.assertIs(self.cliente.cliente_async(), primeiro)
+            await primeiro.aclose()
+            return id(primeiro)
+
+        loops = [asyncio.new_event_loop() for _ in range(2)]
+        try:
+            ids = [loop.run_until_complete(_dois_gets()) for loop in loops]
+        finally:
+            for loop in loops:
+                loop.close()
+        self.assertNotEqual(ids[0], ids[1])
+        self.assertEqual(upstream.chamadas, 4)
+
+    def test_resumo_das_metricas(self):
+        metricas = clientes_http.MetricasUpstream()
+        self.assertEqual(metricas.resumo()['latencia_ms'], {"p50": None, "p95": None, "max": None})
+        for i in range(1, 101):
+            metricas.registrar(i / 1000, erro='HTTP 500' if i % 4 == 0 else None)
+        metricas.registrar_nova_tentativa()
+        self.assertEqual(metricas.resumo(), {
+            "chamadas": 100,
+            "erros": 25,
+            "taxa_erro": 0.25,
+            "novas_tentativas": 1,
+            "latencia_ms": {"p50": 51.0, "p95": 96.0, "max": 100.0},
+            "ultimo_erro": 'HTTP 500',
+        })
+
+
+class MetricasIntegracoesApiTests(TestCase):
+    """GET /api/metricas/integracoes/: só para administradores."""
+    URL = '/api/metricas/integracoes/'
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_administrador_ve_as_metricas_dos_upstreams(self):
+        admin = User.objects.create_user(username='admin', email='admin@exemplo.com', password='senha-forte-123', is_staff=True)
+        self.client.force_authenticate(admin)
+        clientes_http.cliente('devolucoes')
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('devolucoes', response.json())
+        self.assertEqual(set(response.json()['devolucoes']),
+                         {'chamadas', 'erros', 'taxa_erro', 'novas_tentativas', 'latencia_ms', 'ultimo_erro'})
+
+    def test_usuario_comum_e_anonimo_nao_acessam(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+        usuario = User.objects.create_user(username='medico', email='medico@exemplo.com', password='senha-forte-123')
+        self.client.force_authenticate(usuario)
+        self.assertEqual(self.client.get(self.URL).status_code, 403)
@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
+from .views import metricas_integracoes
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('authentication.urls')),
     path('api/fillsense/', include('fillsense.urls')),
     path('api/', include('devolucoes.urls')),
+    path('api/relatorios/', include('relatorios.urls')),
+    path('api/metricas/integracoes/', metricas_integracoes, name='metricas-integracoes'),
 ]
\ No newline at end of file
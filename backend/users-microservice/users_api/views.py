@@ -0,0 +1,16 @@
+from rest_framework import permissions, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from . import clientes_http
+
+
+# GET /api/metricas/integracoes/
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def metricas_integracoes(request):
+    """
+    Latência e erros das chamadas às integrações externas (Ollama, API de
+    procedimentos e API de devoluções), por upstream, neste processo.
+    """
+    return Response(clientes_http.metricas(), status=status.HTTP_200_OK)
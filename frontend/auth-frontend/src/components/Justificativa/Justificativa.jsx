@@ -10,12 +10,14 @@ const Justificativa = () => {
     const [isLoading, setIsLoading] = useState(true);
     const [justificationText, setJustificationText] = useState('');
     const [error, setError] = useState(null);
+    // ERs da nota técnica deixadas fora do prompt (compactação), gravadas em metadados_ia
+    const [compactacao, setCompactacao] = useState(null);
 
     const location = useLocation();
     const procedimento = location.state?.procedimento;
     const clinico_text = location.state?.clinico_text;
     const solicitacaoId = location.state?.solicitacaoId;
-    const selectedErs = location.state?.ers;
+    const procId = location.state?.proc_id;
     const [statusMessage, setStatusMessage] = useState('');
 
     const generateJustification = async () => {
@@ -28,7 +30,7 @@ const Justificativa = () => {
         const formData = {
             procedimento: procedimento, // O nome (Label) do procedimento
             clinico_text: clinico_text, // O texto clínico combinado
-            ers: selectedErs // A lista de ERs
+            proc_id: procId // O código do procedimento (a nota técnica vem do catálogo)
         }
 
         console.log(formData)
@@ -42,6 +44,7 @@ const Justificativa = () => {
 
             const data = response.data;
             setJustificationText(data.justificativa);
+            setCompactacao(data.compactacao || null);
 
         } catch (err) {
             let errorMsg = 'Falha crítica: Verifique o servidor (porta 8000).';
@@ -56,14 +59,16 @@ const Justificativa = () => {
 
     useEffect(() => {
         generateJustification();
-    }, [procedimento, clinico_text, solicitacaoId, selectedErs]);
+    }, [procedimento, clinico_text, solicitacaoId, procId]);
 
     const handleSaveButton = async (event) => {
         event.preventDefault();
         setStatusMessage('');
         try {
+            // O backend junta a compactação aos metadados_ia já gravados (null remove a anterior)
             const formData = {
-                'justificativa': justificationText
+                'justificativa': justificationText,
+                'compactacao': compactacao
             };
 
             const response = await apiClient.patch(`/api/fillsense/solicitacoes/${solicitacaoId}/`, formData);
@@ -29,7 +29,6 @@ function NovaSolicitacao() {
     const [formError, setFormError] = useState('');
     const [notaTecnicaLabel, setNotaTecnicaLabel] = useState(null); 
     const [procedimentosConfig, setProcedimentosConfig] = useState([]); 
-    const [selectedErs, setSelectedErs] = useState([]);
     const [isLoading, setIsLoading] = useState(true);
     const [isSubmitting, setIsSubmitting] = useState(false);
     const [apiError, setApiError] = useState(null);
@@ -56,8 +55,7 @@ function NovaSolicitacao() {
                         value: proc.proc_id,
                         label: proc.proc_label,
                         fields: fieldsWithUniqueIds,
-                        nota_tecnica: proc.NT_label || null,
-                        ers: proc.ers || []
+                        nota_tecnica: proc.NT_label || null
                     };
                 });
                 
@@ -81,7 +79,6 @@ function NovaSolicitacao() {
         const newDadosAdicionais = {};
         let novaNotaTecnica = null; 
         let novoLabel = '';
-        let novosErs = [];
 
         if (procId) {
             const selectedProc = procedimentosConfig.find(p => p.value === procId);
@@ -97,13 +94,11 @@ function NovaSolicitacao() {
                 // Captura as novas informações
                 novaNotaTecnica = selectedProc.nota_tecnica; 
                 novoLabel = selectedProc.label;
-                novosErs = selectedProc.ers;
             }
         }
         setDadosAdicionais(newDadosAdicionais);
         setNotaTecnicaLabel(novaNotaTecnica);
         setProcedimentoLabel(novoLabel);
-        setSelectedErs(novosErs);
     };
 
     const handleDadosAdicionaisChange = (event) => {
@@ -188,7 +183,7 @@ function NovaSolicitacao() {
                     procedimento: procedimentoLabel, // O nome (Label) do procedimento
                     clinico_text: descricaoFinalCombinada, // O texto clínico combinado
                     solicitacaoId: response.data.id, // O id da solicitação
-                    ers: selectedErs // A lista de ERs
+                    proc_id: procedimento // O código do procedimento (a nota técnica vem do catálogo)
                 };
 
                 navigate('/justificativa', {
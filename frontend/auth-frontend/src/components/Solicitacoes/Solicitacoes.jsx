@@ -7,11 +7,14 @@ function Solicitacoes() {
     const [solicitacoes, setSolicitacoes] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
+    const [proximaPagina, setProximaPagina] = useState(null);
+    const [carregandoMais, setCarregandoMais] = useState(false);
 
     const fetchSolicitacoes = async () => {
         try {
             const response = await apiClient.get('api/fillsense/solicitacoes/');
-            setSolicitacoes(response.data);
+            setSolicitacoes(response.data.results);
+            setProximaPagina(response.data.next);
             setLoading(false);
         } catch (err) {
             setError('Não foi possível carregar as solicitações.');
@@ -19,6 +22,21 @@ function Solicitacoes() {
         }
     };
 
+    // A API é paginada por cursor: 'next' já traz a URL da próxima página
+    const carregarMais = async () => {
+        if (!proximaPagina) return;
+        setCarregandoMais(true);
+        try {
+            const response = await apiClient.get(proximaPagina);
+            setSolicitacoes((anteriores) => [...anteriores, ...response.data.results]);
+            setProximaPagina(response.data.next);
+        } catch (err) {
+            setError('Não foi possível carregar as solicitações.');
+        } finally {
+            setCarregandoMais(false);
+        }
+    };
+
     useEffect(() => {
         fetchSolicitacoes();
     }, []);
@@ -62,6 +80,13 @@ function Solicitacoes() {
                             ))}
                         </tbody>
                     </table>
+                    {proximaPagina && (
+                        <div className="action-buttons">
+                            <button className="action-button" onClick={carregarMais} disabled={carregandoMais}>
+                                {carregandoMais ? 'Carregando...' : 'Carregar mais'}
+                            </button>
+                        </div>
+                    )}
                 </div>
             )}
         </section>